@@ -24,6 +24,57 @@ AVBTOOL_PATH = 'tools/avbtool.py'
 ABOOTIMG_PATH = 'tools/abootimg'
 LPMAKE_PATH = 'tools/lpmake'
 
+# Native ADB transport: talk to the adb server socket directly instead of
+# spawning tools/adb for every shell/getprop/push/pull.
+ADB_NATIVE_TRANSPORT = os.environ.get('ACRD_ADB_NATIVE', '1') == '1'
+ADB_SERVER_HOST = os.environ.get('ANDROID_ADB_SERVER_ADDRESS', '127.0.0.1')
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', '5037'))
+
+# Native fastboot transport: drive `tcp:host[:port]` devices (fastbootd over
+# the network, or the local emulator) without spawning tools/fastboot.
+FASTBOOT_NATIVE_TCP = os.environ.get('ACRD_FASTBOOT_NATIVE', '1') == '1'
+
+# Tool process scheduler: how many adb processes may run at once across all devices.
+# fastboot is always limited to one operation per device.
+ADB_MAX_PROCESSES = int(os.environ.get('ACRD_ADB_MAX_PROCESSES', '8'))
+
+# Optional JSONL trace of every HAL tool invocation (also settable with --hal-trace).
+HAL_TRACE_FILE = os.environ.get('ACRD_HAL_TRACE')
+
+# Incremental flashing: skip partitions whose last successfully flashed image
+# (recorded per serial) has the same SHA-256 as the one about to be flashed.
+FLASH_INCREMENTAL = os.environ.get('ACRD_FLASH_INCREMENTAL', '0') == '1'
+
+# Partition backups: how many partitions stream at once, and the codec
+# ('zstd' needs the optional zstandard package; 'default' picks zstd or gzip).
+BACKUP_PARALLEL = int(os.environ.get('ACRD_BACKUP_PARALLEL', '3'))
+BACKUP_COMPRESSION = os.environ.get('ACRD_BACKUP_COMPRESSION', 'default')
+
+# Shared HTTP client: retries (with backoff) for failed connections and 429/5xx
+# answers to GET/HEAD, and opt-in HTTP/2 (needs `pip install h2`).
+HTTP_RETRIES = int(os.environ.get('ACRD_HTTP_RETRIES', '3'))
+HTTP2 = os.environ.get('ACRD_HTTP2', '0') == '1'
+
+# Downloads: how many byte ranges of one file are fetched in parallel
+# (1 disables segmenting; servers without range support always get one stream).
+DOWNLOAD_CONNECTIONS = int(os.environ.get('ACRD_DOWNLOAD_CONNECTIONS', '4'))
+
+# Download queue: how many components download at once, the combined bandwidth cap
+# in KiB/s (0 = unlimited), and how many requests may be open to one host.
+DOWNLOAD_WORKERS = int(os.environ.get('ACRD_DOWNLOAD_WORKERS', '3'))
+DOWNLOAD_BANDWIDTH_LIMIT = int(os.environ.get('ACRD_DOWNLOAD_BANDWIDTH', '0')) * 1024
+DOWNLOAD_HOST_CONNECTIONS = int(os.environ.get('ACRD_DOWNLOAD_HOST_CONNECTIONS', '6'))
+
+# Content-addressed download cache shared by all devices and models. Keep it on the
+# same filesystem as devices/ so per-device copies can be reflinks or hardlinks.
+BLOB_STORE_DIR = os.environ.get('ACRD_BLOB_STORE', os.path.join('devices', '.blobs'))
+
+# File hashing (image validation, artifact indexing): how many files are hashed at once.
+HASH_WORKERS = int(os.environ.get('ACRD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Fleet mode (--fleet): how many devices are worked on at once.
+FLEET_CONCURRENCY = int(os.environ.get('ACRD_FLEET_CONCURRENCY', '8'))
+
 def validate_config():
     """
     Validate the configuration in config.py.
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -22,6 +22,85 @@ class DeviceProfile(Base):
     last_quarried = Column(DateTime, default=datetime.utcnow)
 
 
+class FlashedImage(Base):
+    __tablename__ = "flashed_images"
+    __table_args__ = (UniqueConstraint("serial", "partition"),)
+
+    id = Column(Integer, primary_key=True)
+    serial = Column(String(255), nullable=False)
+    partition = Column(String(255), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(BigInteger)
+    flashed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FlashJob(Base):
+    __tablename__ = "flash_jobs"
+
+    id = Column(Integer, primary_key=True)
+    serial = Column(String(255), nullable=False)
+    boot_mode = Column(String(64))
+    source = Column(Text)
+    plan_json = Column(Text, nullable=False)
+    status = Column(String(64), default="running")
+    created = Column(DateTime, default=datetime.utcnow)
+    updated = Column(DateTime, default=datetime.utcnow)
+
+
+class FlashJobStep(Base):
+    __tablename__ = "flash_job_steps"
+    __table_args__ = (UniqueConstraint("job_id", "position"),)
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("flash_jobs.id"), nullable=False)
+    position = Column(Integer, nullable=False)
+    action = Column(String(64), nullable=False)
+    partition = Column(String(255))
+    fingerprint = Column(String(255))
+    sha256 = Column(String(64))
+    status = Column(String(64), default="pending")
+    updated = Column(DateTime, default=datetime.utcnow)
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    sha1 = Column(String(40))
+    md5 = Column(String(32))
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger)
+    created = Column(DateTime, default=datetime.utcnow)
+    verified = Column(DateTime, default=datetime.utcnow)
+
+
+class BlobSource(Base):
+    __tablename__ = "blob_sources"
+    __table_args__ = (UniqueConstraint("url", "etag"),)
+
+    id = Column(Integer, primary_key=True)
+    url = Column(Text, nullable=False)
+    etag = Column(String(255), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    seen = Column(DateTime, default=datetime.utcnow)
+
+
+class QueuedDownload(Base):
+    __tablename__ = "download_queue"
+
+    id = Column(Integer, primary_key=True)
+    model = Column(String(255), nullable=False)
+    component = Column(String(255), nullable=False)
+    type = Column(String(64), nullable=False)
+    priority = Column(Integer, default=0)
+    status = Column(String(64), default="queued")
+    destination = Column(Text)
+    detail = Column(Text)
+    created = Column(DateTime, default=datetime.utcnow)
+    updated = Column(DateTime, default=datetime.utcnow)
+
+
 class Method(Base):
     __tablename__ = "methods"
 
@@ -76,6 +155,17 @@ class AiTailoredOption(Base):
     tailored_data = Column(Text)
 
 
+class PartitionTableCache(Base):
+    __tablename__ = "partition_tables"
+
+    id = Column(Integer, primary_key=True)
+    device_key = Column(String(255), unique=True, nullable=False)
+    source = Column(String(64))
+    sha256 = Column(String(64))
+    table_json = Column(Text, nullable=False)
+    updated = Column(DateTime, default=datetime.utcnow)
+
+
 class DbMetadata(Base):
     __tablename__ = "db_metadata"
 
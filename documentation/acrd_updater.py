@@ -1,7 +1,12 @@
-import requests
 import json
 import time
 import os
+import sys
+
+# Add project root to path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules import http_client
 
 # Configuration file name
 CONFIG_FILE = "acrd_config.json"
@@ -24,7 +29,7 @@ def get_latest_release(api_url_template, repo_path):
     url = api_url_template.format(repo_path)
     
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         
         if response.status_code == 200:
             data = response.json()
@@ -103,7 +108,8 @@ def main():
         time.sleep(0.5)
 
     print("-" * 85)
-    print("Update check complete.")
+    stats = http_client.stats()
+    print(f"Update check complete ({stats['requests']} requests, {stats['reused']} on reused connections).")
 
     # Optional: Save results to a report file
     with open("acrd_update_report.json", "w") as f:
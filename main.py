@@ -1,23 +1,88 @@
 # main.py
 
 import argparse
+import atexit
 import sys
 
 from rich.console import Console
+from rich.table import Table
 
 import config
-from modules import db_manager, device_quarry, dir_tree_generator, ai_integration
+from modules import db_manager, device_quarry, dir_tree_generator, ai_integration, fleet, download_queue, http_client
+from modules.hal import (
+    AdbWrapper, AdbServerClient, FastbootWrapper, get_hal_stats, get_scheduler, start_device_watcher,
+)
 from ui import tui
 
 console = Console()
 
+def print_hal_stats():
+    """Prints per-command latency percentiles and counters for every HAL tool call."""
+    rows = get_hal_stats().summary()
+    if not rows:
+        console.print("[yellow]No HAL tool invocations recorded.[/yellow]")
+        return
+    table = Table(title="HAL tool invocations")
+    for column in ("Tool", "Command", "Calls", "Failed", "Timed out", "Bytes", "p50 ms", "p90 ms", "p99 ms", "Max ms"):
+        table.add_column(column, justify="left" if column in ("Tool", "Command") else "right")
+    for row in rows:
+        table.add_row(
+            row['tool'], row['subcommand'], str(row['calls']), str(row['failures']),
+            str(row['timeouts']), str(row['bytes']),
+            *(f"{row[key] * 1000:.1f}" for key in ('p50', 'p90', 'p99', 'max')),
+        )
+    console.print(table)
+
+def run_fleet(args):
+    """Quarries every connected device and runs one operation on the matching ones. Returns the exit code."""
+    devices = fleet.select_devices(device_quarry.quarry_all_devices(), args.match)
+    if not devices:
+        console.print("[red]No matching devices found.[/red]")
+        return 1
+    if not fleet.confirm_operation(devices, args.fleet, assume_yes=args.yes):
+        console.print("Operation cancelled.")
+        return 1
+    console.print(f"Running {args.fleet} on {len(devices)} device(s), {args.fleet_concurrency} at a time...")
+    results = fleet.run_fleet(devices, args.fleet, {'rom': args.rom}, concurrency=args.fleet_concurrency)
+    failed = [r for r in results if r['state'] != 'done']
+    for row in failed:
+        console.print(f"[red]{row['serial']}: {row['detail']}[/red]")
+    console.print(f"{len(results) - len(failed)}/{len(results)} devices succeeded.")
+    return 1 if failed else 0
+
 def main():
     """Main entry point for the ACRD-GEMINI tool."""
     parser = argparse.ArgumentParser(description="ACRD-GEMINI: Android Custom ROM Development Tool")
     parser.add_argument("--quarry-only", action="store_true", help="Only detect and quarry the device, then exit.")
     parser.add_argument("--check-config", action="store_true", help="Validate configuration and tool paths.")
     parser.add_argument("--no-tui", action="store_true", help="Run without TUI (useful for automation).")
+    parser.add_argument("--hal-stats", action="store_true", help="Print HAL tool latency statistics at exit.")
+    parser.add_argument("--hal-trace", metavar="PATH", default=config.HAL_TRACE_FILE,
+                        help="Append one JSON line per HAL tool invocation to PATH.")
+    parser.add_argument("--incremental", action="store_true", default=config.FLASH_INCREMENTAL,
+                        help="When flashing, skip partitions that already hold the identical image.")
+    parser.add_argument("--fleet", metavar="OPERATION", choices=sorted(fleet.OPERATIONS),
+                        help="Run OPERATION (%(choices)s) on every connected device at once, then exit.")
+    parser.add_argument("--match", metavar="PATTERN",
+                        help="With --fleet, only devices whose serial or model matches PATTERN (e.g. 'pixel*').")
+    parser.add_argument("--rom", metavar="PATH", help="ROM folder for --fleet flash.")
+    parser.add_argument("--yes", action="store_true",
+                        help="With --fleet flash or backup, skip the confirmation listing the devices.")
+    parser.add_argument("--fleet-concurrency", metavar="N", type=int, default=config.FLEET_CONCURRENCY,
+                        help="With --fleet, how many devices are worked on at once.")
+    parser.add_argument("--downloads", action="store_true",
+                        help="Run the queued downloads (see the TUI's Download menu), then exit.")
+    parser.add_argument("--download-workers", metavar="N", type=int, default=config.DOWNLOAD_WORKERS,
+                        help="With --downloads, how many components download at once.")
     args = parser.parse_args()
+    if args.fleet == 'flash' and not args.rom:
+        parser.error("--fleet flash needs --rom")
+
+    if args.hal_trace:
+        get_hal_stats().set_trace_file(args.hal_trace)
+    if args.hal_stats:
+        atexit.register(print_hal_stats)
+    config.FLASH_INCREMENTAL = args.incremental
 
     # 1. Validate Config
     if args.check_config:
@@ -34,6 +99,25 @@ def main():
     # 2. Initialize Core Components
     ai_integration.initialize_gemini(config.GEMINI_API_KEY)
     db_manager.init_db()
+    get_scheduler().set_limits('adb', total=config.ADB_MAX_PROCESSES)
+    FastbootWrapper.native_tcp = config.FASTBOOT_NATIVE_TCP
+    if config.ADB_NATIVE_TRANSPORT:
+        AdbWrapper.default_transport = AdbServerClient(config.ADB_SERVER_HOST, config.ADB_SERVER_PORT)
+        # Device lists come from the watcher's registry instead of `adb devices`/`fastboot devices`.
+        if AdbWrapper.default_transport.is_available():
+            start_device_watcher(AdbWrapper.default_transport, fastboot_path=config.FASTBOOT_PATH).wait_until_ready()
+
+    if args.fleet:
+        sys.exit(run_fleet(args))
+
+    if args.downloads:
+        results = download_queue.run_queue(workers=args.download_workers)
+        failed = [r for r in results if r['status'] != 'done']
+        console.print(f"{len(results) - len(failed)}/{len(results)} downloads finished.")
+        stats = http_client.stats()
+        console.print(f"{stats['requests']} HTTP requests over {stats['connections']} connections "
+                      f"({stats['reused']} reused).")
+        sys.exit(1 if failed else 0)
 
     # 3. Detect and quarry the device
     device_info = device_quarry.quarry_device()
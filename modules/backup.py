@@ -0,0 +1,251 @@
+# modules/backup.py
+
+import concurrent.futures
+import hashlib
+import json
+import logging
+import lzma
+import os
+import queue
+import shlex
+import threading
+import time
+import zlib
+
+from rich.console import Console
+
+import config
+from modules.exceptions import ToolError
+import modules.hal as hal
+
+try:
+    import zstandard
+except ImportError:  # Optional: `pip install zstandard` enables .zst backups.
+    zstandard = None
+
+logger = logging.getLogger("ACRD")
+
+console = Console()
+
+CRITICAL_PARTITIONS = ['boot', 'init_boot', 'vbmeta', 'dtbo', 'persist', 'efs', 'modem']
+BY_NAME_DIRS = ['/dev/block/by-name', '/dev/block/bootdevice/by-name']
+
+# Raw chunks buffered between the USB reader and the compressor of each partition.
+BACKUP_QUEUE_DEPTH = 16
+DEFAULT_PARALLEL = 3
+
+COMPRESSION_EXTENSIONS = {
+    None: '.img',
+    'zstd': '.img.zst',
+    'xz': '.img.xz',
+    'gzip': '.img.gz',
+}
+
+
+def default_compression():
+    """zstd when the optional zstandard module is installed, otherwise gzip (xz is too slow to keep up with USB)."""
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def _compressor(compression):
+    """Returns an object with compress(data) and flush() for the given codec."""
+    if compression is None:
+        return None
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ToolError("zstd compression needs the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3, threads=-1).compressobj()
+    if compression == 'xz':
+        return lzma.LZMACompressor(preset=1)
+    if compression == 'gzip':
+        return zlib.compressobj(1, zlib.DEFLATED, 31)
+    raise ToolError(f"Unsupported backup compression: {compression}")
+
+
+def _as_root(command, su):
+    return f"su -c {shlex.quote(command)}" if su else command
+
+
+def resolve_partitions(adb, partitions, su=True):
+    """
+    Finds the block device of each partition (preferring the active slot) with one
+    shell round trip. Returns {partition: {'device_name', 'path', 'size'}}; partitions
+    the device does not have are left out. 'size' is None if blockdev is unavailable.
+    """
+    suffix = adb.get_props().get('ro.boot.slot_suffix', '')
+    candidates = []
+    for partition in partitions:
+        candidates += [partition + suffix, partition] if suffix else [partition]
+    script = (
+        f"cd {BY_NAME_DIRS[0]} 2>/dev/null || cd {BY_NAME_DIRS[1]} || exit 1; "
+        f"for n in {' '.join(shlex.quote(c) for c in candidates)}; do "
+        f"[ -e \"$n\" ] && echo \"$n $(readlink -f \"$n\") $(blockdev --getsize64 \"$n\" 2>/dev/null)\"; "
+        f"done; true"
+    )
+    output = adb.shell_many([_as_root(script, su)])[0] or ''
+
+    found = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            found[parts[0]] = {'path': parts[1], 'size': int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None}
+
+    resolved = {}
+    for partition in partitions:
+        for name in ([partition + suffix, partition] if suffix else [partition]):
+            if name in found:
+                resolved[partition] = dict(found[name], device_name=name)
+                break
+    return resolved
+
+
+def _backup_partition(adb, partition, device, dest_dir, compression, su):
+    """
+    Streams one block device through `exec-out dd` into a compressed file. The USB
+    reader hashes raw data as it arrives; a writer thread compresses and writes it,
+    so a slow disk or compressor only stalls the reader once the queue is full.
+    """
+    started = time.monotonic()
+    file_name = partition + COMPRESSION_EXTENSIONS[compression]
+    path = os.path.join(dest_dir, file_name)
+    compressor = _compressor(compression)
+    chunks = queue.Queue(maxsize=BACKUP_QUEUE_DEPTH)
+    writer_error = []
+
+    def writer():
+        try:
+            with open(path, 'wb') as f:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is None:
+                        break
+                    f.write(compressor.compress(chunk) if compressor else chunk)
+                if compressor:
+                    f.write(compressor.flush())
+        except Exception as e:  # Any compressor or disk error; the reader must not hang.
+            writer_error.append(e)
+            # Keep draining so the reader never blocks on a dead writer.
+            while chunks.get() is not None:
+                pass
+
+    thread = threading.Thread(target=writer, name=f"acrd-backup-{partition}", daemon=True)
+    thread.start()
+    digest = hashlib.sha256()
+    size = 0
+    dd = f"dd if={shlex.quote(device['path'])} bs=1048576"
+    try:
+        for chunk in adb.exec_out_chunks(_as_root(dd, su), check=True):
+            digest.update(chunk)
+            size += len(chunk)
+            chunks.put(chunk)
+    except (ToolError, OSError) as e:  # OSError: the stream was reset or timed out mid-partition.
+        writer_error.append(e)
+    finally:
+        chunks.put(None)
+        thread.join()
+
+    entry = {
+        'partition': partition,
+        'device_name': device['device_name'],
+        'device_path': device['path'],
+        'file': file_name,
+        'size': size,
+        'sha256': digest.hexdigest(),
+        'compression': compression,
+        'compressed_size': os.path.getsize(path) if os.path.exists(path) else 0,
+        'seconds': round(time.monotonic() - started, 3),
+        'status': 'ok',
+    }
+    if writer_error:
+        entry['status'] = f"failed: {writer_error[0]}"
+    elif size == 0 or (device['size'] is not None and size != device['size']):
+        entry['status'] = f"failed: read {size} of {device['size'] or 'unknown'} bytes (is the device rooted?)"
+    elif device['size'] is None:
+        entry['status'] = f"unverified: read {size} bytes, but the partition size is unknown"
+    return entry
+
+
+def backup_partitions(adb, dest_dir, partitions=None, compression='default', parallel=DEFAULT_PARALLEL, su=True):
+    """
+    Backs up partitions of an ADB device into dest_dir, several at a time, and
+    writes dest_dir/manifest.json with each partition's size and SHA-256.
+    Returns the manifest.
+    """
+    if compression == 'default':
+        compression = default_compression()
+    _compressor(compression)  # Fail fast on an unavailable codec.
+    partitions = partitions or CRITICAL_PARTITIONS
+    os.makedirs(dest_dir, exist_ok=True)
+    started = time.monotonic()
+
+    resolved = resolve_partitions(adb, partitions, su)
+    entries = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        futures = [
+            pool.submit(_backup_partition, adb, partition, resolved[partition], dest_dir, compression, su)
+            for partition in partitions if partition in resolved
+        ]
+        for future in futures:
+            entries.append(future.result())
+
+    props = adb.get_props()
+    manifest = {
+        'serial': adb.serial,
+        'model': props.get('ro.product.model'),
+        'fingerprint': props.get('ro.build.fingerprint'),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'compression': compression,
+        'seconds': round(time.monotonic() - started, 3),
+        'partitions': entries,
+        'missing': [p for p in partitions if p not in resolved],
+    }
+    with open(os.path.join(dest_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def incomplete_partitions(manifest):
+    """Partitions of a backup manifest that did not back up cleanly, as 'name (status)' strings."""
+    return [f"{entry['partition']} ({entry['status']})" for entry in manifest['partitions'] if entry['status'] != 'ok']
+
+
+def backup_device(device_info, partitions=None, dest_dir=None, progress=None):
+    """
+    Backs up the critical partitions of the connected ADB device (by default under devices/<model>/backups/).
+    With progress, each status line is passed to progress(message) instead of being printed, so
+    callers that own the terminal (the fleet's live table) can show it in their own display.
+    """
+    def say(message, style=None):
+        if progress is not None:
+            progress(message)
+        elif style:
+            console.print(f"[{style}]{message}[/{style}]")
+        else:
+            console.print(message)
+
+    if device_info.get('boot_mode') != 'adb' or not device_info.get('serial'):
+        say("Partition backup requires a rooted device in ADB mode. Skipping.", 'yellow')
+        return None
+
+    if dest_dir is None:
+        model = device_info.get('model', 'unknown_device').replace(' ', '_')
+        dest_dir = os.path.join('devices', model, 'backups', time.strftime('%Y%m%d-%H%M%S'))
+    say(f"Backing up partitions to {dest_dir}...")
+    try:
+        adb = hal.AdbWrapper(config.ADB_PATH, serial=device_info['serial'])
+        manifest = backup_partitions(adb, dest_dir, partitions, config.BACKUP_COMPRESSION, config.BACKUP_PARALLEL)
+    except (ToolError, OSError) as e:
+        say(f"Backup failed: {e}", 'red')
+        return None
+
+    for entry in manifest['partitions']:
+        if entry['status'] == 'ok':
+            say(f"[✓] {entry['partition']}: {entry['size']} bytes, sha256 {entry['sha256'][:16]}…", 'green')
+        elif entry['status'].startswith('unverified'):
+            say(f"[?] {entry['partition']}: {entry['status']}", 'yellow')
+        else:
+            say(f"[✗] {entry['partition']}: {entry['status']}", 'red')
+    if manifest['missing']:
+        say(f"Not present on this device: {', '.join(manifest['missing'])}", 'yellow')
+    logger.info(f"Partition backup written to {dest_dir} in {manifest['seconds']}s")
+    return manifest
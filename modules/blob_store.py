@@ -0,0 +1,143 @@
+# modules/blob_store.py
+
+"""
+Content-addressed store for downloaded files, shared by every device and model.
+Each file is kept once under <BLOB_STORE_DIR>/sha256/<ab>/<sha256>, indexed in the
+blobs table by its digests and in blob_sources by the URL and ETag that served it.
+Per-device paths are reflinks (copy-on-write) or read-only hardlinks into the store.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import stat
+
+import config
+from modules import db_manager, hashing
+from modules.exceptions import DatabaseError
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; links fall back to hardlinks or copies.
+    fcntl = None
+
+logger = logging.getLogger("ACRD")
+
+_FICLONE = 0x40049409  # Linux ioctl: share extents copy-on-write (btrfs, XFS, bcachefs).
+
+
+def blob_path(sha256):
+    return os.path.join(config.BLOB_STORE_DIR, 'sha256', sha256[:2], sha256)
+
+
+def incoming_path(url):
+    """Where url is downloaded before it is added; stable per URL so a download can resume."""
+    name = hashlib.sha256(url.encode()).hexdigest()[:32]
+    return os.path.join(config.BLOB_STORE_DIR, 'incoming', name)
+
+
+def _verified(blob):
+    """
+    True if the blob's file is still intact. A file whose size and mtime match what was
+    recorded when it was hashed is trusted; anything else is hashed again, and dropped
+    from the store if it no longer matches.
+    """
+    path = blob_path(blob['sha256'])
+    try:
+        st = os.stat(path)
+        if st.st_size == blob['size'] and st.st_mtime_ns == blob['mtime_ns']:
+            return True
+        if st.st_size == blob['size'] and hashing.hash_file(path)['sha256'] == blob['sha256']:
+            db_manager.store_blob(blob['sha256'], st.st_size, st.st_mtime_ns)
+            return True
+    except OSError:
+        pass
+    logger.warning(f"Stored download {blob['sha256']} is missing or changed; dropping it")
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    db_manager.delete_blob(blob['sha256'])
+    return False
+
+
+def find(algorithm, digest):
+    """The verified blob with this digest (sha256, sha1 or md5), as a path, or None."""
+    try:
+        blob = db_manager.get_blob(algorithm, digest)
+        return blob_path(blob['sha256']) if blob and _verified(blob) else None
+    except DatabaseError as e:
+        logger.warning(f"Download cache lookup failed: {e}")
+        return None
+
+
+def find_source(url, etag):
+    """The verified blob url last served under this ETag, as a path, or None."""
+    # A weak ETag promises equivalent content, not identical bytes.
+    if not etag or etag.startswith('W/'):
+        return None
+    try:
+        sha256 = db_manager.get_blob_source(url, etag)
+    except DatabaseError as e:
+        logger.warning(f"Download cache lookup failed: {e}")
+        return None
+    return find('sha256', sha256) if sha256 else None
+
+
+def add(path, digests, url=None, etag=None):
+    """
+    Moves a downloaded file into the store under its sha256 (digests must include it)
+    and indexes it by its digests and, given a strong ETag, by url+ETag. If the store
+    already holds the same content, the new copy is discarded. Returns the blob path.
+    """
+    sha256 = digests['sha256']
+    target = blob_path(sha256)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        # Read-only, so writing through a hardlinked device path cannot corrupt the blob.
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(path, target)
+    st = os.stat(target)
+    try:
+        db_manager.store_blob(sha256, st.st_size, st.st_mtime_ns, sha1=digests.get('sha1'), md5=digests.get('md5'))
+        if url and etag and not etag.startswith('W/'):
+            db_manager.record_blob_source(url, etag, sha256)
+    except DatabaseError as e:
+        logger.warning(f"Could not index {target} in the download cache: {e}")
+    return target
+
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError("reflinks are not supported here")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+def link(blob, destination):
+    """
+    Makes destination a reflink of the blob, or else a hardlink, or else a copy, and
+    returns which of 'reflink', 'hardlink' or 'copy' it got. Replaces destination atomically.
+    """
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    if os.path.exists(destination) and os.path.samefile(blob, destination):
+        return 'hardlink'
+    temp = f"{destination}.link"
+    for method, make in (('reflink', _reflink), ('hardlink', os.link), ('copy', shutil.copyfile)):
+        try:
+            if os.path.lexists(temp):
+                os.remove(temp)
+            make(blob, temp)
+        except OSError as e:
+            logger.debug(f"{method} of {blob} to {destination} failed: {e}")
+            continue
+        if method != 'hardlink':
+            os.chmod(temp, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(temp, destination)
+        return method
+    if os.path.lexists(temp):
+        os.remove(temp)
+    raise OSError(f"Could not link {blob} to {destination}")
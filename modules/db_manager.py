@@ -6,7 +6,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from contextlib import contextmanager
 import config
 from .exceptions import DatabaseError
-from db.models import Base, DeviceProfile, Method, ToolConfig, Log, UrlPlaceholder, AiTailoredOption, DbMetadata
+from db.models import Base, DeviceProfile, Method, ToolConfig, Log, UrlPlaceholder, AiTailoredOption, DbMetadata, PartitionTableCache, FlashedImage, FlashJob, FlashJobStep, Blob, BlobSource, QueuedDownload
 import datetime
 import logging
 
@@ -130,6 +130,197 @@ def insert_device_profile(info: dict):
             filtered_info = {k: v for k, v in info.items() if k in valid_keys}
             session.add(DeviceProfile(**filtered_info))
 
+def record_flashed_image(serial, partition, sha256, size):
+    """Records the image last flashed successfully to a device partition."""
+    with get_session() as session:
+        image = session.query(FlashedImage).filter_by(serial=serial, partition=partition).first()
+        if image:
+            image.sha256 = sha256
+            image.size = size
+            image.flashed_at = datetime.datetime.utcnow()
+        else:
+            session.add(FlashedImage(serial=serial, partition=partition, sha256=sha256, size=size))
+
+def get_flashed_images(serial):
+    """Returns {partition: {'sha256', 'size', 'flashed_at'}} for the images last flashed to a device."""
+    with get_session() as session:
+        return {
+            image.partition: {'sha256': image.sha256, 'size': image.size, 'flashed_at': image.flashed_at}
+            for image in session.query(FlashedImage).filter_by(serial=serial)
+        }
+
+def clear_flashed_images(serial, partition=None):
+    """Forgets recorded images for a device (or one partition), e.g. after it was modified outside ACRD."""
+    with get_session() as session:
+        query = session.query(FlashedImage).filter_by(serial=serial)
+        if partition is not None:
+            query = query.filter_by(partition=partition)
+        query.delete()
+
+def create_flash_job(serial, boot_mode, source, plan_json, steps):
+    """
+    Starts a checkpointed flash job from [(action, partition, fingerprint)] and returns its id.
+    Earlier unfinished jobs for the device are marked abandoned; only the latest can be resumed.
+    """
+    with get_session() as session:
+        session.query(FlashJob).filter(FlashJob.serial == serial, FlashJob.status.in_(("running", "failed"))).update(
+            {FlashJob.status: "abandoned"}, synchronize_session=False)
+        job = FlashJob(serial=serial, boot_mode=boot_mode, source=source, plan_json=plan_json, status="running")
+        session.add(job)
+        session.flush()
+        for position, (action, partition, fingerprint) in enumerate(steps):
+            session.add(FlashJobStep(job_id=job.id, position=position, action=action,
+                                     partition=partition, fingerprint=fingerprint))
+        return job.id
+
+def update_flash_job_step(job_id, position, status, sha256=None):
+    """Checkpoints one step of a flash job ('running', 'done' or 'failed')."""
+    with get_session() as session:
+        now = datetime.datetime.utcnow()
+        step = session.query(FlashJobStep).filter_by(job_id=job_id, position=position).first()
+        if step:
+            step.status = status
+            step.sha256 = sha256 or step.sha256
+            step.updated = now
+        session.query(FlashJob).filter_by(id=job_id).update({FlashJob.updated: now}, synchronize_session=False)
+
+def update_flash_job(job_id, status=None, boot_mode=None):
+    """Updates a flash job's status ('running', 'failed', 'done', 'abandoned') or the mode the device is in."""
+    with get_session() as session:
+        job = session.query(FlashJob).filter_by(id=job_id).first()
+        if job:
+            job.status = status or job.status
+            job.boot_mode = boot_mode or job.boot_mode
+            job.updated = datetime.datetime.utcnow()
+
+def get_resumable_flash_job(serial, boot_mode):
+    """
+    Returns the device's latest interrupted or failed flash job, if the device is in the
+    boot mode the job left it in, as {'id', 'source', 'plan_json', 'updated', 'steps'}; else None.
+    """
+    with get_session() as session:
+        job = (session.query(FlashJob)
+               .filter(FlashJob.serial == serial, FlashJob.status.in_(("running", "failed")))
+               .order_by(FlashJob.id.desc()).first())
+        if not job or job.boot_mode != boot_mode:
+            return None
+        steps = session.query(FlashJobStep).filter_by(job_id=job.id).order_by(FlashJobStep.position)
+        return {
+            'id': job.id, 'source': job.source, 'plan_json': job.plan_json, 'updated': job.updated,
+            'steps': [{'action': s.action, 'partition': s.partition, 'fingerprint': s.fingerprint,
+                       'sha256': s.sha256, 'status': s.status} for s in steps],
+        }
+
+def _blob_dict(blob):
+    return {'sha256': blob.sha256, 'sha1': blob.sha1, 'md5': blob.md5, 'size': blob.size,
+            'mtime_ns': blob.mtime_ns, 'verified': blob.verified}
+
+def get_blob(algorithm, digest):
+    """Looks a stored download up by its sha256, sha1 or md5 digest; returns a dict or None."""
+    if algorithm not in ('sha256', 'sha1', 'md5'):
+        return None
+    with get_session() as session:
+        blob = session.query(Blob).filter(getattr(Blob, algorithm) == digest).first()
+        return _blob_dict(blob) if blob else None
+
+def store_blob(sha256, size, mtime_ns, sha1=None, md5=None):
+    """Records (or re-verifies) a stored download, keeping any digests already known for it."""
+    with get_session() as session:
+        blob = session.query(Blob).filter_by(sha256=sha256).first()
+        if not blob:
+            blob = Blob(sha256=sha256)
+            session.add(blob)
+        blob.size = size
+        blob.mtime_ns = mtime_ns
+        blob.sha1 = sha1 or blob.sha1
+        blob.md5 = md5 or blob.md5
+        blob.verified = datetime.datetime.utcnow()
+
+def delete_blob(sha256):
+    """Forgets a stored download and every URL that pointed at it."""
+    with get_session() as session:
+        session.query(BlobSource).filter_by(sha256=sha256).delete()
+        session.query(Blob).filter_by(sha256=sha256).delete()
+
+def get_blob_source(url, etag):
+    """The sha256 of what url served under this ETag, or None."""
+    with get_session() as session:
+        source = session.query(BlobSource).filter_by(url=url, etag=etag).first()
+        return source.sha256 if source else None
+
+def record_blob_source(url, etag, sha256):
+    """Remembers that url with this ETag served the blob sha256."""
+    with get_session() as session:
+        source = session.query(BlobSource).filter_by(url=url, etag=etag).first()
+        if source:
+            source.sha256 = sha256
+            source.seen = datetime.datetime.utcnow()
+        else:
+            session.add(BlobSource(url=url, etag=etag, sha256=sha256))
+
+def _queued_download_dict(item):
+    return {'id': item.id, 'model': item.model, 'component': item.component, 'type': item.type,
+            'priority': item.priority, 'status': item.status, 'destination': item.destination,
+            'detail': item.detail, 'created': item.created, 'updated': item.updated}
+
+def enqueue_download(model, component, type, priority=0):
+    """
+    Adds a component download to the persistent queue and returns its id. If the same
+    download is already waiting or running, that entry is kept (at the higher priority).
+    """
+    with get_session() as session:
+        item = (session.query(QueuedDownload)
+                .filter(QueuedDownload.model == model, QueuedDownload.component == component,
+                        QueuedDownload.type == type, QueuedDownload.status.in_(("queued", "running")))
+                .first())
+        if item:
+            item.priority = max(item.priority or 0, priority)
+        else:
+            item = QueuedDownload(model=model, component=component, type=type, priority=priority, status="queued")
+            session.add(item)
+        session.flush()
+        return item.id
+
+def claim_next_download():
+    """Marks the highest-priority (then oldest) queued download running and returns it, or None."""
+    with get_session() as session:
+        item = (session.query(QueuedDownload).filter_by(status="queued")
+                .order_by(QueuedDownload.priority.desc(), QueuedDownload.id).first())
+        if not item:
+            return None
+        item.status = "running"
+        item.updated = datetime.datetime.utcnow()
+        return _queued_download_dict(item)
+
+def finish_download(download_id, status, destination=None, detail=None):
+    """Records the outcome ('done', 'failed' or 'cancelled') of a queued download."""
+    with get_session() as session:
+        item = session.query(QueuedDownload).filter_by(id=download_id).first()
+        if item:
+            item.status = status
+            item.destination = destination
+            item.detail = detail
+            item.updated = datetime.datetime.utcnow()
+
+def get_download_queue(statuses=("queued", "running")):
+    """Queued downloads with one of the given statuses, in the order they will run."""
+    with get_session() as session:
+        items = (session.query(QueuedDownload).filter(QueuedDownload.status.in_(statuses))
+                 .order_by(QueuedDownload.priority.desc(), QueuedDownload.id))
+        return [_queued_download_dict(item) for item in items]
+
+def requeue_interrupted_downloads():
+    """Puts downloads left 'running' by a process that exited back in the queue; returns how many."""
+    with get_session() as session:
+        return session.query(QueuedDownload).filter_by(status="running").update(
+            {QueuedDownload.status: "queued"}, synchronize_session=False)
+
+def get_urls(model):
+    """Every component URL stored for a model, as [{'component', 'type', 'url', 'checksum'}]."""
+    with get_session() as session:
+        return [{'component': u.component, 'type': u.type, 'url': u.url, 'checksum': u.checksum}
+                for u in session.query(UrlPlaceholder).filter_by(model=model).order_by(UrlPlaceholder.id)]
+
 def query_methods(os_version):
     """Query root methods by compatibility."""
     with get_session() as session:
@@ -179,6 +370,29 @@ def store_tailored_options(model, option, tailored_data):
     with get_session() as session:
         session.add(AiTailoredOption(model=model, option=option, tailored_data=tailored_data))
 
+def store_partition_table(device_key, table_json, sha256, source='heimdall'):
+    """Caches a device's partition table (PitTable JSON), replacing any earlier one."""
+    with get_session() as session:
+        cached = session.query(PartitionTableCache).filter_by(device_key=device_key).first()
+        if cached:
+            cached.table_json = table_json
+            cached.sha256 = sha256
+            cached.source = source
+            cached.updated = datetime.datetime.utcnow()
+        else:
+            session.add(PartitionTableCache(device_key=device_key, table_json=table_json, sha256=sha256, source=source))
+
+def get_partition_table(device_key):
+    """Returns the cached partition table JSON for a device, or None."""
+    with get_session() as session:
+        cached = session.query(PartitionTableCache).filter_by(device_key=device_key).first()
+        return cached.table_json if cached else None
+
+def invalidate_partition_table(device_key):
+    """Drops a device's cached partition table, e.g. after repartitioning."""
+    with get_session() as session:
+        session.query(PartitionTableCache).filter_by(device_key=device_key).delete()
+
 def log_operation(model, operation, log_data, status):
     """Log an operation."""
     logger.info(f"Operation: {operation} | Model: {model} | Status: {status} | Data: {log_data}")
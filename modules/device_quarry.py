@@ -1,9 +1,13 @@
 # modules/device_quarry.py
 
+import asyncio
 import config
 from modules.hal import AdbWrapper, FastbootWrapper, HeimdallWrapper
-from modules.exceptions import ToolError
-from modules import ai_integration
+from modules.hal import AsyncAdbWrapper, AsyncFastbootWrapper, AsyncHeimdallWrapper
+from modules.hal import usb_sysfs
+from modules.exceptions import DatabaseError, ToolError
+from modules import ai_integration, db_manager
+from modules.hal.pit import PitTable
 import os
 from rich.console import Console
 from rich.prompt import Prompt
@@ -27,6 +31,12 @@ def quarry_device():
         console.print(f"[yellow]Could not list fastboot devices: {e}[/yellow]")
         fastboot_devices = []
 
+    # A serial that changed boot mode has stale snapshots from its previous mode.
+    for d in fastboot_devices:
+        AdbWrapper.invalidate_props(d)
+    for d in adb_devices:
+        FastbootWrapper.invalidate_vars(d)
+
     all_devices = []
     for d in adb_devices:
         all_devices.append({'serial': d, 'mode': 'adb'})
@@ -34,15 +44,21 @@ def quarry_device():
         all_devices.append({'serial': d, 'mode': 'fastboot'})
 
     if not all_devices:
-        # Check for Heimdall or EDL as fallback
-        try:
-            heimdall_wrapper = HeimdallWrapper(config.HEIMDALL_PATH)
-            if heimdall_wrapper.detect():
-                return quarry_heimdall(heimdall_wrapper)
-        except (FileNotFoundError, ToolError) as e:
-             console.print(f"[yellow]Heimdall not found or failed: {e}[/yellow]")
-        if detect_edl():
+        # Check for Download Mode, EDL or MediaTek BROM as fallback.
+        # One sysfs pass classifies them all; without sysfs every probe is unknown (None).
+        usb_modes = _usb_modes()
+        if usb_modes is None or 'download' in usb_modes:
+            try:
+                heimdall_wrapper = HeimdallWrapper(config.HEIMDALL_PATH, device_key=download_mode_key())
+                if heimdall_wrapper.detect():
+                    return quarry_heimdall(heimdall_wrapper)
+            except (FileNotFoundError, ToolError) as e:
+                 console.print(f"[yellow]Heimdall not found or failed: {e}[/yellow]")
+        if detect_edl(usb_modes):
             return quarry_edl()
+        for mode in ('brom', 'preloader'):
+            if usb_modes and mode in usb_modes:
+                return quarry_mediatek(mode)
         
         console.print("[red]No device detected.[/red]")
         return None
@@ -76,17 +92,7 @@ def quarry_device():
 def quarry_adb(adb_wrapper):
     """Quarries a device via ADB."""
     try:
-        model = adb_wrapper.get_prop("ro.product.model")
-        if model:
-            return {
-                'model': model,
-                'brand': adb_wrapper.get_prop("ro.product.brand"),
-                'os_version': adb_wrapper.get_prop("ro.product.version.release"),
-                'firmware': adb_wrapper.get_prop("ro.build.version.incremental"),
-                'security_patch': adb_wrapper.get_prop("ro.build.version.security_patch"),
-                'boot_mode': 'adb',
-                'serial': adb_wrapper.serial
-            }
+        return _adb_device_info(adb_wrapper.get_props(), adb_wrapper.serial)
     except ToolError as e:
         handle_quarry_error("ADB", e)
     return None
@@ -94,34 +100,168 @@ def quarry_adb(adb_wrapper):
 def quarry_fastboot(fastboot_wrapper):
     """Quarries a device via Fastboot."""
     try:
-        model = fastboot_wrapper.getvar("product")
-        if model:
-            # Check if it's fastbootd
-            is_fastbootd = "yes" in (fastboot_wrapper.getvar("is-userspace") or "")
-            return {
-                'model': model,
-                'brand': fastboot_wrapper.getvar("product"), 
-                'os_version': fastboot_wrapper.getvar("os-version"),
-                'firmware': fastboot_wrapper.getvar("version-bootloader"),
-                'security_patch': None,
-                'boot_mode': 'fastbootd' if is_fastbootd else 'fastboot',
-                'serial': fastboot_wrapper.serial
-            }
+        return _fastboot_device_info(fastboot_wrapper.getvar_all(), fastboot_wrapper.serial)
     except ToolError as e:
         handle_quarry_error("Fastboot", e)
     return None
 
-def quarry_heimdall(heimdall_wrapper):
+def _adb_device_info(props, serial):
+    """Builds a device_info dict from a getprop snapshot."""
+    model = props.get("ro.product.model")
+    if not model:
+        return None
+    return {
+        'model': model,
+        'brand': props.get("ro.product.brand"),
+        'os_version': props.get("ro.build.version.release") or props.get("ro.product.version.release"),
+        'firmware': props.get("ro.build.version.incremental"),
+        'security_patch': props.get("ro.build.version.security_patch"),
+        'boot_mode': 'adb',
+        'serial': serial
+    }
+
+def _fastboot_device_info(snapshot, serial):
+    """Builds a device_info dict from a `getvar all` snapshot."""
+    fb_vars = snapshot.get('vars', {})
+    model = fb_vars.get("product")
+    if not model:
+        return None
+    # Check if it's fastbootd
+    is_fastbootd = fb_vars.get("is-userspace") == "yes"
+    return {
+        'model': model,
+        'brand': model,
+        'os_version': fb_vars.get("os-version"),
+        'firmware': fb_vars.get("version-bootloader"),
+        'security_patch': None,
+        'boot_mode': 'fastbootd' if is_fastbootd else 'fastboot',
+        'serial': serial
+    }
+
+def quarry_all_devices():
+    """
+    Enumerates every transport concurrently and quarries every attached device in parallel.
+    Returns a list of device_info dicts (possibly empty).
+    """
+    return asyncio.run(_quarry_all_devices_async())
+
+def _usb_modes():
+    """Set of modes seen on the USB bus via sysfs, or None if sysfs is not available."""
+    devices = usb_sysfs.enumerate_usb_devices()
+    if devices is None:
+        return None
+    return {d['mode'] for d in devices if d['mode']}
+
+async def _quarry_all_devices_async():
+    async def list_or_empty(coro, tool):
+        try:
+            return await coro
+        except ToolError as e:
+            console.print(f"[yellow]Could not list {tool} devices: {e}[/yellow]")
+            return []
+
+    usb_modes = _usb_modes()
+
+    async def heimdall_detected():
+        if usb_modes is not None and 'download' not in usb_modes:
+            return False
+        try:
+            return await AsyncHeimdallWrapper(config.HEIMDALL_PATH, device_key=download_mode_key()).detect()
+        except ToolError:
+            return False
+
+    # Every transport probe runs at once, so discovery costs the slowest probe, not their sum.
+    adb_devices, fastboot_devices, in_download_mode, in_edl = await asyncio.gather(
+        list_or_empty(AsyncAdbWrapper.list_devices(config.ADB_PATH), "adb"),
+        list_or_empty(AsyncFastbootWrapper.list_devices(config.FASTBOOT_PATH), "fastboot"),
+        heimdall_detected(),
+        asyncio.to_thread(detect_edl, usb_modes),
+    )
+
+    for d in fastboot_devices:
+        AdbWrapper.invalidate_props(d)
+    for d in adb_devices:
+        FastbootWrapper.invalidate_vars(d)
+
+    async def quarry_adb_async(serial):
+        try:
+            adb = AsyncAdbWrapper(config.ADB_PATH, serial=serial)
+            return _adb_device_info(await adb.get_props(), serial)
+        except ToolError as e:
+            console.print(f"[red]ADB quarry of {serial} failed: {e}[/red]")
+            return None
+
+    async def quarry_fastboot_async(serial):
+        try:
+            fastboot = AsyncFastbootWrapper(config.FASTBOOT_PATH, serial=serial)
+            return _fastboot_device_info(await fastboot.getvar_all(), serial)
+        except ToolError as e:
+            console.print(f"[red]Fastboot quarry of {serial} failed: {e}[/red]")
+            return None
+
+    results = await asyncio.gather(
+        *(quarry_adb_async(d) for d in adb_devices),
+        *(quarry_fastboot_async(d) for d in fastboot_devices),
+    )
+    devices = [info for info in results if info]
+
+    # Heimdall and EDL cannot address a device by serial, so they report at most one each.
+    if in_download_mode:
+        info = quarry_heimdall(HeimdallWrapper(config.HEIMDALL_PATH, device_key=download_mode_key()))
+        if info:
+            devices.append(info)
+    if in_edl:
+        devices.append(quarry_edl())
+    for mode in ('brom', 'preloader'):
+        if usb_modes and mode in usb_modes:
+            devices.append(quarry_mediatek(mode))
+    return devices
+
+def download_mode_key():
+    """
+    Identifies the Samsung device in Download Mode by its USB serial, for caching its PIT.
+    Returns None when there is not exactly one such device or it reports no serial.
+    """
+    devices = usb_sysfs.devices_in_mode('download')
+    if not devices or len(devices) != 1 or not devices[0]['serial']:
+        return None
+    return f"download:{devices[0]['serial']}"
+
+def load_partition_table(heimdall_wrapper, device_key=None, refresh=False):
+    """
+    Returns the device's PitTable, reusing the copy cached in the database for device_key.
+    Reading the PIT takes seconds and reboots some devices, so it is fetched only on a miss.
+    """
+    if device_key and not refresh:
+        try:
+            cached = db_manager.get_partition_table(device_key)
+        except DatabaseError:
+            cached = None
+        if cached:
+            return PitTable.from_json(cached)
+
+    table = heimdall_wrapper.get_pit()
+    if table and device_key:
+        try:
+            db_manager.store_partition_table(device_key, table.to_json(), table.sha256())
+        except DatabaseError as e:
+            console.print(f"[yellow]Could not cache partition table: {e}[/yellow]")
+    return table
+
+def quarry_heimdall(heimdall_wrapper, device_key=None):
     """Quarries a device via Heimdall."""
     try:
-        pit_data = heimdall_wrapper.print_pit()
+        device_key = device_key or heimdall_wrapper.device_key or download_mode_key()
+        table = load_partition_table(heimdall_wrapper, device_key)
         return {
             'model': 'Samsung Device',
             'brand': 'Samsung',
             'os_version': 'Unknown (Download Mode)',
             'firmware': 'Unknown',
             'security_patch': None,
-            'boot_mode': 'download'
+            'boot_mode': 'download',
+            'device_key': device_key,
+            'partitions': [entry.name for entry in table] if table else [],
         }
     except ToolError as e:
         handle_quarry_error("Heimdall", e)
@@ -138,8 +278,26 @@ def quarry_edl():
         'boot_mode': 'edl'
     }
 
-def detect_edl():
-    """Heuristic to detect Qualcomm EDL mode via lsusb."""
+def quarry_mediatek(mode):
+    """Quarries a device in MediaTek BROM or Preloader mode."""
+    return {
+        'model': 'MediaTek Device',
+        'brand': 'MediaTek',
+        'os_version': f"Unknown ({'BROM' if mode == 'brom' else 'Preloader'} Mode)",
+        'firmware': 'Unknown',
+        'security_patch': None,
+        'boot_mode': mode
+    }
+
+def detect_edl(usb_modes=None):
+    """
+    Detects Qualcomm EDL mode (05c6:9008) from a sysfs USB scan.
+    Falls back to lsusb on hosts without sysfs.
+    """
+    if usb_modes is None:
+        usb_modes = _usb_modes()
+    if usb_modes is not None:
+        return 'edl' in usb_modes
     try:
         import subprocess
         result = subprocess.run(['lsusb'], capture_output=True, text=True)
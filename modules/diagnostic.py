@@ -1,5 +1,6 @@
 # modules/diagnostic.py
 
+import collections
 import logging
 import config
 from rich.console import Console
@@ -7,6 +8,36 @@ import modules.hal as hal
 
 logger = logging.getLogger("ACRD")
 
+DIAGNOSTIC_COMMANDS = [
+    "su -c \"echo 'rooted'\"",
+    "dumpsys battery",
+    "df -h /data",
+    "getenforce",
+]
+
+# Log scans are streamed line by line so memory stays flat however large the logs are.
+CRASH_LOG_COMMAND = "logcat -d -b crash -t 10"
+DMESG_COMMAND = "dmesg"
+DMESG_ERRORS_SHOWN = 5
+
+def collect_diagnostics(adb):
+    """
+    Runs the quick checks in one pipelined shell session (instead of one `adb shell`
+    spawn each) and returns {'root', 'battery', 'storage', 'selinux'}; unknowns are None.
+    """
+    root_status, battery_info, storage_info, selinux = adb.shell_many(DIAGNOSTIC_COMMANDS)
+    summary = {'root': bool(root_status and "rooted" in root_status), 'battery': None, 'storage': None,
+               'selinux': selinux.strip() if selinux else None}
+    if battery_info:
+        level = [line for line in battery_info.splitlines() if "level:" in line]
+        if level:
+            summary['battery'] = level[0].split(':')[1].strip()
+    if storage_info:
+        lines = storage_info.splitlines()
+        if len(lines) > 1:
+            summary['storage'] = lines[1]
+    return summary
+
 def run_diagnostics(device_info):
     """
     Runs diagnostics on the device.
@@ -20,48 +51,61 @@ def run_diagnostics(device_info):
 
     adb = hal.AdbWrapper(config.ADB_PATH, serial=device_info['serial'])
 
+    # 0. Build info from the cached property snapshot (filled during quarry)
+    props = adb.get_props()
+    if props.get('ro.build.fingerprint'):
+        console.print(f"[cyan][i] Build: {props['ro.build.fingerprint']}[/cyan]")
+    if props.get('ro.boot.verifiedbootstate'):
+        console.print(f"[cyan][i] Verified Boot State: {props['ro.boot.verifiedbootstate']}[/cyan]")
+
+    summary = collect_diagnostics(adb)
+
     # 1. Check for root
-    root_status = adb.shell(["su", "-c", "echo 'rooted'"])
-    if root_status and "rooted" in root_status:
+    if summary['root']:
         console.print("[green][✓] Root access: Available[/green]")
     else:
         console.print("[yellow][!] Root access: Not available or su not found[/yellow]")
         
     # 2. Check Battery status
-    battery_info = adb.shell(["dumpsys", "battery"])
-    if battery_info:
-        level = [line for line in battery_info.splitlines() if "level:" in line]
-        if level:
-            console.print(f"[cyan][i] Battery Level: {level[0].split(':')[1].strip()}%[/cyan]")
+    if summary['battery']:
+        console.print(f"[cyan][i] Battery Level: {summary['battery']}%[/cyan]")
 
     # 3. Check Storage
-    storage_info = adb.shell(["df", "-h", "/data"])
-    if storage_info:
-        lines = storage_info.splitlines()
-        if len(lines) > 1:
-            console.print(f"[cyan][i] Data Partition: {lines[1]}[/cyan]")
+    if summary['storage']:
+        console.print(f"[cyan][i] Data Partition: {summary['storage']}[/cyan]")
 
     # 4. Check SELinux status
-    selinux = adb.shell(["getenforce"])
-    if selinux:
-        console.print(f"[cyan][i] SELinux Status: {selinux.strip()}[/cyan]")
+    if summary['selinux']:
+        console.print(f"[cyan][i] SELinux Status: {summary['selinux']}[/cyan]")
 
     # 5. Check for recent app crashes
     console.print("Checking for recent app crashes...")
-    crashes = adb.shell(["logcat", "-d", "-b", "crash", "-t", "10"])
-    if crashes and len(crashes.strip()) > 0:
-        console.print(f"[red]Found recent crashes:[/red]\n{crashes}")
+    # `-t` bounds the output, so the lines can be held until the exit code is known.
+    crash_lines = [line for line in adb.iter_shell_lines(CRASH_LOG_COMMAND) if line.strip()]
+    # A failed logcat only produced its own error message.
+    if adb.last_returncode != 0:
+        console.print("[yellow][!] Could not read the crash log.[/yellow]")
+    elif crash_lines:
+        console.print("[red]Found recent crashes:[/red]")
+        for line in crash_lines:
+            console.print(line, markup=False)
     else:
         console.print("[green][✓] No recent crashes found.[/green]")
 
     # 6. Check for any critical errors in dmesg (AI directed)
     console.print("Checking for critical kernel errors...")
-    dmesg = adb.shell(["dmesg"])
-    if dmesg:
-        errors = [line for line in dmesg.splitlines() if "error" in line.lower() or "fail" in line.lower()]
-        if errors:
-            console.print(f"[red]Found {len(errors)} potential errors in dmesg. Showing last 5:[/red]")
-            for err in errors[-5:]:
-                console.print(f"  - {err}")
+    error_count = 0
+    last_errors = collections.deque(maxlen=DMESG_ERRORS_SHOWN)
+    for line in adb.iter_shell_lines(DMESG_COMMAND):
+        lowered = line.lower()
+        if "error" in lowered or "fail" in lowered:
+            error_count += 1
+            last_errors.append(line)
+    # A failed dmesg (no permission) only produced its own error message.
+    if adb.last_returncode == 0:
+        if error_count:
+            console.print(f"[red]Found {error_count} potential errors in dmesg. Showing last {len(last_errors)}:[/red]")
+            for err in last_errors:
+                console.print(f"  - {err}", markup=False)
         else:
             console.print("[green][✓] No obvious kernel errors found.[/green]")
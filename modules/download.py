@@ -1,62 +1,429 @@
 # modules/download.py
 
+import concurrent.futures
+import contextlib
+import json
 import os
+import re
 import requests
-import hashlib
 import logging
-from modules import db_manager
+import threading
+import time
+import urllib.parse
+import config
+from modules import blob_store, db_manager, hashing, http_client
+from modules.exceptions import DownloadError
 from rich.progress import Progress, BarColumn, TextColumn, DownloadColumn, TransferSpeedColumn, TimeRemainingColumn
 
 logger = logging.getLogger("ACRD")
 
-def download_file(url, destination):
-    """Downloads a file from a URL to a destination with a progress bar."""
+# A dropped connection loses at most the read in progress, so reads stay modest.
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Files are split into at most DOWNLOAD_CONNECTIONS ranges, none smaller than this.
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+SEGMENT_RETRIES = 4
+PROGRESS_SAVE_INTERVAL = 1.0
+REQUEST_TIMEOUT = (10, 60)  # connect, read
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+# A 416 to the probe of a zero-length file: there is no byte 0 to send.
+_EMPTY_RANGE = re.compile(r'bytes \*/0$')
+_seek_lock = threading.Lock()
+
+
+class BandwidthLimiter:
+    """
+    A token bucket shared by every download thread: consume(n) sleeps just long enough
+    to keep the combined rate at or under `rate` bytes/s (None or 0 means unlimited).
+    Up to one second's worth of bytes may go out in a burst.
+    """
+
+    def __init__(self, rate=None):
+        self._lock = threading.Lock()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate or None
+            self._allowance = float(rate or 0)
+            self._last = time.monotonic()
+
+    def consume(self, size):
+        with self._lock:
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate) - size
+            self._last = now
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+bandwidth = BandwidthLimiter(config.DOWNLOAD_BANDWIDTH_LIMIT)
+
+# At most config.DOWNLOAD_HOST_CONNECTIONS requests in flight per host, across all downloads.
+_host_slots = {}
+_host_slots_guard = threading.Lock()
+# One download per URL at a time: they share an incoming file in the blob store.
+_url_locks = {}
+
+
+@contextlib.contextmanager
+def _host_slot(url):
+    # Keyed by the limit too, so changing config.DOWNLOAD_HOST_CONNECTIONS takes effect.
+    key = (urllib.parse.urlsplit(url).netloc.lower(), max(1, config.DOWNLOAD_HOST_CONNECTIONS))
+    with _host_slots_guard:
+        slot = _host_slots.setdefault(key, threading.BoundedSemaphore(key[1]))
+    with slot:
+        yield
+
+
+def _url_lock(url):
+    with _host_slots_guard:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def _pwrite(fd, data, offset):
+    # os.pwrite is POSIX-only; elsewhere the ranges are written under a lock with seek+write.
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data, offset = data[written:], offset + written
+        return
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _pread(fd, size, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+class _ProgressMap:
+    """
+    The sidecar (<destination>.part.json) recording how much of each byte range has been
+    written, so an interrupted download resumes where it stopped. It also records the
+    file's size and validators (ETag/Last-Modified) so a changed file is not spliced.
+    """
+
+    def __init__(self, path, meta, segments):
+        self.path = path
+        self.meta = meta
+        self.segments = segments  # [[start, end (inclusive), bytes done], ...]
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved = time.monotonic()
+
+    @classmethod
+    def load(cls, path, meta):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('meta') != meta:
+            return None
+        return cls(path, meta, data['segments'])
+
+    def done(self):
+        with self._lock:
+            return sum(done for _, _, done in self.segments)
+
+    def contiguous(self):
+        """How many bytes from the start of the file have been written without a gap."""
+        end = 0
+        with self._lock:
+            for start, last, done in self.segments:
+                end = start + done
+                if end <= last:
+                    break
+        return end
+
+    def advance(self, index, size):
+        with self._lock:
+            self.segments[index][2] += size
+        if time.monotonic() - self._saved >= PROGRESS_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps({'meta': self.meta, 'segments': self.segments})
+                self._saved = time.monotonic()
+            temp = f"{self.path}.tmp"
+            with open(temp, 'w') as f:
+                f.write(data)
+            os.replace(temp, self.path)
+
+
+class _RangeHasher:
+    """
+    Hashes a segmented download in file order while it arrives. Bytes written at the hash
+    frontier are hashed straight from memory; ranges that finished ahead of it are read
+    back (normally from the page cache, just written) once the frontier reaches them.
+    """
+
+    def __init__(self, fd, progress_map, algorithms):
+        self.fd = fd
+        self.progress_map = progress_map
+        self.hasher = hashing.MultiHasher(algorithms)
+        self.frontier = 0
+        self._lock = threading.Lock()
+
+    def feed(self, offset, data):
+        # Never stall a download thread: whoever holds the lock (or finish) catches up.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if offset == self.frontier:
+                self.hasher.update(data)
+                self.frontier += len(data)
+            self._catch_up()
+        finally:
+            self._lock.release()
+
+    def _catch_up(self):
+        end = self.progress_map.contiguous()
+        while self.frontier < end:
+            data = _pread(self.fd, min(hashing.HASH_BUFFER_SIZE, end - self.frontier), self.frontier)
+            if not data:
+                raise DownloadError(f"{self.progress_map.path} is shorter than the bytes written to it")
+            self.hasher.update(data)
+            self.frontier += len(data)
+
+    def finish(self):
+        with self._lock:
+            self._catch_up()
+            return self.hasher.hexdigests()
+
+
+def _split(size, connections):
+    count = max(1, min(connections, -(-size // MIN_SEGMENT_SIZE)))
+    step = -(-size // count)
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+
+def _if_range_validator(validators):
+    """The If-Range value for the ranges: a strong ETag, else Last-Modified (RFC 7233 forbids weak ETags there)."""
+    etag = validators.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return validators.get('last_modified')
+
+
+def _fetch_segment(url, fd, progress_map, index, validator, progress, hasher):
+    """Fetches what is left of one byte range, retrying from where a dropped connection stopped."""
+    for attempt in range(SEGMENT_RETRIES + 1):
+        start, end, done = progress_map.segments[index]
+        if start + done > end:
+            return
+        headers = {'Range': f"bytes={start + done}-{end}"}
+        if validator:
+            headers['If-Range'] = validator
+        try:
+            with _host_slot(url), http_client.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    # A 200 to an If-Range request means the file changed on the server.
+                    raise DownloadError(f"{url} changed on the server or stopped honouring ranges")
+                offset = start + done
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    chunk = chunk[:end + 1 - offset]
+                    if not chunk:
+                        break
+                    _pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    progress_map.advance(index, len(chunk))
+                    hasher.feed(offset - len(chunk), chunk)
+                    if progress:
+                        progress(len(chunk))
+                    bandwidth.consume(len(chunk))
+            if progress_map.segments[index][0] + progress_map.segments[index][2] > end:
+                return
+            error = DownloadError(f"range {start}-{end} of {url} ended early")
+        except requests.exceptions.RequestException as e:
+            # Client errors will not go away on retry; dropped connections and 5xx may.
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code < 500:
+                raise
+            error = e
+        if attempt < SEGMENT_RETRIES:
+            logger.info(f"Retrying range {start}-{end} of {url} after: {error}")
+            time.sleep(min(2 ** attempt * 0.5, 8))
+    raise DownloadError(f"range {start}-{end} of {url} failed after {SEGMENT_RETRIES + 1} attempts: {error}")
+
+
+def _fetch_ranges(url, part, size, validators, connections, progress, algorithms):
+    sidecar = f"{part}.json"
+    meta = {'url': url, 'size': size, **validators}
+    progress_map = _ProgressMap.load(sidecar, meta) if os.path.exists(part) else None
+    if progress_map is None:
+        progress_map = _ProgressMap(sidecar, meta, _split(size, connections))
+        with open(part, 'wb') as f:
+            f.truncate(size)
+    else:
+        logger.info(f"Resuming {url} at {progress_map.done()} of {size} bytes")
+        if progress:
+            progress(progress_map.done())
+    progress_map.save()
+
+    validator = _if_range_validator(validators)
+    pending = [i for i, (start, end, done) in enumerate(progress_map.segments) if start + done <= end]
+    fd = os.open(part, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        hasher = _RangeHasher(fd, progress_map, algorithms)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(pending)),
+                                                   thread_name_prefix='acrd-download') as pool:
+            futures = [pool.submit(_fetch_segment, url, fd, progress_map, i, validator, progress, hasher)
+                       for i in pending]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        digests = hasher.finish()
+    finally:
+        os.close(fd)
+        progress_map.save()
+    os.remove(sidecar)
+    return digests
+
+
+def _fetch_single(response, part, progress, algorithms):
+    hasher = hashing.MultiHasher(algorithms)
+    with open(part, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            hasher.update(chunk)
+            if progress:
+                progress(len(chunk))
+            bandwidth.consume(len(chunk))
+    return hasher.hexdigests()
+
+
+def _download_single(response, part, destination, progress, on_size, algorithms):
+    """Writes a full (non-range) response to destination through part; returns its digests."""
+    if on_size:
+        on_size(int(response.headers.get('content-length', 0)) or None)
+    if os.path.exists(f"{part}.json"):
+        os.remove(f"{part}.json")
+    digests = _fetch_single(response, part, progress, algorithms)
+    os.replace(part, destination)
+    return digests
+
+
+def fetch(url, destination, connections=None, progress=None, on_size=None, algorithms=('sha256',),
+          on_validators=None):
+    """
+    Downloads url to destination. If the server supports byte ranges, the file is split
+    into up to `connections` ranges (default config.DOWNLOAD_CONNECTIONS) fetched in
+    parallel into a preallocated <destination>.part with pwrite; a sidecar progress map
+    lets an interrupted download resume. Otherwise it falls back to a single stream.
+    progress(bytes) is called as data arrives, on_size(total) once the size is known and
+    on_validators({'etag', 'last_modified'}) with the server's validators. The file is hashed
+    as it is written; returns {algorithm: hex digest}.
+    Every request counts against the per-host connection limit and every byte against
+    the shared bandwidth cap. Raises DownloadError or requests.RequestException.
+    """
+    connections = connections or config.DOWNLOAD_CONNECTIONS
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    part = f"{destination}.part"
+
+    # A one-byte range request tells whether ranges work, and the size, in one round trip.
+    with _host_slot(url), http_client.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                                          timeout=REQUEST_TIMEOUT) as probe:
+        empty = probe.status_code == 416 and _EMPTY_RANGE.match(probe.headers.get('Content-Range', ''))
+        if not empty:
+            probe.raise_for_status()
+            content_range = _CONTENT_RANGE.match(probe.headers.get('Content-Range', ''))
+            validators = {'etag': probe.headers.get('ETag'), 'last_modified': probe.headers.get('Last-Modified')}
+            if on_validators:
+                on_validators(validators)
+            if probe.status_code == 206 and content_range:
+                size = int(content_range.group(3))
+                # Reading the one byte lets the connection go back to the pool for the ranges.
+                probe.content
+            else:
+                # No range support: the probe already is the full response.
+                logger.info(f"{url} does not support ranges; downloading as a single stream")
+                return _download_single(probe, part, destination, progress, on_size, algorithms)
+
+    if empty:
+        # Nothing to split; a plain GET fetches the (empty) file and its validators.
+        logger.info(f"{url} is empty; downloading as a single stream")
+        with _host_slot(url), http_client.get(url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            if on_validators:
+                on_validators({'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')})
+            return _download_single(response, part, destination, progress, on_size, algorithms)
+
+    if on_size:
+        on_size(size)
+    digests = _fetch_ranges(url, part, size, validators, connections, progress, algorithms)
+    os.replace(part, destination)
+    return digests
+
+
+def download_file(url, destination, connections=None, algorithms=('sha256',), on_validators=None,
+                  progress=None, on_size=None):
+    """
+    Downloads a file from a URL to a destination with a progress bar, or reporting to the
+    caller's progress/on_size callbacks instead (see fetch). Returns the file's digests
+    ({algorithm: hex}, computed while downloading), or None on failure.
+    """
     logger.info(f"Downloading file from {url} to {destination}")
     try:
-        # Ensure the destination directory exists
-        os.makedirs(os.path.dirname(destination), exist_ok=True)
-        
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total_size = int(r.headers.get('content-length', 0))
-            
-            with Progress(
-                TextColumn("[bold blue]{task.description}"),
-                BarColumn(),
-                DownloadColumn(),
-                TransferSpeedColumn(),
-                TimeRemainingColumn(),
-            ) as progress:
-                task = progress.add_task(f"Downloading {os.path.basename(destination)}", total=total_size)
-                
-                with open(destination, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        progress.update(task, advance=len(chunk))
+        if progress:
+            digests = fetch(url, destination, connections, progress=progress, on_size=on_size,
+                            algorithms=algorithms, on_validators=on_validators)
+            logger.info(f"Successfully downloaded {destination}")
+            return digests
+        with Progress(
+            TextColumn("[bold blue]{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+        ) as progress:
+            task = progress.add_task(f"Downloading {os.path.basename(destination)}", total=None)
+            digests = fetch(url, destination, connections,
+                            progress=lambda size: progress.update(task, advance=size),
+                            on_size=lambda total: progress.update(task, total=total),
+                            algorithms=algorithms, on_validators=on_validators)
         logger.info(f"Successfully downloaded {destination}")
-        return True
-    except requests.exceptions.RequestException as e:
+        return digests
+    except (requests.exceptions.RequestException, DownloadError, OSError) as e:
         logger.error(f"Error downloading file {url}: {e}")
         print(f"Error downloading file: {e}")
-        return False
-
-def verify_checksum(file_path, checksum):
-    """Verifies the checksum of a downloaded file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest() == checksum
-
-def download_component(model, component, type):
-    """Downloads a specific component for a given model."""
+        return None
+
+def remote_etag(url):
+    """The ETag the server currently sends for url, or None if it sends none or cannot be asked."""
+    try:
+        with _host_slot(url):
+            response = http_client.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.headers.get('ETag')
+    except requests.exceptions.RequestException as e:
+        logger.info(f"Could not ask {url} for its ETag: {e}")
+        return None
+
+def download_component(model, component, type, progress=None, on_size=None):
+    """
+    Downloads a specific component for a given model into devices/<model>/<component>/.
+    The file itself lives in the shared blob store; when the store already holds it (by
+    the manifest checksum, or by URL and ETag when there is none) nothing is downloaded.
+    progress/on_size replace the progress bar (see fetch). Returns the device path, or
+    None if there is nothing to download or it failed.
+    """
     logger.info(f"Initiating download for {model}: {component} ({type})")
     # Get the URL from the database
     url_info = db_manager.get_url(model, component, type)
     if not url_info:
         logger.warning(f"No URL found for {component} {type} for model {model}")
         print(f"No URL found for {component} {type} for model {model}")
-        return
+        return None
 
     url = url_info['url']
     checksum = url_info.get('checksum')
@@ -64,21 +431,54 @@ def download_component(model, component, type):
     if "SEARCH_XDA" in url or "placeholder" in url:
         print(f"The URL for {component} ({type}) is currently a placeholder: {url}")
         print("Please provide a valid URL or check the database later.")
-        return
+        return None
 
     # Determine a proper destination path under devices/
     model_sanitized = model.replace(' ', '_')
     destination = f"devices/{model_sanitized}/{component}/{type}_{os.path.basename(url)}"
 
-    print(f"Starting download of {component} ({type})...")
-    if download_file(url, destination):
-        if checksum and not verify_checksum(destination, checksum):
+    algorithm, expected = 'sha256', None
+    if checksum:
+        try:
+            algorithm, expected = hashing.parse_checksum(checksum)
+        except ValueError as e:
+            logger.error(f"{component} {type} for {model}: {e}")
+            print(f"Cannot verify {component} ({type}): {e}")
+            return None
+
+    # A second request for the same URL waits here, then finds the first one's blob.
+    with _url_lock(url):
+        if expected:
+            blob = blob_store.find(algorithm, expected)
+        else:
+            blob = blob_store.find_source(url, remote_etag(url))
+        if blob:
+            method = blob_store.link(blob, destination)
+            print(f"{component} {type} is already downloaded; linked to {destination}")
+            db_manager.log_operation(model, f"Download {component} {type}",
+                                     f"Cached {os.path.basename(blob)} ({method}) at {destination}", "SUCCESS")
+            db_manager.set_url_verified(model, component, type, True)
+            return destination
+
+        print(f"Starting download of {component} ({type})...")
+        incoming = blob_store.incoming_path(url)
+        validators = {}
+        digests = download_file(url, incoming, algorithms=tuple(dict.fromkeys(('sha256', algorithm))),
+                                on_validators=validators.update, progress=progress, on_size=on_size)
+        if not digests:
+            return None
+        if expected and digests[algorithm] != expected:
             print("Checksum verification failed!")
+            # A bad download never enters the shared store.
+            if os.path.exists(incoming):
+                os.remove(incoming)
             # Log the failure
             db_manager.log_operation(model, f"Download {component} {type}", f"Checksum mismatch: {checksum}", "FAILED")
-        else:
-            print(f"Successfully downloaded {component} {type} to {destination}")
-            # Log the success
-            db_manager.log_operation(model, f"Download {component} {type}", f"Downloaded to {destination}", "SUCCESS")
-            # Update verified status in DB
-            db_manager.set_url_verified(model, component, type, True)
+            return None
+        blob_store.link(blob_store.add(incoming, digests, url=url, etag=validators.get('etag')), destination)
+    print(f"Successfully downloaded {component} {type} to {destination}")
+    # Log the success
+    db_manager.log_operation(model, f"Download {component} {type}", f"Downloaded to {destination}", "SUCCESS")
+    # Update verified status in DB
+    db_manager.set_url_verified(model, component, type, True)
+    return destination
@@ -0,0 +1,158 @@
+# modules/download_queue.py
+
+import concurrent.futures
+import contextlib
+import logging
+import threading
+
+from rich.console import Console
+from rich.progress import Progress, BarColumn, TextColumn, DownloadColumn, TransferSpeedColumn, TimeRemainingColumn
+from rich.table import Table
+
+import config
+from modules import db_manager, download
+
+logger = logging.getLogger("ACRD")
+
+console = Console()
+
+_PLACEHOLDERS = ("SEARCH_XDA", "placeholder")
+
+
+def enqueue(model, component, type, priority=0):
+    """Queues one component download (higher priority runs first) and returns its queue id."""
+    return db_manager.enqueue_download(model, component, type, priority)
+
+
+def enqueue_model(model, components=None, priority=0):
+    """Queues every component with a real URL for a model, or only the given components. Returns the ids."""
+    ids = []
+    for entry in db_manager.get_urls(model):
+        if components and entry['component'] not in components:
+            continue
+        if not entry['url'] or any(marker in entry['url'] for marker in _PLACEHOLDERS):
+            continue
+        ids.append(enqueue(model, entry['component'], entry['type'], priority))
+    return ids
+
+
+def enqueue_fleet(models, component, type, priority=0):
+    """Queues the same component for several models; identical files are downloaded once."""
+    return [enqueue(model, component, type, priority) for model in dict.fromkeys(models)]
+
+
+class _QueueDisplay:
+    """One Rich progress display for a queue run: a bar per download and one for the total."""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self._lock = threading.Lock()
+        self._known = 0
+        self._tasks = {}
+        self.total = progress.add_task("[bold]All downloads", total=0) if progress else None
+
+    def start(self, item):
+        if not self.progress:
+            return None
+        description = f"{item['model']}: {item['component']} ({item['type']})"
+        task = self.progress.add_task(description, total=None)
+        self._tasks[task] = {'description': description, 'total': None}
+        return task
+
+    def size(self, task, total):
+        if not self.progress or not total:
+            return
+        self.progress.update(task, total=total)
+        self._tasks[task]['total'] = total
+        with self._lock:
+            self._known += total
+            self.progress.update(self.total, total=self._known)
+
+    def advance(self, task, size):
+        if self.progress:
+            self.progress.update(task, advance=size)
+            self.progress.update(self.total, advance=size)
+
+    def finish(self, task, status):
+        if not self.progress:
+            return
+        if status == 'done':
+            done = self._tasks[task]['total'] or 1
+            self.progress.update(task, total=done, completed=done)
+        else:
+            self.progress.update(task, description=f"[red]{self._tasks[task]['description']} (failed)")
+
+
+def _run_one(item, display):
+    task = display.start(item)
+    destination, detail = None, None
+    try:
+        destination = download.download_component(
+            item['model'], item['component'], item['type'],
+            progress=lambda size: display.advance(task, size),
+            on_size=lambda total: display.size(task, total))
+        if destination is None:
+            detail = "not downloaded; see the log"
+    except Exception as e:  # One broken entry must not stop the rest of the queue.
+        logger.exception(f"Queued download {item['id']} crashed")
+        detail = f"{type(e).__name__}: {e}"
+    status = 'done' if destination else 'failed'
+    db_manager.finish_download(item['id'], status, destination, detail)
+    display.finish(task, status)
+    return {**item, 'status': status, 'destination': destination, 'detail': detail}
+
+
+def run_queue(workers=None, bandwidth=None, live=True):
+    """
+    Works through the persistent download queue until it is empty, highest priority
+    first, `workers` downloads at a time (default config.DOWNLOAD_WORKERS). All of them
+    share the bandwidth cap (bytes/s; default config.DOWNLOAD_BANDWIDTH_LIMIT) and the
+    per-host connection limit. Entries left running by an earlier process are retried
+    (and resume from their partial files). With live=True, progress is shown in one
+    Rich display. Returns this run's entries in the order they started.
+    """
+    workers = workers or config.DOWNLOAD_WORKERS
+    previous_rate = download.bandwidth.rate
+    if bandwidth is not None:
+        download.bandwidth.set_rate(bandwidth)
+    requeued = db_manager.requeue_interrupted_downloads()
+    if requeued:
+        logger.info(f"Retrying {requeued} download(s) interrupted by an earlier run")
+
+    claim_lock = threading.Lock()
+    started = []
+
+    def worker(display):
+        results = []
+        while True:
+            with claim_lock:
+                item = db_manager.claim_next_download()
+                if item is None:
+                    return results
+                started.append(item['id'])
+            results.append(_run_one(item, display))
+
+    columns = (TextColumn("{task.description}"), BarColumn(), DownloadColumn(), TransferSpeedColumn(),
+               TimeRemainingColumn())
+    try:
+        with (Progress(*columns, console=console) if live else contextlib.nullcontext()) as progress:
+            display = _QueueDisplay(progress)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers),
+                                                       thread_name_prefix='acrd-download-queue') as pool:
+                futures = [pool.submit(worker, display) for _ in range(max(1, workers))]
+                results = {r['id']: r for f in futures for r in f.result()}
+    finally:
+        if bandwidth is not None:
+            download.bandwidth.set_rate(previous_rate)
+    return [results[i] for i in started if i in results]
+
+
+def render_queue(items):
+    """A table of queue entries (as returned by db_manager.get_download_queue)."""
+    table = Table(title="Download queue")
+    for column in ("#", "Model", "Component", "Type", "Priority", "Status"):
+        table.add_column(column, justify="right" if column in ("#", "Priority") else "left")
+    for item in items:
+        table.add_row(str(item['id']), item['model'], item['component'], item['type'],
+                      str(item['priority']), item['status'])
+    return table
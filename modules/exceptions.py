@@ -12,3 +12,15 @@ class DatabaseError(ACRDError):
 
 class ToolError(ACRDError):
     """Errors raised by device tooling wrappers."""
+
+
+class AdbProtocolError(ToolError):
+    """Errors reported by the adb server over its host protocol."""
+
+
+class FastbootProtocolError(ToolError):
+    """Errors reported by a device (or transport) speaking the fastboot protocol."""
+
+
+class DownloadError(ACRDError):
+    """Errors raised while downloading a file (bad response, changed file, exhausted retries)."""
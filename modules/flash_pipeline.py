@@ -0,0 +1,282 @@
+# modules/flash_pipeline.py
+
+import concurrent.futures
+import json
+import logging
+import os
+import struct
+import time
+import zipfile
+
+from modules import db_manager, hashing
+from modules.exceptions import DatabaseError, ToolError
+import modules.hal as hal
+
+logger = logging.getLogger("ACRD")
+
+SPARSE_MAGIC = 0xED26FF3A
+# magic, major, minor, file header size, chunk header size, block size, total blocks, total chunks, checksum
+_SPARSE_HEADER = struct.Struct('<IHHHHIIII')
+# chunk type, reserved, size in blocks, total size in bytes (header included)
+_SPARSE_CHUNK = struct.Struct('<HHII')
+SPARSE_CHUNK_RAW = 0xCAC1
+SPARSE_CHUNK_FILL = 0xCAC2
+SPARSE_CHUNK_DONT_CARE = 0xCAC3
+SPARSE_CHUNK_CRC32 = 0xCAC4
+
+AVB_FOOTER_MAGIC = b'AVBf'
+# magic, version major, version minor, original image size, vbmeta offset, vbmeta size, reserved
+_AVB_FOOTER = struct.Struct('>4sIIQQQ28x')
+VBMETA_MAGIC = b'AVB0'
+# magic, libavb major, libavb minor, authentication block size, auxiliary block size
+_VBMETA_HEADER = struct.Struct('>4sIIQQ')
+VBMETA_HEADER_SIZE = 256
+
+_RAW_FORMATS = {
+    b'ANDROID!': 'boot',
+    b'VNDRBOOT': 'vendor_boot',
+    VBMETA_MAGIC: 'vbmeta',
+}
+
+
+def _inspect_sparse(f, file_size):
+    header = f.read(_SPARSE_HEADER.size)
+    if len(header) < _SPARSE_HEADER.size:
+        raise ToolError("truncated sparse header")
+    _, major, _, file_header_size, chunk_header_size, block_size, total_blocks, total_chunks, _ = _SPARSE_HEADER.unpack(header)
+    if major != 1 or file_header_size < _SPARSE_HEADER.size or chunk_header_size < _SPARSE_CHUNK.size or block_size % 4:
+        raise ToolError("unsupported sparse header")
+
+    # Walk the chunk headers (seeking over data) to catch truncated or corrupt images.
+    offset = file_header_size
+    blocks = 0
+    for _ in range(total_chunks):
+        f.seek(offset)
+        chunk = f.read(_SPARSE_CHUNK.size)
+        if len(chunk) < _SPARSE_CHUNK.size:
+            raise ToolError(f"sparse image truncated after {blocks} of {total_blocks} blocks")
+        chunk_type, _, chunk_blocks, total_size = _SPARSE_CHUNK.unpack(chunk)
+        if chunk_type not in (SPARSE_CHUNK_RAW, SPARSE_CHUNK_FILL, SPARSE_CHUNK_DONT_CARE, SPARSE_CHUNK_CRC32):
+            raise ToolError(f"unknown sparse chunk type {chunk_type:#x}")
+        if chunk_type == SPARSE_CHUNK_RAW and total_size != chunk_header_size + chunk_blocks * block_size:
+            raise ToolError("sparse raw chunk size mismatch")
+        blocks += chunk_blocks
+        offset += total_size
+    if blocks != total_blocks or offset > file_size:
+        raise ToolError(f"sparse image truncated after {blocks} of {total_blocks} blocks")
+    return block_size * total_blocks
+
+
+def _inspect_avb(f, file_size, image_format):
+    """Checks the AVB footer (or, for vbmeta images, the vbmeta header). Returns 'footer', 'vbmeta' or 'none'."""
+    if image_format == 'vbmeta':
+        f.seek(0)
+        _, _, _, auth_size, aux_size = _VBMETA_HEADER.unpack(f.read(_VBMETA_HEADER.size))
+        if VBMETA_HEADER_SIZE + auth_size + aux_size > file_size:
+            raise ToolError("vbmeta blocks extend past the end of the image")
+        return 'vbmeta'
+
+    if file_size < _AVB_FOOTER.size:
+        return 'none'
+    f.seek(file_size - _AVB_FOOTER.size)
+    magic, major, _, original_size, vbmeta_offset, vbmeta_size = _AVB_FOOTER.unpack(f.read(_AVB_FOOTER.size))
+    if magic != AVB_FOOTER_MAGIC:
+        return 'none'
+    if major != 1:
+        raise ToolError(f"unsupported AVB footer version {major}")
+    if original_size > file_size or vbmeta_offset + vbmeta_size > file_size:
+        raise ToolError("AVB footer points past the end of the image")
+    f.seek(vbmeta_offset)
+    if f.read(len(VBMETA_MAGIC)) != VBMETA_MAGIC:
+        raise ToolError("AVB footer does not point at a vbmeta blob")
+    return 'footer'
+
+
+def _inspect(f, file_size):
+    magic = f.read(8)
+    if len(magic) >= 4 and struct.unpack('<I', magic[:4])[0] == SPARSE_MAGIC:
+        f.seek(0)
+        # The AVB footer of a sparse image is inside its expanded data; fastboot checks it on the device.
+        return {'format': 'sparse', 'size': file_size, 'expanded_size': _inspect_sparse(f, file_size), 'avb': 'n/a'}
+    image_format = _RAW_FORMATS.get(magic) or _RAW_FORMATS.get(magic[:4]) or 'raw'
+    if file_size == 0:
+        raise ToolError("image is empty")
+    return {'format': image_format, 'size': file_size, 'expanded_size': file_size,
+            'avb': _inspect_avb(f, file_size, image_format)}
+
+
+def inspect_image(path, archive=None):
+    """
+    Parses an image's sparse or raw header and its AVB footer without reading the payload.
+    With archive (an image zip), path is a member name and is read in place, not extracted.
+    Returns {'format', 'size', 'expanded_size', 'avb'}; raises ToolError if the image is malformed.
+    """
+    try:
+        if archive:
+            with zipfile.ZipFile(archive) as z:
+                info = z.getinfo(path)
+                with z.open(info) as f:
+                    return _inspect(f, info.file_size)
+        with open(path, 'rb') as f:
+            return _inspect(f, os.path.getsize(path))
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        raise ToolError(f"cannot read {path}: {e}") from e
+    except struct.error as e:
+        raise ToolError(f"truncated header in {path}") from e
+
+
+def check_fit(snapshot, partition, expanded_size):
+    """
+    Raises ToolError if an image's expanded size exceeds the partition size from a
+    `getvar all` snapshot. Unknown and logical (super) partitions always pass.
+    """
+    info = hal.FastbootWrapper.partition_info(snapshot, partition)
+    if not info or info.get('is-logical') or 'size' not in info:
+        return
+    if expanded_size > info['size']:
+        raise ToolError(f"image is {expanded_size} bytes but {partition} holds {info['size']}")
+
+
+def slot_partition_name(snapshot, partition):
+    """The partition a flash will actually write: "boot" becomes "boot_a" on slot a of an A/B device."""
+    partitions = snapshot.get('partitions', {})
+    slot = snapshot.get('vars', {}).get('current-slot')
+    if partition in partitions or not slot:
+        return partition
+    slotted = f"{partition}_{slot.lstrip('_')}"
+    return slotted if slotted in partitions else partition
+
+
+def sha256_file(path):
+    """SHA-256 of a file, hashed on the shared HashService pool."""
+    return hashing.get_hash_service().submit(path).result()['sha256']
+
+
+def validate_image(snapshot, partition, path, digest=None):
+    """
+    Full pre-flash validation of one image: header, AVB footer, partition fit and SHA-256.
+    digest is a HashService future already hashing path, if there is one.
+    Returns a result dict whose 'error' is None when the image is good.
+    """
+    started = time.monotonic()
+    result = {'partition': partition, 'path': path, 'error': None}
+    try:
+        result.update(inspect_image(path))
+        check_fit(snapshot, partition, result['expanded_size'])
+        result['sha256'] = digest.result()['sha256'] if digest else sha256_file(path)
+    except (ToolError, OSError) as e:
+        result['error'] = str(e)
+    result['validate_seconds'] = round(time.monotonic() - started, 3)
+    return result
+
+
+_STATUS = {'flashed': 'SUCCESS', 'skipped': 'SKIPPED', 'failed': 'FAILED', 'invalid': 'FAILED'}
+
+
+def _record(serial, partition, result):
+    try:
+        db_manager.record_flashed_image(serial, partition, result['sha256'], result['size'])
+    except DatabaseError as e:
+        logger.warning(f"Could not record flashed image for {partition}: {e}")
+
+
+def _forget(serial, partition):
+    try:
+        db_manager.clear_flashed_images(serial, partition)
+    except DatabaseError as e:
+        logger.warning(f"Could not clear the flash record for {partition}: {e}")
+
+
+def log_event(model, operation, data, status):
+    """Writes a flash event to the logs table as JSON; a database problem never stops a flash."""
+    try:
+        db_manager.log_operation(model, operation, json.dumps(data, sort_keys=True), status)
+    except DatabaseError as e:
+        logger.warning(f"Could not log {operation}: {e}")
+
+
+def flash_images(fastboot, images, snapshot=None, model=None, progress=None, serial=None, incremental=False):
+    """
+    Flashes [(partition, path)] in order. Every image's header, AVB footer and size are
+    checked before the device is touched; then every image is queued on the shared hash
+    service, and while partition N is being written, a background worker fully validates
+    image N+1 (collecting its hash). The run stops at the first bad image or failed write.
+    Each partition's outcome is logged to the logs table.
+
+    With a serial, every successful write is recorded in the flashed_images table (and a
+    failed one clears the partition's record); with incremental=True, partitions whose
+    recorded image has the same SHA-256 and size are skipped. Returns (ok, results).
+    """
+    snapshot = snapshot if snapshot is not None else fastboot.getvar_all()
+    started = time.monotonic()
+    results = []
+    flashed_before = {}
+    if serial and incremental:
+        try:
+            flashed_before = db_manager.get_flashed_images(serial)
+        except DatabaseError as e:
+            logger.warning(f"Could not read flash history, flashing everything: {e}")
+
+    # Cheap structural preflight over every image, so a bad one fails before any write.
+    for partition, path in images:
+        try:
+            check_fit(snapshot, partition, inspect_image(path)['expanded_size'])
+        except ToolError as e:
+            result = {'partition': partition, 'path': path, 'error': str(e), 'status': 'invalid'}
+            log_event(model, 'fastboot_flash', result, 'INVALID')
+            log_event(model, 'fastboot_flash_run', {'partitions': [p for p, _ in images], 'failed': partition,
+                                               'seconds': round(time.monotonic() - started, 3)}, 'FAILED')
+            return False, [result]
+
+    ok = True
+    hashes = hashing.get_hash_service()
+    digests = {path: hashes.submit(path) for path in dict.fromkeys(path for _, path in images)}
+
+    def validate(index):
+        partition, path = images[index]
+        return validator.submit(validate_image, snapshot, partition, path, digests[path])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='acrd-validate') as validator:
+        pending = validate(0) if images else None
+        for index in range(len(images)):
+            result = pending.result()
+            # Start validating the next image before this one goes over the wire.
+            pending = validate(index + 1) if index + 1 < len(images) else None
+
+            target = slot_partition_name(snapshot, result['partition'])
+            previous = flashed_before.get(target)
+            if result['error']:
+                result['status'] = 'invalid'
+            elif previous and previous['sha256'] == result['sha256'] and previous['size'] == result['size']:
+                result['status'] = 'skipped'
+            else:
+                if progress:
+                    progress(result['partition'])
+                if serial:
+                    # Until this write succeeds the partition holds neither the old image nor the new one.
+                    _forget(serial, target)
+                flash_started = time.monotonic()
+                output = fastboot.flash(result['partition'], result['path'])
+                result['flash_seconds'] = round(time.monotonic() - flash_started, 3)
+                result['status'] = 'flashed' if output is not None else 'failed'
+                if output is None:
+                    result['error'] = "fastboot flash failed"
+                elif serial:
+                    _record(serial, target, result)
+            results.append(result)
+            log_event(model, 'fastboot_flash', result, _STATUS[result['status']])
+            if result['status'] not in ('flashed', 'skipped'):
+                ok = False
+                if pending:
+                    pending.cancel()
+                for digest in digests.values():
+                    digest.cancel()
+                break
+
+    log_event(model, 'fastboot_flash_run', {
+        'partitions': [p for p, _ in images],
+        'flashed': [r['partition'] for r in results if r['status'] == 'flashed'],
+        'skipped': [r['partition'] for r in results if r['status'] == 'skipped'],
+        'seconds': round(time.monotonic() - started, 3),
+    }, 'SUCCESS' if ok else 'FAILED')
+    return ok, results
@@ -0,0 +1,616 @@
+# modules/flash_plan.py
+
+import collections
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import shlex
+import struct
+import time
+import zipfile
+
+from modules import db_manager, flash_pipeline, hashing
+from modules.exceptions import DatabaseError, ToolError
+
+logger = logging.getLogger("ACRD")
+
+# action: 'flash', 'erase', 'set-active', 'wipe', 'update-super', 'wipe-super', 'reboot', 'reboot-bootloader'
+# or 'reboot-fastboot'.
+# image is a path, or a member name when archive (an image zip) is set. slot is None (current), 'a', 'b', 'all' or 'other'.
+FlashStep = collections.namedtuple('FlashStep', ['action', 'partition', 'image', 'archive', 'slot'],
+                                   defaults=(None, None, None, None))
+
+# Used when super_empty.img cannot be parsed: partitions that live inside super on current devices.
+DYNAMIC_PARTITIONS = {'system', 'system_ext', 'product', 'vendor', 'odm', 'vendor_dlkm', 'odm_dlkm', 'system_dlkm'}
+# Images `fastboot update` only writes as part of a wipe (-w).
+WIPE_ONLY_IMAGES = {'userdata', 'cache'}
+# Partitions that are flashed but not listed by `getvar all` (bootloader-internal).
+PSEUDO_PARTITIONS = {'bootloader', 'radio'}
+
+# liblp: geometry at 4 KiB (plus a backup copy), primary metadata for slot 0 right after.
+LP_GEOMETRY_OFFSET = 4096
+LP_METADATA_OFFSET = 4096 * 3
+LP_GEOMETRY_MAGIC = 0x616C4467
+LP_METADATA_MAGIC = 0x414C5030
+# magic, major, minor, header size, header checksum, tables size, tables checksum, then
+# (offset, entries, entry size) for the partition table.
+_LP_HEADER = struct.Struct('<IHHI32sI32sIII')
+LP_PARTITION_NAME_SIZE = 36
+
+
+class FlashPlan:
+    """An ordered list of FlashSteps plus the android-info.txt requirements they must satisfy."""
+
+    def __init__(self, source, kind):
+        self.source = source
+        self.kind = kind  # 'script' (flash-all.sh), 'update' (image zip) or 'images' (loose .img files)
+        self.steps = []
+        self.requirements = {}
+        self.warnings = []
+
+    def add(self, action, partition=None, image=None, archive=None, slot=None):
+        self.steps.append(FlashStep(action, partition, image, archive, slot))
+
+    def flashes(self):
+        return [step for step in self.steps if step.action == 'flash']
+
+    def is_simple(self):
+        """True if the plan only flashes loose image files on the current slot (no reboots, archives or slots)."""
+        return all(s.action == 'flash' and not s.archive and not s.slot for s in self.steps)
+
+    def to_json(self):
+        return json.dumps({'source': self.source, 'kind': self.kind, 'requirements': self.requirements,
+                           'steps': [step._asdict() for step in self.steps]}, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        plan = cls(data['source'], data['kind'])
+        plan.requirements = data.get('requirements', {})
+        plan.steps = [FlashStep(**step) for step in data['steps']]
+        return plan
+
+    def describe(self):
+        lines = []
+        for step in self.steps:
+            if step.action == 'flash':
+                source = f"{os.path.basename(step.archive)}:{step.image}" if step.archive else os.path.basename(step.image)
+                slot = f" (slot {step.slot})" if step.slot else ""
+                lines.append(f"flash {step.partition}{slot} <- {source}")
+            elif step.action == 'set-active':
+                lines.append(f"set active slot {step.slot or 'current'}")
+            elif step.action == 'erase':
+                lines.append(f"erase {step.partition}")
+            else:
+                lines.append(step.action)
+        return lines
+
+
+def parse_android_info(text):
+    """Parses android-info.txt `require key=v1|v2` lines into {key: [values]}."""
+    requirements = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith('require ') or '=' not in line:
+            continue
+        key, values = line[len('require '):].split('=', 1)
+        requirements[key.strip()] = [v.strip() for v in values.split('|') if v.strip()]
+    return requirements
+
+
+def logical_partitions(super_empty):
+    """Names of the partitions described by super_empty.img (liblp metadata), without slot suffixes."""
+    geometry_magic, = struct.unpack_from('<I', super_empty, LP_GEOMETRY_OFFSET)
+    if geometry_magic != LP_GEOMETRY_MAGIC:
+        raise ToolError("super_empty.img has no liblp geometry")
+    (magic, _, _, header_size, _, _, _,
+     table_offset, entries, entry_size) = _LP_HEADER.unpack_from(super_empty, LP_METADATA_OFFSET)
+    if magic != LP_METADATA_MAGIC:
+        raise ToolError("super_empty.img has no liblp metadata")
+    start = LP_METADATA_OFFSET + header_size + table_offset
+    names = set()
+    for i in range(entries):
+        raw = super_empty[start + i * entry_size:start + i * entry_size + LP_PARTITION_NAME_SIZE]
+        name = raw.split(b'\0', 1)[0].decode('ascii', errors='replace')
+        if name.endswith(('_a', '_b')):
+            name = name[:-2]
+        names.add(name)
+    return names
+
+
+def _add_images(plan, images, archive=None, super_empty=None, wipe=False, skip_reboot=True, slot=None):
+    """
+    Adds the steps `fastboot update` performs for a set of images ({partition: image}):
+    bootloader-level images first, then (with super_empty.img) a reboot into fastbootd,
+    a super layout update and the logical partitions, then the optional wipe and reboot.
+    """
+    logical = set()
+    if super_empty:
+        try:
+            data = _read(archive, super_empty)
+            logical = logical_partitions(data)
+        except (ToolError, struct.error, OSError, KeyError) as e:
+            plan.warnings.append(f"Could not read {super_empty} ({e}); assuming the usual dynamic partitions")
+            logical = set(DYNAMIC_PARTITIONS)
+
+    def target(name):
+        # system_other.img goes to the inactive slot's system partition.
+        return (name[:-len('_other')], 'other') if name.endswith('_other') else (name, slot)
+
+    names = sorted(n for n in images if n not in WIPE_ONLY_IMAGES)
+    for name in names:
+        partition, step_slot = target(name)
+        if partition not in logical:
+            plan.add('flash', partition, images[name], archive, step_slot)
+    if super_empty:
+        plan.add('reboot-fastboot')
+        # With -w the super layout is recreated from scratch, as `fastboot -w update` does.
+        plan.add('wipe-super' if wipe else 'update-super', 'super', super_empty, archive)
+        for name in names:
+            partition, step_slot = target(name)
+            if partition in logical:
+                plan.add('flash', partition, images[name], archive, step_slot)
+    if wipe:
+        plan.add('wipe')
+    if not skip_reboot:
+        plan.add('reboot')
+
+
+def _read(archive, image):
+    if archive:
+        with zipfile.ZipFile(archive) as z:
+            return z.read(image)
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+def _add_update(plan, zip_path, wipe=False, skip_reboot=False, slot=None):
+    """Expands `fastboot update image-*.zip` into steps; images stay inside the zip."""
+    try:
+        with zipfile.ZipFile(zip_path) as z:
+            names = z.namelist()
+            if 'android-info.txt' in names:
+                plan.requirements.update(parse_android_info(z.read('android-info.txt').decode(errors='replace')))
+    except (OSError, zipfile.BadZipFile) as e:
+        raise ToolError(f"Cannot read {zip_path}: {e}") from e
+    images = {n[:-len('.img')]: n for n in names if n.endswith('.img') and '/' not in n}
+    super_empty = images.pop('super_empty', None)
+    _add_images(plan, images, zip_path, super_empty, wipe, skip_reboot, slot)
+
+
+def parse_flash_all(text, rom_dir):
+    """
+    Interprets the fastboot commands of a factory image's flash-all.sh. Shell plumbing
+    (version checks, sleeps, echos) is ignored; anything else unrecognised becomes a warning.
+    """
+    plan = FlashPlan(rom_dir, 'script')
+    for line in text.splitlines():
+        try:
+            tokens = shlex.split(line, comments=True)
+        except ValueError:
+            plan.warnings.append(f"Cannot parse: {line.strip()}")
+            continue
+        if not tokens:
+            continue
+        if os.path.basename(tokens[0]) != 'fastboot':
+            if tokens[0] not in ('if', 'then', 'fi', 'else', 'sleep', 'echo', 'exit', 'set', '#!/bin/sh'):
+                plan.warnings.append(f"Ignored: {line.strip()}")
+            continue
+        _parse_fastboot_command(plan, tokens[1:], rom_dir, line.strip())
+    return plan
+
+
+def _parse_fastboot_command(plan, args, rom_dir, line):
+    wipe = skip_reboot = set_active = False
+    slot = active_slot = None
+    positional = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '-w':
+            wipe = True
+        elif arg == '--skip-reboot':
+            skip_reboot = True
+        elif arg.startswith('--slot='):
+            slot = arg.split('=', 1)[1]
+        elif arg == '--slot' and i + 1 < len(args):
+            slot = args[i + 1]
+            i += 1
+        elif arg == '--set-active' or arg.startswith('--set-active='):
+            set_active = True
+            active_slot = arg.split('=', 1)[1] if '=' in arg else None
+        elif arg == '-s' and i + 1 < len(args):
+            i += 1
+        elif arg.startswith('-'):
+            plan.warnings.append(f"Unsupported fastboot option {arg} in: {line}")
+        else:
+            positional.append(arg)
+        i += 1
+
+    first = len(plan.steps)
+    command, params = (positional[0], positional[1:]) if positional else (None, [])
+    if command == 'flash' and params:
+        image = params[1] if len(params) > 1 else f"{params[0]}.img"
+        plan.add('flash', params[0], os.path.join(rom_dir, image), slot=slot)
+    elif command == 'update' and params:
+        _add_update(plan, os.path.join(rom_dir, params[0]), wipe, skip_reboot, slot)
+        wipe = False  # Already part of the update steps.
+    elif command in ('reboot-bootloader', 'reboot-fastboot'):
+        plan.add(command)
+    elif command == 'reboot':
+        plan.add(f"reboot-{params[0]}" if params and params[0] in ('bootloader', 'fastboot') else 'reboot')
+    elif command == 'erase' and params:
+        plan.add('erase', params[0])
+    elif command in ('set_active', '--set-active') and params:
+        plan.add('set-active', slot=params[0])
+    elif command is not None:
+        plan.warnings.append(f"Unsupported fastboot command: {line}")
+
+    # fastboot wipes and switches slots after the command but before it reboots.
+    after = []
+    if wipe:
+        after.append(FlashStep('wipe'))
+    if set_active:
+        # A bare --set-active activates the --slot slot, or else the current one (slot None).
+        after.append(FlashStep('set-active', slot=active_slot or slot))
+    at = len(plan.steps)
+    if at > first and plan.steps[-1].action == 'reboot':
+        at -= 1
+    plan.steps[at:at] = after
+
+
+def build_plan(rom_path):
+    """
+    Builds a flash plan for a factory image: from flash-all.sh when present, else from
+    the image-*.zip it would `fastboot update`, else from the loose .img files.
+    """
+    script = os.path.join(rom_path, 'flash-all.sh')
+    if os.path.exists(script):
+        with open(script, 'r', errors='replace') as f:
+            return parse_flash_all(f.read(), rom_path)
+
+    zips = sorted(glob.glob(os.path.join(rom_path, 'image-*.zip')))
+    if zips:
+        plan = FlashPlan(rom_path, 'update')
+        _add_update(plan, zips[0], skip_reboot=True)
+        return plan
+
+    plan = FlashPlan(rom_path, 'images')
+    info = os.path.join(rom_path, 'android-info.txt')
+    if os.path.exists(info):
+        with open(info, 'r', errors='replace') as f:
+            plan.requirements = parse_android_info(f.read())
+    images = {name[:-len('.img')]: os.path.join(rom_path, name)
+              for name in os.listdir(rom_path) if name.endswith('.img')}
+    super_empty = images.pop('super_empty', None)
+    _add_images(plan, images, super_empty=super_empty)
+    return plan
+
+
+def validate_plan(plan, snapshot):
+    """
+    Checks a plan against the device before anything is written: android-info.txt
+    requirements (board, and bootloader/baseband versions unless the plan flashes
+    them), that every image exists and passes flash_pipeline.inspect_image (sparse
+    chunk map, AVB footer), and that bootloader-level images fit their partitions.
+    Images inside a zip are read in place. Returns a list of problems; empty means
+    the plan is good.
+    """
+    problems = []
+    device_vars = {k.lower(): v for k, v in snapshot.get('vars', {}).items()}
+    flashed = {step.partition: os.path.basename(step.image) for step in plan.flashes()}
+
+    for key, values in plan.requirements.items():
+        wanted = [v.lower() for v in values]
+        if key in ('board', 'product'):
+            current = device_vars.get('product')
+            if current is not None and current.lower() not in wanted:
+                problems.append(f"Image is for {'/'.join(values)}, but the device is {current}")
+        elif key in ('version-bootloader', 'version-baseband'):
+            partition = 'bootloader' if key == 'version-bootloader' else 'radio'
+            current = (device_vars.get(key) or '').lower()
+            image = flashed.get(partition, '').lower()
+            if current not in wanted and not any(v in image for v in wanted):
+                problems.append(f"Requires {key} {'/'.join(values)} (device has {current or 'unknown'}) "
+                                f"and the plan does not flash a matching {partition}")
+        elif key == 'partition-exists':
+            partitions = snapshot.get('partitions', {})
+            for name in values:
+                if partitions and not any(p == name or p.startswith(name + '_') for p in partitions):
+                    problems.append(f"Requires a {name} partition, which the device does not have")
+
+    in_fastbootd = False
+    for step in plan.steps:
+        if step.action == 'reboot-fastboot':
+            in_fastbootd = True
+        if step.action not in ('flash', 'update-super', 'wipe-super'):
+            continue
+        try:
+            size = flash_pipeline.inspect_image(step.image, step.archive)['expanded_size']
+        except ToolError as e:
+            problems.append(f"{step.partition}: image {step.image} is missing or invalid ({e})")
+            continue
+        # Logical partitions are sized by fastbootd; bootloader pseudo-partitions are not listed.
+        if step.action == 'flash' and not in_fastbootd and step.partition not in PSEUDO_PARTITIONS:
+            try:
+                flash_pipeline.check_fit(snapshot, step.partition, size)
+            except ToolError as e:
+                problems.append(f"{step.partition}: {e}")
+    return problems
+
+
+class _HashingReader:
+    """File object wrapper hashing everything read through it."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.name = getattr(fileobj, 'name', 'image')
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _resolve_slot(snapshot, slot):
+    """'a' or 'b' for a step's slot: None is the current slot and 'other' the inactive one."""
+    current = (snapshot.get('vars', {}).get('current-slot') or '').lstrip('_')
+    if slot == 'other':
+        slot = {'a': 'b', 'b': 'a'}.get(current)
+    elif slot is None:
+        slot = current
+    if not slot:
+        raise ToolError("the device does not report its current slot")
+    return slot.lstrip('_')
+
+
+def _written_partitions(snapshot, step):
+    """The partitions a flash step writes, named as in flashed_images (boot_a for boot on slot a)."""
+    if not step.slot:
+        return [flash_pipeline.slot_partition_name(snapshot, step.partition)]
+    partitions = snapshot.get('partitions', {})
+    if step.partition in partitions or f"{step.partition}_a" not in partitions:
+        return [step.partition]
+    if step.slot == 'all':
+        return [f"{step.partition}_a", f"{step.partition}_b"]
+    return [f"{step.partition}_{_resolve_slot(snapshot, step.slot)}"]
+
+
+def _image_identity(step):
+    """(sha256, size) of a step's image; zip members are hashed in place."""
+    if not step.archive:
+        return flash_pipeline.sha256_file(step.image), os.path.getsize(step.image)
+    with zipfile.ZipFile(step.archive) as z:
+        info = z.getinfo(step.image)
+        with z.open(info) as member:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: member.read(hashing.HASH_BUFFER_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest(), info.file_size
+
+
+def _image_size(step):
+    if not step.archive:
+        return os.path.getsize(step.image)
+    with zipfile.ZipFile(step.archive) as z:
+        return z.getinfo(step.image).file_size
+
+
+def _unchanged(step, targets, flashed_before):
+    """The image's SHA-256 if every partition the step writes already holds it (per flashed_images), else None."""
+    previous = [flashed_before.get(target) for target in targets]
+    if not previous or not all(previous) or any(p['size'] != _image_size(step) for p in previous):
+        return None
+    sha256, _ = _image_identity(step)
+    return sha256 if all(p['sha256'] == sha256 for p in previous) else None
+
+
+def _record(update, *args):
+    try:
+        update(*args)
+    except DatabaseError as e:
+        logger.warning(f"Could not update the flashed image records: {e}")
+
+
+def _forget_super(serial, snapshot, written, flashed_before):
+    """
+    Before super is wiped: clears the flashed_images records of the logical partitions
+    (every partition not written in this run if the device does not say which are logical).
+    """
+    try:
+        recorded = set(db_manager.get_flashed_images(serial))
+    except DatabaseError as e:
+        logger.warning(f"Could not read flash history: {e}")
+        recorded = set()
+    logical = {name for name, info in snapshot.get('partitions', {}).items() if info.get('is-logical')}
+    for name in (recorded | set(flashed_before)) - written:
+        if not logical or name in logical:
+            _record(db_manager.clear_flashed_images, serial, name)
+            flashed_before.pop(name, None)
+
+
+def _run_step(fastboot, step, archives):
+    if step.action == 'flash':
+        if not step.archive:
+            return fastboot.flash(step.partition, step.image, slot=step.slot), flash_pipeline.sha256_file(step.image)
+        archive = archives.setdefault(step.archive, zipfile.ZipFile(step.archive))
+        info = archive.getinfo(step.image)
+        with archive.open(info) as member:
+            reader = _HashingReader(member)
+            output = fastboot.flash_stream(step.partition, reader, info.file_size, slot=step.slot,
+                                           spool_dir=os.path.dirname(os.path.abspath(step.archive)))
+            return output, reader.digest.hexdigest()
+    if step.action in ('update-super', 'wipe-super'):
+        # super_empty.img is only metadata (a few KiB), so it is simply read into memory.
+        data = _read(step.archive, step.image)
+        output = fastboot.update_super(io.BytesIO(data), len(data), wipe=step.action == 'wipe-super',
+                                       spool_dir=os.path.dirname(os.path.abspath(step.archive or step.image)))
+        return output, hashlib.sha256(data).hexdigest()
+    if step.action == 'erase':
+        return fastboot.erase(step.partition), None
+    if step.action == 'set-active':
+        return fastboot.set_active(_resolve_slot(fastboot.getvar_all(), step.slot)), None
+    if step.action == 'wipe':
+        return fastboot.wipe(), None
+    if step.action == 'reboot':
+        return fastboot.reboot(), None
+    target = step.action.split('-', 1)[1]
+    output = fastboot.reboot(target)
+    if output is not None and not fastboot.wait_for_device():
+        return None, None
+    return output, None
+
+
+def step_fingerprint(step):
+    """
+    Cheap identity of a step's image: size and mtime for a file, size and CRC-32 from
+    the zip directory for a zip member. None for steps without an image.
+    """
+    if not step.image:
+        return None
+    try:
+        if step.archive:
+            with zipfile.ZipFile(step.archive) as z:
+                info = z.getinfo(step.image)
+            return f"{info.file_size}:{info.CRC:08x}"
+        stat = os.stat(step.image)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def _checkpoint(update, *args, **kwargs):
+    try:
+        update(*args, **kwargs)
+    except DatabaseError as e:
+        logger.warning(f"Could not checkpoint flash job: {e}")
+
+
+def start_job(plan, serial, boot_mode):
+    """Persists a plan as a checkpointed flash job for a device; returns the job id, or None if the DB is unavailable."""
+    steps = [(step.action, step.partition, step_fingerprint(step)) for step in plan.steps]
+    try:
+        return db_manager.create_flash_job(serial, boot_mode, plan.source, plan.to_json(), steps)
+    except DatabaseError as e:
+        logger.warning(f"Could not record flash job, it will not be resumable: {e}")
+        return None
+
+
+def find_resumable_job(serial, boot_mode):
+    """
+    Looks for an interrupted flash job for a device in the given boot mode. Steps that
+    completed are verified by fingerprint rather than rewritten; if any of their images
+    changed since, the job is not resumable. Returns (job, plan, start) or None, where
+    start is the index of the first incomplete step.
+    """
+    try:
+        job = db_manager.get_resumable_flash_job(serial, boot_mode)
+    except DatabaseError as e:
+        logger.warning(f"Could not read flash jobs: {e}")
+        return None
+    if not job:
+        return None
+    plan = FlashPlan.from_json(job['plan_json'])
+    start = next((i for i, step in enumerate(job['steps']) if step['status'] != 'done'), len(plan.steps))
+    if start >= len(plan.steps):
+        return None
+    for step, recorded in zip(plan.steps[:start], job['steps']):
+        if recorded['fingerprint'] != step_fingerprint(step):
+            logger.info(f"{step.image} changed since flash job {job['id']} was interrupted; not resuming it")
+            return None
+    return job, plan, start
+
+
+# The boot mode a device is left in after each kind of reboot step.
+_REBOOT_MODES = {'reboot-bootloader': 'fastboot', 'reboot-fastboot': 'fastbootd', 'reboot': 'adb'}
+
+
+def execute_plan(fastboot, plan, model=None, progress=None, job_id=None, start=0, serial=None, incremental=False):
+    """
+    Runs a validated plan through FastbootWrapper. Images inside the zip are streamed
+    out of it one at a time, never extracted as a whole. Stops at the first failing
+    step; every step is logged to the logs table. With a job_id (see start_job) each
+    step is checkpointed, and start skips steps a resumed job already completed.
+
+    With a serial, flashes are recorded in the flashed_images table like flash_images
+    does (erase and wipe-super clear what they destroy); with incremental=True, a flash
+    whose partitions already hold the same image is skipped with status 'unchanged'.
+    Returns (ok, results).
+    """
+    started = time.monotonic()
+    results = [{'action': step.action, 'partition': step.partition, 'image': step.image, 'archive': step.archive,
+                'slot': step.slot, 'status': 'skipped'} for step in plan.steps[:start]]
+    archives = {}
+    ok = True
+    flashed_before, written = {}, set()
+    if serial and incremental:
+        try:
+            flashed_before = db_manager.get_flashed_images(serial)
+        except DatabaseError as e:
+            logger.warning(f"Could not read flash history, flashing everything: {e}")
+    if job_id and start:
+        _checkpoint(db_manager.update_flash_job, job_id, status='running')
+    try:
+        for position, step in enumerate(plan.steps[start:], start):
+            if progress:
+                progress(step)
+            if job_id:
+                _checkpoint(db_manager.update_flash_job_step, job_id, position, 'running')
+            step_started = time.monotonic()
+            status = None
+            try:
+                targets = []
+                if serial and step.action in ('flash', 'erase'):
+                    targets = _written_partitions(fastboot.getvar_all(), step)
+                sha256 = _unchanged(step, targets, flashed_before) if step.action == 'flash' and incremental else None
+                if sha256:
+                    output, status = 'unchanged', 'unchanged'
+                    written.update(targets)
+                else:
+                    # Until a write succeeds its partitions hold neither the old image nor the new one.
+                    for target in targets:
+                        _record(db_manager.clear_flashed_images, serial, target)
+                        flashed_before.pop(target, None)
+                    if serial and step.action == 'wipe-super':
+                        _forget_super(serial, fastboot.getvar_all(), written, flashed_before)
+                    output, sha256 = _run_step(fastboot, step, archives)
+                    if output is not None and step.action == 'flash':
+                        for target in targets:
+                            _record(db_manager.record_flashed_image, serial, target, sha256, _image_size(step))
+                            written.add(target)
+            except (OSError, KeyError, zipfile.BadZipFile, ToolError) as e:
+                output, sha256 = None, None
+                logger.error(f"{step.action} {step.partition or ''} failed: {e}")
+            result = {
+                'action': step.action, 'partition': step.partition, 'image': step.image,
+                'archive': step.archive, 'slot': step.slot, 'sha256': sha256,
+                'seconds': round(time.monotonic() - step_started, 3),
+                'status': status or ('done' if output is not None else 'failed'),
+            }
+            results.append(result)
+            if job_id:
+                _checkpoint(db_manager.update_flash_job_step, job_id, position,
+                            'done' if status == 'unchanged' else result['status'], sha256)
+                if output is not None and step.action in _REBOOT_MODES:
+                    _checkpoint(db_manager.update_flash_job, job_id, boot_mode=_REBOOT_MODES[step.action])
+            flash_pipeline.log_event(model, 'fastboot_plan_step', result, 'SUCCESS' if output is not None else 'FAILED')
+            if output is None:
+                ok = False
+                break
+    finally:
+        for archive in archives.values():
+            archive.close()
+    if job_id:
+        _checkpoint(db_manager.update_flash_job, job_id, status='done' if ok else 'failed')
+
+    flash_pipeline.log_event(model, 'fastboot_plan_run', {
+        'source': plan.source, 'kind': plan.kind, 'steps': len(plan.steps),
+        'completed': sum(1 for r in results if r['status'] == 'done'),
+        'unchanged': [r['partition'] for r in results if r['status'] == 'unchanged'], 'resumed_at': start, 'job': job_id,
+        'seconds': round(time.monotonic() - started, 3),
+    }, 'SUCCESS' if ok else 'FAILED')
+    return ok, results
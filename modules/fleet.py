@@ -0,0 +1,280 @@
+# modules/fleet.py
+
+import concurrent.futures
+import fnmatch
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from rich.console import Console
+from rich.live import Live
+from rich.prompt import Confirm
+from rich.table import Table
+
+import config
+from modules import backup, db_manager, device_quarry, diagnostic, flash_plan
+from modules.exceptions import DatabaseError, ToolError
+import modules.hal as hal
+
+logger = logging.getLogger("ACRD")
+
+console = Console()
+
+_STATE_STYLES = {'queued': 'dim', 'waiting': 'yellow', 'running': 'cyan', 'done': 'green', 'failed': 'red'}
+
+# One operation per device at a time, whichever fleet run (or thread) asks for it.
+_device_locks = {}
+_device_locks_guard = threading.Lock()
+
+
+def device_lock(serial):
+    """The lock that serializes fleet operations on one device."""
+    with _device_locks_guard:
+        return _device_locks.setdefault(serial, threading.Lock())
+
+
+def _safe_name(serial):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', serial)
+
+
+def _device_dir(device_info, kind):
+    model = (device_info.get('model') or 'unknown_device').replace(' ', '_')
+    return os.path.join('devices', model, kind)
+
+
+def _require_mode(device_info, *modes):
+    if device_info.get('boot_mode') not in modes:
+        raise ToolError(f"needs a device in {' or '.join(modes)} mode, not {device_info.get('boot_mode')}")
+
+
+def quarry(device_info, report, options):
+    """Re-reads the device's properties/variables and stores its profile."""
+    if device_info.get('boot_mode') == 'adb':
+        info = device_quarry.quarry_adb(hal.AdbWrapper(config.ADB_PATH, serial=device_info['serial']))
+    else:
+        _require_mode(device_info, 'fastboot', 'fastbootd')
+        info = device_quarry.quarry_fastboot(hal.FastbootWrapper(config.FASTBOOT_PATH, serial=device_info['serial']))
+    if not info:
+        raise ToolError("device did not answer")
+    device_info.update(info)
+    db_manager.insert_device_profile(info)
+    return f"{info['model']} {info.get('firmware') or ''}".strip()
+
+
+def diagnostics(device_info, report, options):
+    """Root, battery, storage and SELinux checks in one shell session."""
+    _require_mode(device_info, 'adb')
+    summary = diagnostic.collect_diagnostics(hal.AdbWrapper(config.ADB_PATH, serial=device_info['serial']))
+    return (f"root {'yes' if summary['root'] else 'no'}, battery {summary['battery'] or '?'}%, "
+            f"SELinux {summary['selinux'] or '?'}")
+
+
+def flash(device_info, report, options):
+    """
+    Builds, validates and runs the flash plan for options['rom'] as a checkpointed job.
+    An interrupted job for the same ROM is resumed instead of starting over.
+    """
+    _require_mode(device_info, 'fastboot', 'fastbootd')
+    rom = options.get('rom')
+    if not rom or not os.path.isdir(rom):
+        raise ToolError("flashing needs a ROM folder (--rom)")
+    serial = device_info['serial']
+    fastboot = hal.FastbootWrapper(config.FASTBOOT_PATH, serial=serial)
+
+    resumable = flash_plan.find_resumable_job(serial, device_info['boot_mode'])
+    if resumable and resumable[0]['source'] == rom:
+        job, plan, start = resumable
+        job_id = job['id']
+        report(f"resuming at step {start + 1}/{len(plan.steps)}")
+    else:
+        plan = flash_plan.build_plan(rom)
+        if not plan.flashes():
+            raise ToolError(f"no images to flash in {rom}")
+        problems = flash_plan.validate_plan(plan, fastboot.getvar_all())
+        if problems:
+            raise ToolError("; ".join(problems))
+        job_id, start = flash_plan.start_job(plan, serial, device_info['boot_mode']), 0
+
+    def progress(step):
+        report(f"{step.action} {step.partition or ''}".strip())
+
+    ok, results = flash_plan.execute_plan(fastboot, plan, model=device_info.get('model'), progress=progress,
+                                          job_id=job_id, start=start, serial=serial,
+                                          incremental=config.FLASH_INCREMENTAL)
+    if not ok:
+        failed = results[-1]
+        raise ToolError(f"{failed['action']} {failed['partition'] or ''}".strip() + " failed")
+    unchanged = sum(1 for r in results if r['status'] == 'unchanged')
+    return f"{sum(1 for r in results if r['status'] == 'done')} steps" + (f", {unchanged} unchanged" if unchanged else "")
+
+
+def backup_partitions(device_info, report, options):
+    """Backs up the critical partitions into devices/<model>/backups/<timestamp>-<serial>/."""
+    _require_mode(device_info, 'adb')
+    dest_dir = os.path.join(_device_dir(device_info, 'backups'),
+                            f"{time.strftime('%Y%m%d-%H%M%S')}-{_safe_name(device_info['serial'])}")
+    report(f"to {dest_dir}")
+    # Status lines go to the device's row; printing them would tear the live table.
+    messages = []
+    def progress(message):
+        messages.append(message)
+        report(message)
+    manifest = backup.backup_device(device_info, dest_dir=dest_dir, progress=progress)
+    if manifest is None:
+        raise ToolError(messages[-1] if messages else "backup failed")
+    failed = [e['partition'] for e in manifest['partitions'] if e['status'] != 'ok']
+    if failed:
+        raise ToolError(f"backup of {', '.join(failed)} failed")
+    return f"{len(manifest['partitions'])} partitions in {manifest['seconds']}s"
+
+
+def capture_logcat(device_info, report, options):
+    """Dumps the device's logcat buffers to devices/<model>/logs/logcat-<serial>-<timestamp>.txt."""
+    _require_mode(device_info, 'adb')
+    adb = hal.AdbWrapper(config.ADB_PATH, serial=device_info['serial'])
+    log_dir = _device_dir(device_info, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, f"logcat-{_safe_name(device_info['serial'])}-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+    lines = 0
+    with open(path, 'w') as f:
+        for line in adb.iter_shell_lines("logcat -d"):
+            f.write(line + "\n")
+            lines += 1
+            if lines % 5000 == 0:
+                report(f"{lines} lines")
+    if adb.last_returncode not in (0, None):
+        raise ToolError(f"logcat exited with {adb.last_returncode}")
+    return f"{lines} lines to {path}"
+
+
+# name -> function(device_info, report, options) returning a one-line summary; raises ToolError on failure.
+OPERATIONS = {
+    'quarry': quarry,
+    'diagnostics': diagnostics,
+    'flash': flash,
+    'backup': backup_partitions,
+    'logcat': capture_logcat,
+}
+
+
+# Operations that write to, or read raw partitions of, every selected device.
+CONFIRM_OPERATIONS = ('flash', 'backup')
+
+
+def confirm_operation(devices, operation, assume_yes=False):
+    """
+    Lists the devices a flash or backup is about to touch and asks before it starts.
+    Returns True if the operation may go ahead (always for other operations, or with assume_yes).
+    """
+    if operation not in CONFIRM_OPERATIONS or assume_yes:
+        return True
+    console.print(f"[bold]{operation} will run on {len(devices)} device(s):[/bold]")
+    for device in devices:
+        console.print(f"  {device['serial']}  {device.get('model') or ''} ({device.get('boot_mode')})")
+    if operation == 'flash':
+        console.print("[bold red]WARNING: Flashing can wipe data and potentially brick these devices. "
+                      "Make sure every one is adequately charged.[/bold red]")
+    return Confirm.ask(f"Run {operation} on all {len(devices)} device(s)?", default=False)
+
+
+def select_devices(devices, pattern=None, modes=None):
+    """
+    Devices that can be addressed by serial, optionally only those whose serial or
+    model matches a shell-style pattern and whose boot mode is in modes.
+    """
+    selected, seen = [], set()
+    for device in devices:
+        if not device or not device.get('serial') or device['serial'] in seen:
+            continue
+        if modes and device.get('boot_mode') not in modes:
+            continue
+        if pattern and not any(fnmatch.fnmatchcase((device.get(key) or '').lower(), pattern.lower())
+                               for key in ('serial', 'model')):
+            continue
+        seen.add(device['serial'])
+        selected.append(device)
+    return selected
+
+
+class FleetRun:
+    """Per-device state of one fleet operation, safe to update from worker threads."""
+
+    def __init__(self, operation, devices):
+        self.operation = operation
+        self._lock = threading.Lock()
+        self.rows = {
+            d['serial']: {'serial': d['serial'], 'model': d.get('model'), 'mode': d.get('boot_mode'),
+                          'state': 'queued', 'detail': '', 'seconds': None}
+            for d in devices
+        }
+
+    def update(self, serial, **fields):
+        with self._lock:
+            self.rows[serial].update(fields)
+
+    def results(self):
+        with self._lock:
+            return [dict(row) for row in self.rows.values()]
+
+    def render(self):
+        table = Table(title=f"Fleet: {self.operation}")
+        for column in ("Serial", "Model", "Mode", "State", "Detail", "Time"):
+            table.add_column(column, justify="right" if column == "Time" else "left")
+        for row in self.results():
+            seconds = f"{row['seconds']:.1f}s" if row['seconds'] is not None else ""
+            table.add_row(row['serial'], row['model'] or "", row['mode'] or "",
+                          f"[{_STATE_STYLES[row['state']]}]{row['state']}[/]", row['detail'], seconds)
+        return table
+
+
+def _run_one(run, operation, device_info, options):
+    serial = device_info['serial']
+    lock = device_lock(serial)
+    if not lock.acquire(blocking=False):
+        run.update(serial, state='waiting', detail="another operation holds the device")
+        lock.acquire()
+    started = time.monotonic()
+    run.update(serial, state='running', detail='')
+    try:
+        detail = OPERATIONS[operation](device_info, lambda text: run.update(serial, detail=text), options)
+        state = 'done'
+    except (ToolError, DatabaseError, OSError) as e:
+        detail, state = str(e), 'failed'
+    except Exception as e:  # One misbehaving device must not take the rest of the fleet down.
+        logger.exception(f"Fleet {operation} on {serial} crashed")
+        detail, state = f"{type(e).__name__}: {e}", 'failed'
+    finally:
+        lock.release()
+    run.update(serial, state=state, detail=detail, seconds=round(time.monotonic() - started, 3))
+    try:
+        db_manager.log_operation(device_info.get('model'), f"fleet_{operation}",
+                                 json.dumps({'serial': serial, 'detail': detail}), 'SUCCESS' if state == 'done' else 'FAILED')
+    except DatabaseError as e:
+        logger.warning(f"Could not log fleet {operation} for {serial}: {e}")
+
+
+def run_fleet(devices, operation, options=None, concurrency=None, live=True):
+    """
+    Runs one operation on every device concurrently: at most `concurrency` devices at
+    once (default config.FLEET_CONCURRENCY), never two operations on the same device,
+    and each tool call still goes through the HAL scheduler. With live=True a per-device
+    progress table is shown while it runs. Returns the per-device result rows.
+    """
+    if operation not in OPERATIONS:
+        raise ToolError(f"Unknown fleet operation '{operation}' (choose from {', '.join(OPERATIONS)})")
+    options = options or {}
+    concurrency = concurrency or config.FLEET_CONCURRENCY
+    run = FleetRun(operation, devices)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='acrd-fleet') as pool:
+        futures = [pool.submit(_run_one, run, operation, device, options) for device in devices]
+        if live:
+            with Live(run.render(), console=console, refresh_per_second=4) as display:
+                while not all(f.done() for f in futures):
+                    concurrent.futures.wait(futures, timeout=0.25)
+                    display.update(run.render())
+        concurrent.futures.wait(futures)
+    return run.results()
@@ -1,5 +1,34 @@
+from .adb_protocol import AdbServerClient
 from .adb_wrapper import AdbWrapper
+from .async_wrapper import AsyncAdbWrapper, AsyncFastbootWrapper, AsyncHeimdallWrapper, AsyncToolWrapper
+from .device_watcher import DeviceWatcher, get_device_watcher, start_device_watcher, stop_device_watcher
+from .fastboot_protocol import FastbootClient
 from .fastboot_wrapper import FastbootWrapper
 from .heimdall_wrapper import HeimdallWrapper
+from .pit import PitEntry, PitTable, parse_pit
+from .scheduler import ToolScheduler, get_scheduler
+from .stats import HalStats, LatencyHistogram, get_hal_stats
 
-__all__ = ["AdbWrapper", "FastbootWrapper", "HeimdallWrapper"]
+__all__ = [
+    "AdbServerClient",
+    "AdbWrapper",
+    "AsyncAdbWrapper",
+    "AsyncFastbootWrapper",
+    "AsyncHeimdallWrapper",
+    "AsyncToolWrapper",
+    "DeviceWatcher",
+    "FastbootClient",
+    "FastbootWrapper",
+    "HalStats",
+    "HeimdallWrapper",
+    "LatencyHistogram",
+    "PitEntry",
+    "PitTable",
+    "ToolScheduler",
+    "get_device_watcher",
+    "get_hal_stats",
+    "get_scheduler",
+    "parse_pit",
+    "start_device_watcher",
+    "stop_device_watcher",
+]
@@ -0,0 +1,352 @@
+# modules/hal/adb_protocol.py
+
+from __future__ import annotations
+
+import os
+import socket
+import struct
+import threading
+import time
+
+from modules.exceptions import AdbProtocolError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+
+# The sync protocol caps a single DATA packet at 64 KiB.
+SYNC_DATA_MAX = 64 * 1024
+
+# Shell protocol v2 packets: id, payload length, payload.
+_SHELL_PACKET = struct.Struct("<BI")
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+# Shell v1 has no exit status; the fallback echoes it after this marker.
+_SHELL_V1_EXIT_MARKER = "::acrd-exit::"
+
+
+class _ConnectionClosed(AdbProtocolError):
+    """The adb server closed the socket mid-exchange."""
+
+
+class AdbServerClient:
+    """
+    Pure-Python client for the adb host protocol.
+
+    Talks to the local adb server over its socket instead of forking the adb
+    binary for every command. Sync sessions are kept open per device serial and
+    reused across push/pull/stat calls.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sync_sockets: dict[str | None, socket.socket] = {}
+        self._sync_locks: dict[str | None, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._available: bool | None = None
+        self._available_checked = 0.0
+
+    # --- Framing helpers ---
+
+    def _connect(self) -> socket.socket:
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as exc:
+            raise AdbProtocolError(f"Could not reach adb server at {self.host}:{self.port}: {exc}") from exc
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise _ConnectionClosed("Connection closed by adb server")
+            data += chunk
+        return bytes(data)
+
+    @staticmethod
+    def _send_request(sock: socket.socket, payload: str):
+        data = payload.encode("utf-8")
+        sock.sendall(f"{len(data):04x}".encode("ascii") + data)
+
+    def _read_length_prefixed(self, sock: socket.socket) -> str:
+        length = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, length).decode("utf-8", errors="replace")
+
+    def _read_status(self, sock: socket.socket):
+        status = self._recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbProtocolError(self._read_length_prefixed(sock))
+        raise AdbProtocolError(f"Unexpected adb server status: {status!r}")
+
+    # --- Host and device services ---
+
+    def is_available(self, ttl: float = 5.0) -> bool:
+        """Returns True if the adb server answers on its socket (cached for ttl seconds)."""
+        now = time.monotonic()
+        if self._available is None or now - self._available_checked > ttl:
+            try:
+                self.host_command("host:version")
+                self._available = True
+            except AdbProtocolError:
+                self._available = False
+            self._available_checked = now
+        return self._available
+
+    def host_command(self, service: str) -> str:
+        """Runs a host service (e.g. host:devices) and returns its length-prefixed reply."""
+        sock = self._connect()
+        try:
+            self._send_request(sock, service)
+            self._read_status(sock)
+            return self._read_length_prefixed(sock)
+        finally:
+            sock.close()
+
+    def devices(self) -> list[tuple[str, str]]:
+        """Lists (serial, state) pairs known to the adb server."""
+        devices = []
+        for line in self.host_command("host:devices").splitlines():
+            if "\t" in line:
+                serial, state = line.split("\t", 1)
+                devices.append((serial.strip(), state.strip()))
+        return devices
+
+    def open_track_devices(self) -> socket.socket:
+        """Opens a host:track-devices-l stream; read updates with read_track_update()."""
+        sock = self._connect()
+        try:
+            self._send_request(sock, "host:track-devices-l")
+            self._read_status(sock)
+        except (OSError, AdbProtocolError):
+            sock.close()
+            raise
+        # Updates only arrive when something changes, so block indefinitely between them.
+        sock.settimeout(None)
+        return sock
+
+    def read_track_update(self, sock: socket.socket) -> str:
+        """Blocks until the server pushes the next full device list on a track stream."""
+        return self._read_length_prefixed(sock)
+
+    @staticmethod
+    def parse_device_list(text: str) -> list[dict]:
+        """Parses `devices -l` style lines into dicts (serial, state and key:value attributes)."""
+        devices = []
+        for line in text.splitlines():
+            tokens = line.split()
+            if len(tokens) < 2:
+                continue
+            device = {'serial': tokens[0]}
+            attributes = tokens[1:]
+            state = []
+            while attributes and ":" not in attributes[0]:
+                state.append(attributes.pop(0))
+            device['state'] = ' '.join(state)
+            for token in attributes:
+                key, _, value = token.partition(":")
+                device[key] = value
+            devices.append(device)
+        return devices
+
+    def open_service(self, serial: str | None, service: str) -> socket.socket:
+        """Switches a fresh connection to the device transport and opens a service on it."""
+        sock = self._connect()
+        try:
+            self._send_request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+            self._read_status(sock)
+            self._send_request(sock, service)
+            self._read_status(sock)
+        except (OSError, AdbProtocolError):
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _arm_deadline(sock: socket.socket, deadline: float | None):
+        if deadline is None:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("adb shell deadline passed")
+        sock.settimeout(remaining)
+
+    def shell(self, serial: str | None, command: str, timeout: float | None = None) -> tuple[str, int]:
+        """
+        Runs a shell command and returns (stdout, exit status). Uses shell protocol v2,
+        which keeps stderr apart and reports the exit status; devices without it get a
+        v1 shell with the status echoed after the output. timeout is an overall
+        deadline in seconds, past which socket.timeout is raised.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            sock = self.open_service(serial, f"shell,v2,raw:{command}")
+        except _ConnectionClosed:
+            raise
+        except AdbProtocolError:
+            return self._shell_v1(serial, command, deadline)
+        try:
+            stdout = bytearray()
+            while True:
+                self._arm_deadline(sock, deadline)
+                packet_id, length = _SHELL_PACKET.unpack(self._recv_exact(sock, _SHELL_PACKET.size))
+                self._arm_deadline(sock, deadline)
+                data = self._recv_exact(sock, length)
+                if packet_id == SHELL_STDOUT:
+                    stdout += data
+                elif packet_id == SHELL_EXIT:
+                    return stdout.decode("utf-8", errors="replace"), data[0] if data else 0
+        finally:
+            sock.close()
+
+    def _shell_v1(self, serial: str | None, command: str, deadline: float | None) -> tuple[str, int]:
+        sock = self.open_service(serial, f"shell:{command}; echo {_SHELL_V1_EXIT_MARKER}$?")
+        try:
+            chunks = []
+            while True:
+                self._arm_deadline(sock, deadline)
+                chunk = sock.recv(SYNC_DATA_MAX)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+        output, marker, status = b"".join(chunks).decode("utf-8", errors="replace").rpartition(_SHELL_V1_EXIT_MARKER)
+        if not marker or not status.strip().isdigit():
+            raise AdbProtocolError("Shell output ended without an exit status")
+        return output, int(status.strip())
+
+    # --- Sync service ---
+
+    def _sync_lock(self, serial: str | None) -> threading.Lock:
+        with self._lock:
+            return self._sync_locks.setdefault(serial, threading.Lock())
+
+    def _sync_socket(self, serial: str | None) -> socket.socket:
+        sock = self._sync_sockets.get(serial)
+        if sock is None:
+            sock = self.open_service(serial, "sync:")
+            self._sync_sockets[serial] = sock
+        return sock
+
+    def _drop_sync_socket(self, serial: str | None):
+        sock = self._sync_sockets.pop(serial, None)
+        if sock is not None:
+            sock.close()
+
+    def _sync_call(self, serial: str | None, operation):
+        """Runs operation(sock) on the cached sync session, reconnecting once if it went stale."""
+        with self._sync_lock(serial):
+            for attempt in range(2):
+                sock = self._sync_socket(serial)
+                try:
+                    return operation(sock)
+                except (OSError, _ConnectionClosed) as exc:
+                    self._drop_sync_socket(serial)
+                    if attempt:
+                        raise AdbProtocolError(f"Sync session to {serial} failed: {exc}") from exc
+                except AdbProtocolError:
+                    # A FAIL leaves the session in an undefined state on some adbd versions.
+                    self._drop_sync_socket(serial)
+                    raise
+
+    @staticmethod
+    def _sync_send(sock: socket.socket, request_id: bytes, data: bytes = b""):
+        sock.sendall(request_id + struct.pack("<I", len(data)) + data)
+
+    def _sync_read_header(self, sock: socket.socket) -> tuple[bytes, int]:
+        header = self._recv_exact(sock, 8)
+        return header[:4], struct.unpack("<I", header[4:])[0]
+
+    def _sync_raise_fail(self, sock: socket.socket, length: int):
+        message = self._recv_exact(sock, length).decode("utf-8", errors="replace")
+        raise AdbProtocolError(message)
+
+    def stat(self, serial: str | None, remote_path: str) -> tuple[int, int, int]:
+        """Returns (mode, size, mtime) for a remote path; mode is 0 if it does not exist."""
+        def operation(sock):
+            self._sync_send(sock, b"STAT", remote_path.encode("utf-8"))
+            response = self._recv_exact(sock, 16)
+            if response[:4] != b"STAT":
+                raise AdbProtocolError(f"Unexpected sync response: {response[:4]!r}")
+            return struct.unpack("<III", response[4:])
+        return self._sync_call(serial, operation)
+
+    def push(self, serial: str | None, local_path: str, remote_path: str, mode: int | None = None) -> int:
+        """Pushes a local file to the device. Returns the number of bytes sent."""
+        if remote_path.endswith("/"):
+            remote_path += os.path.basename(local_path)
+        if mode is None:
+            mode = os.stat(local_path).st_mode & 0o777
+        mtime = int(os.path.getmtime(local_path))
+
+        def operation(sock):
+            sent = 0
+            self._sync_send(sock, b"SEND", f"{remote_path},{mode:d}".encode("utf-8"))
+            with open(local_path, "rb") as f:
+                for chunk in iter(lambda: f.read(SYNC_DATA_MAX), b""):
+                    self._sync_send(sock, b"DATA", chunk)
+                    sent += len(chunk)
+            sock.sendall(b"DONE" + struct.pack("<I", mtime))
+            status, length = self._sync_read_header(sock)
+            if status == b"FAIL":
+                self._sync_raise_fail(sock, length)
+            if status != b"OKAY":
+                raise AdbProtocolError(f"Unexpected sync response: {status!r}")
+            return sent
+        return self._sync_call(serial, operation)
+
+    def pull(self, serial: str | None, remote_path: str, local_path: str) -> int:
+        """
+        Pulls a remote file to the host. Returns the number of bytes received.
+        The file is received into <local_path>.part and only replaces local_path once complete.
+        """
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, os.path.basename(remote_path))
+        partial = f"{local_path}.part"
+
+        def operation(sock):
+            received = 0
+            self._sync_send(sock, b"RECV", remote_path.encode("utf-8"))
+            with open(partial, "wb") as f:
+                while True:
+                    status, length = self._sync_read_header(sock)
+                    if status == b"DATA":
+                        f.write(self._recv_exact(sock, length))
+                        received += length
+                    elif status == b"DONE":
+                        break
+                    elif status == b"FAIL":
+                        self._sync_raise_fail(sock, length)
+                    else:
+                        raise AdbProtocolError(f"Unexpected sync response: {status!r}")
+            os.replace(partial, local_path)
+            return received
+
+        try:
+            return self._sync_call(serial, operation)
+        finally:
+            try:
+                os.remove(partial)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        """Closes every cached sync session."""
+        with self._lock:
+            serials = list(self._sync_sockets)
+        for serial in serials:
+            with self._sync_lock(serial):
+                sock = self._sync_sockets.pop(serial, None)
+                if sock is not None:
+                    try:
+                        self._sync_send(sock, b"QUIT")
+                    except OSError:
+                        pass
+                    sock.close()
@@ -1,12 +1,82 @@
 # modules/hal/adb_wrapper.py
 
+import logging
+import re
 import subprocess
-from .tool_wrapper import ToolWrapper
+import tarfile
+import threading
+import time
+from modules.exceptions import AdbProtocolError, ToolError
+from . import scheduler, tar_stream
+from .shell_session import ShellSession
+from .tool_wrapper import STREAM_CHUNK_SIZE, ToolWrapper
+
+logger = logging.getLogger("ACRD")
+
+_PROP_LINE = re.compile(r'^\[(?P<key>[^\]]+)\]: \[(?P<value>.*)$')
+
+# Stats key for calls served by the native adb server transport instead of tools/adb.
+NATIVE_STATS_TOOL = 'adb-server'
+
+# exec-out has no exit status, so checked commands end their stream with this marker,
+# the status and the tail of their stderr; EXIT_TRAILER_MAX bytes are held back to find it.
+EXIT_MARKER = b'::acrd-exit::'
+EXIT_STDERR_MAX = 200
+EXIT_TRAILER_MAX = len(EXIT_MARKER) + 12 + EXIT_STDERR_MAX
+
+
+def with_exit_trailer(command):
+    """Wraps a device shell command line so its exit status and stderr follow its stdout."""
+    return (f"exec 3>&1; err=$( {{ {command} ; }} 2>&1 1>&3 ); status=$?; "
+            f"printf '%s%d %s' '{EXIT_MARKER.decode()}' \"$status\" "
+            f"\"$(printf '%s' \"$err\" | tail -c {EXIT_STDERR_MAX})\"")
+
+
+class _CountingWriter:
+    """Write-only file object that counts the bytes passed through to another one."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
 
 class AdbWrapper(ToolWrapper):
-    def __init__(self, tool_path, serial=None):
+    # Shared native transport (an AdbServerClient) used when no per-instance one is given.
+    default_transport = None
+
+    # Per-serial `getprop` snapshots, shared by every wrapper instance.
+    _prop_cache = {}
+    _prop_cache_lock = threading.Lock()
+
+    # Per-serial persistent shell sessions, shared by every wrapper instance.
+    _shell_sessions = {}
+    _shell_sessions_lock = threading.Lock()
+
+    command_timeouts = {
+        'devices': 15,
+        'shell': 120,
+        'reboot': 60,
+        'install': 600,
+        'push': 3600,
+        'pull': 3600,
+        'exec-out': 3600,
+    }
+
+    def __init__(self, tool_path, serial=None, transport=None):
         super().__init__(tool_path)
         self.serial = serial
+        self.transport = transport if transport is not None else AdbWrapper.default_transport
+
+    def _native_transport(self):
+        """Returns the native adb server transport if one is configured and reachable."""
+        if self.transport is not None and self.transport.is_available():
+            return self.transport
+        return None
 
     def _run_adb_command(self, command):
         adb_command = []
@@ -21,6 +91,11 @@ class AdbWrapper(ToolWrapper):
     @staticmethod
     def list_devices(tool_path):
         """Lists connected ADB devices."""
+        from .device_watcher import get_device_watcher
+        watcher = get_device_watcher()
+        if watcher is not None and watcher.wait_until_ready(0):
+            return watcher.serials('adb')
+
         wrapper = ToolWrapper(tool_path)
         result = wrapper._run_command(['devices'])
         if not result:
@@ -32,22 +107,300 @@ class AdbWrapper(ToolWrapper):
 
     def get_prop(self, prop):
         """Gets a device property."""
-        return self._run_adb_command(['shell', 'getprop', prop])
+        return self.shell(['getprop', prop])
+
+    def get_props(self, refresh=False):
+        """
+        Gets every device property with a single `getprop` call.
+        The result is cached per serial until the device reboots or changes boot mode.
+        """
+        if not refresh:
+            cached = AdbWrapper.cached_props(self.serial)
+            if cached is not None:
+                return cached
+
+        output = self.shell(['getprop'])
+        if not output:
+            return {}
+        return AdbWrapper.store_props(self.serial, self.parse_props(output))
+
+    @staticmethod
+    def parse_props(output):
+        """Parses `getprop` output (`[key]: [value]` lines) into a dict."""
+        props = {}
+        key = None
+        for line in output.splitlines():
+            match = _PROP_LINE.match(line)
+            if match:
+                key = match.group('key')
+                props[key] = match.group('value')
+            elif key is not None:
+                # Multi-line values continue until the closing bracket.
+                props[key] += '\n' + line
+            if key is not None and props[key].endswith(']'):
+                props[key] = props[key][:-1]
+                key = None
+        return props
+
+    @classmethod
+    def cached_props(cls, serial):
+        """Returns a copy of the cached property snapshot for a serial, or None."""
+        with cls._prop_cache_lock:
+            cached = cls._prop_cache.get(serial)
+        return dict(cached) if cached is not None else None
+
+    @classmethod
+    def store_props(cls, serial, props):
+        """Caches a property snapshot for a serial and returns a copy of it."""
+        with cls._prop_cache_lock:
+            cls._prop_cache[serial] = props
+        return dict(props)
+
+    @classmethod
+    def invalidate_props(cls, serial=None):
+        """Drops the cached property snapshot for a serial (or every serial)."""
+        with cls._prop_cache_lock:
+            if serial is None:
+                cls._prop_cache.clear()
+            else:
+                cls._prop_cache.pop(serial, None)
 
     def shell(self, command):
         """Executes a shell command on the device."""
         if isinstance(command, str):
             command = command.split()
+        native = self._native_transport()
+        if native:
+            # adb joins shell arguments with spaces without quoting; keep that behaviour.
+            started = time.monotonic()
+            timeout = self._timeout_for(['shell'] + command)
+            try:
+                output, status = native.shell(self.serial, ' '.join(command), timeout=timeout)
+            except TimeoutError:
+                self._record(['shell'] + command, started, None, timed_out=True, tool=NATIVE_STATS_TOOL)
+                logger.warning(f"adb shell {' '.join(command)} timed out after {timeout}s")
+                return None
+            except (AdbProtocolError, OSError):
+                self._record(['shell'] + command, started, 1, tool=NATIVE_STATS_TOOL)
+                return None
+            self._record(['shell'] + command, started, status, len(output), tool=NATIVE_STATS_TOOL)
+            # Like the adb binary, a command that exits non-zero fails.
+            return output.strip() if status == 0 else None
         return self._run_adb_command(['shell'] + command)
     
+    def shell_session(self):
+        """
+        Returns the persistent shell session for this device, opening one if needed.
+        Use it to pipeline many commands over a single `adb shell` channel.
+        """
+        with AdbWrapper._shell_sessions_lock:
+            session = AdbWrapper._shell_sessions.get(self.serial)
+            if session is not None and session.alive():
+                return session
+            native = self._native_transport()
+            if native:
+                try:
+                    session = ShellSession.over_socket(native.open_service(self.serial, 'shell:sh'))
+                except (AdbProtocolError, OSError) as exc:
+                    raise ToolError(f"Could not open a shell session: {exc}") from exc
+            else:
+                command = [self.tool_path] + (['-s', self.serial] if self.serial else []) + ['shell', 'sh']
+                session = ShellSession.over_process(command)
+            AdbWrapper._shell_sessions[self.serial] = session
+            return session
+
+    def shell_many(self, commands):
+        """
+        Runs several shell command lines over the persistent session in one pipelined batch.
+        Returns each command's stripped output, or None where it exited non-zero.
+        Falls back to one `adb shell` per command if no session can be opened.
+        """
+        try:
+            results = self.shell_session().run_many(commands)
+        except (ToolError, OSError):
+            return [self.shell([command]) for command in commands]
+        return [r.output.strip() if r.exit_code == 0 else None for r in results]
+
+    def iter_shell_lines(self, command, cancel_event=None):
+        """
+        Streams a shell command line's output line by line over the persistent session,
+        so memory stays flat however large the output is. The exit code is left in
+        `last_returncode` once the lines are exhausted; it is None if the command
+        did not finish (it timed out or the session broke).
+        """
+        try:
+            session = self.shell_session()
+        except (ToolError, OSError):
+            session = None
+        self.last_returncode = None
+        try:
+            if session is None:
+                adb_command = (['-s', self.serial] if self.serial else []) + ['shell', command]
+                yield from self.iter_lines(adb_command, cancel_event=cancel_event, merge_stderr=True)
+            else:
+                yield from session.iter_lines(command, cancel_event=cancel_event)
+                self.last_returncode = session.last_exit_code
+        except ToolError as e:
+            logger.warning(f"adb shell {command} did not finish: {e}")
+            self.last_returncode = None
+
+    @classmethod
+    def close_shell_sessions(cls, serial=None):
+        """Closes the persistent shell session for a serial (or every serial)."""
+        with cls._shell_sessions_lock:
+            serials = list(cls._shell_sessions) if serial is None else [serial]
+            sessions = [cls._shell_sessions.pop(s) for s in serials if s in cls._shell_sessions]
+        for session in sessions:
+            session.close()
+
     def pull(self, remote_path, local_path):
         """Pulls a file from the device."""
+        native = self._native_transport()
+        if native:
+            started = time.monotonic()
+            try:
+                size = native.pull(self.serial, remote_path, local_path)
+            except (AdbProtocolError, OSError):
+                self._record(['pull'], started, 1, tool=NATIVE_STATS_TOOL)
+                return None
+            self._record(['pull'], started, 0, size, tool=NATIVE_STATS_TOOL)
+            return f"{remote_path}: 1 file pulled, {size} bytes"
         return self._run_adb_command(['pull', remote_path, local_path])
 
     def push(self, local_path, remote_path):
         """Pushes a file to the device."""
+        native = self._native_transport()
+        if native:
+            started = time.monotonic()
+            try:
+                size = native.push(self.serial, local_path, remote_path)
+            except (AdbProtocolError, OSError):
+                self._record(['push'], started, 1, tool=NATIVE_STATS_TOOL)
+                return None
+            self._record(['push'], started, 0, size, tool=NATIVE_STATS_TOOL)
+            return f"{local_path}: 1 file pushed, {size} bytes"
         return self._run_adb_command(['push', local_path, remote_path])
 
+    def exec_out_chunks(self, command, cancel_event=None, check=False):
+        """
+        Streams the raw stdout of `adb exec-out <command>` (no pty, binary safe) as byte chunks.
+        Uses an `exec:` service socket when the native transport is available.
+        With check=True, raises ToolError after the last chunk if the command exited
+        non-zero or its stream was cut short.
+        """
+        if check:
+            yield from self._exec_out_checked(command, cancel_event)
+            return
+        native = self._native_transport()
+        if not native:
+            yield from self.iter_chunks(self._serial_args() + ['exec-out', command], cancel_event=cancel_event)
+            return
+        started = time.monotonic()
+        streamed = 0
+        try:
+            sock = native.open_service(self.serial, f"exec:{command}")
+        except (AdbProtocolError, OSError) as exc:
+            self._record(['exec-out', command], started, 1, tool=NATIVE_STATS_TOOL)
+            raise ToolError(f"exec-out failed: {exc}") from exc
+        status = 0
+        try:
+            sock.settimeout(None)
+            while cancel_event is None or not cancel_event.is_set():
+                try:
+                    chunk = sock.recv(STREAM_CHUNK_SIZE)
+                except OSError as exc:
+                    status = 1
+                    raise ToolError(f"exec-out failed after {streamed} bytes: {exc}") from exc
+                if not chunk:
+                    break
+                streamed += len(chunk)
+                yield chunk
+        finally:
+            sock.close()
+            self._record(['exec-out', command], started, status, streamed, tool=NATIVE_STATS_TOOL)
+
+    def _exec_out_checked(self, command, cancel_event):
+        held = b''
+        for chunk in self.exec_out_chunks(with_exit_trailer(command), cancel_event):
+            held += chunk
+            if len(held) > 2 * EXIT_TRAILER_MAX:
+                yield held[:-EXIT_TRAILER_MAX]
+                held = held[-EXIT_TRAILER_MAX:]
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        index = held.rfind(EXIT_MARKER)
+        if index < 0:
+            raise ToolError(f"exec-out `{command}` ended without an exit status")
+        if index:
+            yield held[:index]
+        status, _, stderr = held[index + len(EXIT_MARKER):].decode(errors='replace').partition(' ')
+        if status != '0':
+            detail = f": {stderr.strip()}" if stderr.strip() else ''
+            raise ToolError(f"exec-out `{command}` exited with status {status}{detail}")
+
+    def pull_tree(self, remote_dir, local_dir, include=None, compression=None):
+        """
+        Pulls the contents of remote_dir into local_dir as one tar stream over `exec-out`,
+        unpacking on the fly instead of paying one sync round trip per file.
+        `include` is a list of basename globs; `compression` is None or 'gzip'.
+        Returns {'files', 'bytes', 'seconds'}, or None if the archive could not be read or
+        the device's tar exited non-zero (e.g. a file could not be read).
+        """
+        started = time.monotonic()
+        stream = tar_stream.ChunkReader(
+            self.exec_out_chunks(tar_stream.remote_pack_command(remote_dir, include, compression), check=True))
+        try:
+            files = tar_stream.unpack_stream(stream, local_dir, compression)
+            # tarfile stops at the end-of-archive blocks; read on to the exit status.
+            while stream.read(STREAM_CHUNK_SIZE):
+                pass
+        except (tarfile.TarError, OSError, ToolError) as e:
+            logger.error(f"Bulk pull of {remote_dir} failed: {e}")
+            return None
+        finally:
+            stream.close()
+        return {'files': files, 'bytes': stream.bytes_read, 'seconds': time.monotonic() - started}
+
+    def push_tree(self, local_dir, remote_dir, include=None, compression=None):
+        """
+        Pushes local_dir's files into remote_dir as one tar stream over `exec-in`.
+        Takes the same include/compression options as pull_tree and returns the same stats,
+        or None if the device side failed.
+        """
+        command = self._serial_args() + ['exec-in', tar_stream.remote_unpack_command(remote_dir, compression)]
+        with scheduler.get_scheduler().slot(self.tool_name, self.serial, self.priority):
+            started = time.monotonic()
+            try:
+                process = subprocess.Popen([self.tool_path] + command, stdin=subprocess.PIPE,
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except FileNotFoundError as exc:
+                raise ToolError(f"Tool not found at {self.tool_path}") from exc
+            counter = _CountingWriter(process.stdin)
+            try:
+                files = tar_stream.pack_tree(counter, local_dir, include, compression)
+            except (tarfile.TarError, OSError) as e:
+                logger.error(f"Bulk push to {remote_dir} failed: {e}")
+                files = None
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+            returncode = process.wait()
+            self._record(command, started, returncode, counter.bytes_written)
+        if files is None or returncode != 0:
+            return None
+        return {'files': files, 'bytes': counter.bytes_written, 'seconds': time.monotonic() - started}
+
+    def _serial_args(self):
+        return ['-s', self.serial] if self.serial else []
+
+    def reboot(self, target=None):
+        """Reboots the device, optionally into bootloader/recovery/fastboot."""
+        AdbWrapper.invalidate_props(self.serial)
+        AdbWrapper.close_shell_sessions(self.serial)
+        return self._run_adb_command(['reboot'] + ([target] if target else []))
+
     def install(self, apk_path):
         """Installs an APK."""
         return self._run_adb_command(['install', apk_path])
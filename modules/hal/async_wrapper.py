@@ -0,0 +1,205 @@
+# modules/hal/async_wrapper.py
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import subprocess
+import time
+
+from modules.exceptions import ToolError
+from . import scheduler
+from .adb_wrapper import AdbWrapper
+from .device_watcher import get_device_watcher
+from .fastboot_wrapper import FastbootWrapper
+from .heimdall_wrapper import HeimdallWrapper
+from .tool_wrapper import ToolWrapper
+
+logger = logging.getLogger("ACRD")
+
+
+async def _acquire_slot(tools, tool, serial, priority):
+    """
+    Waits for a scheduler slot on a worker thread. The thread cannot be interrupted, so
+    if the task is cancelled while waiting, the slot it is granted later is released.
+    """
+    waiting = asyncio.ensure_future(asyncio.to_thread(tools.acquire, tool, serial, priority))
+    try:
+        await asyncio.shield(waiting)
+    except asyncio.CancelledError:
+        waiting.add_done_callback(
+            lambda done: done.cancelled() or done.exception() or tools.release(tool, serial))
+        raise
+
+
+class AsyncToolWrapper(ToolWrapper):
+    """
+    asyncio counterpart of ToolWrapper built on asyncio.create_subprocess_exec.
+    Shares ToolWrapper's deadlines, scheduler slots and statistics.
+    """
+
+    async def _run_command(self, command: list[str], timeout: float | None = None):
+        if timeout is None:
+            timeout = self._timeout_for(command)
+        tools = scheduler.get_scheduler()
+        serial = getattr(self, 'serial', None)
+        await _acquire_slot(tools, self.tool_name, serial, self.priority)
+        started = time.monotonic()
+        try:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.tool_path, *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError as exc:
+                raise ToolError(f"Tool not found at {self.tool_path}") from exc
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self._record(command, started, None, timed_out=True)
+                logger.warning(f"{self.tool_name} {' '.join(command)} timed out after {timeout}s and was killed")
+                return None
+        finally:
+            tools.release(self.tool_name, serial)
+        self._record(command, started, process.returncode, len(stdout) + len(stderr))
+        if process.returncode != 0:
+            return None
+        return subprocess.CompletedProcess(
+            [self.tool_path] + command,
+            process.returncode,
+            stdout.decode(errors="replace"),
+            stderr.decode(errors="replace"),
+        )
+
+
+class AsyncAdbWrapper(AsyncToolWrapper):
+    command_timeouts = AdbWrapper.command_timeouts
+
+    def __init__(self, tool_path, serial=None):
+        super().__init__(tool_path)
+        self.serial = serial
+
+    async def _run_adb_command(self, command):
+        adb_command = ['-s', self.serial] if self.serial else []
+        result = await self._run_command(adb_command + command)
+        return result.stdout.strip() if result else None
+
+    @staticmethod
+    async def list_devices(tool_path):
+        """Lists connected ADB devices."""
+        watcher = get_device_watcher()
+        if watcher is not None and watcher.wait_until_ready(0):
+            return watcher.serials('adb')
+        result = await AsyncToolWrapper(tool_path)._run_command(['devices'])
+        if not result:
+            return []
+        output = '\n'.join(result.stdout.strip().split('\n')[1:])
+        return ToolWrapper._parse_device_list(output, '\tdevice')
+
+    async def get_prop(self, prop):
+        """Gets a device property."""
+        return await self.shell(['getprop', prop])
+
+    async def get_props(self, refresh=False):
+        """Gets every device property; shares the per-serial cache with AdbWrapper."""
+        if not refresh:
+            cached = AdbWrapper.cached_props(self.serial)
+            if cached is not None:
+                return cached
+        output = await self.shell(['getprop'])
+        if not output:
+            return {}
+        return AdbWrapper.store_props(self.serial, AdbWrapper.parse_props(output))
+
+    async def shell(self, command):
+        """Executes a shell command on the device."""
+        if isinstance(command, str):
+            command = command.split()
+        return await self._run_adb_command(['shell'] + command)
+
+    async def pull(self, remote_path, local_path):
+        """Pulls a file from the device."""
+        return await self._run_adb_command(['pull', remote_path, local_path])
+
+    async def push(self, local_path, remote_path):
+        """Pushes a file to the device."""
+        return await self._run_adb_command(['push', local_path, remote_path])
+
+
+class AsyncFastbootWrapper(AsyncToolWrapper):
+    command_timeouts = FastbootWrapper.command_timeouts
+
+    def __init__(self, tool_path, serial=None):
+        super().__init__(tool_path)
+        self.serial = serial
+
+    async def _run_fastboot_command(self, command):
+        fb_command = ['-s', self.serial] if self.serial else []
+        result = await self._run_command(fb_command + command)
+        return (result.stdout + result.stderr).strip() if result else None
+
+    @staticmethod
+    async def list_devices(tool_path):
+        """Lists connected fastboot devices."""
+        watcher = get_device_watcher()
+        if watcher is not None and watcher.wait_until_ready(0):
+            return watcher.serials('fastboot')
+        result = await AsyncToolWrapper(tool_path)._run_command(['devices'])
+        if not result:
+            return []
+        return ToolWrapper._parse_device_list(result.stdout, '\tfastboot')
+
+    async def getvar(self, variable):
+        """Gets a fastboot variable."""
+        return await self._run_fastboot_command(['getvar', variable])
+
+    async def getvar_all(self, refresh=False):
+        """Runs `getvar all`; shares the per-serial cache with FastbootWrapper."""
+        if not refresh:
+            cached = FastbootWrapper.cached_vars(self.serial)
+            if cached is not None:
+                return cached
+        output = await self._run_fastboot_command(['getvar', 'all'])
+        if not output:
+            return {'vars': {}, 'partitions': {}, 'slots': {}}
+        return FastbootWrapper.store_vars(self.serial, FastbootWrapper.parse_getvar_all(output))
+
+    async def flash(self, partition, file):
+        """Flashes a file to a partition."""
+        return await self._run_fastboot_command(['flash', partition, file])
+
+    async def reboot(self):
+        """Reboots the device."""
+        AdbWrapper.invalidate_props(self.serial)
+        FastbootWrapper.invalidate_vars(self.serial)
+        return await self._run_fastboot_command(['reboot'])
+
+
+class AsyncHeimdallWrapper(AsyncToolWrapper):
+    command_timeouts = HeimdallWrapper.command_timeouts
+
+    def __init__(self, tool_path, device_key=None):
+        super().__init__(tool_path)
+        self.device_key = device_key
+
+    async def _run_heimdall_command(self, command):
+        result = await self._run_command(command)
+        if not result:
+            HeimdallWrapper.mark_session(self.device_key, False)
+            return None
+        return result.stdout.strip()
+
+    async def detect(self):
+        """Checks if a device is in Download Mode (Samsung)."""
+        result = await self._run_heimdall_command(['detect'])
+        return "Device detected" in (result or "")
+
+    async def print_pit(self):
+        """Downloads and prints the PIT file from the device."""
+        output = await self._run_heimdall_command(['print-pit', '--no-reboot'])
+        if output is not None:
+            HeimdallWrapper.mark_session(self.device_key)
+        return output
@@ -0,0 +1,214 @@
+# modules/hal/device_watcher.py
+
+from __future__ import annotations
+
+import logging
+import threading
+
+from modules.exceptions import AdbProtocolError, ToolError
+from . import usb_sysfs
+from .adb_wrapper import AdbWrapper
+from .fastboot_wrapper import FastbootWrapper
+from .heimdall_wrapper import HeimdallWrapper
+
+logger = logging.getLogger("ACRD")
+
+ATTACH = 'attach'
+DETACH = 'detach'
+STATE_CHANGE = 'state-change'
+
+
+class DeviceWatcher:
+    """
+    Long-lived registry of connected devices.
+
+    ADB devices are tracked through the adb server's host:track-devices-l push
+    stream. Fastboot has no such stream, so fastboot devices are found by a
+    periodic sysfs scan (falling back to `fastboot devices` where sysfs is not
+    available), which also picks up Samsung devices in Download Mode.
+    Subscribers receive (event, device) callbacks for attach, detach and
+    state-change events. Every event drops the cached property and `getvar all`
+    snapshots of the device's serial, and a Download Mode device's open Heimdall
+    session.
+    """
+
+    def __init__(self, client, fastboot_path=None, sysfs_root=None,
+                 poll_interval=1.0, reconnect_delay=2.0):
+        self.client = client
+        self.fastboot_path = fastboot_path
+        self.sysfs_root = sysfs_root
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._registry: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._adb_ready = threading.Event()
+        self._fastboot_ready = threading.Event()
+        self._track_socket = None
+        self._threads = []
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Starts the adb track and fastboot scan threads."""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._track_adb, name="acrd-adb-track", daemon=True),
+            threading.Thread(target=self._scan_fastboot, name="acrd-fastboot-scan", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stops the watcher threads and closes the track stream."""
+        self._stop.set()
+        sock = self._track_socket
+        if sock is not None:
+            try:
+                sock.shutdown(2)
+            except OSError:
+                pass
+            sock.close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def wait_until_ready(self, timeout=2.0):
+        """Waits for the first adb and fastboot snapshots. Returns False on timeout."""
+        return self._adb_ready.wait(timeout) and self._fastboot_ready.wait(timeout)
+
+    # --- Registry access ---
+
+    def subscribe(self, callback):
+        """Registers callback(event, device) for attach/detach/state-change events."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def devices(self, mode=None, state=None):
+        """Returns copies of the registered devices, optionally filtered by mode and state."""
+        with self._lock:
+            entries = [dict(d) for d in self._registry.values()]
+        return [d for d in entries
+                if (mode is None or d['mode'] == mode) and (state is None or d['state'] == state)]
+
+    def serials(self, mode):
+        """Serials of devices ready for use in a mode ('adb', 'fastboot' or 'download')."""
+        return [d['serial'] for d in self.devices(mode=mode, state='device' if mode == 'adb' else mode)]
+
+    def get(self, serial):
+        """Returns the registry entry for a serial, or None if it is not connected."""
+        with self._lock:
+            for (entry_serial, _), device in self._registry.items():
+                if entry_serial == serial:
+                    return dict(device)
+        return None
+
+    # --- Updates ---
+
+    def _apply(self, mode, current: dict[str, dict]):
+        """Replaces every entry of one mode with `current` and emits the resulting events."""
+        events = []
+        with self._lock:
+            previous = {serial: d for (serial, m), d in self._registry.items() if m == mode}
+            for serial, device in previous.items():
+                if serial not in current:
+                    del self._registry[(serial, mode)]
+                    events.append((DETACH, device))
+            for serial, device in current.items():
+                device = dict(device, serial=serial, mode=mode)
+                old = previous.get(serial)
+                self._registry[(serial, mode)] = device
+                if old is None:
+                    events.append((ATTACH, device))
+                elif old['state'] != device['state']:
+                    events.append((STATE_CHANGE, device))
+            subscribers = list(self._subscribers)
+
+        for event, device in events:
+            logger.info(f"Device {event}: {device['serial']} ({device['mode']}, {device['state']})")
+            # A device that left, appeared or changed state may have rebooted or switched
+            # boot mode outside ACRD, so its cached snapshots cannot be trusted.
+            AdbWrapper.invalidate_props(device['serial'])
+            FastbootWrapper.invalidate_vars(device['serial'])
+            if device['mode'] == 'download':
+                # A re-plugged device starts a fresh Heimdall session; --resume would fail its handshake.
+                HeimdallWrapper.end_sessions(f"download:{device['serial']}" if device.get('usb_serial') else None)
+            for callback in subscribers:
+                try:
+                    callback(event, dict(device))
+                except Exception as e:
+                    logger.error(f"Device watcher subscriber failed: {e}")
+
+    def _track_adb(self):
+        while not self._stop.is_set():
+            try:
+                self._track_socket = self.client.open_track_devices()
+                while not self._stop.is_set():
+                    update = self.client.read_track_update(self._track_socket)
+                    devices = self.client.parse_device_list(update)
+                    self._apply('adb', {d.pop('serial'): d for d in devices})
+                    self._adb_ready.set()
+            except (AdbProtocolError, OSError) as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f"adb device tracking interrupted: {e}")
+                # The server went away, so nothing it reported can be trusted any more.
+                self._apply('adb', {})
+                self._adb_ready.set()
+            finally:
+                if self._track_socket is not None:
+                    self._track_socket.close()
+                    self._track_socket = None
+            self._stop.wait(self.reconnect_delay)
+
+    def _list_fastboot(self):
+        serials = usb_sysfs.list_fastboot_serials(self.sysfs_root)
+        if serials is None and self.fastboot_path:
+            try:
+                serials = FastbootWrapper.list_devices(self.fastboot_path, use_registry=False)
+            except ToolError:
+                serials = []
+        return serials or []
+
+    def _list_download(self):
+        """Download Mode devices keyed by USB serial, or by bus path for those reporting none."""
+        devices = usb_sysfs.devices_in_mode('download', self.sysfs_root) or []
+        return {d['serial'] or d['path']: {'state': 'download', 'usb_serial': d['serial']} for d in devices}
+
+    def _scan_fastboot(self):
+        while not self._stop.is_set():
+            try:
+                self._apply('fastboot', {s: {'state': 'fastboot'} for s in self._list_fastboot()})
+                self._apply('download', self._list_download())
+            except OSError as e:
+                logger.warning(f"fastboot scan failed: {e}")
+            self._fastboot_ready.set()
+            self._stop.wait(self.poll_interval)
+
+
+# Process-wide watcher, started by main.py when the native adb transport is enabled.
+_watcher = None
+
+def start_device_watcher(client, fastboot_path=None, **kwargs):
+    """Starts the process-wide device watcher and returns it."""
+    global _watcher
+    if _watcher is None:
+        _watcher = DeviceWatcher(client, fastboot_path=fastboot_path, **kwargs).start()
+    return _watcher
+
+def get_device_watcher():
+    """Returns the running process-wide device watcher, or None."""
+    return _watcher
+
+def stop_device_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
@@ -0,0 +1,244 @@
+# modules/hal/fastboot_emulator.py
+
+"""
+Local fastboot-over-TCP device emulator, for tests and for benchmarking the
+flashing path without hardware:
+
+    python -m modules.hal.fastboot_emulator --port 5554
+    python -m modules.hal.fastboot_emulator --benchmark 512
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import socketserver
+import struct
+import tempfile
+import threading
+
+DEFAULT_VARIABLES = {
+    'product': 'emulator',
+    'serialno': 'EMULATOR01',
+    'unlocked': 'yes',
+    'current-slot': 'a',
+    'is-userspace': 'yes',
+}
+DEFAULT_PARTITIONS = {
+    'boot_a': 64 * 1024 * 1024,
+    'boot_b': 64 * 1024 * 1024,
+    'vendor_boot_a': 64 * 1024 * 1024,
+    'vendor_boot_b': 64 * 1024 * 1024,
+    'dtbo_a': 8 * 1024 * 1024,
+    'dtbo_b': 8 * 1024 * 1024,
+    'vbmeta_a': 64 * 1024,
+    'vbmeta_b': 64 * 1024,
+    'super': 8 * 1024 * 1024 * 1024,
+}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def _recv_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(min(size - len(data), 1024 * 1024))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return bytes(data)
+
+    def _read_packet(self):
+        length = struct.unpack(">Q", self._recv_exact(8))[0]
+        return self._recv_exact(length)
+
+    def _send(self, data: bytes):
+        self.request.sendall(struct.pack(">Q", len(data)) + data)
+
+    def _receive_download(self, size):
+        # Hash the data as it arrives; only keep it when the emulator is asked to.
+        digest = hashlib.sha256()
+        kept = bytearray() if self.server.keep_data else None
+        received = 0
+        while received < size:
+            length = struct.unpack(">Q", self._recv_exact(8))[0]
+            remaining = length
+            while remaining:
+                chunk = self.request.recv(min(remaining, 1024 * 1024))
+                if not chunk:
+                    raise ConnectionError("client closed")
+                digest.update(chunk)
+                if kept is not None:
+                    kept += chunk
+                remaining -= len(chunk)
+            received += length
+        return {'size': size, 'sha256': digest.hexdigest(), 'data': bytes(kept) if kept is not None else None}
+
+    def handle(self):
+        server = self.server
+        try:
+            if self._recv_exact(4) != b"FB01":
+                return
+            self.request.sendall(b"FB01")
+            download = None
+            while True:
+                command = self._read_packet().decode(errors="replace")
+                server.commands.append(command)
+                name, _, arg = command.partition(":")
+                if name == "getvar":
+                    if arg == "all":
+                        for key, value in server.variables.items():
+                            self._send(f"INFO{key}:{value}".encode())
+                        for partition, size in server.partitions.items():
+                            self._send(f"INFOpartition-size:{partition}:0x{size:x}".encode())
+                        self._send(b"OKAY")
+                    elif arg == "max-download-size":
+                        self._send(f"OKAY0x{server.max_download_size:x}".encode())
+                    elif arg.startswith("partition-size:") and arg.split(":", 1)[1] in server.partitions:
+                        self._send(f"OKAY0x{server.partitions[arg.split(':', 1)[1]]:x}".encode())
+                    elif arg in server.variables:
+                        self._send(f"OKAY{server.variables[arg]}".encode())
+                    else:
+                        self._send(b"FAILGetVar Variable Not found")
+                elif name == "download":
+                    size = int(arg, 16)
+                    if size > server.max_download_size:
+                        self._send(b"FAILdata too large")
+                        continue
+                    self._send(f"DATA{size:08x}".encode())
+                    download = self._receive_download(size)
+                    self._send(b"OKAY")
+                elif name == "flash":
+                    partition = server.resolve(arg)
+                    if partition is None:
+                        self._send(f"FAILpartition {arg} does not exist".encode())
+                    elif download is None:
+                        self._send(b"FAILno image downloaded")
+                    elif download['size'] > server.partitions[partition]:
+                        self._send(f"FAILimage too large for {partition}".encode())
+                    else:
+                        self._send(f"INFOWriting '{partition}'".encode())
+                        server.flashed[partition] = download
+                        self._send(b"OKAY")
+                elif name == "erase":
+                    partition = server.resolve(arg)
+                    if partition is None:
+                        self._send(f"FAILpartition {arg} does not exist".encode())
+                    else:
+                        server.flashed.pop(partition, None)
+                        self._send(b"OKAY")
+                elif name == "set_active":
+                    if f"boot_{arg}" not in server.partitions:
+                        self._send(f"FAILinvalid slot {arg}".encode())
+                    else:
+                        server.variables['current-slot'] = arg
+                        self._send(b"OKAY")
+                elif name == "update-super":
+                    if download is None:
+                        self._send(b"FAILno image downloaded")
+                    else:
+                        server.super_updates.append(dict(download, wipe=arg.endswith(":wipe")))
+                        self._send(b"OKAY")
+                elif name == "reboot" or name.startswith("reboot-"):
+                    server.reboots.append(name)
+                    self._send(b"OKAY")
+                    return
+                else:
+                    self._send(f"FAILunknown command {command}".encode())
+        except ConnectionError:
+            pass
+
+
+class FastbootEmulator(socketserver.ThreadingTCPServer):
+    """
+    In-process fastboot TCP device: answers getvar (including getvar:all),
+    accepts downloads, and records flashes, erases, slot switches, super layout
+    updates and reboots. Flashed images are kept as size + SHA-256 (plus the
+    bytes when keep_data is set).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, variables=None, partitions=None,
+                 max_download_size=512 * 1024 * 1024, keep_data=False):
+        super().__init__((host, port), _Handler)
+        self.variables = dict(DEFAULT_VARIABLES if variables is None else variables)
+        self.partitions = dict(DEFAULT_PARTITIONS if partitions is None else partitions)
+        self.max_download_size = max_download_size
+        self.keep_data = keep_data
+        self.commands = []
+        self.flashed = {}
+        self.reboots = []
+        self.super_updates = []
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def serial(self):
+        """The `fastboot -s` serial that reaches this emulator."""
+        return f"tcp:{self.server_address[0]}:{self.port}"
+
+    def resolve(self, partition):
+        """Maps an A/B partition name to the current slot, like a real bootloader."""
+        if partition in self.partitions:
+            return partition
+        slotted = f"{partition}_{self.variables.get('current-slot', 'a')}"
+        return slotted if slotted in self.partitions else None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="acrd-fastboot-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _benchmark(size_mib):
+    from .fastboot_protocol import FastbootClient
+
+    with FastbootEmulator(max_download_size=(size_mib + 1) * 1024 * 1024,
+                          partitions={'bench': (size_mib + 1) * 1024 * 1024}) as emulator, \
+            tempfile.NamedTemporaryFile(suffix='.img') as image:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mib):
+            image.write(block)
+        image.flush()
+        with FastbootClient.connect_tcp('127.0.0.1', emulator.port) as client:
+            transfer = client.flash('bench', image.name)
+        print(f"Flashed {transfer['bytes']} bytes in {transfer['seconds']:.2f}s "
+              f"({transfer['mib_per_s']:.1f} MiB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fastboot-over-TCP device emulator.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5554)
+    parser.add_argument("--benchmark", type=int, metavar="MIB",
+                        help="Flash a MIB-sized image through the native client and report throughput.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.benchmark)
+        return
+    emulator = FastbootEmulator(args.host, args.port)
+    print(f"fastboot emulator listening on {emulator.serial} (Ctrl+C to stop)")
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        emulator.server_close()
+
+
+if __name__ == '__main__':
+    main()
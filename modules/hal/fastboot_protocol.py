@@ -0,0 +1,288 @@
+# modules/hal/fastboot_protocol.py
+
+from __future__ import annotations
+
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+from modules.exceptions import FastbootProtocolError
+
+DEFAULT_TCP_PORT = 5554
+
+# Data phase writes are split into packets of this size; the reader thread keeps
+# DOWNLOAD_QUEUE_DEPTH of them ready so disk reads overlap with the transfer.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_QUEUE_DEPTH = 4
+
+# Largest response a device sends ("OKAY"/"FAIL"/"INFO"/"TEXT"/"DATA" + payload).
+MAX_RESPONSE_SIZE = 256
+
+
+class FastbootTcpTransport:
+    """
+    fastboot over TCP (fastbootd / network bootloaders).
+
+    After a "FB01" handshake every message travels as a packet with an 8-byte
+    big-endian length header.
+    """
+
+    def __init__(self, host: str, port: int = DEFAULT_TCP_PORT, timeout: float = 30.0):
+        try:
+            self._sock = socket.create_connection((host, port), timeout=timeout)
+        except OSError as exc:
+            raise FastbootProtocolError(f"Could not reach fastboot device at {host}:{port}: {exc}") from exc
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._pending = 0
+        try:
+            self._sock.sendall(b"FB01")
+            version = self._recv_exact(4)
+        except OSError as exc:
+            self.close()
+            raise FastbootProtocolError(f"fastboot TCP handshake failed: {exc}") from exc
+        if not version.startswith(b"FB"):
+            self.close()
+            raise FastbootProtocolError(f"Unexpected fastboot TCP handshake {version!r}")
+
+    def _recv_exact(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise FastbootProtocolError("Connection closed by fastboot device")
+            data += chunk
+        return bytes(data)
+
+    def write(self, data: bytes):
+        self._sock.sendall(struct.pack(">Q", len(data)) + data)
+
+    def read(self, size: int) -> bytes:
+        # A packet larger than `size` is handed out over several reads.
+        if not self._pending:
+            self._pending = struct.unpack(">Q", self._recv_exact(8))[0]
+        data = self._recv_exact(min(size, self._pending))
+        self._pending -= len(data)
+        return data
+
+    def close(self):
+        self._sock.close()
+
+
+class FastbootUsbTransport:
+    """
+    fastboot over USB bulk endpoints.
+
+    Takes any pair of endpoint objects with write(data, timeout) and
+    read(size, timeout), e.g. pyusb's, so no USB library is required here.
+    """
+
+    def __init__(self, endpoint_out, endpoint_in, timeout: float = 30.0):
+        self._out = endpoint_out
+        self._in = endpoint_in
+        self._timeout_ms = int(timeout * 1000)
+
+    def write(self, data: bytes):
+        self._out.write(data, self._timeout_ms)
+
+    def read(self, size: int) -> bytes:
+        return bytes(self._in.read(size, self._timeout_ms))
+
+    def close(self):
+        pass
+
+
+class FastbootClient:
+    """
+    Pure-Python fastboot protocol client over a pluggable transport.
+
+    Commands are ASCII strings; the device answers with INFO/TEXT progress
+    messages followed by OKAY, FAIL or (for downloads) DATA<size>.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.info = []
+        self.last_transfer = None
+
+    @classmethod
+    def connect_tcp(cls, host: str, port: int = DEFAULT_TCP_PORT, timeout: float = 30.0):
+        return cls(FastbootTcpTransport(host, port, timeout))
+
+    @staticmethod
+    def parse_tcp_serial(serial: str):
+        """Splits a `tcp:host[:port]` serial (as used by `fastboot -s`) into (host, port)."""
+        if not serial or not serial.startswith("tcp:"):
+            return None
+        host, _, port = serial[len("tcp:"):].partition(":")
+        return host, int(port) if port else DEFAULT_TCP_PORT
+
+    def _read_response(self):
+        """Reads responses until a terminal one; returns (kind, payload)."""
+        while True:
+            response = self.transport.read(MAX_RESPONSE_SIZE)
+            kind, payload = response[:4], response[4:].decode(errors="replace")
+            if kind in (b"INFO", b"TEXT"):
+                self.info.append(payload)
+                continue
+            if kind == b"FAIL":
+                raise FastbootProtocolError(payload or "Command failed")
+            if kind in (b"OKAY", b"DATA"):
+                return kind, payload
+            raise FastbootProtocolError(f"Unexpected fastboot response {response!r}")
+
+    def command(self, command: str) -> str:
+        """Sends one command and returns the payload of its OKAY response."""
+        self.info = []
+        try:
+            self.transport.write(command.encode())
+            kind, payload = self._read_response()
+        except OSError as exc:
+            raise FastbootProtocolError(f"fastboot transport error: {exc}") from exc
+        if kind != b"OKAY":
+            raise FastbootProtocolError(f"Unexpected {kind.decode()} response to {command}")
+        return payload
+
+    def getvar(self, name: str) -> str:
+        return self.command(f"getvar:{name}")
+
+    def getvar_all(self) -> str:
+        """Runs getvar:all and returns it as `(bootloader) key: value` lines, like the CLI prints."""
+        self.command("getvar:all")
+        return "".join(f"(bootloader) {line}\n" for line in self.info)
+
+    def download(self, source, size: int | None = None) -> dict:
+        """
+        Sends an image (a path, bytes, or a readable file object of the given size,
+        such as a zip member) into the device's download buffer. A reader thread
+        prefetches chunks so reads (and decompression) overlap with the transfer.
+        Returns throughput stats: {'bytes', 'seconds', 'mib_per_s'}.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = memoryview(source)
+            size = len(data)
+            chunks = (data[i:i + DOWNLOAD_CHUNK_SIZE] for i in range(0, size, DOWNLOAD_CHUNK_SIZE))
+        elif hasattr(source, 'read'):
+            if size is None:
+                raise FastbootProtocolError("Streaming a download needs its size up front")
+            chunks = self._prefetch(source)
+        else:
+            size = os.path.getsize(source) if size is None else size
+            chunks = self._prefetch(source)
+
+        started = time.monotonic()
+        self.info = []
+        try:
+            self.transport.write(f"download:{size:08x}".encode())
+            kind, payload = self._read_response()
+            if kind != b"DATA" or int(payload, 16) != size:
+                raise FastbootProtocolError(f"Device refused a {size} byte download")
+            for chunk in chunks:
+                self.transport.write(chunk)
+            kind, _ = self._read_response()
+        except OSError as exc:
+            raise FastbootProtocolError(f"fastboot transport error: {exc}") from exc
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        if kind != b"OKAY":
+            raise FastbootProtocolError("Download was not acknowledged")
+
+        seconds = max(time.monotonic() - started, 1e-9)
+        self.last_transfer = {'bytes': size, 'seconds': seconds, 'mib_per_s': size / seconds / (1024 * 1024)}
+        return self.last_transfer
+
+    @staticmethod
+    def _prefetch(source):
+        """Yields a file's (or file object's) chunks, read ahead by a background thread into a bounded queue."""
+        chunks = queue.Queue(maxsize=DOWNLOAD_QUEUE_DEPTH)
+        stop = threading.Event()
+        path = getattr(source, 'name', source) if hasattr(source, 'read') else source
+
+        def copy(f):
+            while not stop.is_set():
+                chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+                chunks.put(chunk)
+                if not chunk:
+                    return
+
+        def reader():
+            try:
+                if hasattr(source, 'read'):
+                    copy(source)
+                else:
+                    with open(source, 'rb') as f:
+                        copy(f)
+            except (OSError, EOFError, zlib.error, zipfile.BadZipFile) as exc:
+                chunks.put(exc)
+
+        thread = threading.Thread(target=reader, name="acrd-fastboot-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if isinstance(chunk, Exception):
+                    raise FastbootProtocolError(f"Could not read {path}: {chunk}")
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            stop.set()
+            # Unblock the reader if it is waiting on a full queue.
+            while thread.is_alive():
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def flash(self, partition: str, image, size: int | None = None) -> dict:
+        """
+        Downloads an image (a path, or a file object of the given size) and flashes it.
+        Images larger than the device's max-download-size are refused (this client
+        does not split sparse images).
+        """
+        size = os.path.getsize(image) if size is None else size
+        limit = self.getvar("max-download-size")
+        if limit and size > int(limit, 0):
+            name = getattr(image, 'name', image)
+            raise FastbootProtocolError(
+                f"{name} ({size} bytes) exceeds max-download-size ({int(limit, 0)} bytes)")
+        transfer = self.download(image, size)
+        self.command(f"flash:{partition}")
+        return transfer
+
+    def boot(self, image_path: str) -> dict:
+        """Downloads an image and boots it without flashing."""
+        transfer = self.download(image_path)
+        self.command("boot")
+        return transfer
+
+    def erase(self, partition: str):
+        return self.command(f"erase:{partition}")
+
+    def set_active(self, slot: str):
+        return self.command(f"set_active:{slot}")
+
+    def update_super(self, image, size: int | None = None, wipe: bool = False) -> dict:
+        """Downloads super_empty.img and rewrites the dynamic partition layout from it (fastbootd only)."""
+        transfer = self.download(image, size)
+        self.command("update-super:super:wipe" if wipe else "update-super:super")
+        return transfer
+
+    def reboot(self, target: str | None = None):
+        """Reboots the device, optionally into bootloader/fastboot/recovery."""
+        return self.command(f"reboot-{target}" if target else "reboot")
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,8 +1,61 @@
 # modules/hal/fastboot_wrapper.py
 
-from .tool_wrapper import ToolWrapper
+import contextlib
+import copy
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from modules.exceptions import FastbootProtocolError
+from . import scheduler
+from .adb_wrapper import AdbWrapper
+from .fastboot_protocol import FastbootClient
+from .tool_wrapper import STREAM_CHUNK_SIZE, ToolWrapper
+
+logger = logging.getLogger("ACRD")
+
+# Stats key for calls served by the native fastboot TCP client instead of tools/fastboot.
+NATIVE_STATS_TOOL = 'fastboot-tcp'
+
+# `getvar all` variables qualified by a partition name, e.g. "partition-size:boot_a".
+PARTITION_VARS = {
+    'partition-size': 'size',
+    'partition-type': 'type',
+    'is-logical': 'is-logical',
+    'has-slot': 'has-slot',
+}
+# `getvar all` variables qualified by a slot suffix, e.g. "slot-successful:a".
+SLOT_VARS = {
+    'slot-successful': 'successful',
+    'slot-unbootable': 'unbootable',
+    'slot-retry-count': 'retry-count',
+}
 
 class FastbootWrapper(ToolWrapper):
+    # When set, `tcp:host[:port]` serials are driven by the pure-Python fastboot
+    # client instead of spawning tools/fastboot for every command.
+    native_tcp = False
+
+    # Per-serial `getvar all` snapshots, shared by every wrapper instance.
+    _vars_cache = {}
+    _vars_cache_lock = threading.Lock()
+
+    command_timeouts = {
+        'devices': 15,
+        'getvar': 15,
+        'set_active': 15,
+        'reboot': 60,
+        'boot': 120,
+        'erase': 300,
+        '-w': 300,
+        'wipe-super': 300,
+        'update-super': 300,
+        'flash': 1800,
+    }
+
     def __init__(self, tool_path, serial=None):
         super().__init__(tool_path)
         self.serial = serial
@@ -18,9 +71,41 @@ class FastbootWrapper(ToolWrapper):
         # Fastboot often outputs info to stderr, so we combine them
         return (result.stdout + result.stderr).strip() if result else None
 
+    def _uses_native_tcp(self):
+        return FastbootWrapper.native_tcp and FastbootClient.parse_tcp_serial(self.serial) is not None
+
+    def _native_call(self, command, operation):
+        """
+        Runs operation(client) over a native TCP connection to the device, holding the
+        same scheduler slot and recording the same stats as a tools/fastboot call.
+        Returns the operation's output, or None if the device reported a failure.
+        """
+        host, port = FastbootClient.parse_tcp_serial(self.serial)
+        with scheduler.get_scheduler().slot(self.tool_name, self.serial, self.priority):
+            started = time.monotonic()
+            try:
+                with FastbootClient.connect_tcp(host, port, timeout=self._timeout_for(command)) as client:
+                    output = operation(client)
+            except FastbootProtocolError as e:
+                logger.warning(f"fastboot {' '.join(command)} on {self.serial} failed: {e}")
+                self._record(command, started, 1, tool=NATIVE_STATS_TOOL)
+                return None
+            self._record(command, started, 0, len(output), tool=NATIVE_STATS_TOOL)
+            return output
+
+    @staticmethod
+    def _describe_transfer(action, name, transfer):
+        return (f"Sending '{name}' ({transfer['bytes'] // 1024} KB) OKAY "
+                f"[{transfer['seconds']:.3f}s, {transfer['mib_per_s']:.1f} MiB/s]\n{action} '{name}' OKAY")
+
     @staticmethod
-    def list_devices(tool_path):
+    def list_devices(tool_path, use_registry=True):
         """Lists connected fastboot devices."""
+        from .device_watcher import get_device_watcher
+        watcher = get_device_watcher() if use_registry else None
+        if watcher is not None and watcher.wait_until_ready(0):
+            return watcher.serials('fastboot')
+
         wrapper = ToolWrapper(tool_path)
         result = wrapper._run_command(['devices'])
         if not result:
@@ -30,16 +115,212 @@ class FastbootWrapper(ToolWrapper):
 
     def getvar(self, variable):
         """Gets a fastboot variable."""
+        if self._uses_native_tcp():
+            return self._native_call(['getvar', variable], lambda c: f"{variable}: {c.getvar(variable)}")
         return self._run_fastboot_command(['getvar', variable])
 
-    def flash(self, partition, file):
-        """Flashes a file to a partition."""
-        return self._run_fastboot_command(['flash', partition, file])
+    def getvar_all(self, refresh=False):
+        """
+        Runs `getvar all` once and returns a structured snapshot:
+        {'vars': {...}, 'partitions': {name: {...}}, 'slots': {suffix: {...}}}.
+        The snapshot is cached per serial until the device reboots.
+        """
+        if not refresh:
+            cached = FastbootWrapper.cached_vars(self.serial)
+            if cached is not None:
+                return cached
+
+        if self._uses_native_tcp():
+            output = self._native_call(['getvar', 'all'], lambda c: c.getvar_all())
+        else:
+            output = self._run_fastboot_command(['getvar', 'all'])
+        if not output:
+            return {'vars': {}, 'partitions': {}, 'slots': {}}
+        return FastbootWrapper.store_vars(self.serial, self.parse_getvar_all(output))
+
+    @staticmethod
+    def parse_getvar_all(output):
+        """Parses the `(bootloader) key: value` lines printed by `fastboot getvar all`."""
+        snapshot = {'vars': {}, 'partitions': {}, 'slots': {}}
+        for line in output.splitlines():
+            line = line.strip()
+            if not line.startswith('(bootloader)'):
+                continue
+            parts = [p.strip() for p in line[len('(bootloader)'):].split(':')]
+            name = parts[0]
+            if len(parts) < 2 or not name:
+                continue
+            if name in PARTITION_VARS and len(parts) >= 3:
+                value = ':'.join(parts[2:])
+                if name == 'partition-size':
+                    try:
+                        value = int(value, 0)
+                    except ValueError:
+                        continue
+                elif name in ('is-logical', 'has-slot'):
+                    value = value.lower() == 'yes'
+                snapshot['partitions'].setdefault(parts[1], {})[PARTITION_VARS[name]] = value
+            elif name in SLOT_VARS and len(parts) >= 3:
+                snapshot['slots'].setdefault(parts[1], {})[SLOT_VARS[name]] = ':'.join(parts[2:])
+            else:
+                snapshot['vars'][name] = ':'.join(parts[1:])
+        return snapshot
+
+    @staticmethod
+    def partition_info(snapshot, partition):
+        """Looks up a partition in a snapshot, resolving A/B names to the current slot."""
+        partitions = snapshot.get('partitions', {})
+        if partition in partitions:
+            return partitions[partition]
+        slot = snapshot.get('vars', {}).get('current-slot')
+        if slot:
+            return partitions.get(f"{partition}_{slot.lstrip('_')}")
+        return None
+
+    @classmethod
+    def cached_vars(cls, serial):
+        """Returns a copy of the cached `getvar all` snapshot for a serial, or None."""
+        with cls._vars_cache_lock:
+            cached = cls._vars_cache.get(serial)
+        return copy.deepcopy(cached) if cached is not None else None
+
+    @classmethod
+    def store_vars(cls, serial, snapshot):
+        """Caches a `getvar all` snapshot for a serial and returns a copy of it."""
+        with cls._vars_cache_lock:
+            cls._vars_cache[serial] = snapshot
+        return copy.deepcopy(snapshot)
+
+    @classmethod
+    def invalidate_vars(cls, serial=None):
+        """Drops the cached `getvar all` snapshot for a serial (or every serial)."""
+        with cls._vars_cache_lock:
+            if serial is None:
+                cls._vars_cache.clear()
+            else:
+                cls._vars_cache.pop(serial, None)
+
+    def _slot_targets(self, partition, slot):
+        """The partitions a `--slot` flash writes, for the native client which has no slot logic of its own."""
+        if not slot:
+            return [partition]
+        snapshot = self.getvar_all()
+        partitions = snapshot.get('partitions', {})
+        if partition in partitions or f"{partition}_a" not in partitions:
+            return [partition]
+        if slot == 'all':
+            return [f"{partition}_a", f"{partition}_b"]
+        if slot == 'other':
+            slot = 'b' if snapshot.get('vars', {}).get('current-slot', 'a').lstrip('_') == 'a' else 'a'
+        return [f"{partition}_{slot.lstrip('_')}"]
+
+    def flash(self, partition, file, slot=None):
+        """Flashes a file to a partition, optionally on a given slot ('a', 'b', 'all' or 'other')."""
+        if self._uses_native_tcp():
+            # Resolved before the call: getvar_all() needs the device slot this call will hold.
+            targets = self._slot_targets(partition, slot)
+
+            def operation(client):
+                transfer = client.flash(targets[0], file)
+                for target in targets[1:]:
+                    client.command(f"flash:{target}")
+                return self._describe_transfer('Writing', ', '.join(targets), transfer)
+            return self._native_call(['flash', partition, file], operation)
+        slot_args = [f'--slot={slot}'] if slot else []
+        return self._run_fastboot_command(['flash'] + slot_args + [partition, file])
+
+    def flash_stream(self, partition, fileobj, size, slot=None, spool_dir=None):
+        """
+        Flashes an image read from a file object of known size, e.g. a zip member, so
+        the archive never has to be extracted. The native client streams it straight
+        to the device; tools/fastboot needs a path, so the image is spooled to a single
+        temporary file in spool_dir that is removed as soon as it has been flashed.
+        """
+        if self._uses_native_tcp():
+            targets = self._slot_targets(partition, slot)
+
+            def operation(client):
+                transfer = client.flash(targets[0], fileobj, size)
+                # The download buffer still holds the image, so further slots need no new transfer.
+                for target in targets[1:]:
+                    client.command(f"flash:{target}")
+                return self._describe_transfer('Writing', ', '.join(targets), transfer)
+            return self._native_call(['flash', partition], operation)
+        with self._spooled(fileobj, spool_dir) as path:
+            return self.flash(partition, path, slot=slot)
+
+    @contextlib.contextmanager
+    def _spooled(self, fileobj, spool_dir):
+        fd, path = tempfile.mkstemp(suffix='.img', prefix='.acrd-', dir=spool_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(fileobj, f, STREAM_CHUNK_SIZE)
+            yield path
+        finally:
+            os.remove(path)
 
     def boot(self, image):
         """Boots a specific image."""
+        if self._uses_native_tcp():
+            return self._native_call(['boot', image], lambda c: self._describe_transfer(
+                'Booting', 'boot.img', c.boot(image)))
         return self._run_fastboot_command(['boot', image])
 
-    def reboot(self):
-        """Reboots the device."""
-        return self._run_fastboot_command(['reboot'])
+    def erase(self, partition):
+        """Erases a partition."""
+        if self._uses_native_tcp():
+            return self._native_call(['erase', partition], lambda c: c.erase(partition) or f"Erasing '{partition}' OKAY")
+        return self._run_fastboot_command(['erase', partition])
+
+    def reboot(self, target=None):
+        """Reboots the device, or into 'bootloader', 'fastboot' (fastbootd) or 'recovery'."""
+        AdbWrapper.invalidate_props(self.serial)
+        FastbootWrapper.invalidate_vars(self.serial)
+        if self._uses_native_tcp():
+            return self._native_call(['reboot'], lambda c: c.reboot(target) or "Rebooting")
+        return self._run_fastboot_command(['reboot'] + ([target] if target else []))
+
+    def set_active(self, slot):
+        """Marks a slot ('a' or 'b') active for the next boot."""
+        FastbootWrapper.invalidate_vars(self.serial)
+        if self._uses_native_tcp():
+            return self._native_call(['set_active', slot], lambda c: c.set_active(slot) or f"Setting current slot to '{slot}' OKAY")
+        return self._run_fastboot_command(['set_active', slot])
+
+    def wipe(self):
+        """Wipes user data (`fastboot -w`). The native client erases userdata and metadata; Android reformats them on boot."""
+        if self._uses_native_tcp():
+            def operation(client):
+                client.erase('userdata')
+                try:
+                    client.erase('metadata')
+                except FastbootProtocolError:
+                    pass  # Only devices with metadata encryption have it.
+                return "Erasing 'userdata' OKAY"
+            return self._native_call(['-w'], operation)
+        return self._run_fastboot_command(['-w'])
+
+    def update_super(self, fileobj, size, wipe=False, spool_dir=None):
+        """
+        Rewrites the dynamic partition layout from super_empty.img (in fastbootd).
+        tools/fastboot only exposes the wiping form (`wipe-super`); without wipe it
+        is skipped there, and fastbootd resizes logical partitions as they are flashed.
+        """
+        if self._uses_native_tcp():
+            return self._native_call(['update-super'], lambda c: self._describe_transfer(
+                'Updating', 'super', c.update_super(fileobj, size, wipe)))
+        if not wipe:
+            logger.info("tools/fastboot cannot update super without wiping it; relying on fastbootd resizing")
+            return ''
+        with self._spooled(fileobj, spool_dir) as path:
+            return self._run_fastboot_command(['wipe-super', path])
+
+    def wait_for_device(self, timeout=90, interval=1.0):
+        """Waits for the device to answer in fastboot (e.g. after a reboot). Returns True once it does."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.getvar('product') is not None:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
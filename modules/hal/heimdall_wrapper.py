@@ -1,14 +1,70 @@
 # modules/hal/heimdall_wrapper.py
 
+import logging
+import os
+import re
+import threading
+import time
+
+from modules.exceptions import ToolError
+
+from . import pit
 from .tool_wrapper import ToolWrapper
 
+logger = logging.getLogger("ACRD")
+
+_UPLOADING = re.compile(r'Uploading (?P<name>\S+)')
+_UPLOADED = re.compile(r'(?P<name>\S+) upload successful')
+
 class HeimdallWrapper(ToolWrapper):
-    def __init__(self, tool_path):
+    command_timeouts = {
+        'detect': 15,
+        'print-pit': 60,
+        'download-pit': 60,
+        'flash': 1800,
+    }
+
+    # Device keys whose session a --no-reboot command left open; the next flash must --resume it.
+    # None stands for a device in Download Mode that reports no USB serial.
+    _open_sessions = set()
+    _open_sessions_lock = threading.Lock()
+
+    def __init__(self, tool_path, device_key=None):
         super().__init__(tool_path)
+        # Identifies the device in Download Mode (see device_quarry.download_mode_key).
+        self.device_key = device_key
+
+    @classmethod
+    def session_open(cls, device_key=None):
+        """True if a --no-reboot command left the device's Heimdall session open."""
+        with cls._open_sessions_lock:
+            return device_key in cls._open_sessions
+
+    @classmethod
+    def mark_session(cls, device_key=None, is_open=True):
+        """Records whether the device's Heimdall session was left open for --resume."""
+        with cls._open_sessions_lock:
+            if is_open:
+                cls._open_sessions.add(device_key)
+            else:
+                cls._open_sessions.discard(device_key)
+
+    @classmethod
+    def end_sessions(cls, device_key=None):
+        """Forgets the open session of a device that was unplugged or rebooted (or of every device)."""
+        with cls._open_sessions_lock:
+            if device_key is None:
+                cls._open_sessions.clear()
+            else:
+                cls._open_sessions.discard(device_key)
 
     def _run_heimdall_command(self, command):
         result = self._run_command(command)
-        return result.stdout.strip() if result else None
+        if not result:
+            # A failed command may have dropped the USB session; resuming it would fail the handshake.
+            HeimdallWrapper.mark_session(self.device_key, False)
+            return None
+        return result.stdout.strip()
 
     def detect(self):
         """Checks if a device is in Download Mode (Samsung)."""
@@ -17,8 +73,79 @@ class HeimdallWrapper(ToolWrapper):
 
     def print_pit(self):
         """Downloads and prints the PIT file from the device."""
-        return self._run_heimdall_command(['print-pit', '--no-reboot'])
+        output = self._run_heimdall_command(['print-pit', '--no-reboot'])
+        if output is not None:
+            HeimdallWrapper.mark_session(self.device_key)
+        return output
+
+    def get_pit(self):
+        """Downloads the device's PIT and returns it as a PitTable, or None if it could not be read."""
+        output = self.print_pit()
+        if not output:
+            return None
+        try:
+            return pit.parse_pit_text(output)
+        except ToolError:
+            return None
+
+    def download_pit(self, output_path):
+        """Saves the device's binary PIT to output_path. Returns True on success."""
+        if self._run_heimdall_command(['download-pit', '--output', output_path, '--no-reboot']) is None:
+            return False
+        HeimdallWrapper.mark_session(self.device_key)
+        return True
 
     def flash(self, partition_name, file_path):
         """Flashes a partition."""
         return self._run_heimdall_command(['flash', '--' + partition_name, file_path])
+
+    def flash_many(self, partitions, reboot=True, cancel_event=None):
+        """
+        Flashes several partitions in one Heimdall session (one USB handshake and PIT
+        exchange), given (partition_name, file_path) pairs. Returns per-partition
+        transfer stats, {name: {'file', 'bytes', 'seconds', 'mib_per_s'}}, or None if
+        Heimdall failed.
+        """
+        command = ['flash']
+        for name, path in partitions:
+            command += ['--' + name, path]
+        if HeimdallWrapper.session_open(self.device_key):
+            command.append('--resume')
+        if not reboot:
+            command.append('--no-reboot')
+
+        files = dict(partitions)
+        stats = {}
+        current, started = None, None
+        output = []
+        try:
+            for line in self.iter_lines(command, cancel_event=cancel_event, merge_stderr=True):
+                output.append(line)
+                # Progress percentages are redrawn with backspaces on the same line.
+                line = line.replace('\b', '')
+                uploaded = _UPLOADED.search(line)
+                if uploaded and uploaded.group('name') == current:
+                    seconds = time.monotonic() - started
+                    size = os.path.getsize(files[current])
+                    stats[current] = {
+                        'file': files[current],
+                        'bytes': size,
+                        'seconds': round(seconds, 3),
+                        'mib_per_s': round(size / (1024 * 1024) / seconds, 1) if seconds > 0 else 0.0,
+                    }
+                    current = None
+                    continue
+                uploading = _UPLOADING.search(line)
+                if uploading and uploading.group('name') in files:
+                    current, started = uploading.group('name'), time.monotonic()
+        except ToolError as e:  # Killed at the flash deadline.
+            logger.error(f"heimdall flash failed: {e}")
+            HeimdallWrapper.mark_session(self.device_key, False)
+            return None
+
+        if self.last_returncode != 0 or len(stats) != len(files):
+            logger.error(f"heimdall flash failed (exit {self.last_returncode}): {' | '.join(output[-5:])}")
+            HeimdallWrapper.mark_session(self.device_key, False)
+            return None
+        HeimdallWrapper.mark_session(self.device_key, not reboot)
+        return stats
@@ -0,0 +1,154 @@
+# modules/hal/pit.py
+
+"""Samsung PIT (Partition Information Table) parsing for binary .pit files and `heimdall print-pit` output."""
+
+from __future__ import annotations
+
+import collections
+import hashlib
+import json
+import re
+import struct
+
+from modules.exceptions import ToolError
+
+PIT_MAGIC = 0x12349876
+HEADER_SIZE = 28
+ENTRY_SIZE = 132
+# binary type, device type, identifier, attributes, update attributes, block offset,
+# block count, file offset, file size, partition name, flash filename, FOTA filename.
+_ENTRY = struct.Struct('<9I32s32s32s')
+_HEADER = struct.Struct('<II8s8sI')
+
+ATTRIBUTE_WRITE = 1 << 0
+ATTRIBUTE_STL = 1 << 1
+ATTRIBUTE_BML = 1 << 2
+UPDATE_ATTRIBUTE_FOTA = 1 << 0
+UPDATE_ATTRIBUTE_SECURE = 1 << 1
+
+PitEntry = collections.namedtuple('PitEntry', [
+    'identifier', 'name', 'flash_filename', 'block_offset', 'block_count',
+    'attributes', 'update_attributes', 'binary_type', 'device_type', 'fota_filename',
+])
+
+# `print-pit` field label -> PitEntry field
+_TEXT_FIELDS = {
+    'binary type': 'binary_type',
+    'device type': 'device_type',
+    'identifier': 'identifier',
+    'attributes': 'attributes',
+    'update attributes': 'update_attributes',
+    'partition block size/offset': 'block_offset',
+    'partition block size': 'block_offset',
+    'partition block count': 'block_count',
+    'partition name': 'name',
+    'flash filename': 'flash_filename',
+    'fota filename': 'fota_filename',
+}
+_TEXT_INTS = {'binary_type', 'device_type', 'identifier', 'attributes', 'update_attributes', 'block_offset', 'block_count'}
+_ENTRY_START = re.compile(r'^--- Entry #\d+ ---$')
+
+
+class PitTable:
+    """A device's partition table, in PIT order."""
+
+    def __init__(self, entries, chip=None):
+        self.entries = list(entries)
+        self.chip = chip
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __eq__(self, other):
+        return isinstance(other, PitTable) and self.entries == other.entries and self.chip == other.chip
+
+    def find(self, name):
+        """The entry for a partition name (case-insensitive), or None."""
+        name = name.upper()
+        return next((e for e in self.entries if e.name.upper() == name), None)
+
+    def find_by_filename(self, filename):
+        """The entry whose flash filename matches (case-insensitive, ignoring .lz4), or None."""
+        filename = filename.lower().removesuffix('.lz4')
+        return next((e for e in self.entries if e.flash_filename and e.flash_filename.lower() == filename), None)
+
+    def to_json(self):
+        return json.dumps({'chip': self.chip, 'entries': [e._asdict() for e in self.entries]}, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls([PitEntry(**e) for e in data['entries']], data.get('chip'))
+
+    def sha256(self):
+        """Digest of the table's content, to tell whether a cached table is still current."""
+        return hashlib.sha256(self.to_json().encode()).hexdigest()
+
+
+def _cstring(raw):
+    return raw.split(b'\0', 1)[0].decode('ascii', errors='replace')
+
+
+def parse_pit_binary(data: bytes) -> PitTable:
+    """Parses a binary .pit file (as written by `heimdall download-pit` or shipped in firmware)."""
+    if len(data) < HEADER_SIZE:
+        raise ToolError("PIT data is too short")
+    magic, count, _, chip, _ = _HEADER.unpack_from(data)
+    if magic != PIT_MAGIC:
+        raise ToolError(f"Not a PIT file (magic {magic:#010x})")
+    if len(data) < HEADER_SIZE + count * ENTRY_SIZE:
+        raise ToolError(f"PIT declares {count} entries but holds {(len(data) - HEADER_SIZE) // ENTRY_SIZE}")
+    entries = []
+    for i in range(count):
+        (binary_type, device_type, identifier, attributes, update_attributes, block_offset,
+         block_count, _, _, name, flash_filename, fota_filename) = _ENTRY.unpack_from(data, HEADER_SIZE + i * ENTRY_SIZE)
+        entries.append(PitEntry(
+            identifier, _cstring(name), _cstring(flash_filename), block_offset, block_count,
+            attributes, update_attributes, binary_type, device_type, _cstring(fota_filename),
+        ))
+    return PitTable(entries, _cstring(chip) or None)
+
+
+def parse_pit_text(text: str) -> PitTable:
+    """Parses `heimdall print-pit` output; banner and header lines are ignored."""
+    entries = []
+    fields = None
+    for line in text.splitlines():
+        line = line.strip()
+        if _ENTRY_START.match(line):
+            if fields is not None:
+                entries.append(_text_entry(fields))
+            fields = {}
+            continue
+        if fields is None or ':' not in line:
+            continue
+        label, value = line.split(':', 1)
+        field = _TEXT_FIELDS.get(label.strip().lower())
+        if field:
+            value = value.strip()
+            # Numeric fields may carry a description: "Attributes: 5 (Read/Write)".
+            fields[field] = int(value.split()[0]) if field in _TEXT_INTS else value
+    if fields is not None:
+        entries.append(_text_entry(fields))
+    if not entries:
+        raise ToolError("No PIT entries found in print-pit output")
+    return PitTable(entries)
+
+
+def _text_entry(fields):
+    defaults = dict.fromkeys(PitEntry._fields, 0)
+    defaults.update(name='', flash_filename='', fota_filename='')
+    defaults.update(fields)
+    return PitEntry(**defaults)
+
+
+def parse_pit(data) -> PitTable:
+    """Parses either form: bytes starting with the PIT magic are binary, anything else is print-pit text."""
+    if isinstance(data, bytes):
+        if data[:4] == struct.pack('<I', PIT_MAGIC):
+            return parse_pit_binary(data)
+        data = data.decode('utf-8', errors='replace')
+    return parse_pit_text(data)
@@ -0,0 +1,122 @@
+# modules/hal/scheduler.py
+
+from __future__ import annotations
+
+import collections
+import contextlib
+import itertools
+import threading
+
+# Lower values are admitted first when processes queue for the same tool.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BULK = 20
+
+# tool -> (max processes overall, max processes per device serial); None means unlimited.
+# fastboot and heimdall own the USB pipe for the whole command, so one op per device;
+# heimdall cannot address a device by serial, so it is one op overall.
+DEFAULT_LIMITS = {
+    'adb': (8, None),
+    'fastboot': (None, 1),
+    'heimdall': (1, 1),
+}
+
+
+# Per-device key of commands run without a serial (`fastboot devices`, or a `-s`-less
+# flash with one device attached): they share one bucket, so the per-device limit
+# still serializes them with each other, but not with commands naming a serial.
+ANY_DEVICE = '*'
+
+
+class ToolScheduler:
+    """
+    Admission control for every tool process the HAL spawns.
+
+    Each process holds a slot for its tool and device (ANY_DEVICE without a serial)
+    while it runs. Waiters are admitted in (priority, arrival) order, but a waiter
+    blocked only by its own device's limit does not hold back waiters for other devices.
+    """
+
+    def __init__(self, limits: dict | None = None):
+        self._limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._cond = threading.Condition()
+        self._running = collections.Counter()
+        self._running_per_device = collections.Counter()
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    def set_limits(self, tool: str, total: int | None = None, per_device: int | None = None):
+        """Sets the concurrency limits of one tool."""
+        with self._cond:
+            self._limits[tool] = (total, per_device)
+            self._cond.notify_all()
+
+    def limits(self, tool: str) -> tuple:
+        with self._cond:
+            return self._limits.get(tool, (None, None))
+
+    def running(self, tool: str, serial: str | None = None) -> int:
+        """Number of processes currently holding a slot for a tool (or one device of it)."""
+        with self._cond:
+            if serial is None:
+                return self._running[tool]
+            return self._running_per_device[(tool, serial)]
+
+    def _has_capacity(self, tool, serial):
+        total, per_device = self._limits.get(tool, (None, None))
+        if total is not None and self._running[tool] >= total:
+            return False
+        if per_device is not None:
+            return self._running_per_device[(tool, serial)] < per_device
+        return True
+
+    def _admissible(self, entry):
+        _, _, tool, serial = entry
+        if not self._has_capacity(tool, serial):
+            return False
+        # Anyone ahead of us in the queue who could run now gets the slot first.
+        return not any(
+            other < entry and other[2] == tool and self._has_capacity(other[2], other[3])
+            for other in self._waiting
+        )
+
+    def acquire(self, tool: str, serial: str | None = None,
+                priority: int = PRIORITY_NORMAL, timeout: float | None = None) -> bool:
+        """Waits for a slot. Returns False if none was granted within timeout."""
+        serial = ANY_DEVICE if serial is None else serial
+        entry = (priority, next(self._arrivals), tool, serial)
+        with self._cond:
+            self._waiting.append(entry)
+            try:
+                if not self._cond.wait_for(lambda: self._admissible(entry), timeout):
+                    return False
+                self._running[tool] += 1
+                self._running_per_device[(tool, serial)] += 1
+                return True
+            finally:
+                self._waiting.remove(entry)
+                self._cond.notify_all()
+
+    def release(self, tool: str, serial: str | None = None):
+        serial = ANY_DEVICE if serial is None else serial
+        with self._cond:
+            self._running[tool] -= 1
+            self._running_per_device[(tool, serial)] -= 1
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, tool: str, serial: str | None = None, priority: int = PRIORITY_NORMAL):
+        """Holds a slot for the duration of the with block."""
+        self.acquire(tool, serial, priority)
+        try:
+            yield
+        finally:
+            self.release(tool, serial)
+
+
+# Process-wide scheduler shared by every wrapper instance.
+_scheduler = ToolScheduler()
+
+def get_scheduler() -> ToolScheduler:
+    """Returns the process-wide tool scheduler."""
+    return _scheduler
@@ -0,0 +1,281 @@
+# modules/hal/shell_session.py
+
+from __future__ import annotations
+
+import collections
+import itertools
+import queue
+import socket
+import subprocess
+import threading
+import time
+import uuid
+
+from modules.exceptions import ToolError
+from .tool_wrapper import MAX_LINE_LENGTH, iter_decoded_lines
+
+ShellResult = collections.namedtuple('ShellResult', ['output', 'exit_code'])
+READ_SIZE = 65536
+QUEUED_READS = 4
+
+
+class _ProcessChannel:
+    """
+    Byte channel over the stdin/stdout pipes of an `adb shell sh` process. A reader
+    thread drains stdout into a queue, since pipes cannot be polled on Windows.
+    """
+
+    def __init__(self, command: list[str]):
+        try:
+            self._process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0,
+            )
+        except FileNotFoundError as exc:
+            raise ToolError(f"Tool not found at {command[0]}") from exc
+        # Bounded, so a fast producer waits for the consumer instead of filling memory.
+        self._chunks = queue.Queue(maxsize=QUEUED_READS)
+        self._eof = False
+        self._reader = threading.Thread(target=self._drain, name="acrd-shell-reader", daemon=True)
+        self._reader.start()
+
+    def _drain(self):
+        try:
+            while True:
+                chunk = self._process.stdout.read(READ_SIZE)
+                if not chunk:
+                    break
+                self._chunks.put(chunk)
+        except (OSError, ValueError):
+            pass
+        self._chunks.put(b"")
+
+    def write(self, data: bytes):
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+
+    def read(self, timeout: float):
+        """The next chunk of output, b"" at end of stream, or None if nothing arrived in time."""
+        if self._eof:
+            return b""
+        try:
+            chunk = self._chunks.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._eof = not chunk
+        return chunk
+
+    def alive(self):
+        return self._process.poll() is None
+
+    def _discard(self, deadline: float):
+        """Drops queued output until the reader thread finishes or the deadline passes."""
+        while self._reader.is_alive() and time.monotonic() < deadline:
+            try:
+                self._chunks.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+    def close(self, timeout: float = 2):
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        # Keep the pipe draining so the process is not stuck writing while it exits.
+        deadline = time.monotonic() + timeout
+        self._discard(deadline)
+        try:
+            self._process.wait(timeout=max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._discard(time.monotonic() + 1)
+        self._process.stdout.close()
+
+
+class _SocketChannel:
+    """Byte channel over a native adb `shell:sh` service socket."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._closed = False
+
+    def write(self, data: bytes):
+        self._sock.sendall(data)
+
+    def read(self, timeout: float):
+        """The next chunk of output, b"" at end of stream, or None if nothing arrived in time."""
+        self._sock.settimeout(timeout)
+        try:
+            return self._sock.recv(READ_SIZE)
+        except socket.timeout:
+            return None
+
+    def alive(self):
+        return not self._closed
+
+    def close(self, timeout: float = 2):
+        self._closed = True
+        self._sock.close()
+
+
+class ShellSession:
+    """
+    One long-lived device shell that runs many commands.
+
+    Each command is framed by a unique sentinel line carrying its exit code, so
+    several commands can be written at once (pipelined) and their outputs split
+    apart afterwards. Commands run in a subshell with stdin from /dev/null so
+    they cannot consume the framing of the commands queued behind them.
+    """
+
+    def __init__(self, channel, timeout: float = 30.0):
+        self._channel = channel
+        self.timeout = timeout
+        self._token = uuid.uuid4().hex
+        self._counter = itertools.count()
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        # Exit code of the last streamed command, set once its output is exhausted.
+        self.last_exit_code = None
+
+    @classmethod
+    def over_process(cls, command: list[str], **kwargs):
+        """Opens a session by spawning `adb [-s serial] shell sh`."""
+        return cls(_ProcessChannel(command), **kwargs)
+
+    @classmethod
+    def over_socket(cls, sock, **kwargs):
+        """Opens a session over a native adb `shell:sh` socket."""
+        return cls(_SocketChannel(sock), **kwargs)
+
+    def _frame(self, command: str) -> tuple[bytes, bytes]:
+        marker = f"__ACRD_{self._token}_{next(self._counter)}__"
+        # A subshell keeps `exit`/`cd` in one command from leaking into the session.
+        script = f"( {command}\n) </dev/null 2>&1; __acrd_rc=$?; echo; echo \"{marker} $__acrd_rc\"\n"
+        return script.encode(), marker.encode()
+
+    def _fill(self, deadline: float):
+        """Appends the next chunk from the channel to the buffer."""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.close()
+                raise ToolError("Timed out waiting for shell session output")
+            try:
+                chunk = self._channel.read(remaining)
+            except OSError as exc:
+                self.close()
+                raise ToolError(f"Shell session read failed: {exc}") from exc
+            if chunk is not None:
+                break
+        if not chunk:
+            self.close()
+            raise ToolError("Shell session closed by device")
+        self._buffer += chunk
+
+    def _read_until(self, marker: bytes, deadline: float) -> ShellResult:
+        # The framing's bare `echo` guarantees a newline right before every marker.
+        needle = b"\n" + marker + b" "
+        search_from = 0
+        while True:
+            index = self._buffer.find(needle, search_from)
+            if index != -1:
+                end = self._buffer.find(b"\n", index + len(needle))
+                if end != -1:
+                    output = bytes(self._buffer[:index])
+                    exit_code = int(self._buffer[index + len(needle):end])
+                    del self._buffer[:end + 1]
+                    return ShellResult(output.decode(errors="replace"), exit_code)
+            else:
+                # Only rescan the tail that could hold a marker split across reads.
+                search_from = max(0, len(self._buffer) - len(needle))
+            self._fill(deadline)
+
+    def run(self, command: str) -> ShellResult:
+        """Runs one command and returns its (output, exit_code)."""
+        return self.run_many([command])[0]
+
+    def run_many(self, commands: list[str]) -> list[ShellResult]:
+        """Writes every command at once, then collects their results in order."""
+        with self._lock:
+            framed = [self._frame(c) for c in commands]
+            try:
+                self._channel.write(b"".join(script for script, _ in framed))
+            except OSError as exc:
+                self.close()
+                raise ToolError(f"Shell session write failed: {exc}") from exc
+            deadline = time.monotonic() + self.timeout * max(1, len(commands))
+            return [self._read_until(marker, deadline) for _, marker in framed]
+
+    def iter_chunks(self, command: str, cancel_event=None):
+        """
+        Runs one command and yields its output as it arrives, never holding more
+        than one read in memory. The session lock is held until the generator is
+        exhausted or closed; stopping early (or setting cancel_event) aborts the
+        session, which is reopened on next use. `timeout` applies between reads.
+        """
+        with self._lock:
+            self.last_exit_code = None
+            script, marker = self._frame(command)
+            try:
+                self._channel.write(script)
+            except OSError as exc:
+                self.close()
+                raise ToolError(f"Shell session write failed: {exc}") from exc
+
+            needle = b"\n" + marker + b" "
+            finished = False
+            try:
+                while True:
+                    index = self._buffer.find(needle)
+                    if index != -1:
+                        end = self._buffer.find(b"\n", index + len(needle))
+                        if end != -1:
+                            output = bytes(self._buffer[:index])
+                            self.last_exit_code = int(self._buffer[index + len(needle):end])
+                            del self._buffer[:end + 1]
+                            finished = True
+                            if output:
+                                yield output
+                            return
+                    else:
+                        # Hand over everything except a tail that could be the start of the marker.
+                        safe = len(self._buffer) - len(needle)
+                        if safe > 0:
+                            output = bytes(self._buffer[:safe])
+                            del self._buffer[:safe]
+                            yield output
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    self._fill(time.monotonic() + self.timeout)
+            finally:
+                if not finished:
+                    self.abort()
+
+    def iter_lines(self, command: str, cancel_event=None, max_line_length: int = MAX_LINE_LENGTH):
+        """Runs one command and yields its output line by line (see iter_chunks)."""
+        return iter_decoded_lines(self.iter_chunks(command, cancel_event=cancel_event),
+                                  max_line_length=max_line_length)
+
+    def alive(self) -> bool:
+        return self._channel.alive()
+
+    def close(self):
+        if self._channel.alive():
+            try:
+                self._channel.write(b"exit\n")
+            except OSError:
+                pass
+            self._channel.close()
+
+    def abort(self):
+        """Tears the session down at once, without waiting for the running command."""
+        self._buffer.clear()
+        if self._channel.alive():
+            self._channel.close(timeout=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,181 @@
+# modules/hal/stats.py
+
+from __future__ import annotations
+
+import collections
+import json
+import math
+import threading
+import time
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram over integer microseconds.
+
+    Values are bucketed by their top `precision_bits + 1` significant bits, so
+    buckets widen with magnitude and every percentile is within 1/2**precision_bits
+    of the true value while memory stays bounded however many values are recorded.
+    """
+
+    def __init__(self, precision_bits: int = 7):
+        self.precision_bits = precision_bits
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = None
+
+    def _bucket(self, value_us: int) -> int:
+        shift = max(0, value_us.bit_length() - self.precision_bits - 1)
+        return (value_us >> shift) << shift
+
+    def _bucket_top(self, bucket: int) -> int:
+        shift = max(0, bucket.bit_length() - self.precision_bits - 1)
+        return bucket + (1 << shift) - 1
+
+    def record(self, seconds: float):
+        value_us = max(0, int(seconds * 1_000_000))
+        self.buckets[self._bucket(value_us)] += 1
+        self.count += 1
+        self.total_us += value_us
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+        self.max_us = value_us if self.max_us is None else max(self.max_us, value_us)
+
+    def merge(self, other: LatencyHistogram):
+        """Adds every value recorded in another histogram of the same precision."""
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total_us += other.total_us
+        for value in (other.min_us, other.max_us):
+            if value is not None:
+                self.min_us = value if self.min_us is None else min(self.min_us, value)
+                self.max_us = value if self.max_us is None else max(self.max_us, value)
+        return self
+
+    def percentile(self, percent: float) -> float | None:
+        """Latency in seconds at a percentile (0-100), or None if nothing was recorded."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self._bucket_top(bucket), self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    def mean(self) -> float | None:
+        return self.total_us / self.count / 1_000_000 if self.count else None
+
+
+class HalStats:
+    """
+    Process-wide record of every tool invocation made by the HAL: a latency
+    histogram plus call/failure/timeout/byte counters per (tool, subcommand,
+    serial), and an optional JSONL trace with one line per invocation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._trace = None
+
+    def record(self, tool: str, subcommand: str, serial: str | None, duration: float,
+               exit_code: int | None, output_bytes: int = 0, timed_out: bool = False):
+        key = (tool, subcommand, serial)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+                self._counters[key] = collections.Counter()
+            histogram.record(duration)
+            counters = self._counters[key]
+            counters['calls'] += 1
+            counters['bytes'] += output_bytes
+            if timed_out:
+                counters['timeouts'] += 1
+            elif exit_code != 0:
+                counters['failures'] += 1
+            if self._trace is not None:
+                self._trace.write(json.dumps({
+                    'ts': time.time(),
+                    'tool': tool,
+                    'subcommand': subcommand,
+                    'serial': serial,
+                    'duration': round(duration, 6),
+                    'exit_code': exit_code,
+                    'bytes': output_bytes,
+                    'timed_out': timed_out,
+                }) + '\n')
+                self._trace.flush()
+
+    def _matching(self, tool, subcommand, serial):
+        return [key for key in self._histograms
+                if (tool is None or key[0] == tool)
+                and (subcommand is None or key[1] == subcommand)
+                and (serial is None or key[2] == serial)]
+
+    def histogram(self, tool=None, subcommand=None, serial=None) -> LatencyHistogram:
+        """Merged histogram of every invocation matching the given filters."""
+        merged = LatencyHistogram()
+        with self._lock:
+            for key in self._matching(tool, subcommand, serial):
+                merged.merge(self._histograms[key])
+        return merged
+
+    def counters(self, tool=None, subcommand=None, serial=None) -> collections.Counter:
+        """Summed counters ('calls', 'failures', 'timeouts', 'bytes') matching the filters."""
+        total = collections.Counter()
+        with self._lock:
+            for key in self._matching(tool, subcommand, serial):
+                total.update(self._counters[key])
+        return total
+
+    def summary(self, by_serial: bool = False) -> list[dict]:
+        """One row per (tool, subcommand[, serial]) with counters and p50/p90/p99/max in seconds."""
+        groups = {}
+        with self._lock:
+            for key, histogram in self._histograms.items():
+                group = key if by_serial else key[:2]
+                merged, counters = groups.setdefault(group, (LatencyHistogram(), collections.Counter()))
+                merged.merge(histogram)
+                counters.update(self._counters[key])
+        rows = []
+        for group in sorted(groups, key=lambda k: tuple(part or '' for part in k)):
+            histogram, counters = groups[group]
+            row = {'tool': group[0], 'subcommand': group[1]}
+            if by_serial:
+                row['serial'] = group[2]
+            row.update({
+                'calls': counters['calls'],
+                'failures': counters['failures'],
+                'timeouts': counters['timeouts'],
+                'bytes': counters['bytes'],
+                'p50': histogram.percentile(50),
+                'p90': histogram.percentile(90),
+                'p99': histogram.percentile(99),
+                'max': histogram.max_us / 1_000_000,
+            })
+            rows.append(row)
+        return rows
+
+    def set_trace_file(self, path: str | None):
+        """Starts appending one JSON line per invocation to path (None stops tracing)."""
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+            self._trace = open(path, 'a', encoding='utf-8') if path else None
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+_hal_stats = HalStats()
+
+def get_hal_stats() -> HalStats:
+    """Returns the process-wide HAL statistics."""
+    return _hal_stats
@@ -0,0 +1,119 @@
+# modules/hal/tar_stream.py
+
+"""Helpers for streaming tar archives between the host and a device shell."""
+
+from __future__ import annotations
+
+import fnmatch
+import io
+import os
+import shlex
+import tarfile
+
+from modules.exceptions import ToolError
+
+# compression -> (device tar flag, tarfile stream mode suffix)
+TAR_COMPRESSION = {
+    None: ('', ''),
+    'gzip': ('z', 'gz'),
+}
+
+
+def _compression(compression):
+    if compression not in TAR_COMPRESSION:
+        raise ToolError(f"Unsupported tar compression: {compression}")
+    return TAR_COMPRESSION[compression]
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks, counting what it hands out."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = b''
+        self._offset = 0
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset >= len(self._chunk):
+            self._chunk = next(self._chunks, b'')
+            self._offset = 0
+            if not self._chunk:
+                return 0
+        size = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:size] = self._chunk[self._offset:self._offset + size]
+        self._offset += size
+        self.bytes_read += size
+        return size
+
+    def close(self):
+        # Stops (and reaps) whatever produces the chunks, e.g. an `adb exec-out` process.
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        super().close()
+
+
+def remote_pack_command(remote_dir: str, include=None, compression=None) -> str:
+    """Device shell command writing a tar of remote_dir's contents (optionally filtered) to stdout."""
+    flag, _ = _compression(compression)
+    command = f"cd {shlex.quote(remote_dir)} && "
+    if include:
+        names = " -o ".join(f"-name {shlex.quote(pattern)}" for pattern in include)
+        return command + f"find . -type f \\( {names} \\) | tar -c{flag}f - -T -"
+    return command + f"tar -c{flag}f - ."
+
+
+def remote_unpack_command(remote_dir: str, compression=None) -> str:
+    """Device shell command unpacking a tar read from stdin into remote_dir."""
+    flag, _ = _compression(compression)
+    quoted = shlex.quote(remote_dir)
+    return f"mkdir -p {quoted} && cd {quoted} && tar -x{flag}f -"
+
+
+# Extraction filters (Python 3.12, backported to 3.8.17+/3.11.4+); 'data' is the default from 3.14.
+_EXTRACT_OPTIONS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+
+def _is_safe(member: tarfile.TarInfo) -> bool:
+    name = os.path.normpath(member.name)
+    if os.path.isabs(name) or name == '..' or name.startswith('..' + os.sep):
+        return False
+    return member.isfile() or member.isdir()
+
+
+def unpack_stream(fileobj, local_dir: str, compression=None) -> int:
+    """
+    Unpacks a tar stream into local_dir as it arrives and returns the number of
+    files written. Links, devices and paths escaping local_dir are skipped.
+    """
+    _, suffix = _compression(compression)
+    os.makedirs(local_dir, exist_ok=True)
+    files = 0
+    with tarfile.open(fileobj=fileobj, mode=f"r|{suffix}") as archive:
+        for member in archive:
+            if not _is_safe(member):
+                continue
+            archive.extract(member, local_dir, set_attrs=False, **_EXTRACT_OPTIONS)
+            if member.isfile():
+                files += 1
+    return files
+
+
+def pack_tree(fileobj, local_dir: str, include=None, compression=None) -> int:
+    """Writes local_dir's files (optionally filtered by basename globs) as a tar stream; returns the file count."""
+    _, suffix = _compression(compression)
+    files = 0
+    with tarfile.open(fileobj=fileobj, mode=f"w|{suffix}") as archive:
+        for root, dirs, names in os.walk(local_dir):
+            dirs.sort()
+            for name in sorted(names):
+                if include and not any(fnmatch.fnmatch(name, pattern) for pattern in include):
+                    continue
+                path = os.path.join(root, name)
+                archive.add(path, arcname=os.path.relpath(path, local_dir), recursive=False)
+                files += 1
+    return files
@@ -2,30 +2,201 @@
 
 from __future__ import annotations
 
+import codecs
+import logging
 import os
 import subprocess
+import threading
+import time
 
 from modules.exceptions import ToolError
+from . import scheduler
+from .stats import get_hal_stats
+
+logger = logging.getLogger("ACRD")
+
+# Streaming reads never hold more than one chunk, plus at most one partial line.
+STREAM_CHUNK_SIZE = 65536
+MAX_LINE_LENGTH = 65536
+
+
+def iter_decoded_lines(chunks, encoding: str = 'utf-8', max_line_length: int = MAX_LINE_LENGTH):
+    """
+    Incrementally decodes an iterable of byte chunks and yields its lines without
+    line endings. Lines longer than max_line_length are yielded in pieces so the
+    pending buffer stays bounded however the producer behaves.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ''
+    try:
+        for chunk in chunks:
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split('\n')
+            for line in lines:
+                while len(line) > max_line_length:
+                    yield line[:max_line_length]
+                    line = line[max_line_length:]
+                yield line.rstrip('\r')
+            while len(pending) > max_line_length:
+                yield pending[:max_line_length]
+                pending = pending[max_line_length:]
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield pending.rstrip('\r')
+    finally:
+        # Stopping early must stop (and reap) whatever produces the chunks.
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
 
 
 class ToolWrapper:
+    # Deadline in seconds per subcommand (the first argument after `-s serial`).
+    # A process still running at its deadline is killed and the command fails.
+    default_timeout = 300
+    command_timeouts = {'devices': 15}
+
     def __init__(self, tool_path: str):
         if not os.path.exists(tool_path):
             raise ToolError(f"Tool not found at {tool_path}")
         self.tool_path = tool_path
+        # Exit status of the last streamed command, set once its output is exhausted.
+        self.last_returncode = None
+        # Queueing priority of this wrapper's commands in the process-wide scheduler.
+        self.priority = scheduler.PRIORITY_NORMAL
+
+    @property
+    def tool_name(self) -> str:
+        """Scheduler key of the tool, e.g. 'adb' for tools/adb or tools\\adb.exe."""
+        return os.path.splitext(os.path.basename(self.tool_path))[0]
+
+    @staticmethod
+    def _subcommand_args(command: list[str]) -> list[str]:
+        args = list(command)
+        while args[:1] == ['-s']:
+            args = args[2:]
+        return args
+
+    def _timeout_for(self, command: list[str]):
+        args = self._subcommand_args(command)
+        if not args:
+            return self.default_timeout
+        return self.command_timeouts.get(args[0], self.default_timeout)
 
-    def _run_command(self, command: list[str]):
+    def _subcommand(self, command: list[str]) -> str:
+        """Stats key of a command: its subcommand, plus the program name for `shell`."""
+        args = self._subcommand_args(command)
+        if not args:
+            return ''
+        if args[0] == 'shell' and len(args) > 1 and args[1].split():
+            return f"shell {args[1].split()[0]}"
+        return args[0]
+
+    def _record(self, command: list[str], started: float, exit_code, output_bytes: int = 0,
+                timed_out: bool = False, tool: str | None = None):
+        """Records one invocation in the process-wide HAL statistics."""
+        get_hal_stats().record(
+            tool or self.tool_name, self._subcommand(command), getattr(self, 'serial', None),
+            time.monotonic() - started, exit_code, output_bytes, timed_out,
+        )
+
+    def _run_command(self, command: list[str], timeout: float | None = None):
+        """
+        Runs the tool once its scheduler slot is free. Returns the CompletedProcess,
+        or None if it exited non-zero or was killed at its deadline.
+        """
+        if timeout is None:
+            timeout = self._timeout_for(command)
+        with scheduler.get_scheduler().slot(self.tool_name, getattr(self, 'serial', None), self.priority):
+            started = time.monotonic()
+            try:
+                result = subprocess.run(
+                    [self.tool_path] + command,
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                )
+            except FileNotFoundError as exc:
+                raise ToolError(f"Tool not found at {self.tool_path}") from exc
+            except subprocess.CalledProcessError as exc:
+                self._record(command, started, exc.returncode, len(exc.stdout or '') + len(exc.stderr or ''))
+                return None
+            except subprocess.TimeoutExpired as exc:
+                self._record(command, started, None, len(exc.stdout or '') + len(exc.stderr or ''), timed_out=True)
+                logger.warning(f"{self.tool_name} {' '.join(command)} timed out after {timeout}s and was killed")
+                return None
+            self._record(command, started, result.returncode, len(result.stdout or '') + len(result.stderr or ''))
+            return result
+
+    def iter_chunks(self, command: list[str], chunk_size: int = STREAM_CHUNK_SIZE,
+                    cancel_event=None, merge_stderr: bool = False):
+        """
+        Runs the tool and yields its stdout as byte chunks of at most chunk_size.
+        Closing the generator early, or setting cancel_event (checked between
+        chunks), kills the process. `last_returncode` is set when it ends.
+        A process still running at its command's deadline (see _timeout_for) is
+        killed, and ToolError is raised once its output is drained.
+        """
+        timeout = self._timeout_for(command)
+        tools = scheduler.get_scheduler()
+        serial = getattr(self, 'serial', None)
+        tools.acquire(self.tool_name, serial, self.priority)
         try:
-            return subprocess.run(
+            process = subprocess.Popen(
                 [self.tool_path] + command,
-                check=True,
-                capture_output=True,
-                text=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if merge_stderr else subprocess.DEVNULL,
             )
         except FileNotFoundError as exc:
+            tools.release(self.tool_name, serial)
             raise ToolError(f"Tool not found at {self.tool_path}") from exc
-        except subprocess.CalledProcessError:
-            return None
+
+        self.last_returncode = None
+        started = time.monotonic()
+        streamed = 0
+        finished = False
+        # A wedged process produces no output, so the deadline cannot be checked between reads.
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            while cancel_event is None or not cancel_event.is_set():
+                chunk = process.stdout.read1(chunk_size)
+                if not chunk:
+                    finished = True
+                    break
+                streamed += len(chunk)
+                yield chunk
+            if timed_out.is_set():
+                logger.warning(f"{self.tool_name} {' '.join(command)} timed out after {timeout}s and was killed")
+                raise ToolError(f"{self.tool_name} {self._subcommand(command)} timed out after {timeout}s")
+        finally:
+            watchdog.cancel()
+            if not finished and process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            self.last_returncode = process.wait()
+            tools.release(self.tool_name, serial)
+            if timed_out.is_set():
+                self._record(command, started, None, streamed, timed_out=True)
+            else:
+                self._record(command, started, self.last_returncode, streamed)
+
+    def iter_lines(self, command: list[str], cancel_event=None, merge_stderr: bool = False,
+                   encoding: str = 'utf-8', max_line_length: int = MAX_LINE_LENGTH):
+        """Runs the tool and yields its output line by line without buffering all of it."""
+        chunks = self.iter_chunks(command, cancel_event=cancel_event, merge_stderr=merge_stderr)
+        return iter_decoded_lines(chunks, encoding=encoding, max_line_length=max_line_length)
 
     @staticmethod
     def _parse_device_list(output: str, marker: str) -> list[str]:
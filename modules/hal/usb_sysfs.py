@@ -0,0 +1,102 @@
+# modules/hal/usb_sysfs.py
+
+from __future__ import annotations
+
+import os
+
+SYSFS_USB_DEVICES = '/sys/bus/usb/devices'
+
+# (bInterfaceClass, bInterfaceSubClass, bInterfaceProtocol) advertised by adbd and fastboot.
+ADB_INTERFACE = ('ff', '42', '01')
+FASTBOOT_INTERFACE = ('ff', '42', '03')
+
+# (idVendor, idProduct) of boot-ROM / flashing modes that expose no adb or fastboot interface.
+USB_MODES = {
+    ('05c6', '9008'): 'edl',        # Qualcomm Emergency Download (Sahara/Firehose)
+    ('04e8', '685d'): 'download',   # Samsung Download Mode (Odin/Heimdall)
+    ('04e8', '68c3'): 'download',
+    ('0e8d', '0003'): 'brom',       # MediaTek BootROM
+    ('0e8d', '2000'): 'preloader',  # MediaTek Preloader
+}
+
+
+def _read_attr(path: str) -> str | None:
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _interface_signatures(root: str) -> dict[str, set[tuple]]:
+    """Maps each USB device directory to the set of interface class triples it exposes."""
+    signatures: dict[str, set[tuple]] = {}
+    for name in os.listdir(root):
+        if ':' not in name:
+            continue
+        iface = os.path.join(root, name)
+        triple = tuple(
+            (_read_attr(os.path.join(iface, attr)) or '').lower()
+            for attr in ('bInterfaceClass', 'bInterfaceSubClass', 'bInterfaceProtocol')
+        )
+        signatures.setdefault(name.split(':', 1)[0], set()).add(triple)
+    return signatures
+
+
+def enumerate_usb_devices(root: str | None = None) -> list[dict] | None:
+    """
+    Reads every USB device from sysfs in one pass and classifies its mode:
+    'edl', 'download', 'brom', 'preloader', 'adb', 'fastboot' or None.
+    Returns None when sysfs is not available (non-Linux hosts).
+    """
+    root = root or SYSFS_USB_DEVICES
+    if not os.path.isdir(root):
+        return None
+    signatures = _interface_signatures(root)
+    devices = []
+    for name in sorted(os.listdir(root)):
+        # Interfaces ("1-1:1.0") and root hubs ("usb1") are not devices we care about.
+        if ':' in name or name.startswith('usb'):
+            continue
+        path = os.path.join(root, name)
+        vid = _read_attr(os.path.join(path, 'idVendor'))
+        pid = _read_attr(os.path.join(path, 'idProduct'))
+        if not vid or not pid:
+            continue
+        vid, pid = vid.lower(), pid.lower()
+        triples = signatures.get(name, set())
+        if FASTBOOT_INTERFACE in triples:
+            mode = 'fastboot'
+        elif ADB_INTERFACE in triples:
+            mode = 'adb'
+        else:
+            mode = USB_MODES.get((vid, pid))
+        devices.append({
+            'path': name,
+            'vid': vid,
+            'pid': pid,
+            'serial': _read_attr(os.path.join(path, 'serial')),
+            'manufacturer': _read_attr(os.path.join(path, 'manufacturer')),
+            'product': _read_attr(os.path.join(path, 'product')),
+            'mode': mode,
+        })
+    return devices
+
+
+def devices_in_mode(mode: str, root: str | None = None) -> list[dict] | None:
+    """USB devices classified as `mode`, or None when sysfs is not available."""
+    devices = enumerate_usb_devices(root)
+    if devices is None:
+        return None
+    return [d for d in devices if d['mode'] == mode]
+
+
+def list_fastboot_serials(root: str | None = None) -> list[str] | None:
+    """
+    Lists serials of USB devices exposing a fastboot interface by reading sysfs.
+    Returns None when sysfs is not available (non-Linux hosts).
+    """
+    devices = devices_in_mode('fastboot', root)
+    if devices is None:
+        return None
+    return [d['serial'] for d in devices if d['serial']]
@@ -0,0 +1,136 @@
+# modules/hashing.py
+
+"""
+File and stream hashing shared by downloads, flash validation and artifact indexing.
+Several algorithms are computed in one pass, files are read through mmap (or large
+buffers), and hashlib releases the GIL on big chunks, so HashService can hash many
+files on a thread pool at close to disk speed.
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import mmap
+import os
+import re
+import threading
+
+import config
+
+logger = logging.getLogger("ACRD")
+
+ALGORITHMS = ('sha256', 'sha1', 'md5')
+# hashlib drops the GIL for updates over 2 KiB; big slices keep the per-call overhead negligible.
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+_HEX_LENGTHS = {64: 'sha256', 40: 'sha1', 32: 'md5'}
+_CHECKSUM = re.compile(r'(?:(sha256|sha1|md5)[:=])?([0-9a-f]+)$', re.IGNORECASE)
+
+
+class MultiHasher:
+    """Feeds the same bytes to several hashlib objects."""
+
+    def __init__(self, algorithms=('sha256',)):
+        unknown = [a for a in algorithms if a not in ALGORITHMS]
+        if unknown:
+            raise ValueError(f"Unsupported hash algorithm(s): {', '.join(unknown)}")
+        self._hashes = {a: hashlib.new(a) for a in dict.fromkeys(algorithms)}
+
+    def update(self, data):
+        for digest in self._hashes.values():
+            digest.update(data)
+
+    def hexdigests(self):
+        return {name: digest.hexdigest() for name, digest in self._hashes.items()}
+
+
+def parse_checksum(checksum):
+    """
+    Splits a manifest checksum into (algorithm, lowercase hex). Accepts "sha1:<hex>"
+    style prefixes; a bare hex digest is identified by its length. Raises ValueError.
+    """
+    match = _CHECKSUM.match((checksum or '').strip())
+    if not match:
+        raise ValueError(f"Unrecognised checksum: {checksum!r}")
+    algorithm, value = (match.group(1) or '').lower(), match.group(2).lower()
+    expected = _HEX_LENGTHS.get(len(value))
+    if expected is None or (algorithm and algorithm != expected):
+        raise ValueError(f"Unrecognised checksum: {checksum!r}")
+    return expected, value
+
+
+def hash_file(path, algorithms=('sha256',)):
+    """Returns {algorithm: hex digest} of a file, reading it in one pass."""
+    hasher = MultiHasher(algorithms)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, size, HASH_BUFFER_SIZE):
+                            hasher.update(view[offset:offset + HASH_BUFFER_SIZE])
+                    finally:
+                        view.release()
+                return hasher.hexdigests()
+            except (ValueError, OSError):
+                # Some filesystems (and special files) cannot be mapped.
+                hasher = MultiHasher(algorithms)
+                f.seek(0)
+            buffer = bytearray(HASH_BUFFER_SIZE)
+            view = memoryview(buffer)
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                hasher.update(view[:count])
+    return hasher.hexdigests()
+
+
+def verify_file(path, checksum):
+    """True if the file matches a checksum in any form parse_checksum accepts."""
+    algorithm, expected = parse_checksum(checksum)
+    return hash_file(path, (algorithm,))[algorithm] == expected
+
+
+class HashService:
+    """A thread pool that hashes files concurrently; see hash_file."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or config.HASH_WORKERS
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.workers),
+                                                           thread_name_prefix='acrd-hash')
+
+    def submit(self, path, algorithms=('sha256',)):
+        """Starts hashing one file; the future's result is hash_file's dict."""
+        return self._pool.submit(hash_file, path, algorithms)
+
+    def hash_files(self, paths, algorithms=('sha256',)):
+        """
+        Hashes every path concurrently and returns {path: {algorithm: hex}}. Files that
+        cannot be read are logged and left out.
+        """
+        futures = {path: self.submit(path, algorithms) for path in dict.fromkeys(paths)}
+        results = {}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except OSError as e:
+                logger.warning(f"Could not hash {path}: {e}")
+        return results
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_hash_service():
+    """The process-wide HashService."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = HashService()
+        return _service
@@ -0,0 +1,140 @@
+# modules/http_client.py
+
+"""
+The HTTP client shared by downloads, setup, the tool updater and URL checks: one
+pooled requests.Session with keep-alive, retries with backoff for idempotent requests,
+a default timeout and, with ACRD_HTTP2=1 and the h2 package installed, HTTP/2 over
+TLS. stats() tells how many requests reused a pooled connection.
+"""
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+import config
+
+logger = logging.getLogger("ACRD")
+
+DEFAULT_TIMEOUT = (10, 60)  # connect, read
+RETRY_BACKOFF = 0.5  # seconds, doubled per retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Enough pooled connections per host for every download range plus some headroom.
+POOL_SIZE = 16
+
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'connections': 0}
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+class _CountingPoolMixin:
+    # urlopen runs once per attempt (urllib3 retries call it again). A connection
+    # without a socket, new or dropped by the server while idle, is about to connect.
+    def urlopen(self, *args, **kwargs):
+        _count('requests')
+        return super().urlopen(*args, **kwargs)
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        if getattr(conn, 'sock', None) is None:
+            _count('connections')
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _Adapter(HTTPAdapter):
+    """Pools connections, counts their reuse and applies DEFAULT_TIMEOUT when none is given."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool, 'https': _CountingHTTPSConnectionPool}
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+
+def _enable_http2():
+    try:
+        import urllib3.http2
+        urllib3.http2.inject_into_urllib3()
+    except ImportError:  # Optional: `pip install h2` (with urllib3 2.3+) for HTTP/2.
+        logger.info("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def create_session(retries=None):
+    """A new session with the shared pool, retry and timeout settings."""
+    retry = Retry(
+        total=config.HTTP_RETRIES if retries is None else retries,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # The last response is returned; callers raise_for_status().
+    )
+    adapter = _Adapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = f"ACRD {requests.utils.default_user_agent()}"
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide session (created on first use)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            if config.HTTP2:
+                _enable_http2()
+            _session = create_session()
+        return _session
+
+
+def close():
+    """Closes the pooled connections; the next request opens new ones."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_session().head(url, **kwargs)
+
+
+def stats():
+    """Requests sent, connections opened, and how many requests reused a pooled connection."""
+    with _stats_lock:
+        return {**_stats, 'reused': max(0, _stats['requests'] - _stats['connections'])}
+
+
+def reset_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
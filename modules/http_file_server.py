@@ -0,0 +1,204 @@
+# modules/http_file_server.py
+
+"""
+Local HTTP/1.1 file server with Range, ETag and keep-alive support, for tests and
+for benchmarking the downloader without the network:
+
+    python -m modules.http_file_server --port 8000
+    python -m modules.http_file_server --benchmark 256 --rate 40
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import http.server
+import os
+import re
+import tempfile
+import threading
+import time
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+SEND_CHUNK_SIZE = 64 * 1024
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path, self.headers.get('Range')))
+        with server.lock:
+            errors = server.errors.get(self.path)
+            status = errors.pop(0) if errors else None
+        if status:
+            self.send_error(status)
+            return
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        etag = server.etags[self.path]
+        start, end, status = 0, len(data) - 1, 200
+        requested = self.headers.get('Range') if server.ranges else None
+        if_range = self.headers.get('If-Range')
+        # A weak ETag never satisfies If-Range, so the whole file is sent (RFC 7233).
+        if requested and (if_range is None or (if_range == etag and not if_range.startswith('W/'))):
+            match = _RANGE.match(requested.strip())
+            if not match or (not match.group(1) and not match.group(2)):
+                self.send_error(416)
+                return
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), len(data) - 1) if match.group(2) else len(data) - 1
+            else:
+                start = max(0, len(data) - int(match.group(2)))
+            if start >= len(data) or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(data)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if not send_body:
+            return
+
+        offset = start
+        while offset <= end:
+            chunk = data[offset:min(offset + SEND_CHUNK_SIZE, end + 1)]
+            with server.lock:
+                drop = server.drop_after.get(self.path)
+                if drop is not None and server.sent.get(self.path, 0) + len(chunk) > drop:
+                    # Simulates a dropped connection: send what fits, then hang up mid-body.
+                    del server.drop_after[self.path]
+                    chunk = chunk[:max(0, drop - server.sent.get(self.path, 0))]
+                    server.sent[self.path] = server.sent.get(self.path, 0) + len(chunk)
+                    self.wfile.write(chunk)
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                server.sent[self.path] = server.sent.get(self.path, 0) + len(chunk)
+            self.wfile.write(chunk)
+            offset += len(chunk)
+            if server.rate:
+                time.sleep(len(chunk) / server.rate)
+
+
+class HttpFileServer(http.server.ThreadingHTTPServer):
+    """
+    Serves in-memory files over HTTP/1.1 with keep-alive. Range requests (and
+    If-Range) are honoured unless ranges=False; rate caps each connection in
+    bytes/s; drop_after[path] = n hangs up once after n bytes of that file, and
+    errors[path] = [503, ...] answers the next requests for it with those statuses.
+    Counts connections and records every request.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, files=None, host='127.0.0.1', port=0, ranges=True, rate=None):
+        super().__init__((host, port), _Handler)
+        self.files = {}
+        self.etags = {}
+        self.ranges = ranges
+        self.rate = rate
+        self.drop_after = {}
+        self.errors = {}
+        self.sent = {}
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._thread = None
+        for path, data in (files or {}).items():
+            self.add_file(path, data)
+
+    def add_file(self, path, data):
+        self.files[path] = data
+        self.etags[path] = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+
+    def url(self, path):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{path}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="acrd-http-file-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _benchmark(size_mib, rate_mib, connections):
+    from modules import download
+
+    data = os.urandom(size_mib * 1024 * 1024)
+    server = HttpFileServer({'/image.zip': data}, rate=rate_mib * 1024 * 1024 if rate_mib else None).start()
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            for label, count in (("single stream", 1), (f"{connections} ranges", connections)):
+                destination = os.path.join(scratch, f"{count}.zip")
+                started = time.monotonic()
+                download.fetch(server.url('/image.zip'), destination, connections=count)
+                seconds = time.monotonic() - started
+                print(f"{label:>14}: {size_mib} MiB in {seconds:.2f}s ({size_mib / seconds:.1f} MiB/s)")
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP file server with Range support")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--directory", default=".", help="Serve the files in this directory (loaded into memory).")
+    parser.add_argument("--rate", type=float, help="Per-connection rate cap in MiB/s.")
+    parser.add_argument("--benchmark", type=int, metavar="MIB",
+                        help="Download a MIB-sized file single-stream and segmented, then exit.")
+    parser.add_argument("--connections", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.benchmark, args.rate, args.connections)
+        return
+
+    files = {}
+    for name in os.listdir(args.directory):
+        path = os.path.join(args.directory, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                files[f"/{name}"] = f.read()
+    server = HttpFileServer(files, port=args.port, rate=args.rate * 1024 * 1024 if args.rate else None)
+    print(f"Serving {len(files)} files on {server.url('/')}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,12 @@
 # modules/repair.py
 
-import os
 import logging
 
 from rich.console import Console
 from rich.prompt import Confirm
 
 import config
-from modules import ai_integration, logger as acrd_logger
+from modules import ai_integration, backup, device_quarry, flash_pipeline, flash_plan, samsung_flash, logger as acrd_logger
 from modules.exceptions import AIError, ToolError
 import modules.hal as hal
 
@@ -22,7 +21,7 @@ def repair_device(device_info):
     """
     console.print(f"[bold red]Repairing Device: {device_info.get('brand', '')} {device_info.get('model', 'Unknown')}[/bold red]")
     
-    options = ["Soft-brick Recovery", "Flash Factory Image", "IMEI Repair (Diagnostic)", "Hard-brick (EDL/Download)"]
+    options = ["Soft-brick Recovery", "Flash Factory Image", "IMEI Repair (Diagnostic)", "Hard-brick (EDL/Download)", "Back up Critical Partitions"]
     for i, opt in enumerate(options):
         console.print(f"{i+1}. {opt}")
     
@@ -32,7 +31,11 @@ def repair_device(device_info):
         recover_soft_brick(device_info)
     elif choice == '2':
         rom_path = console.input("Enter path to factory image folder: ")
-        flash_stock_rom(device_info, rom_path)
+        incremental = config.FLASH_INCREMENTAL and Confirm.ask(
+            "Skip partitions that already hold these exact images? (No forces a full flash)", default=True)
+        flash_stock_rom(device_info, rom_path, incremental=incremental)
+    elif choice == '5':
+        backup.backup_device(device_info)
     # ... other options
 
 def recover_soft_brick(device_info):
@@ -54,8 +57,8 @@ def check_battery(device_info):
     if device_info.get('boot_mode') == 'adb' and device_info.get('serial'):
         try:
             adb = hal.AdbWrapper(config.ADB_PATH, serial=device_info['serial'])
-            # Dumpsys is more reliable for battery info
-            battery_info = adb.shell(["dumpsys", "battery"])
+            # Dumpsys is more reliable for battery info; reuse the device's persistent shell session
+            battery_info = adb.shell_many(["dumpsys battery"])[0]
             if battery_info:
                 level_line = [line for line in battery_info.splitlines() if "level:" in line]
                 if level_line:
@@ -76,10 +79,14 @@ def check_battery(device_info):
         return Confirm.ask("Continue anyway?", default=True)
     return True # For other modes, we can't check, so we proceed with caution
 
-def flash_stock_rom(device_info, rom_path):
+def flash_stock_rom(device_info, rom_path, incremental=None):
     """
     Flashes a stock ROM to the device with safety checks.
+    With incremental (default: config.FLASH_INCREMENTAL), fastboot partitions whose last
+    flashed image is identical are skipped; pass incremental=False to force a full flash.
     """
+    if incremental is None:
+        incremental = config.FLASH_INCREMENTAL
     # Safety Checks
     if not Confirm.ask("[bold red]WARNING: This operation will wipe data and potentially brick the device. Continue?[/bold red]"):
         console.print("Operation cancelled.")
@@ -89,42 +96,99 @@ def flash_stock_rom(device_info, rom_path):
         console.print("[red]Battery check failed or user cancelled. Aborting.[/red]")
         return
 
+    if device_info.get('boot_mode') == 'adb':
+        if Confirm.ask("Back up critical partitions before flashing?", default=True):
+            manifest = backup.backup_device(device_info)
+            if manifest is None:
+                problem = "The partition backup failed."
+            elif not manifest['partitions']:
+                problem = "No partitions were backed up."
+            elif backup.incomplete_partitions(manifest):
+                problem = f"Not backed up completely: {', '.join(backup.incomplete_partitions(manifest))}."
+            else:
+                problem = None
+            if problem:
+                console.print(f"[red]{problem}[/red]")
+                if not Confirm.ask("[bold red]Flash anyway, without a complete backup?[/bold red]", default=False):
+                    console.print("Operation cancelled.")
+                    return
+    else:
+        console.print("[yellow]Partition backup needs the device booted to Android (ADB); continuing without one.[/yellow]")
+
     console.print(f"Flashing stock ROM from {rom_path}...")
     
     try:
         if device_info.get('boot_mode') in ['fastboot', 'fastbootd'] and device_info.get('serial'):
             fastboot = hal.FastbootWrapper(config.FASTBOOT_PATH, serial=device_info['serial'])
-            # Check for flash-all script first
-            flash_all_sh = os.path.join(rom_path, "flash-all.sh")
-            flash_all_bat = os.path.join(rom_path, "flash-all.bat")
-            
-            if os.path.exists(flash_all_sh): # Linux/Mac
-                 console.print("Executing flash-all.sh... (This is a placeholder, script will not be run)")
-                 # subprocess.run(['bash', flash_all_sh], check=True, cwd=rom_path)
+            plan, job_id, start = None, None, 0
+            resumable = flash_plan.find_resumable_job(device_info['serial'], device_info['boot_mode'])
+            if resumable:
+                job, resumed_plan, resume_at = resumable
+                step = resumed_plan.steps[resume_at]
+                if Confirm.ask(f"A flash of {job['source']} was interrupted at step {resume_at + 1}/{len(resumed_plan.steps)} "
+                               f"({step.action} {step.partition or ''}). Resume it?", default=True):
+                    plan, job_id, start = resumed_plan, job['id'], resume_at
+
+            if plan is None:
+                plan = flash_plan.build_plan(rom_path)
+                for warning in plan.warnings:
+                    console.print(f"[yellow]{warning}[/yellow]")
+                if not plan.flashes():
+                    console.print(f"[red]No images to flash in {rom_path}.[/red]")
+                    return
+                problems = flash_plan.validate_plan(plan, fastboot.getvar_all())
+                if problems:
+                    for problem in problems:
+                        console.print(f"[red]{problem}[/red]")
+                    console.print("[red]The factory image does not match this device. Nothing was flashed.[/red]")
+                    return
+
+            if plan.is_simple() and job_id is None:
+                # Every image is checked before the first write; the next one is hashed while the current one flashes.
+                # An interrupted run resumes through the flashed_images history (--incremental).
+                ok, results = flash_pipeline.flash_images(
+                    fastboot, [(step.partition, step.image) for step in plan.steps], fastboot.getvar_all(),
+                    model=device_info.get('model'),
+                    progress=lambda partition: console.print(f"Flashing {partition}..."),
+                    serial=device_info['serial'], incremental=incremental)
+                if not ok:
+                    failed = results[-1]
+                    console.print(f"[red]{failed['partition']}: {failed['error']}. Flashing stopped.[/red]")
+                    return
+                skipped = [r['partition'] for r in results if r['status'] == 'skipped']
+                if skipped:
+                    console.print(f"[green]Unchanged, not reflashed: {', '.join(skipped)}[/green]")
             else:
-                # Manual flashing of common partitions
-                images = {
-                    "boot": "boot.img",
-                    "system": "system.img",
-                    "vendor": "vendor.img",
-                    "recovery": "recovery.img",
-                    "vbmeta": "vbmeta.img",
-                    "dtbo": "dtbo.img"
-                }
-                
-                for partition, img_name in images.items():
-                    img_path = os.path.join(rom_path, img_name)
-                    if os.path.exists(img_path):
-                        console.print(f"Flashing {partition}...")
-                        fastboot.flash(partition, img_path)
-                    else:
-                        console.print(f"[yellow]Skipping {partition} (not found)[/yellow]")
-                        
+                # Factory image (flash-all.sh / image zip): bootloader, radio, reboots and the update payload, in order.
+                # Each step is checkpointed, so a run cut short can be resumed when the device reconnects.
+                console.print("Flash plan:\n  " + "\n  ".join(plan.describe()[start:]))
+                if job_id is None:
+                    job_id = flash_plan.start_job(plan, device_info['serial'], device_info['boot_mode'])
+                ok, results = flash_plan.execute_plan(
+                    fastboot, plan, model=device_info.get('model'), job_id=job_id, start=start,
+                    progress=lambda step: console.print(f"{step.action} {step.partition or ''}..."),
+                    serial=device_info['serial'], incremental=incremental)
+                if not ok:
+                    failed = results[-1]
+                    console.print(f"[red]{failed['action']} {failed['partition'] or ''} failed. "
+                                  f"Flashing stopped; reconnect the device to resume.[/red]")
+                    return
+                unchanged = [r['partition'] for r in results if r['status'] == 'unchanged']
+                if unchanged:
+                    console.print(f"[green]Unchanged, not reflashed: {', '.join(unchanged)}[/green]")
+
         elif device_info.get('boot_mode') == 'download': # Samsung
-            heimdall = hal.HeimdallWrapper(config.HEIMDALL_PATH)
-            console.print("Heimdall flashing is not yet implemented.")
-            # Heimdall logic to be implemented here
-            pass
+            heimdall = hal.HeimdallWrapper(config.HEIMDALL_PATH, device_key=device_info.get('device_key'))
+            table = device_quarry.load_partition_table(heimdall, device_info.get('device_key'))
+            if not table:
+                console.print("[red]Could not read the device's partition table (PIT). Aborting.[/red]")
+                return
+            stats = samsung_flash.flash_firmware(heimdall, table, rom_path)
+            if stats is None:
+                console.print("[red]Heimdall flashing failed.[/red]")
+                return
+            for partition, transfer in stats.items():
+                console.print(f"{partition}: {transfer['bytes'] // 1024} KB in {transfer['seconds']:.1f}s ({transfer['mib_per_s']} MiB/s)")
             
         console.print("[green]Stock ROM flashing complete.[/green]")
         
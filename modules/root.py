@@ -96,8 +96,8 @@ def execute_root_method(method, device_info):
     bootloader_unlocked = False
     if device_info.get('boot_mode') in ['fastboot', 'fastbootd'] and device_info.get('serial'):
         fb = FastbootWrapper(config.FASTBOOT_PATH, serial=device_info['serial'])
-        unlocked_var = fb.getvar('unlocked')
-        if unlocked_var and 'yes' in unlocked_var.lower():
+        unlocked_var = fb.getvar_all().get('vars', {}).get('unlocked')
+        if unlocked_var and unlocked_var.lower() == 'yes':
             bootloader_unlocked = True
     
     if reqs.get('bootloader_unlock') and not bootloader_unlocked:
@@ -0,0 +1,114 @@
+# modules/samsung_flash.py
+
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+
+from modules.exceptions import ToolError
+from modules.hal.tool_wrapper import STREAM_CHUNK_SIZE
+
+try:
+    import lz4.frame
+except ImportError:  # Optional: `pip install lz4` for Odin firmware with .lz4 images.
+    lz4 = None
+
+logger = logging.getLogger("ACRD")
+
+# Odin firmware slots in the order they are flashed. HOME_CSC keeps user data; CSC wipes it.
+ODIN_SLOTS = [('BL', 'BL_'), ('AP', 'AP_'), ('CP', 'CP_'), ('CSC', 'CSC_'), ('CSC', 'HOME_CSC_')]
+_ODIN_TAR = re.compile(r'\.tar(\.md5)?$', re.IGNORECASE)
+
+
+def find_firmware_tars(folder):
+    """
+    Returns the Odin tar set in folder as [(slot, path)] in flashing order.
+    CSC_* is preferred over HOME_CSC_* when both are present.
+    """
+    names = sorted(n for n in os.listdir(folder) if _ODIN_TAR.search(n))
+    found = {}
+    for slot, prefix in ODIN_SLOTS:
+        if slot in found:
+            continue
+        match = next((n for n in names if n.upper().startswith(prefix)), None)
+        if match:
+            found[slot] = os.path.join(folder, match)
+    return list(found.items())
+
+
+def _write_image(src, dest, compressed):
+    """Copies an image stream to dest, decompressing .lz4 frames on the way."""
+    if compressed:
+        if lz4 is None:
+            raise ToolError(f"{os.path.basename(dest)}.lz4 needs the 'lz4' package to decompress")
+        src = lz4.frame.LZ4FrameFile(src, 'rb')
+    with open(dest, 'wb') as f:
+        shutil.copyfileobj(src, f, STREAM_CHUNK_SIZE)
+
+
+def stage_firmware(table, source, scratch_dir):
+    """
+    Maps the images in source (a folder of images, a folder of Odin tars, or a single tar)
+    to PIT partitions and returns [(partition, path)] in PIT order. Plain images in a folder
+    are used in place; tar members are streamed into scratch_dir in one sequential pass per
+    tar, only for members the PIT knows, and .lz4 images are decompressed on the way.
+    """
+    if os.path.isdir(source):
+        tars = [path for _, path in find_firmware_tars(source)]
+    else:
+        tars = [source]
+
+    images = {}
+
+    def add(entry, path):
+        if entry.name in images:
+            logger.warning(f"{entry.name}: {path} replaces {images[entry.name]}")
+        images[entry.name] = path
+
+    if tars:
+        for tar_path in tars:
+            # Stream mode reads the archive front to back once; Odin's .md5 trailer is ignored.
+            with tarfile.open(tar_path, mode='r|') as archive:
+                for member in archive:
+                    name = os.path.basename(member.name)
+                    entry = table.find_by_filename(name) if member.isfile() else None
+                    if entry is None:
+                        continue
+                    dest = os.path.join(scratch_dir, name.removesuffix('.lz4'))
+                    _write_image(archive.extractfile(member), dest, name.endswith('.lz4'))
+                    add(entry, dest)
+    else:
+        for name in sorted(os.listdir(source)):
+            entry = table.find_by_filename(name)
+            if entry is None:
+                continue
+            path = os.path.join(source, name)
+            if name.endswith('.lz4'):
+                dest = os.path.join(scratch_dir, name.removesuffix('.lz4'))
+                with open(path, 'rb') as src:
+                    _write_image(src, dest, True)
+                path = dest
+            add(entry, path)
+
+    return [(entry.name, images[entry.name]) for entry in table if entry.name in images]
+
+
+def flash_firmware(heimdall, table, source, reboot=True):
+    """
+    Flashes every image in source that maps to a PIT partition in a single Heimdall
+    session. Returns per-partition transfer stats (see HeimdallWrapper.flash_many),
+    or None if Heimdall failed.
+    """
+    # Stage next to the firmware rather than in /tmp, which is often too small (or RAM).
+    parent = source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+    scratch = tempfile.mkdtemp(prefix='.acrd-heimdall-', dir=parent)
+    try:
+        partitions = stage_firmware(table, source, scratch)
+        if not partitions:
+            raise ToolError(f"No images in {source} match the device's partition table")
+        logger.info(f"Flashing {', '.join(name for name, _ in partitions)} in one Heimdall session")
+        return heimdall.flash_many(partitions, reboot=reboot)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
@@ -1,10 +1,9 @@
 # setup.py
 
 import os
-import requests
 import subprocess
 import sys
-from modules import db_manager
+from modules import db_manager, http_client
 
 # Tools metadata from ACRD-toolset.md
 TOOL_METADATA = {
@@ -193,7 +192,7 @@ TOOL_METADATA = {
 def download_file(url, dest_path):
     """Downloads a file."""
     print(f"Downloading {url} to {dest_path}...")
-    with requests.get(url, stream=True) as r:
+    with http_client.get(url, stream=True) as r:
         r.raise_for_status()
         with open(dest_path, 'wb') as f:
             for chunk in r.iter_content(chunk_size=8192):
@@ -0,0 +1,207 @@
+# tests/fake_adb_server.py
+
+"""A minimal in-process adb server speaking the host and sync protocols, for tests."""
+
+import socketserver
+import struct
+import threading
+
+
+class FakeDevice:
+    def __init__(self, serial, state="device", props=None, files=None, commands=None, shell_v2=True):
+        self.serial = serial
+        self.state = state
+        self.props = props or {}
+        self.files = files or {}
+        # Maps an exact shell command line to its output (str, or bytes for exec:), an
+        # (output, exit status) pair, or a callable returning either.
+        self.commands = commands or {}
+        # Devices before Android 7 only speak shell protocol v1.
+        self.shell_v2 = shell_v2
+        self.shell_log = []
+
+    def run_command(self, command):
+        """Returns (output, exit status) of a shell command line."""
+        self.shell_log.append(command)
+        if command in self.commands:
+            output = self.commands[command]
+            output = output(command) if callable(output) else output
+            return output if isinstance(output, tuple) else (output, 0)
+        parts = command.split()
+        if parts and parts[0] == "getprop":
+            if len(parts) == 1:
+                return "".join(f"[{k}]: [{v}]\n" for k, v in self.props.items()), 0
+            return self.props.get(parts[1], "") + "\n", 0
+        return f"/system/bin/sh: {parts[0] if parts else ''}: not found\n", 127
+
+    def run_shell(self, command):
+        return self.run_command(command)[0]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def _recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def _read_request(self):
+        length = int(self._recv_exact(4), 16)
+        return self._recv_exact(length).decode()
+
+    def _okay(self):
+        self.request.sendall(b"OKAY")
+
+    def _fail(self, message):
+        data = message.encode()
+        self.request.sendall(b"FAIL" + f"{len(data):04x}".encode() + data)
+
+    def _reply(self, text):
+        data = text.encode()
+        self.request.sendall(b"OKAY" + f"{len(data):04x}".encode() + data)
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        try:
+            request = self._read_request()
+            if request == "host:version":
+                return self._reply("0029")
+            if request == "host:devices":
+                return self._reply("".join(f"{d.serial}\t{d.state}\n" for d in server.devices.values()))
+            if request == "host:track-devices-l":
+                return self._handle_track()
+            if request.startswith("host:transport"):
+                if request == "host:transport-any":
+                    device = next(iter(server.devices.values()), None)
+                else:
+                    device = server.devices.get(request.split(":", 2)[2])
+                if device is None:
+                    return self._fail("device not found")
+                self._okay()
+                return self._handle_device(device, self._read_request())
+            self._fail(f"unknown host service {request}")
+        except ConnectionError:
+            pass
+
+    def _handle_track(self):
+        server = self.server
+        self._okay()
+        generation = -1
+        while not server.stopping:
+            with server.changed:
+                server.changed.wait_for(lambda: server.generation != generation or server.stopping, timeout=0.1)
+                if server.generation == generation:
+                    continue
+                generation = server.generation
+                listing = "".join(
+                    f"{d.serial:<22} {d.state} product:p model:m device:d transport_id:{i + 1}\n"
+                    for i, d in enumerate(server.devices.values())
+                )
+            data = listing.encode()
+            self.request.sendall(f"{len(data):04x}".encode() + data)
+
+    def _handle_device(self, device, service):
+        if service.startswith("shell,v2,") and device.shell_v2:
+            self._okay()
+            output, status = device.run_command(service.split(":", 1)[1])
+            # A failing command's output is its error message, which goes to stderr.
+            data = output if isinstance(output, bytes) else output.encode()
+            packet_id = 1 if status == 0 else 2
+            self.request.sendall(struct.pack("<BI", packet_id, len(data)) + data + struct.pack("<BI", 3, 1) + bytes([status]))
+        elif service.startswith("shell:"):
+            self._okay()
+            command, marker, _ = service[len("shell:"):].partition("; echo ::acrd-exit::$?")
+            output, status = device.run_command(command)
+            self.request.sendall(output.encode() + (f"::acrd-exit::{status}".encode() if marker else b""))
+        elif service.startswith("exec:"):
+            self._okay()
+            output = device.run_shell(service[len("exec:"):])
+            self.request.sendall(output if isinstance(output, bytes) else output.encode())
+        elif service == "sync:":
+            self._okay()
+            self._handle_sync(device)
+        else:
+            self._fail(f"unknown service {service}")
+
+    def _sync_packet(self):
+        header = self._recv_exact(8)
+        return header[:4], self._recv_exact(struct.unpack("<I", header[4:])[0]) if header[:4] != b"DONE" else header[4:]
+
+    def _handle_sync(self, device):
+        while True:
+            request_id, data = self._sync_packet()
+            if request_id == b"QUIT":
+                return
+            path = data.decode()
+            if request_id == b"STAT":
+                content = device.files.get(path)
+                if content is None:
+                    self.request.sendall(b"STAT" + struct.pack("<III", 0, 0, 0))
+                else:
+                    self.request.sendall(b"STAT" + struct.pack("<III", 0o100644, len(content), 0))
+            elif request_id == b"RECV":
+                content = device.files.get(path)
+                if content is None:
+                    message = b"No such file or directory"
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                for offset in range(0, len(content), 65536):
+                    chunk = content[offset:offset + 65536]
+                    self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            elif request_id == b"SEND":
+                remote_path = path.rsplit(",", 1)[0]
+                content = b""
+                while True:
+                    packet_id, payload = self._sync_packet()
+                    if packet_id == b"DONE":
+                        break
+                    content += payload
+                device.files[remote_path] = content
+                self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices=()):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.devices = {d.serial: d for d in devices}
+        self.connections = 0
+        self.changed = threading.Condition()
+        self.generation = 0
+        self.stopping = False
+        self._thread = None
+
+    def update_devices(self, add=(), remove=(), states=None):
+        """Changes the device list and wakes any host:track-devices streams."""
+        with self.changed:
+            for device in add:
+                self.devices[device.serial] = device
+            for serial in remove:
+                self.devices.pop(serial, None)
+            for serial, state in (states or {}).items():
+                self.devices[serial].state = state
+            self.generation += 1
+            self.changed.notify_all()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        with self.changed:
+            self.stopping = True
+            self.changed.notify_all()
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,19 @@
+# tests/fake_sysfs.py
+
+"""Builds fake /sys/bus/usb/devices trees for tests."""
+
+import os
+
+
+def make_usb_device(root, name, serial, interface, vid='18d1', pid='4ee0'):
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    for attr, value in (('serial', serial), ('idVendor', vid), ('idProduct', pid)):
+        with open(os.path.join(root, name, attr), 'w') as f:
+            f.write(value + '\n')
+    if interface is None:
+        return
+    iface = os.path.join(root, f"{name}:1.0")
+    os.makedirs(iface, exist_ok=True)
+    for attr, value in zip(('bInterfaceClass', 'bInterfaceSubClass', 'bInterfaceProtocol'), interface):
+        with open(os.path.join(iface, attr), 'w') as f:
+            f.write(value + '\n')
@@ -0,0 +1,116 @@
+# tests/test_adb_protocol.py
+
+import os
+import shutil
+import time
+import unittest
+from unittest.mock import patch
+
+from fake_adb_server import FakeAdbServer, FakeDevice
+from modules.exceptions import AdbProtocolError
+from modules.hal import AdbServerClient, AdbWrapper
+import config
+
+class TestAdbProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.device = FakeDevice("serial1", props={"ro.product.model": "Pixel 6"},
+                                 files={"/sdcard/remote.txt": b"hello from device"})
+        self.server = FakeAdbServer([self.device, FakeDevice("serial2", state="unauthorized")])
+        self.server.__enter__()
+        self.client = AdbServerClient(port=self.server.port)
+        self.tmp_dir = "tests/temp_adb"
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_devices(self):
+        self.assertEqual(self.client.devices(), [("serial1", "device"), ("serial2", "unauthorized")])
+
+    def test_shell(self):
+        self.assertEqual(self.client.shell("serial1", "getprop ro.product.model"), ("Pixel 6\n", 0))
+        # Shell v2 keeps the exit status and leaves stderr out of the output.
+        self.assertEqual(self.client.shell("serial1", "su -c id"), ("", 127))
+        self.assertEqual(self.device.shell_log[-1], "su -c id")
+
+    def test_shell_v1_fallback(self):
+        old = FakeDevice("old1", props={"ro.product.model": "Nexus 5"}, shell_v2=False)
+        self.server.update_devices(add=[old])
+        self.assertEqual(self.client.shell("old1", "getprop ro.product.model"), ("Nexus 5\n", 0))
+        self.assertEqual(self.client.shell("old1", "su -c id"), ("/system/bin/sh: su: not found\n", 127))
+
+    @patch('os.path.exists', return_value=True)
+    def test_wrapper_shell_failures_return_none(self, mock_exists):
+        def wedged(command):
+            time.sleep(0.5)
+            return "late\n"
+
+        self.device.commands["logcat -d"] = wedged
+        adb = AdbWrapper(config.ADB_PATH, serial="serial1", transport=self.client)
+        self.assertEqual(adb.shell(["getprop", "ro.product.model"]), "Pixel 6")
+        # A non-zero exit fails the call instead of returning the error message.
+        self.assertIsNone(adb.shell(["su", "-c", "id"]))
+        # The shell deadline comes from the wrapper; a timeout is a failure, not an exception.
+        with patch.dict(AdbWrapper.command_timeouts, {'shell': 0.2}):
+            self.assertIsNone(adb.shell(["logcat", "-d"]))
+
+    def test_unknown_serial_fails(self):
+        with self.assertRaises(AdbProtocolError):
+            self.client.shell("missing", "true")
+
+    def test_pull_and_push_reuse_sync_session(self):
+        local = os.path.join(self.tmp_dir, "local.txt")
+        self.assertEqual(self.client.pull("serial1", "/sdcard/remote.txt", local), 17)
+        with open(local, "rb") as f:
+            self.assertEqual(f.read(), b"hello from device")
+
+        connections = self.server.connections
+        self.client.push("serial1", local, "/sdcard/copy.txt")
+        self.client.push("serial1", local, "/sdcard/")
+        self.assertEqual(self.server.connections, connections)
+        self.assertEqual(self.device.files["/sdcard/copy.txt"], b"hello from device")
+        self.assertEqual(self.device.files["/sdcard/local.txt"], b"hello from device")
+        self.assertEqual(self.client.stat("serial1", "/sdcard/copy.txt")[1], 17)
+
+    def test_pull_missing_file_fails(self):
+        with self.assertRaises(AdbProtocolError):
+            self.client.pull("serial1", "/sdcard/missing", os.path.join(self.tmp_dir, "missing"))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+        # A failed pull leaves an existing local file as it was.
+        local = os.path.join(self.tmp_dir, "local.txt")
+        with open(local, "wb") as f:
+            f.write(b"previous copy")
+        with self.assertRaises(AdbProtocolError):
+            self.client.pull("serial1", "/sdcard/missing", local)
+        with open(local, "rb") as f:
+            self.assertEqual(f.read(), b"previous copy")
+        self.assertEqual(os.listdir(self.tmp_dir), ["local.txt"])
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_wrapper_uses_native_transport(self, mock_run, mock_exists):
+        adb = AdbWrapper(config.ADB_PATH, serial="serial1", transport=self.client)
+        self.assertEqual(adb.get_prop("ro.product.model"), "Pixel 6")
+        local = os.path.join(self.tmp_dir, "pulled.txt")
+        self.assertTrue(adb.pull("/sdcard/remote.txt", local))
+        self.assertIsNone(adb.pull("/sdcard/missing", local))
+        mock_run.assert_not_called()
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_wrapper_falls_back_without_server(self, mock_run, mock_exists):
+        mock_run.return_value.stdout = "Pixel 6"
+        client = AdbServerClient(port=self.server.port)
+        self.server.__exit__(None, None, None)
+        adb = AdbWrapper(config.ADB_PATH, serial="serial1", transport=client)
+        self.assertEqual(adb.get_prop("ro.product.model"), "Pixel 6")
+        mock_run.assert_called_once()
+        self.server = FakeAdbServer()
+        self.server.__enter__()
+
+if __name__ == '__main__':
+    unittest.main()
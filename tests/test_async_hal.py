@@ -0,0 +1,110 @@
+# tests/test_async_hal.py
+
+import asyncio
+import os
+import shutil
+import stat
+import time
+import unittest
+from unittest.mock import patch
+
+from modules import device_quarry
+from modules.hal import AdbWrapper, AsyncAdbWrapper, AsyncFastbootWrapper, FastbootWrapper, get_scheduler
+from modules.exceptions import ToolError
+
+FAKE_ADB = """#!/bin/sh
+sleep 0.3
+if [ "$1" = "devices" ]; then
+    printf 'List of devices attached\\nA1\\tdevice\\nA2\\tdevice\\n'
+    exit 0
+fi
+printf '[ro.product.model]: [Model-%s]\\n[ro.product.brand]: [brand]\\n' "$2"
+"""
+
+FAKE_FASTBOOT = """#!/bin/sh
+sleep 0.3
+if [ "$1" = "devices" ]; then
+    printf 'F1\\tfastboot\\n'
+    exit 0
+fi
+printf '(bootloader) product:prod-%s\\n(bootloader) is-userspace:no\\n' "$2" >&2
+"""
+
+class TestAsyncHal(unittest.TestCase):
+
+    def setUp(self):
+        self.tools_dir = "tests/temp_async_tools"
+        os.makedirs(self.tools_dir, exist_ok=True)
+        self.adb_path = self._write_tool("adb", FAKE_ADB)
+        self.fastboot_path = self._write_tool("fastboot", FAKE_FASTBOOT)
+        AdbWrapper.invalidate_props()
+        FastbootWrapper.invalidate_vars()
+
+    def tearDown(self):
+        shutil.rmtree(self.tools_dir, ignore_errors=True)
+        AdbWrapper.invalidate_props()
+        FastbootWrapper.invalidate_vars()
+
+    def _write_tool(self, name, script):
+        path = os.path.join(self.tools_dir, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return path
+
+    def test_async_wrappers(self):
+        async def run():
+            devices = await AsyncAdbWrapper.list_devices(self.adb_path)
+            props = await AsyncAdbWrapper(self.adb_path, serial="A1").get_props()
+            snapshot = await AsyncFastbootWrapper(self.fastboot_path, serial="F1").getvar_all()
+            return devices, props, snapshot
+
+        devices, props, snapshot = asyncio.run(run())
+        self.assertEqual(devices, ["A1", "A2"])
+        self.assertEqual(props["ro.product.model"], "Model-A1")
+        self.assertEqual(snapshot["vars"]["product"], "prod-F1")
+        # The async wrappers share the sync wrappers' snapshot caches
+        self.assertEqual(AdbWrapper.cached_props("A1")["ro.product.brand"], "brand")
+
+    def test_cancelled_wait_does_not_leak_a_slot(self):
+        tools = get_scheduler()
+
+        async def run():
+            # F1's only fastboot slot is taken, so the getvar queues on a worker thread.
+            tools.acquire('fastboot', 'F1')
+            task = asyncio.ensure_future(AsyncFastbootWrapper(self.fastboot_path, serial="F1").getvar_all())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The slot is granted to the abandoned waiter after the cancellation...
+            tools.release('fastboot', 'F1')
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                if tools.running('fastboot', 'F1') == 0:
+                    break
+
+        asyncio.run(run())
+        # ...and handed straight back.
+        self.assertEqual(tools.running('fastboot', 'F1'), 0)
+
+    def test_missing_tool(self):
+        with self.assertRaises(ToolError):
+            AsyncAdbWrapper(os.path.join(self.tools_dir, "missing"))
+
+    @patch('modules.device_quarry.detect_edl', return_value=False)
+    def test_quarry_all_devices_concurrently(self, mock_edl):
+        with patch('config.ADB_PATH', self.adb_path), \
+             patch('config.FASTBOOT_PATH', self.fastboot_path), \
+             patch('config.HEIMDALL_PATH', os.path.join(self.tools_dir, "missing")):
+            start = time.monotonic()
+            devices = device_quarry.quarry_all_devices()
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(sorted(d['serial'] for d in devices), ["A1", "A2", "F1"])
+        self.assertEqual({d['serial']: d['boot_mode'] for d in devices}["F1"], "fastboot")
+        # Two enumeration rounds of 0.3s each; running the five calls serially would take 1.5s.
+        self.assertLess(elapsed, 1.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# tests/test_backup.py
+
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import stat
+import time
+import unittest
+from unittest.mock import patch
+
+import modules.backup as backup
+from modules.hal import AdbWrapper
+
+# exec-out and shell run on the host, so the "block devices" are plain files.
+# Each exec-out pays a fixed latency to make concurrency measurable.
+FAKE_ADB = """#!/bin/sh
+[ "$1" = "-s" ] && shift 2
+case "$1" in
+    exec-out) shift; sleep 0.3; exec sh -c "$*" ;;
+    shell) shift; exec sh -c "$*" ;;
+esac
+"""
+
+# blockdev --getsize64 for the plain-file "block devices".
+FAKE_BLOCKDEV = """#!/bin/sh
+wc -c < "$2"
+"""
+
+class TestPartitionBackup(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.abspath("tests/temp_backup")
+        self.by_name = os.path.join(self.root, "by-name")
+        os.makedirs(self.by_name, exist_ok=True)
+        self.adb_path = os.path.join(self.root, "adb")
+        with open(self.adb_path, "w") as f:
+            f.write(FAKE_ADB)
+        os.chmod(self.adb_path, os.stat(self.adb_path).st_mode | stat.S_IEXEC)
+        bin_dir = os.path.join(self.root, "bin")
+        os.makedirs(bin_dir, exist_ok=True)
+        with open(os.path.join(bin_dir, "blockdev"), "w") as f:
+            f.write(FAKE_BLOCKDEV)
+        os.chmod(os.path.join(bin_dir, "blockdev"), 0o755)
+        self.path_patcher = patch.dict(os.environ, {'PATH': bin_dir + os.pathsep + os.environ['PATH']})
+        self.path_patcher.start()
+
+        self.images = {
+            'boot': os.urandom(3 * 1024 * 1024 + 17),
+            'vbmeta': b"\0" * 65536,
+            'dtbo': os.urandom(200000),
+        }
+        for name, data in self.images.items():
+            with open(os.path.join(self.by_name, name + "_a"), "wb") as f:
+                f.write(data)
+        # An unsuffixed partition next to slot copies; the active slot must win.
+        with open(os.path.join(self.by_name, "boot"), "wb") as f:
+            f.write(b"wrong")
+        with open(os.path.join(self.by_name, "persist"), "wb") as f:
+            f.write(b"persist data")
+        self.images['persist'] = b"persist data"
+
+        AdbWrapper.store_props("S1", {'ro.boot.slot_suffix': '_a', 'ro.build.fingerprint': 'acme/test'})
+        self.adb = AdbWrapper(self.adb_path, serial="S1")
+        self.patcher = patch.object(backup, 'BY_NAME_DIRS', [self.by_name, self.by_name])
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.path_patcher.stop()
+        AdbWrapper.close_shell_sessions()
+        AdbWrapper.invalidate_props("S1")
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_resolve_prefers_active_slot(self):
+        resolved = backup.resolve_partitions(self.adb, ['boot', 'persist', 'efs'], su=False)
+        self.assertEqual(resolved['boot']['device_name'], 'boot_a')
+        self.assertEqual(resolved['boot']['size'], len(self.images['boot']))
+        self.assertEqual(resolved['persist']['device_name'], 'persist')
+        self.assertNotIn('efs', resolved)
+
+    def test_backup_roundtrip_and_manifest(self):
+        dest = os.path.join(self.root, "out")
+        for compression, opener in (('gzip', gzip.open), ('xz', lzma.open), (None, open)):
+            manifest = backup.backup_partitions(self.adb, dest, compression=compression, su=False)
+            with open(os.path.join(dest, "manifest.json")) as f:
+                self.assertEqual(json.load(f), manifest)
+            self.assertEqual(manifest['fingerprint'], 'acme/test')
+            self.assertEqual(manifest['missing'], ['init_boot', 'efs', 'modem'])
+            entries = {entry['partition']: entry for entry in manifest['partitions']}
+            self.assertEqual(set(entries), set(self.images))
+            for name, data in self.images.items():
+                entry = entries[name]
+                self.assertEqual(entry['status'], 'ok')
+                self.assertEqual(entry['size'], len(data))
+                self.assertEqual(entry['sha256'], hashlib.sha256(data).hexdigest())
+                with opener(os.path.join(dest, entry['file']), "rb") as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_partitions_stream_concurrently(self):
+        start = time.monotonic()
+        manifest = backup.backup_partitions(self.adb, os.path.join(self.root, "out"), compression='gzip', parallel=4, su=False)
+        elapsed = time.monotonic() - start
+        self.assertEqual(len(manifest['partitions']), 4)
+        # Four exec-out calls of 0.3s each would take 1.2s back to back.
+        self.assertLess(elapsed, 0.9)
+
+    def test_unreadable_partition_is_reported(self):
+        os.chmod(os.path.join(self.by_name, "dtbo_a"), 0)
+        if os.access(os.path.join(self.by_name, "dtbo_a"), os.R_OK):
+            self.skipTest("running as root; permissions are not enforced")
+        manifest = backup.backup_partitions(self.adb, os.path.join(self.root, "out"), ['dtbo'], compression='gzip', su=False)
+        self.assertTrue(manifest['partitions'][0]['status'].startswith('failed'))
+
+    def test_failed_dd_and_unknown_size(self):
+        device = {'device_name': 'efs', 'path': os.path.join(self.by_name, "efs"), 'size': None}
+        entry = backup._backup_partition(self.adb, 'efs', device, self.root, None, su=False)
+        self.assertTrue(entry['status'].startswith('failed'))
+        self.assertIn("status 1", entry['status'])
+
+        # A read that cannot be checked against the partition size is not reported as ok.
+        device = {'device_name': 'persist', 'path': os.path.join(self.by_name, "persist"), 'size': None}
+        entry = backup._backup_partition(self.adb, 'persist', device, self.root, None, su=False)
+        self.assertTrue(entry['status'].startswith('unverified'))
+        self.assertEqual(entry['sha256'], hashlib.sha256(self.images['persist']).hexdigest())
+        self.assertEqual(backup.incomplete_partitions({'partitions': [entry]}), [f"persist ({entry['status']})"])
+
+    def test_compressor_error_does_not_hang(self):
+        class BrokenCompressor:
+            def compress(self, data):
+                raise ValueError("codec exploded")
+
+        device = {'device_name': 'boot_a', 'path': os.path.join(self.by_name, "boot_a"), 'size': len(self.images['boot'])}
+        with patch.object(backup, '_compressor', return_value=BrokenCompressor()), \
+                patch.object(backup, 'BACKUP_QUEUE_DEPTH', 1):
+            entry = backup._backup_partition(self.adb, 'boot', device, self.root, 'gzip', su=False)
+        self.assertEqual(entry['status'], "failed: codec exploded")
+
+    def test_stream_error_mid_partition_fails_the_entry(self):
+        def broken_stream(command, cancel_event=None, check=False):
+            yield b"\0" * 65536
+            raise ConnectionResetError("connection reset by adb server")
+
+        device = {'device_name': 'boot_a', 'path': os.path.join(self.by_name, "boot_a"), 'size': len(self.images['boot'])}
+        with patch.object(self.adb, 'exec_out_chunks', side_effect=broken_stream):
+            entry = backup._backup_partition(self.adb, 'boot', device, self.root, 'gzip', su=False)
+        self.assertEqual(entry['status'], "failed: connection reset by adb server")
+        self.assertEqual(backup.incomplete_partitions({'partitions': [entry]}), [f"boot ({entry['status']})"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# tests/test_blob_store.py
+
+import hashlib
+import os
+import shutil
+import stat
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+from modules import blob_store, db_manager
+
+class TestBlobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.abspath("tests/temp_blob_store")
+        os.makedirs(self.dir, exist_ok=True)
+        self.store = patch.object(config, 'BLOB_STORE_DIR', os.path.join(self.dir, "blobs"))
+        self.store.start()
+        db_manager.engine = create_engine('sqlite:///:memory:')
+        db_manager.Session = sessionmaker(bind=db_manager.engine)
+        db_manager.init_db()
+        self.data = os.urandom(5000)
+        self.digests = {'sha256': hashlib.sha256(self.data).hexdigest(), 'md5': hashlib.md5(self.data).hexdigest()}
+
+    def tearDown(self):
+        self.store.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _download(self, data=None):
+        path = blob_store.incoming_path("https://example.com/fw.zip")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(self.data if data is None else data)
+        return path
+
+    def test_add_find_and_deduplicate(self):
+        blob = blob_store.add(self._download(), self.digests, url="https://example.com/fw.zip", etag='"abc"')
+        self.assertEqual(blob, blob_store.blob_path(self.digests['sha256']))
+        self.assertFalse(os.stat(blob).st_mode & stat.S_IWUSR)
+        self.assertEqual(blob_store.find('md5', self.digests['md5']), blob)
+        self.assertEqual(blob_store.find_source("https://example.com/fw.zip", '"abc"'), blob)
+        self.assertIsNone(blob_store.find_source("https://example.com/fw.zip", '"def"'))
+        self.assertIsNone(blob_store.find('sha1', hashlib.sha1(self.data).hexdigest()))
+
+        # Identical content from another URL: the second copy is discarded.
+        incoming = self._download()
+        self.assertEqual(blob_store.add(incoming, {'sha256': self.digests['sha256']}, etag='W/"weak"'), blob)
+        self.assertFalse(os.path.exists(incoming))
+        self.assertIsNone(blob_store.find_source("https://example.com/fw.zip", 'W/"weak"'))
+
+    def test_changed_blob_is_rehashed_and_dropped(self):
+        blob = blob_store.add(self._download(), self.digests)
+        os.utime(blob, ns=(0, 0))
+        # Only the mtime changed: it is hashed again and kept.
+        self.assertEqual(blob_store.find('sha256', self.digests['sha256']), blob)
+        os.chmod(blob, stat.S_IRUSR | stat.S_IWUSR)
+        with open(blob, 'r+b') as f:
+            f.write(b"corrupt")
+        self.assertIsNone(blob_store.find('sha256', self.digests['sha256']))
+        self.assertFalse(os.path.exists(blob))
+        self.assertIsNone(db_manager.get_blob('sha256', self.digests['sha256']))
+
+    def test_link_falls_back_from_reflink_to_hardlink_to_copy(self):
+        blob = blob_store.add(self._download(), self.digests)
+        destination = os.path.join(self.dir, "devices", "Pixel_9", "firmware", "stock_fw.zip")
+        with open(os.path.join(self.dir, "old"), 'wb') as f:
+            f.write(b"old")
+        with patch.object(blob_store, '_reflink', side_effect=OSError("not supported")):
+            self.assertEqual(blob_store.link(blob, destination), 'hardlink')
+            self.assertTrue(os.path.samefile(blob, destination))
+            self.assertEqual(blob_store.link(blob, destination), 'hardlink')
+            with patch.object(blob_store.os, 'link', side_effect=OSError("cross-device")):
+                self.assertEqual(blob_store.link(blob, os.path.join(self.dir, "old")), 'copy')
+        with open(os.path.join(self.dir, "old"), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(destination))), ["stock_fw.zip"])
+
+if __name__ == '__main__':
+    unittest.main()
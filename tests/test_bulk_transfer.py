@@ -0,0 +1,116 @@
+# tests/test_bulk_transfer.py
+
+import io
+import os
+import shutil
+import stat
+import time
+import unittest
+
+from fake_adb_server import FakeAdbServer, FakeDevice
+from modules.hal import AdbServerClient, AdbWrapper, tar_stream
+from modules.hal.adb_wrapper import EXIT_MARKER, with_exit_trailer
+
+# A fake device whose filesystem is the host's: every invocation pays a fixed
+# startup cost like a real adb client, then runs exec-out/exec-in/pull locally.
+FAKE_ADB = """#!/bin/sh
+sleep 0.05
+[ "$1" = "-s" ] && shift 2
+case "$1" in
+    exec-out|exec-in|shell) shift; exec sh -c "$*" ;;
+    pull) cp "$2" "$3" ;;
+esac
+"""
+
+class TestBulkTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.abspath("tests/temp_bulk")
+        os.makedirs(self.root, exist_ok=True)
+        self.adb_path = os.path.join(self.root, "adb")
+        with open(self.adb_path, "w") as f:
+            f.write(FAKE_ADB)
+        os.chmod(self.adb_path, os.stat(self.adb_path).st_mode | stat.S_IEXEC)
+
+        self.device_dir = os.path.join(self.root, "device", "data", "anr")
+        self.files = {}
+        for i in range(40):
+            name = os.path.join("sub" if i % 2 else "", f"trace_{i}.txt" if i % 4 else f"dump_{i}.bin")
+            self.files[name] = f"anr trace {i}\n".encode() * (i + 1)
+            path = os.path.join(self.device_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.files[name])
+        self.adb = AdbWrapper(self.adb_path, serial="S1")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _read_tree(self, root):
+        tree = {}
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as f:
+                    tree[os.path.relpath(path, root)] = f.read()
+        return tree
+
+    def test_bulk_pull_beats_per_file_pull(self):
+        per_file_dir = os.path.join(self.root, "per_file")
+        start = time.monotonic()
+        for name in self.files:
+            os.makedirs(os.path.dirname(os.path.join(per_file_dir, name)), exist_ok=True)
+            self.adb.pull(os.path.join(self.device_dir, name), os.path.join(per_file_dir, name))
+        per_file = time.monotonic() - start
+
+        bulk_dir = os.path.join(self.root, "bulk")
+        start = time.monotonic()
+        stats = self.adb.pull_tree(self.device_dir, bulk_dir)
+        bulk = time.monotonic() - start
+
+        self.assertEqual(self._read_tree(bulk_dir), self.files)
+        self.assertEqual(self._read_tree(per_file_dir), self.files)
+        self.assertEqual(stats['files'], 40)
+        self.assertLess(bulk * 5, per_file)
+
+    def test_include_globs_and_compression(self):
+        local = os.path.join(self.root, "filtered")
+        stats = self.adb.pull_tree(self.device_dir, local, include=["*.bin"], compression="gzip")
+        expected = {name: data for name, data in self.files.items() if name.endswith(".bin")}
+        self.assertEqual(self._read_tree(local), expected)
+        self.assertEqual(stats['files'], 10)
+
+    def test_bulk_push_roundtrip(self):
+        target = os.path.join(self.root, "device", "sdcard", "restore")
+        stats = self.adb.push_tree(self.device_dir, target, compression="gzip")
+        self.assertEqual(stats['files'], 40)
+        self.assertEqual(self._read_tree(target), self.files)
+
+        only_text = os.path.join(self.root, "device", "sdcard", "text")
+        self.adb.push_tree(self.device_dir, only_text, include=["trace_*"])
+        self.assertEqual(set(self._read_tree(only_text)), {n for n in self.files if "trace_" in n})
+
+    def test_native_exec_out(self):
+        archive = io.BytesIO()
+        tar_stream.pack_tree(archive, self.device_dir)
+        command = with_exit_trailer(tar_stream.remote_pack_command("/data/anr"))
+        device = FakeDevice("S1", commands={command: archive.getvalue() + EXIT_MARKER + b"0 "})
+        local = os.path.join(self.root, "native")
+        with FakeAdbServer([device]) as server:
+            adb = AdbWrapper(self.adb_path, serial="S1", transport=AdbServerClient(port=server.port))
+            stats = adb.pull_tree("/data/anr", local)
+            self.assertEqual(device.shell_log, [command])
+            self.assertEqual(stats['files'], 40)
+            self.assertEqual(self._read_tree(local), self.files)
+
+            # A complete-looking archive from a tar that failed (or a stream without the status) is not success.
+            device.commands[command] = archive.getvalue() + EXIT_MARKER + b"1 tar: sub/dump_0.bin: Permission denied"
+            self.assertIsNone(adb.pull_tree("/data/anr", os.path.join(self.root, "failed")))
+            device.commands[command] = archive.getvalue()
+            self.assertIsNone(adb.pull_tree("/data/anr", os.path.join(self.root, "cut")))
+
+    def test_missing_remote_dir(self):
+        self.assertIsNone(self.adb.pull_tree(os.path.join(self.root, "nope"), os.path.join(self.root, "out")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# tests/test_device_watcher.py
+
+import os
+import shutil
+import threading
+import unittest
+from unittest.mock import patch
+
+from fake_adb_server import FakeAdbServer, FakeDevice
+from fake_sysfs import make_usb_device
+from modules.hal import AdbServerClient, AdbWrapper, DeviceWatcher, FastbootWrapper, HeimdallWrapper
+from modules.hal import device_watcher, usb_sysfs
+import config
+
+class TestDeviceWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = "tests/temp_sysfs"
+        os.makedirs(self.sysfs, exist_ok=True)
+        self.server = FakeAdbServer([FakeDevice("A1")])
+        self.server.__enter__()
+        self.watcher = DeviceWatcher(AdbServerClient(port=self.server.port), sysfs_root=self.sysfs,
+                                     poll_interval=0.05, reconnect_delay=0.05)
+        self.events = []
+        self.event_seen = threading.Condition()
+        self.watcher.subscribe(self._record)
+        self.watcher.start()
+        self.assertTrue(self.watcher.wait_until_ready())
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.sysfs, ignore_errors=True)
+
+    def _record(self, event, device):
+        with self.event_seen:
+            self.events.append((event, device['serial'], device['mode'], device['state']))
+            self.event_seen.notify_all()
+
+    def _wait_for(self, expected):
+        with self.event_seen:
+            self.assertTrue(self.event_seen.wait_for(lambda: expected in self.events, timeout=2))
+
+    def test_initial_snapshot(self):
+        self.assertIn(('attach', 'A1', 'adb', 'device'), self.events)
+        device = self.watcher.get('A1')
+        self.assertEqual(device['transport_id'], '1')
+        self.assertEqual(self.watcher.serials('adb'), ['A1'])
+
+    def test_adb_events(self):
+        self.server.update_devices(add=[FakeDevice("A2", state="unauthorized")])
+        self._wait_for(('attach', 'A2', 'adb', 'unauthorized'))
+        self.assertEqual(self.watcher.serials('adb'), ['A1'])
+
+        self.server.update_devices(states={"A2": "device"})
+        self._wait_for(('state-change', 'A2', 'adb', 'device'))
+
+        self.server.update_devices(remove=["A1"])
+        self._wait_for(('detach', 'A1', 'adb', 'device'))
+        self.assertEqual(self.watcher.serials('adb'), ['A2'])
+
+    def test_events_invalidate_cached_snapshots(self):
+        self.server.update_devices(add=[FakeDevice("A2", state="unauthorized")])
+        self._wait_for(('attach', 'A2', 'adb', 'unauthorized'))
+        AdbWrapper.store_props("A2", {'ro.product.model': 'Pixel'})
+        FastbootWrapper.store_vars("A2", {'vars': {'current-slot': 'a'}, 'partitions': {}, 'slots': {}})
+
+        self.server.update_devices(states={"A2": "device"})
+        self._wait_for(('state-change', 'A2', 'adb', 'device'))
+        self.assertIsNone(AdbWrapper.cached_props("A2"))
+        self.assertIsNone(FastbootWrapper.cached_vars("A2"))
+
+        # A reboot into the bootloader shows up as an adb detach.
+        AdbWrapper.store_props("A2", {'ro.product.model': 'Pixel'})
+        self.server.update_devices(remove=["A2"])
+        self._wait_for(('detach', 'A2', 'adb', 'device'))
+        self.assertIsNone(AdbWrapper.cached_props("A2"))
+
+    def test_fastboot_sysfs_scan(self):
+        make_usb_device(self.sysfs, "1-2", "F1", usb_sysfs.FASTBOOT_INTERFACE)
+        make_usb_device(self.sysfs, "1-3", "A9", usb_sysfs.ADB_INTERFACE)
+        self._wait_for(('attach', 'F1', 'fastboot', 'fastboot'))
+        self.assertEqual(self.watcher.serials('fastboot'), ['F1'])
+
+        shutil.rmtree(os.path.join(self.sysfs, "1-2"))
+        shutil.rmtree(os.path.join(self.sysfs, "1-2:1.0"))
+        self._wait_for(('detach', 'F1', 'fastboot', 'fastboot'))
+
+    def test_download_mode_detach_ends_heimdall_session(self):
+        make_usb_device(self.sysfs, "1-4", "R5C1", None, vid='04e8', pid='685d')
+        self._wait_for(('attach', 'R5C1', 'download', 'download'))
+        self.assertEqual(self.watcher.serials('download'), ['R5C1'])
+        HeimdallWrapper.mark_session("download:R5C1")
+        HeimdallWrapper.mark_session("download:R5C2")
+
+        shutil.rmtree(os.path.join(self.sysfs, "1-4"))
+        self._wait_for(('detach', 'R5C1', 'download', 'download'))
+        self.assertFalse(HeimdallWrapper.session_open("download:R5C1"))
+        self.assertTrue(HeimdallWrapper.session_open("download:R5C2"))
+        HeimdallWrapper.end_sessions()
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_list_devices_reads_registry(self, mock_run, mock_exists):
+        with patch.object(device_watcher, '_watcher', self.watcher):
+            self.assertEqual(AdbWrapper.list_devices(config.ADB_PATH), ['A1'])
+            self.assertEqual(FastbootWrapper.list_devices(config.FASTBOOT_PATH), [])
+        mock_run.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
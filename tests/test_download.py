@@ -0,0 +1,208 @@
+# tests/test_download.py
+
+import filecmp
+import hashlib
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+from modules import db_manager, download
+from modules.exceptions import DownloadError
+from modules.http_file_server import HttpFileServer
+
+SEGMENT = 256 * 1024
+
+class DownloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.abspath("tests/temp_download")
+        os.makedirs(self.dir, exist_ok=True)
+        self.data = os.urandom(4 * SEGMENT + 1234)
+        self.server = HttpFileServer({'/factory.zip': self.data}).start()
+        self.url = self.server.url('/factory.zip')
+        self.destination = os.path.join(self.dir, "factory.zip")
+        self.segment = patch.object(download, 'MIN_SEGMENT_SIZE', SEGMENT)
+        self.segment.start()
+        self.sleep = patch.object(download.time, 'sleep')
+        self.sleep.start()
+
+    def tearDown(self):
+        self.sleep.stop()
+        self.segment.stop()
+        self.server.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _read(self):
+        with open(self.destination, 'rb') as f:
+            return f.read()
+
+    def _ranges(self):
+        return [r for _, _, r in self.server.requests if r and r != 'bytes=0-0']
+
+class TestSegmentedDownload(DownloadTestCase):
+
+    def test_ranges_are_fetched_in_parallel(self):
+        sizes = []
+        progress = []
+        digests = download.fetch(self.url, self.destination, connections=4, progress=progress.append,
+                                 on_size=sizes.append, algorithms=('sha256', 'md5'))
+        self.assertEqual(self._read(), self.data)
+        self.assertEqual(digests, {'sha256': hashlib.sha256(self.data).hexdigest(),
+                                   'md5': hashlib.md5(self.data).hexdigest()})
+        self.assertEqual(sizes, [len(self.data)])
+        self.assertEqual(sum(progress), len(self.data))
+        self.assertEqual(len(self._ranges()), 4)
+        self.assertIn(f"bytes=0-{-(-len(self.data) // 4) - 1}", self._ranges())
+        self.assertEqual(os.listdir(self.dir), ["factory.zip"])
+
+    def test_weak_etag_is_not_sent_as_if_range(self):
+        self.server.etags['/factory.zip'] = 'W/"weak"'
+        download.fetch(self.url, self.destination, connections=4)
+        self.assertEqual(self._read(), self.data)
+        self.assertEqual(len(self._ranges()), 4)
+
+    def test_small_files_use_one_range(self):
+        self.server.add_file('/small.img', b"tiny")
+        destination = os.path.join(self.dir, "small.img")
+        download.fetch(self.server.url('/small.img'), destination, connections=8)
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b"tiny")
+        self.assertEqual(self._ranges(), ["bytes=0-3"])
+
+    def test_falls_back_to_one_stream_without_ranges(self):
+        self.server.ranges = False
+        digests = download.download_file(self.url, self.destination, connections=4, algorithms=('sha1',))
+        self.assertEqual(digests, {'sha1': hashlib.sha1(self.data).hexdigest()})
+        self.assertEqual(self._read(), self.data)
+        # The probe response is the download; nothing else is requested.
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_empty_file_is_not_a_range_error(self):
+        # The probe's byte 0 does not exist, so the server answers 416 with "bytes */0".
+        self.server.add_file('/empty.img', b"")
+        destination = os.path.join(self.dir, "empty.img")
+        validators = []
+        digests = download.fetch(self.server.url('/empty.img'), destination, connections=4,
+                                 on_validators=validators.append)
+        self.assertEqual(digests, {'sha256': hashlib.sha256(b"").hexdigest()})
+        self.assertEqual(os.path.getsize(destination), 0)
+        self.assertEqual(self._ranges(), [])
+        self.assertEqual(len(validators), 1)
+        self.assertEqual(os.listdir(self.dir), ["empty.img"])
+
+    def test_dropped_connection_is_retried_from_where_it_stopped(self):
+        self.server.drop_after['/factory.zip'] = SEGMENT // 2
+        download.fetch(self.url, self.destination, connections=4)
+        self.assertEqual(self._read(), self.data)
+        self.assertEqual(len(self._ranges()), 5)
+        # At most the read that was in flight when the connection dropped is fetched twice.
+        self.assertLessEqual(self.server.sent['/factory.zip'], len(self.data) + 1 + download.DOWNLOAD_CHUNK_SIZE)
+
+    def test_failed_download(self):
+        self.assertIsNone(download.download_file(self.server.url('/missing.zip'), self.destination))
+
+class TestResume(DownloadTestCase):
+
+    def _interrupt(self):
+        self.server.drop_after['/factory.zip'] = SEGMENT + 100
+        with patch.object(download, 'SEGMENT_RETRIES', 0), patch.object(download, 'PROGRESS_SAVE_INTERVAL', 0):
+            with self.assertRaises(DownloadError):
+                download.fetch(self.url, self.destination, connections=2)
+        self.assertTrue(os.path.exists(self.destination + ".part.json"))
+        self.server.requests.clear()
+        self.server.sent.clear()
+
+    def test_interrupted_download_resumes(self):
+        self._interrupt()
+        progress = []
+        digests = download.fetch(self.url, self.destination, connections=2, progress=progress.append)
+        self.assertEqual(self._read(), self.data)
+        # The part written before the interruption is hashed too.
+        self.assertEqual(digests['sha256'], hashlib.sha256(self.data).hexdigest())
+        # Only the missing tail of the broken range is fetched again.
+        self.assertLess(self.server.sent['/factory.zip'], len(self.data))
+        self.assertEqual(sum(progress), len(self.data))
+        self.assertFalse(os.path.exists(self.destination + ".part.json"))
+
+    def test_changed_file_starts_over(self):
+        self._interrupt()
+        self.server.add_file('/factory.zip', os.urandom(len(self.data)))
+        download.fetch(self.url, self.destination, connections=2)
+        self.assertEqual(self._read(), self.server.files['/factory.zip'])
+        # Everything again, plus the one-byte probe.
+        self.assertEqual(self.server.sent['/factory.zip'], len(self.data) + 1)
+
+class TestDownloadComponent(DownloadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cwd = os.getcwd()
+        db_manager.engine = create_engine('sqlite:///:memory:')
+        db_manager.Session = sessionmaker(bind=db_manager.engine)
+        db_manager.init_db()
+        self.store = patch.object(config, 'BLOB_STORE_DIR', os.path.join(self.dir, "blobs"))
+        self.store.start()
+        self.addCleanup(self.store.stop)
+
+    def _component(self, checksum, model='Pixel 9'):
+        info = {'url': self.url, 'checksum': checksum}
+        self.server.requests.clear()
+        with patch.object(download.db_manager, 'get_url', return_value=info), \
+                patch.object(download.db_manager, 'log_operation') as log, \
+                patch.object(download.db_manager, 'set_url_verified') as verified, \
+                patch.object(download.hashing, 'hash_file') as rehash, \
+                patch('builtins.print'):
+            os.chdir(self.dir)
+            try:
+                download.download_component(model, 'firmware', 'stock')
+            finally:
+                os.chdir(self.cwd)
+        # The digest comes from the download stream; the file is never read back.
+        rehash.assert_not_called()
+        return log.call_args[0][3], verified.called
+
+    def _device_file(self, model='Pixel_9'):
+        return os.path.join(self.dir, "devices", model, "firmware", "stock_factory.zip")
+
+    def _downloaded(self):
+        return any(command == 'GET' for command, _, _ in self.server.requests)
+
+    def test_vendor_checksums(self):
+        self.assertEqual(self._component(f"MD5:{hashlib.md5(self.data).hexdigest().upper()}"), ('SUCCESS', True))
+        self.assertEqual(self._component(hashlib.sha256(b"other").hexdigest()), ('FAILED', False))
+        with open(self._device_file(), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # The failed download did not reach the store.
+        self.assertEqual(len(os.listdir(os.path.join(self.dir, "blobs", "sha256"))), 1)
+        self.assertEqual(os.listdir(os.path.join(self.dir, "blobs", "incoming")), [])
+
+    def test_same_file_for_another_model_is_not_downloaded_again(self):
+        sha256 = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(self._component(sha256), ('SUCCESS', True))
+        self.assertTrue(self._downloaded())
+        self.assertEqual(self._component(f"sha256:{sha256}", model='Pixel 9 Pro'), ('SUCCESS', True))
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(os.path.samefile(self._device_file(), self._device_file('Pixel_9_Pro'))
+                        or filecmp.cmp(self._device_file(), self._device_file('Pixel_9_Pro'), shallow=False))
+        # The same content under a digest the store has not seen yet is downloaded and merged.
+        self.assertEqual(self._component(hashlib.sha1(self.data).hexdigest(), model='Pixel 9a'), ('SUCCESS', True))
+        self.assertTrue(self._downloaded())
+        self.assertEqual(db_manager.get_blob('sha1', hashlib.sha1(self.data).hexdigest())['sha256'], sha256)
+
+    def test_without_a_checksum_url_and_etag_identify_the_file(self):
+        self.assertEqual(self._component(None), ('SUCCESS', True))
+        self.assertEqual(self._component(None, model='Pixel 9 Pro'), ('SUCCESS', True))
+        self.assertEqual([command for command, _, _ in self.server.requests], ['HEAD'])
+        self.server.add_file('/factory.zip', os.urandom(1000))
+        self.assertEqual(self._component(None, model='Pixel 9a'), ('SUCCESS', True))
+        self.assertTrue(self._downloaded())
+        with open(self._device_file('Pixel_9a'), 'rb') as f:
+            self.assertEqual(f.read(), self.server.files['/factory.zip'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+# tests/test_download_queue.py
+
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from rich.console import Console
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+from db.models import UrlPlaceholder
+from modules import db_manager, download, download_queue
+from modules.http_file_server import HttpFileServer
+from ui import tui
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+class TestBandwidthLimiter(unittest.TestCase):
+
+    def test_combined_rate_is_capped(self):
+        clock = FakeClock()
+        with patch.object(download, 'time', clock):
+            limiter = download.BandwidthLimiter(1000)
+            # One second's worth goes out at once, the rest at the cap.
+            limiter.consume(1000)
+            self.assertEqual(clock.slept, 0)
+            for _ in range(4):
+                limiter.consume(500)
+            self.assertAlmostEqual(clock.slept, 2.0)
+            limiter.set_rate(None)
+            limiter.consume(10 ** 9)
+            self.assertAlmostEqual(clock.slept, 2.0)
+
+class TestDownloadQueue(unittest.TestCase):
+
+    def setUp(self):
+        # A file, not :memory:, so the worker threads share one database.
+        self.db_dir = tempfile.mkdtemp(dir='tests')
+        self.addCleanup(shutil.rmtree, self.db_dir, ignore_errors=True)
+        db_manager.engine = create_engine(f"sqlite:///{os.path.join(self.db_dir, 'acrd.db')}")
+        self.addCleanup(db_manager.engine.dispose)
+        db_manager.Session = sessionmaker(bind=db_manager.engine)
+        db_manager.init_db()
+
+        self.dir = os.path.abspath("tests/temp_download_queue")
+        os.makedirs(self.dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        self.addCleanup(os.chdir, cwd)
+        for patcher in (patch.object(config, 'BLOB_STORE_DIR', os.path.join(self.dir, "blobs")),
+                        patch.object(download, 'MIN_SEGMENT_SIZE', 64 * 1024),
+                        patch('builtins.print')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.server = HttpFileServer().start()
+        self.addCleanup(self.server.stop)
+        self.files = {}
+
+    def _url(self, model, component, type, name, checksum=True):
+        data = self.files.setdefault(name, os.urandom(200 * 1024))
+        self.server.add_file(f"/{name}", data)
+        with db_manager.get_session() as session:
+            session.add(UrlPlaceholder(model=model, component=component, type=type, url=self.server.url(f"/{name}"),
+                                       checksum=hashlib.sha256(data).hexdigest() if checksum else None))
+
+    def _gets(self):
+        return [path for command, path, r in self.server.requests if command == 'GET' and r == 'bytes=0-0']
+
+    def test_priority_order_and_persistence(self):
+        self._url('Pixel 9', 'recovery', 'custom', 'twrp.img')
+        self._url('Pixel 9', 'kernel', 'custom', 'kernel.zip')
+        self._url('Pixel 9', 'firmware', 'stock', 'factory.zip')
+        self._url('Pixel 9', 'rom', 'custom', 'SEARCH_XDA')
+        ids = download_queue.enqueue_model('Pixel 9')
+        self.assertEqual(len(ids), 3)
+        download_queue.enqueue('Pixel 9', 'firmware', 'stock', priority=5)
+        # Queuing the same component again keeps one entry.
+        self.assertEqual(len(db_manager.get_download_queue()), 3)
+        self.assertEqual(db_manager.get_download_queue()[0]['component'], 'firmware')
+
+        # An entry a crashed run left running is picked up again.
+        self.assertEqual(db_manager.claim_next_download()['component'], 'firmware')
+        results = download_queue.run_queue(workers=1, live=False)
+        self.assertEqual([(r['component'], r['status']) for r in results],
+                         [('firmware', 'done'), ('recovery', 'done'), ('kernel', 'done')])
+        self.assertEqual(self._gets(), ['/factory.zip', '/twrp.img', '/kernel.zip'])
+        with open(results[1]['destination'], 'rb') as f:
+            self.assertEqual(f.read(), self.files['twrp.img'])
+        self.assertEqual(db_manager.get_download_queue(), [])
+        self.assertEqual(len(db_manager.get_download_queue(('done',))), 3)
+
+    def test_same_firmware_for_a_fleet_is_fetched_once(self):
+        models = [f"Galaxy S2{i}" for i in range(4)]
+        for model in models:
+            self._url(model, 'firmware', 'stock', 'carrier.zip')
+        download_queue.enqueue_fleet(models + models[:1], 'firmware', 'stock')
+        results = download_queue.run_queue(workers=4, live=False)
+        self.assertEqual([r['status'] for r in results], ['done'] * 4)
+        self.assertEqual(self._gets(), ['/carrier.zip'])
+        for r in results:
+            with open(r['destination'], 'rb') as f:
+                self.assertEqual(f.read(), self.files['carrier.zip'])
+
+    def test_host_connection_limit_and_failures(self):
+        for i in range(4):
+            self._url('Pixel 9', f'part{i}', 'stock', f'part{i}.img')
+        self._url('Pixel 9', 'broken', 'stock', 'broken.img')
+        self.server.files['/broken.img'] = b"not what the checksum says"
+        download_queue.enqueue_model('Pixel 9')
+        self.server.rate = 2 * 1024 * 1024
+        active, peak, entered, lock = [0], [0], [0], threading.Lock()
+        host_slot = download._host_slot
+
+        @contextlib.contextmanager
+        def counting_slot(url):
+            with host_slot(url):
+                with lock:
+                    active[0] += 1
+                    entered[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                try:
+                    yield
+                finally:
+                    with lock:
+                        active[0] -= 1
+
+        with patch.object(config, 'DOWNLOAD_HOST_CONNECTIONS', 2), patch.object(download, '_host_slot', counting_slot):
+            results = download_queue.run_queue(workers=3, live=False)
+        self.assertEqual(sorted(r['status'] for r in results), ['done'] * 4 + ['failed'])
+        self.assertEqual(peak[0], 2)
+        # Every request went through a slot.
+        self.assertEqual(entered[0], len(self.server.requests))
+
+    def test_live_display(self):
+        self._url('Pixel 9', 'recovery', 'custom', 'twrp.img', checksum=False)
+        download_queue.enqueue('Pixel 9', 'recovery', 'custom')
+        with open(os.devnull, 'w') as devnull, patch.object(download_queue, 'console', Console(file=devnull)):
+            results = download_queue.run_queue(live=True, bandwidth=10 * 1024 * 1024)
+        self.assertEqual(results[0]['status'], 'done')
+        self.assertIsNone(download.bandwidth.rate)
+        self.assertEqual(download_queue.render_queue(db_manager.get_download_queue(('done',))).row_count, 1)
+
+class TestTuiQueueRun(unittest.TestCase):
+
+    def test_menu_returns_while_the_queue_runs(self):
+        release = threading.Event()
+        finished = []
+
+        def run_queue(live=True):
+            release.wait(5)
+            finished.append(live)
+            return [{'model': 'Pixel 6', 'component': 'kernel', 'type': 'custom', 'status': 'done', 'detail': None}]
+
+        output = Console(file=open(os.devnull, 'w'))
+        with patch.object(download_queue, 'run_queue', side_effect=run_queue), \
+                patch.object(tui, 'console', output), \
+                patch.object(output, 'input', return_value='4'):
+            tui.download_menu({'model': 'Pixel 6'})
+            self.assertTrue(tui.queue_running())
+            # A second run is not started while the first is going.
+            self.assertFalse(tui.start_queue_run())
+            release.set()
+            tui._queue_run.join(5)
+        output.file.close()
+        self.assertFalse(tui.queue_running())
+        self.assertEqual(finished, [False])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# tests/test_fastboot_protocol.py
+
+import hashlib
+import os
+import unittest
+from unittest.mock import patch
+
+from modules.exceptions import FastbootProtocolError
+from modules.hal import FastbootClient, FastbootWrapper
+from modules.hal.fastboot_emulator import FastbootEmulator
+from modules.hal.fastboot_protocol import DOWNLOAD_CHUNK_SIZE, FastbootUsbTransport
+
+class _FakeEndpoint:
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.written = []
+
+    def write(self, data, timeout):
+        self.written.append(bytes(data))
+
+    def read(self, size, timeout):
+        return self.responses.pop(0)
+
+class TestFastbootProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.emulator = FastbootEmulator(keep_data=True, partitions={'boot_a': 4 * DOWNLOAD_CHUNK_SIZE, 'vbmeta_a': 4096})
+        self.emulator.start()
+        self.image = "tests/temp_fastboot_boot.img"
+        self.payload = os.urandom(3 * DOWNLOAD_CHUNK_SIZE + 123)
+        with open(self.image, "wb") as f:
+            f.write(self.payload)
+
+    def tearDown(self):
+        self.emulator.stop()
+        os.remove(self.image)
+
+    def _client(self):
+        return FastbootClient.connect_tcp('127.0.0.1', self.emulator.port)
+
+    def test_getvar(self):
+        with self._client() as client:
+            self.assertEqual(client.getvar("product"), "emulator")
+            snapshot = FastbootWrapper.parse_getvar_all(client.getvar_all())
+            with self.assertRaises(FastbootProtocolError):
+                client.getvar("nonexistent")
+        self.assertEqual(snapshot['vars']['unlocked'], "yes")
+        self.assertEqual(FastbootWrapper.partition_info(snapshot, 'boot')['size'], 4 * DOWNLOAD_CHUNK_SIZE)
+
+    def test_flash_streams_image(self):
+        with self._client() as client:
+            transfer = client.flash("boot", self.image)
+        self.assertEqual(transfer['bytes'], len(self.payload))
+        self.assertGreater(transfer['mib_per_s'], 0)
+        flashed = self.emulator.flashed['boot_a']
+        self.assertEqual(flashed['data'], self.payload)
+        self.assertEqual(flashed['sha256'], hashlib.sha256(self.payload).hexdigest())
+
+    def test_flash_failures(self):
+        with self._client() as client:
+            with self.assertRaisesRegex(FastbootProtocolError, "too large"):
+                client.flash("vbmeta", self.image)
+            with self.assertRaisesRegex(FastbootProtocolError, "does not exist"):
+                client.flash("missing", self.image)
+        self.emulator.max_download_size = 1024
+        with self._client() as client:
+            with self.assertRaisesRegex(FastbootProtocolError, "max-download-size"):
+                client.flash("boot", self.image)
+
+    def test_usb_transport(self):
+        endpoint_out = _FakeEndpoint()
+        endpoint_in = _FakeEndpoint([b"INFOfoo:bar", b"OKAY"])
+        client = FastbootClient(FastbootUsbTransport(endpoint_out, endpoint_in))
+        self.assertEqual(client.getvar_all(), "(bootloader) foo:bar\n")
+        self.assertEqual(endpoint_out.written, [b"getvar:all"])
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_wrapper_uses_native_client_for_tcp_serials(self, mock_run, mock_exists):
+        FastbootWrapper.invalidate_vars()
+        with patch.object(FastbootWrapper, 'native_tcp', True):
+            fastboot = FastbootWrapper("tools/fastboot", serial=self.emulator.serial)
+            self.assertEqual(fastboot.getvar("product"), "product: emulator")
+            self.assertEqual(fastboot.getvar_all()['vars']['current-slot'], "a")
+            self.assertIn("Writing 'boot' OKAY", fastboot.flash("boot", self.image))
+            self.assertIsNone(fastboot.flash("missing", self.image))
+            self.assertTrue(fastboot.reboot())
+        mock_run.assert_not_called()
+        self.assertEqual(self.emulator.reboots, ["reboot"])
+        FastbootWrapper.invalidate_vars()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+# tests/test_flash_pipeline.py
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Log
+from modules import db_manager, flash_pipeline
+from modules.exceptions import ToolError
+
+BLOCK = 4096
+
+def sparse_image(raw_blocks=2, skip_blocks=3):
+    data = os.urandom(raw_blocks * BLOCK)
+    header = struct.pack('<IHHHHIIII', flash_pipeline.SPARSE_MAGIC, 1, 0, 28, 12, BLOCK, raw_blocks + skip_blocks, 2, 0)
+    raw = struct.pack('<HHII', flash_pipeline.SPARSE_CHUNK_RAW, 0, raw_blocks, 12 + len(data)) + data
+    skip = struct.pack('<HHII', flash_pipeline.SPARSE_CHUNK_DONT_CARE, 0, skip_blocks, 12)
+    return header + raw + skip
+
+def avb_image(magic=b'ANDROID!', payload_size=8192, vbmeta_offset=None):
+    payload = magic + os.urandom(payload_size - len(magic))
+    vbmeta = b'AVB0' + b'\0' * 252
+    offset = len(payload) if vbmeta_offset is None else vbmeta_offset
+    footer = struct.pack('>4sIIQQQ28x', b'AVBf', 1, 0, len(payload), offset, len(vbmeta))
+    return payload + vbmeta + b'\0' * 64 + footer
+
+def vbmeta_image(aux_size=512):
+    return struct.pack('>4sIIQQ', b'AVB0', 1, 0, 64, aux_size) + b'\0' * (256 - 28 + 64 + 512)
+
+SNAPSHOT = {
+    'vars': {'current-slot': 'a'},
+    'partitions': {
+        'boot_a': {'size': 64 * 1024},
+        'vendor_boot_a': {'size': 64 * 1024},
+        'vbmeta_a': {'size': 64 * 1024},
+        'system_a': {'size': 1, 'is-logical': True},
+    },
+    'slots': {},
+}
+
+class ImageDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.abspath("tests/temp_flash_pipeline")
+        os.makedirs(self.dir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+class TestImageInspection(ImageDirTestCase):
+
+    def test_sparse(self):
+        info = flash_pipeline.inspect_image(self._write("system.img", sparse_image()))
+        self.assertEqual((info['format'], info['expanded_size'], info['avb']), ('sparse', 5 * BLOCK, 'n/a'))
+        with self.assertRaisesRegex(ToolError, "truncated"):
+            flash_pipeline.inspect_image(self._write("cut.img", sparse_image()[:-20]))
+
+    def test_avb_footer_and_vbmeta(self):
+        info = flash_pipeline.inspect_image(self._write("boot.img", avb_image()))
+        self.assertEqual((info['format'], info['avb']), ('boot', 'footer'))
+        self.assertEqual(flash_pipeline.inspect_image(self._write("vbmeta.img", vbmeta_image()))['avb'], 'vbmeta')
+        self.assertEqual(flash_pipeline.inspect_image(self._write("dtbo.img", b"\xd7\xb7\xab\x1e" + b"\0" * 100))['avb'], 'none')
+        with self.assertRaisesRegex(ToolError, "vbmeta blob"):
+            flash_pipeline.inspect_image(self._write("bad.img", avb_image(vbmeta_offset=16)))
+        with self.assertRaisesRegex(ToolError, "past the end"):
+            flash_pipeline.inspect_image(self._write("short.img", vbmeta_image(aux_size=1 << 20)))
+        with self.assertRaisesRegex(ToolError, "cannot read"):
+            flash_pipeline.inspect_image(os.path.join(self.dir, "missing.img"))
+
+    def test_validate_checks_fit_and_hashes(self):
+        data = avb_image()
+        result = flash_pipeline.validate_image(SNAPSHOT, 'boot', self._write("boot.img", data))
+        self.assertIsNone(result['error'])
+        self.assertEqual(result['sha256'], hashlib.sha256(data).hexdigest())
+        big = flash_pipeline.validate_image(SNAPSHOT, 'boot', self._write("big.img", avb_image(payload_size=128 * 1024)))
+        self.assertIn("holds 65536", big['error'])
+        # Logical partitions are resized by fastbootd, so size is not checked.
+        self.assertIsNone(flash_pipeline.validate_image(SNAPSHOT, 'system', self._write("system.img", sparse_image()))['error'])
+
+class TestFlashPipeline(ImageDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db_manager.engine = create_engine('sqlite:///:memory:')
+        db_manager.Session = sessionmaker(bind=db_manager.engine)
+        db_manager.init_db()
+        self.images = [
+            ('boot', self._write("boot.img", avb_image())),
+            ('vendor_boot', self._write("vendor_boot.img", avb_image(b'VNDRBOOT'))),
+            ('vbmeta', self._write("vbmeta.img", vbmeta_image())),
+        ]
+
+    def _logs(self, operation):
+        with db_manager.get_session() as session:
+            return [(json.loads(l.log_data), l.status) for l in session.query(Log).filter_by(operation=operation)]
+
+    def test_next_image_validates_while_current_flashes(self):
+        events = []
+        lock = threading.Lock()
+        real_hash = flash_pipeline.hashing.hash_file
+
+        def hashing(path, algorithms):
+            with lock:
+                events.append(('hash', os.path.basename(path)))
+            return real_hash(path, algorithms)
+
+        def flashing(partition, path):
+            with lock:
+                events.append(('flash start', partition))
+            time.sleep(0.2)
+            with lock:
+                events.append(('flash end', partition))
+            return "OKAY"
+
+        fastboot = MagicMock()
+        fastboot.flash.side_effect = flashing
+        with patch.object(flash_pipeline.hashing, 'hash_file', hashing):
+            ok, results = flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, model="Pixel")
+
+        self.assertTrue(ok)
+        self.assertEqual([r['status'] for r in results], ['flashed'] * 3)
+        self.assertLess(events.index(('hash', 'vendor_boot.img')), events.index(('flash end', 'boot')))
+        self.assertLess(events.index(('hash', 'vbmeta.img')), events.index(('flash end', 'vendor_boot')))
+        logged = self._logs('fastboot_flash')
+        self.assertEqual([(d['partition'], status) for d, status in logged],
+                         [('boot', 'SUCCESS'), ('vendor_boot', 'SUCCESS'), ('vbmeta', 'SUCCESS')])
+        self.assertEqual(logged[0][0]['sha256'], flash_pipeline.sha256_file(self.images[0][1]))
+        self.assertIn('flash_seconds', logged[0][0])
+        self.assertEqual(self._logs('fastboot_flash_run')[0][1], 'SUCCESS')
+
+    def test_bad_image_fails_before_any_write(self):
+        self.images.append(('dtbo', self._write("dtbo.img", sparse_image()[:-20])))
+        fastboot = MagicMock()
+        ok, results = flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT)
+        self.assertFalse(ok)
+        self.assertEqual(results[0]['partition'], 'dtbo')
+        fastboot.flash.assert_not_called()
+        self.assertEqual(self._logs('fastboot_flash')[0][1], 'INVALID')
+        self.assertEqual(self._logs('fastboot_flash_run')[0][1], 'FAILED')
+
+    def test_failed_write_stops_the_run(self):
+        fastboot = MagicMock()
+        fastboot.flash.side_effect = ["OKAY", None, "OKAY"]
+        ok, results = flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT)
+        self.assertFalse(ok)
+        self.assertEqual([r['status'] for r in results], ['flashed', 'failed'])
+        self.assertEqual(fastboot.flash.call_count, 2)
+
+    def test_incremental_skips_unchanged_images(self):
+        fastboot = MagicMock()
+        ok, _ = flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S1")
+        self.assertTrue(ok)
+        recorded = db_manager.get_flashed_images("S1")
+        self.assertEqual(set(recorded), {'boot_a', 'vendor_boot_a', 'vbmeta_a'})
+        self.assertEqual(recorded['boot_a']['sha256'], flash_pipeline.sha256_file(self.images[0][1]))
+
+        self._write("vendor_boot.img", avb_image(b'VNDRBOOT'))
+        fastboot.reset_mock()
+        ok, results = flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S1", incremental=True)
+        self.assertTrue(ok)
+        self.assertEqual([r['status'] for r in results], ['skipped', 'flashed', 'skipped'])
+        fastboot.flash.assert_called_once_with('vendor_boot', self.images[1][1])
+        self.assertEqual(self._logs('fastboot_flash_run')[-1][0]['skipped'], ['boot', 'vbmeta'])
+
+        # Another device, or a forced full flash, rewrites everything.
+        fastboot.reset_mock()
+        flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S2", incremental=True)
+        flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S1", incremental=False)
+        self.assertEqual(fastboot.flash.call_count, 6)
+
+    def test_failed_write_is_not_skipped_next_time(self):
+        fastboot = MagicMock()
+        flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S1")
+        # A half-written boot partition no longer holds the recorded image...
+        fastboot.flash.side_effect = [None]
+        flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S1", incremental=False)
+        self.assertNotIn('boot_a', db_manager.get_flashed_images("S1"))
+        # ...so retrying with the known-good image writes it again.
+        fastboot.reset_mock(side_effect=True)
+        ok, results = flash_pipeline.flash_images(fastboot, self.images, SNAPSHOT, serial="S1", incremental=True)
+        self.assertTrue(ok)
+        self.assertEqual([r['status'] for r in results], ['flashed', 'skipped', 'skipped'])
+
+if __name__ == '__main__':
+    unittest.main()
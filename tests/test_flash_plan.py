@@ -0,0 +1,323 @@
+# tests/test_flash_plan.py
+
+import hashlib
+import os
+import shutil
+import struct
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from modules import db_manager, flash_plan
+from modules.hal import FastbootWrapper
+from modules.hal.fastboot_emulator import FastbootEmulator
+
+FLASH_ALL = """#!/bin/sh
+if ! [ $($(which fastboot) --version | grep "version" | cut -c18-23 | sed 's/\\.//g' ) -ge 3301 ]; then
+  echo "fastboot too old; please download the latest version"
+  exit 1
+fi
+fastboot flash bootloader bootloader-oriole-slider-1.2-9152140.img
+fastboot reboot-bootloader
+sleep 5
+fastboot flash radio radio-oriole-g5123b-107485.img
+fastboot reboot-bootloader
+sleep 5
+fastboot -w update image-oriole-tq1a.zip
+"""
+
+ANDROID_INFO = "require board=oriole\nrequire version-bootloader=slider-1.2-9152140\nrequire version-baseband=g5123b-107485\n"
+
+def super_empty(names):
+    """A minimal liblp super_empty.img: geometry block and a metadata header with a partition table."""
+    geometry = struct.pack('<I', flash_plan.LP_GEOMETRY_MAGIC)
+    header_size = 128
+    table = b''.join(name.encode().ljust(flash_plan.LP_PARTITION_NAME_SIZE, b'\0') + b'\0' * 16 for name in names)
+    header = struct.pack('<IHHI32sI32sIII', flash_plan.LP_METADATA_MAGIC, 10, 2, header_size, b'', len(table), b'',
+                         0, len(names), 52).ljust(header_size, b'\0')
+    image = bytearray(flash_plan.LP_METADATA_OFFSET + header_size + len(table))
+    image[flash_plan.LP_GEOMETRY_OFFSET:flash_plan.LP_GEOMETRY_OFFSET + 4] = geometry
+    image[flash_plan.LP_METADATA_OFFSET:] = header + table
+    return bytes(image)
+
+PARTITIONS = {
+    'bootloader': 16 * 1024 * 1024, 'radio': 16 * 1024 * 1024,
+    'boot_a': 64 * 1024, 'boot_b': 64 * 1024, 'init_boot_a': 64 * 1024, 'init_boot_b': 64 * 1024,
+    'vbmeta_a': 64 * 1024, 'vbmeta_b': 64 * 1024,
+    'system_a': 1024 * 1024, 'system_b': 1024 * 1024, 'vendor_a': 1024 * 1024, 'vendor_b': 1024 * 1024,
+    'super': 8 * 1024 * 1024, 'userdata': 8 * 1024 * 1024,
+}
+
+class FactoryImageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.abspath("tests/temp_flash_plan")
+        os.makedirs(self.dir, exist_ok=True)
+        self.images = {
+            'boot.img': b'ANDROID!' + os.urandom(20000),
+            'init_boot.img': b'ANDROID!' + os.urandom(9000),
+            'vbmeta.img': struct.pack('>4sIIQQ', b'AVB0', 1, 0, 64, 512) + os.urandom(4000),
+            'system.img': os.urandom(300000),
+            'vendor.img': os.urandom(100000),
+            'userdata.img': os.urandom(1000),
+            'super_empty.img': super_empty(['system_a', 'system_b', 'vendor_a', 'vendor_b']),
+        }
+        self._write("bootloader-oriole-slider-1.2-9152140.img", b"bootloader" * 100)
+        self._write("radio-oriole-g5123b-107485.img", b"radio" * 100)
+        self.zip_path = os.path.join(self.dir, "image-oriole-tq1a.zip")
+        with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("android-info.txt", ANDROID_INFO)
+            for name, data in self.images.items():
+                z.writestr(name, data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, name, data):
+        path = os.path.join(self.dir, name)
+        mode = "w" if isinstance(data, str) else "wb"
+        with open(path, mode) as f:
+            f.write(data)
+        return path
+
+class TestFlashPlan(FactoryImageTestCase):
+
+    def test_flash_all_script(self):
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        self.assertEqual(plan.kind, 'script')
+        self.assertEqual(plan.warnings, [])
+        self.assertEqual(plan.requirements['board'], ['oriole'])
+        self.assertEqual([(s.action, s.partition) for s in plan.steps], [
+            ('flash', 'bootloader'), ('reboot-bootloader', None), ('flash', 'radio'), ('reboot-bootloader', None),
+            ('flash', 'boot'), ('flash', 'init_boot'), ('flash', 'vbmeta'),
+            ('reboot-fastboot', None), ('wipe-super', 'super'), ('flash', 'system'), ('flash', 'vendor'),
+            ('wipe', None), ('reboot', None),
+        ])
+        boot = plan.steps[4]
+        self.assertEqual((boot.image, boot.archive), ('boot.img', self.zip_path))
+        self.assertFalse(plan.is_simple())
+
+    def test_slots_and_options(self):
+        script = ("fastboot --slot=all flash boot boot.img\nfastboot --set-active=b\n"
+                  "fastboot erase misc\nfastboot oem unlock\n")
+        plan = flash_plan.parse_flash_all(script, self.dir)
+        self.assertEqual(plan.steps, [
+            flash_plan.FlashStep('flash', 'boot', os.path.join(self.dir, 'boot.img'), slot='all'),
+            flash_plan.FlashStep('set-active', slot='b'),
+            flash_plan.FlashStep('erase', 'misc'),
+        ])
+        self.assertEqual(plan.warnings, ["Unsupported fastboot command: fastboot oem unlock"])
+
+    def test_set_active_defaults_and_order(self):
+        script = ("fastboot --slot=b --set-active flash boot boot.img\n"
+                  "fastboot --set-active flash dtbo dtbo.img\n"
+                  "fastboot -w --set-active=a update image-oriole-tq1a.zip\n")
+        plan = flash_plan.parse_flash_all(script, self.dir)
+        self.assertEqual([(s.action, s.partition, s.slot) for s in plan.steps], [
+            ('flash', 'boot', 'b'), ('set-active', None, 'b'),
+            ('flash', 'dtbo', None), ('set-active', None, None),
+            ('flash', 'boot', None), ('flash', 'init_boot', None), ('flash', 'vbmeta', None),
+            ('reboot-fastboot', None, None), ('wipe-super', 'super', None), ('flash', 'system', None),
+            ('flash', 'vendor', None), ('wipe', None, None), ('set-active', None, 'a'), ('reboot', None, None),
+        ])
+        self.assertEqual(plan.describe()[3], "set active slot current")
+
+    def test_loose_images_without_super_are_simple(self):
+        os.remove(self.zip_path)
+        self._write("dtbo.img", os.urandom(100))
+        plan = flash_plan.build_plan(self.dir)
+        self.assertEqual(plan.kind, 'images')
+        self.assertTrue(plan.is_simple())
+        self.assertEqual([s.partition for s in plan.steps], ['bootloader-oriole-slider-1.2-9152140', 'dtbo',
+                                                              'radio-oriole-g5123b-107485'])
+
+    def test_unreadable_super_empty_falls_back(self):
+        with zipfile.ZipFile(self.zip_path, "a") as z:
+            z.writestr("product.img", b"product")
+        self.images['super_empty.img'] = b'\0' * 100
+        with zipfile.ZipFile(os.path.join(self.dir, "image-broken.zip"), "w") as z:
+            for name, data in self.images.items():
+                z.writestr(name, data)
+        os.remove(self.zip_path)
+        plan = flash_plan.build_plan(self.dir)
+        self.assertEqual(len(plan.warnings), 1)
+        self.assertEqual([s.partition for s in plan.flashes()], ['boot', 'init_boot', 'vbmeta', 'system', 'vendor'])
+
+    def test_validation(self):
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        snapshot = {'vars': {'product': 'oriole', 'current-slot': 'a', 'version-bootloader': 'slider-1.0'},
+                    'partitions': {name: {'size': size} for name, size in PARTITIONS.items()}, 'slots': {}}
+        # The plan brings the required bootloader and radio itself.
+        self.assertEqual(flash_plan.validate_plan(plan, snapshot), [])
+
+        snapshot['vars']['product'] = 'raven'
+        snapshot['partitions']['boot_a']['size'] = 1024
+        problems = flash_plan.validate_plan(plan, snapshot)
+        self.assertIn("Image is for oriole, but the device is raven", problems)
+        self.assertTrue(any(p.startswith("boot: image is") for p in problems))
+
+        without_radio = flash_plan.FlashPlan(self.dir, 'script')
+        without_radio.requirements = plan.requirements
+        without_radio.add('flash', 'dtbo', os.path.join(self.dir, 'missing.img'))
+        problems = flash_plan.validate_plan(without_radio, {'vars': {'product': 'oriole'}, 'partitions': {}})
+        self.assertEqual(len(problems), 3)
+        self.assertIn("version-baseband", problems[1])
+        self.assertIn("missing", problems[2])
+
+    def test_validation_inspects_images_inside_the_zip(self):
+        header = struct.pack('<IHHHHIIII', 0xED26FF3A, 1, 0, 28, 12, 4096, 4, 1, 0)
+        chunk = struct.pack('<HHII', 0xCAC1, 0, 4, 12 + 4 * 4096)
+        self.images['system.img'] = header + chunk + os.urandom(4096)  # Three blocks short.
+        with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("android-info.txt", ANDROID_INFO)
+            for name, data in self.images.items():
+                z.writestr(name, data)
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        snapshot = {'vars': {'product': 'oriole'}, 'partitions': {name: {'size': size} for name, size in PARTITIONS.items()}}
+        problems = flash_plan.validate_plan(plan, snapshot)
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith("system: image system.img is missing or invalid (sparse image truncated"))
+
+class TestExecutePlan(FactoryImageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db_manager.engine = create_engine('sqlite:///:memory:')
+        db_manager.Session = sessionmaker(bind=db_manager.engine)
+        db_manager.init_db()
+        self.emulator = FastbootEmulator(variables={'product': 'oriole', 'current-slot': 'a'},
+                                         partitions=PARTITIONS, keep_data=True).start()
+        self.native = patch.object(FastbootWrapper, 'native_tcp', True)
+        self.native.start()
+
+    def tearDown(self):
+        self.native.stop()
+        self.emulator.stop()
+        super().tearDown()
+
+    def test_factory_image_streams_out_of_the_zip(self):
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        fastboot = FastbootWrapper("tools/fastboot", serial=self.emulator.serial)
+        self.assertEqual(flash_plan.validate_plan(plan, fastboot.getvar_all()), [])
+
+        with patch.object(FastbootWrapper, 'wait_for_device', return_value=True) as waited:
+            ok, results = flash_plan.execute_plan(fastboot, plan, model="Pixel 6")
+
+        self.assertTrue(ok)
+        self.assertEqual(len(results), len(plan.steps))
+        self.assertEqual(waited.call_count, 3)
+        for name in ('boot', 'init_boot', 'vbmeta', 'system', 'vendor'):
+            data = self.images[f"{name}.img"]
+            self.assertEqual(self.emulator.flashed[f"{name}_a"]['data'], data)
+        self.assertEqual(results[4]['sha256'], hashlib.sha256(self.images['boot.img']).hexdigest())
+        self.assertEqual(self.emulator.flashed['radio']['data'], b"radio" * 100)
+        self.assertEqual([u['wipe'] for u in self.emulator.super_updates], [True])
+        self.assertEqual(self.emulator.reboots, ['reboot-bootloader', 'reboot-bootloader', 'reboot-fastboot', 'reboot'])
+        self.assertNotIn('userdata', self.emulator.flashed)
+        # Nothing was extracted next to the zip.
+        self.assertEqual(sorted(n for n in os.listdir(self.dir) if n.endswith('.img')),
+                         ['bootloader-oriole-slider-1.2-9152140.img', 'radio-oriole-g5123b-107485.img'])
+
+    def test_incremental_factory_flash(self):
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        fastboot = FastbootWrapper("tools/fastboot", serial=self.emulator.serial)
+        serial = self.emulator.serial
+        with patch.object(FastbootWrapper, 'wait_for_device', return_value=True):
+            ok, _ = flash_plan.execute_plan(fastboot, plan, serial=serial)
+        self.assertTrue(ok)
+        recorded = db_manager.get_flashed_images(serial)
+        self.assertEqual(set(recorded), {'bootloader', 'radio', 'boot_a', 'init_boot_a', 'vbmeta_a', 'system_a', 'vendor_a'})
+        self.assertEqual(recorded['boot_a']['sha256'], hashlib.sha256(self.images['boot.img']).hexdigest())
+
+        # Only the changed image is written again. Super is wiped (-w), so its partitions are too.
+        self._write("radio-oriole-g5123b-107485.img", b"new radio" * 100)
+        self.emulator.commands.clear()
+        with patch.object(FastbootWrapper, 'wait_for_device', return_value=True):
+            ok, results = flash_plan.execute_plan(fastboot, plan, serial=serial, incremental=True)
+        self.assertTrue(ok)
+        self.assertEqual([r['partition'] for r in results if r['status'] == 'unchanged'],
+                         ['bootloader', 'boot', 'init_boot', 'vbmeta'])
+        flashed = [c.split(':')[1] for c in self.emulator.commands if c.startswith('flash:')]
+        self.assertEqual(flashed, ['radio', 'system', 'vendor'])
+        self.assertEqual(self.emulator.flashed['radio']['data'], b"new radio" * 100)
+
+        # A failed write leaves no record to skip on the next run.
+        self.emulator.partitions.pop('vendor_a')
+        with patch.object(FastbootWrapper, 'wait_for_device', return_value=True):
+            ok, _ = flash_plan.execute_plan(fastboot, plan, serial=serial, incremental=True)
+        self.assertFalse(ok)
+        self.assertNotIn('vendor_a', db_manager.get_flashed_images(serial))
+
+    def test_set_active_resolves_current_and_other_slot(self):
+        plan = flash_plan.FlashPlan(self.dir, 'script')
+        plan.add('set-active')
+        plan.add('set-active', slot='other')
+        fastboot = FastbootWrapper("tools/fastboot", serial=self.emulator.serial)
+        ok, _ = flash_plan.execute_plan(fastboot, plan)
+        self.assertTrue(ok)
+        self.assertEqual([c for c in self.emulator.commands if c.startswith('set_active')],
+                         ['set_active:a', 'set_active:b'])
+
+    def test_other_slot_and_failure_stops(self):
+        plan = flash_plan.FlashPlan(self.dir, 'update')
+        plan.add('flash', 'boot', 'boot.img', self.zip_path, 'other')
+        plan.add('set-active', slot='c')
+        plan.add('flash', 'vbmeta', 'vbmeta.img', self.zip_path)
+        fastboot = FastbootWrapper("tools/fastboot", serial=self.emulator.serial)
+        ok, results = flash_plan.execute_plan(fastboot, plan)
+        self.assertFalse(ok)
+        self.assertEqual([r['status'] for r in results], ['done', 'failed'])
+        self.assertIn('boot_b', self.emulator.flashed)
+        self.assertNotIn('vbmeta_a', self.emulator.flashed)
+
+    def test_interrupted_job_resumes_from_first_incomplete_step(self):
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        fastboot = FastbootWrapper("tools/fastboot", serial=self.emulator.serial)
+        serial = self.emulator.serial
+        # The device loses its vendor partition mid-run, e.g. the USB link drops during that transfer.
+        vendor_size = self.emulator.partitions.pop('vendor_a')
+        job_id = flash_plan.start_job(plan, serial, 'fastboot')
+        with patch.object(FastbootWrapper, 'wait_for_device', return_value=True):
+            ok, results = flash_plan.execute_plan(fastboot, plan, job_id=job_id)
+        self.assertFalse(ok)
+        self.assertEqual(results[-1]['partition'], 'vendor')
+
+        # The job left the device in fastbootd; it is only offered there.
+        self.assertIsNone(flash_plan.find_resumable_job(serial, 'fastboot'))
+        job, resumed, start = flash_plan.find_resumable_job(serial, 'fastbootd')
+        self.assertEqual((job['id'], resumed.steps, start), (job_id, plan.steps, 10))
+
+        self.emulator.partitions['vendor_a'] = vendor_size
+        self.emulator.commands.clear()
+        with patch.object(FastbootWrapper, 'wait_for_device', return_value=True):
+            ok, results = flash_plan.execute_plan(fastboot, resumed, job_id=job['id'], start=start)
+        self.assertTrue(ok)
+        self.assertEqual([r['status'] for r in results], ['skipped'] * 10 + ['done'] * 3)
+        self.assertFalse(any(c.startswith('flash:boot') or c.startswith('flash:system') for c in self.emulator.commands))
+        self.assertEqual(self.emulator.flashed['vendor_a']['data'], self.images['vendor.img'])
+        self.assertIsNone(flash_plan.find_resumable_job(serial, 'fastbootd'))
+
+    def test_changed_images_are_not_resumed(self):
+        self._write("flash-all.sh", FLASH_ALL)
+        plan = flash_plan.build_plan(self.dir)
+        job_id = flash_plan.start_job(plan, 'S1', 'fastboot')
+        db_manager.update_flash_job_step(job_id, 0, 'done')
+        self.assertEqual(flash_plan.find_resumable_job('S1', 'fastboot')[2], 1)
+
+        self._write("bootloader-oriole-slider-1.2-9152140.img", b"other bootloader")
+        self.assertIsNone(flash_plan.find_resumable_job('S1', 'fastboot'))
+        # A new job supersedes the interrupted one.
+        flash_plan.start_job(plan, 'S1', 'fastboot')
+        self.assertEqual(flash_plan.find_resumable_job('S1', 'fastboot')[2], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+# tests/test_fleet.py
+
+import collections
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Log
+from modules import db_manager, device_quarry, fleet
+from modules.exceptions import ToolError
+from modules.hal import FastbootWrapper
+from modules.hal.fastboot_emulator import FastbootEmulator
+
+class FleetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # A file, not :memory:, so the worker threads share one database.
+        self.db_dir = tempfile.mkdtemp(dir='tests')
+        self.addCleanup(shutil.rmtree, self.db_dir, ignore_errors=True)
+        db_manager.engine = create_engine(f"sqlite:///{os.path.join(self.db_dir, 'acrd.db')}")
+        self.addCleanup(db_manager.engine.dispose)
+        db_manager.Session = sessionmaker(bind=db_manager.engine)
+        db_manager.init_db()
+
+    def _logs(self, operation):
+        with db_manager.get_session() as session:
+            return [(json.loads(l.log_data), l.status) for l in session.query(Log).filter_by(operation=operation)]
+
+class TestFleetEmulators(FleetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.emulators = [
+            FastbootEmulator(variables={'product': f'rig{i}', 'current-slot': 'a'}, keep_data=True).start()
+            for i in range(3)
+        ]
+        self.native = patch.object(FastbootWrapper, 'native_tcp', True)
+        self.native.start()
+        self.rom = os.path.abspath("tests/temp_fleet_rom")
+        os.makedirs(self.rom, exist_ok=True)
+        self.boot = b'ANDROID!' + os.urandom(50000)
+        with open(os.path.join(self.rom, "boot.img"), "wb") as f:
+            f.write(self.boot)
+
+    def tearDown(self):
+        self.native.stop()
+        for emulator in self.emulators:
+            emulator.stop()
+        shutil.rmtree(self.rom, ignore_errors=True)
+
+    def test_quarry_and_flash_every_device(self):
+        devices = [device_quarry.quarry_fastboot(FastbootWrapper("tools/fastboot", serial=e.serial))
+                   for e in self.emulators]
+        results = fleet.run_fleet(devices, 'quarry', concurrency=3, live=False)
+        self.assertEqual([(r['state'], r['detail']) for r in results], [('done', 'rig0'), ('done', 'rig1'), ('done', 'rig2')])
+
+        results = fleet.run_fleet(devices, 'flash', {'rom': self.rom}, concurrency=3, live=False)
+        self.assertEqual([r['state'] for r in results], ['done'] * 3)
+        for emulator in self.emulators:
+            self.assertEqual(emulator.flashed['boot_a']['data'], self.boot)
+        self.assertEqual([status for _, status in self._logs('fleet_flash')], ['SUCCESS'] * 3)
+
+    def test_flash_needs_a_rom_and_fastboot(self):
+        devices = [{'serial': self.emulators[0].serial, 'model': 'rig0', 'boot_mode': 'fastboot'},
+                   {'serial': 'ADB1', 'model': 'phone', 'boot_mode': 'adb'}]
+        results = fleet.run_fleet(devices, 'flash', {}, live=False)
+        self.assertIn("--rom", results[0]['detail'])
+        self.assertIn("needs a device in fastboot or fastbootd mode", results[1]['detail'])
+        self.assertEqual({r['state'] for r in results}, {'failed'})
+
+class FakeAdb:
+    def __init__(self, path, serial=None):
+        self.serial = serial
+        self.last_returncode = None
+
+    def shell_many(self, commands):
+        return ["rooted", "  level: 87\n", "Filesystem\n/dev/block/dm-5  100G", "Enforcing\n"]
+
+class TestFleetOrchestration(FleetTestCase):
+
+    def _devices(self, count):
+        return [{'serial': f"SIM{i}", 'model': 'Simulated', 'boot_mode': 'adb'} for i in range(count)]
+
+    def _tracking_operation(self):
+        active = collections.Counter()
+        peaks = {'total': 0, 'per_device': 0}
+        lock = threading.Lock()
+
+        def operation(device_info, report, options):
+            with lock:
+                active[device_info['serial']] += 1
+                peaks['total'] = max(peaks['total'], sum(active.values()))
+                peaks['per_device'] = max(peaks['per_device'], active[device_info['serial']])
+            report("working")
+            time.sleep(0.05)
+            with lock:
+                active[device_info['serial']] -= 1
+            return "ok"
+        return operation, peaks
+
+    def test_global_concurrency_limit(self):
+        operation, peaks = self._tracking_operation()
+        with patch.dict(fleet.OPERATIONS, {'probe': operation}):
+            results = fleet.run_fleet(self._devices(6), 'probe', concurrency=2, live=False)
+        self.assertEqual([r['state'] for r in results], ['done'] * 6)
+        self.assertEqual(peaks['total'], 2)
+
+    def test_one_operation_per_device(self):
+        operation, peaks = self._tracking_operation()
+        devices = self._devices(2)
+        with patch.dict(fleet.OPERATIONS, {'probe': operation}):
+            runs = [threading.Thread(target=fleet.run_fleet, args=(devices, 'probe'), kwargs={'live': False})
+                    for _ in range(3)]
+            for run in runs:
+                run.start()
+            for run in runs:
+                run.join()
+        self.assertEqual(peaks['per_device'], 1)
+        self.assertEqual(len(self._logs('fleet_probe')), 6)
+
+    def test_a_failing_device_does_not_stop_the_others(self):
+        def operation(device_info, report, options):
+            if device_info['serial'] == 'SIM1':
+                raise ToolError("device went away")
+            if device_info['serial'] == 'SIM2':
+                raise RuntimeError("bug")
+            return "fine"
+        with patch.dict(fleet.OPERATIONS, {'probe': operation}):
+            results = fleet.run_fleet(self._devices(4), 'probe', live=False)
+        self.assertEqual([(r['state'], r['detail']) for r in results], [
+            ('done', 'fine'), ('failed', 'device went away'), ('failed', 'RuntimeError: bug'), ('done', 'fine')])
+        with self.assertRaisesRegex(ToolError, "Unknown fleet operation"):
+            fleet.run_fleet(self._devices(1), 'nope', live=False)
+
+    def test_diagnostics_and_table(self):
+        with patch('modules.hal.AdbWrapper', FakeAdb):
+            results = fleet.run_fleet(self._devices(2), 'diagnostics', live=False)
+        self.assertEqual(results[0]['detail'], "root yes, battery 87%, SELinux Enforcing")
+        run = fleet.FleetRun('diagnostics', self._devices(2))
+        run.update('SIM0', state='running', detail='step 1')
+        self.assertEqual(run.render().row_count, 2)
+
+    def test_backup_reports_through_the_status_row(self):
+        def backup_partitions(adb, dest_dir, partitions, compression, parallel):
+            return {'partitions': [{'partition': 'boot', 'status': 'ok', 'size': 4096, 'sha256': 'ab' * 32}],
+                    'missing': ['efs'], 'seconds': 0.1}
+        reports = []
+        with patch('modules.hal.AdbWrapper', FakeAdb), \
+                patch('modules.backup.backup_partitions', side_effect=backup_partitions), \
+                patch('modules.backup.console') as console, \
+                patch.object(fleet, '_device_dir', return_value=self.db_dir):
+            detail = fleet.backup_partitions(self._devices(1)[0], reports.append, {})
+            console.print.assert_not_called()
+            self.assertEqual(detail, "1 partitions in 0.1s")
+            self.assertIn("Not present on this device: efs", reports)
+
+            with patch('modules.backup.backup_partitions', side_effect=ToolError("su: not found")):
+                with self.assertRaisesRegex(ToolError, "Backup failed: su: not found"):
+                    fleet.backup_partitions(self._devices(1)[0], reports.append, {})
+            console.print.assert_not_called()
+
+    def test_destructive_operations_need_confirmation(self):
+        devices = self._devices(2)
+        with patch('modules.fleet.Confirm.ask', return_value=False) as ask, patch.object(fleet, 'console') as console:
+            self.assertFalse(fleet.confirm_operation(devices, 'flash'))
+            self.assertFalse(fleet.confirm_operation(devices, 'backup'))
+            self.assertTrue(fleet.confirm_operation(devices, 'flash', assume_yes=True))
+            self.assertTrue(fleet.confirm_operation(devices, 'quarry'))
+        self.assertEqual(ask.call_count, 2)
+        printed = " ".join(str(c.args[0]) for c in console.print.call_args_list)
+        self.assertIn("SIM0", printed)
+        self.assertIn("SIM1", printed)
+
+    def test_select_devices(self):
+        devices = [
+            {'serial': 'A1', 'model': 'Pixel 6', 'boot_mode': 'adb'},
+            {'serial': 'B2', 'model': 'Galaxy S21', 'boot_mode': 'fastboot'},
+            {'serial': 'A1', 'model': 'Pixel 6', 'boot_mode': 'adb'},
+            {'model': 'EDL device', 'boot_mode': 'edl'},
+            None,
+        ]
+        self.assertEqual([d['serial'] for d in fleet.select_devices(devices)], ['A1', 'B2'])
+        self.assertEqual([d['serial'] for d in fleet.select_devices(devices, 'pixel*')], ['A1'])
+        self.assertEqual([d['serial'] for d in fleet.select_devices(devices, 'b?')], ['B2'])
+        self.assertEqual([d['serial'] for d in fleet.select_devices(devices, modes=['fastboot'])], ['B2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 # tests/test_hal.py
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import subprocess
 from modules.hal import AdbWrapper, FastbootWrapper, HeimdallWrapper
 import config
@@ -18,7 +18,7 @@ class TestHal(unittest.TestCase):
         adb = AdbWrapper(config.ADB_PATH, serial="test-serial")
         prop = adb.get_prop("ro.product.model")
         self.assertEqual(prop, "Pixel 6")
-        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'shell', 'getprop', 'ro.product.model'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'shell', 'getprop', 'ro.product.model'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -28,7 +28,7 @@ class TestHal(unittest.TestCase):
         adb = AdbWrapper(config.ADB_PATH, serial="test-serial")
         output = adb.shell("whoami")
         self.assertEqual(output, "root")
-        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'shell', 'whoami'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'shell', 'whoami'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -37,7 +37,7 @@ class TestHal(unittest.TestCase):
         adb = AdbWrapper(config.ADB_PATH, serial="test-serial")
         success = adb.push("local.txt", "/sdcard/remote.txt")
         self.assertTrue(success)
-        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'push', 'local.txt', '/sdcard/remote.txt'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'push', 'local.txt', '/sdcard/remote.txt'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -46,7 +46,7 @@ class TestHal(unittest.TestCase):
         adb = AdbWrapper(config.ADB_PATH, serial="test-serial")
         success = adb.pull("/sdcard/remote.txt", "local.txt")
         self.assertTrue(success)
-        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'pull', '/sdcard/remote.txt', 'local.txt'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'pull', '/sdcard/remote.txt', 'local.txt'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -55,7 +55,31 @@ class TestHal(unittest.TestCase):
         adb = AdbWrapper(config.ADB_PATH, serial="test-serial")
         success = adb.install("app.apk")
         self.assertTrue(success)
-        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'install', 'app.apk'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.ADB_PATH, '-s', 'test-serial', 'install', 'app.apk'], check=True, capture_output=True, text=True, timeout=ANY)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_adb_get_props_cached(self, mock_run, mock_exists):
+        AdbWrapper.invalidate_props()
+        mock_run.return_value.stdout = (
+            "[ro.product.model]: [Pixel 6]\n"
+            "[ro.product.brand]: [google]\n"
+            "[ro.build.description]: [line one\nline two]\n"
+            "[persist.sys.empty]: []\n"
+        )
+        adb = AdbWrapper(config.ADB_PATH, serial="test-serial")
+        props = adb.get_props()
+        self.assertEqual(props['ro.product.model'], "Pixel 6")
+        self.assertEqual(props['ro.build.description'], "line one\nline two")
+        self.assertEqual(props['persist.sys.empty'], "")
+
+        # A second wrapper for the same serial reads the snapshot without a roundtrip
+        AdbWrapper(config.ADB_PATH, serial="test-serial").get_props()
+        mock_run.assert_called_once_with([config.ADB_PATH, '-s', 'test-serial', 'shell', 'getprop'], check=True, capture_output=True, text=True, timeout=ANY)
+
+        adb.reboot()
+        adb.get_props()
+        self.assertEqual(mock_run.call_count, 3)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -75,7 +99,41 @@ class TestHal(unittest.TestCase):
         fastboot = FastbootWrapper(config.FASTBOOT_PATH, serial="test-serial")
         var = fastboot.getvar("unlocked")
         self.assertEqual(var, "unlocked: yes")
-        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'getvar', 'unlocked'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'getvar', 'unlocked'], check=True, capture_output=True, text=True, timeout=ANY)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_fastboot_getvar_all(self, mock_run, mock_exists):
+        FastbootWrapper.invalidate_vars()
+        mock_run.return_value.stdout = ""
+        mock_run.return_value.stderr = (
+            "(bootloader) product:oriole\n"
+            "(bootloader) unlocked:yes\n"
+            "(bootloader) current-slot:a\n"
+            "(bootloader) version-baseband: g5123b-1:2\n"
+            "(bootloader) partition-size:boot_a: 0x4000000\n"
+            "(bootloader) partition-type:boot_a:raw\n"
+            "(bootloader) is-logical:system_a:yes\n"
+            "(bootloader) slot-successful:a:yes\n"
+            "all:\n"
+            "Finished. Total time: 0.050s\n"
+        )
+        fastboot = FastbootWrapper(config.FASTBOOT_PATH, serial="test-serial")
+        snapshot = fastboot.getvar_all()
+        self.assertEqual(snapshot['vars']['product'], "oriole")
+        self.assertEqual(snapshot['vars']['version-baseband'], "g5123b-1:2")
+        self.assertEqual(snapshot['partitions']['boot_a'], {'size': 0x4000000, 'type': 'raw'})
+        self.assertTrue(snapshot['partitions']['system_a']['is-logical'])
+        self.assertEqual(snapshot['slots']['a']['successful'], "yes")
+        self.assertEqual(FastbootWrapper.partition_info(snapshot, 'boot')['size'], 0x4000000)
+
+        # Callers get copies: changing one snapshot does not change the cache.
+        snapshot['partitions']['boot_a']['size'] = 0
+        snapshot['vars'].clear()
+        cached = FastbootWrapper(config.FASTBOOT_PATH, serial="test-serial").getvar_all()
+        self.assertEqual(cached['partitions']['boot_a']['size'], 0x4000000)
+        self.assertEqual(cached['vars']['product'], "oriole")
+        mock_run.assert_called_once_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'getvar', 'all'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -84,7 +142,7 @@ class TestHal(unittest.TestCase):
         fastboot = FastbootWrapper(config.FASTBOOT_PATH, serial="test-serial")
         success = fastboot.flash("boot", "boot.img")
         self.assertTrue(success)
-        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'flash', 'boot', 'boot.img'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'flash', 'boot', 'boot.img'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -93,7 +151,7 @@ class TestHal(unittest.TestCase):
         fastboot = FastbootWrapper(config.FASTBOOT_PATH, serial="test-serial")
         success = fastboot.boot("twrp.img")
         self.assertTrue(success)
-        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'boot', 'twrp.img'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'boot', 'twrp.img'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -102,7 +160,7 @@ class TestHal(unittest.TestCase):
         fastboot = FastbootWrapper(config.FASTBOOT_PATH, serial="test-serial")
         success = fastboot.reboot()
         self.assertTrue(success)
-        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'reboot'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.FASTBOOT_PATH, '-s', 'test-serial', 'reboot'], check=True, capture_output=True, text=True, timeout=ANY)
 
     # --- Heimdall Tests ---
 
@@ -114,7 +172,7 @@ class TestHal(unittest.TestCase):
         heimdall = HeimdallWrapper(config.HEIMDALL_PATH)
         detected = heimdall.detect()
         self.assertTrue(detected)
-        mock_run.assert_called_with([config.HEIMDALL_PATH, 'detect'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.HEIMDALL_PATH, 'detect'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -123,7 +181,7 @@ class TestHal(unittest.TestCase):
         heimdall = HeimdallWrapper(config.HEIMDALL_PATH)
         output = heimdall.print_pit()
         self.assertEqual(output, "PIT file content...")
-        mock_run.assert_called_with([config.HEIMDALL_PATH, 'print-pit', '--no-reboot'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.HEIMDALL_PATH, 'print-pit', '--no-reboot'], check=True, capture_output=True, text=True, timeout=ANY)
 
     @patch('os.path.exists', return_value=True)
     @patch('subprocess.run')
@@ -132,7 +190,7 @@ class TestHal(unittest.TestCase):
         heimdall = HeimdallWrapper(config.HEIMDALL_PATH)
         success = heimdall.flash("BOOT", "boot.img")
         self.assertTrue(success)
-        mock_run.assert_called_with([config.HEIMDALL_PATH, 'flash', '--BOOT', 'boot.img'], check=True, capture_output=True, text=True)
+        mock_run.assert_called_with([config.HEIMDALL_PATH, 'flash', '--BOOT', 'boot.img'], check=True, capture_output=True, text=True, timeout=ANY)
 
     # --- Error Handling Tests ---
 
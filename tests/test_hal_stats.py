@@ -0,0 +1,99 @@
+# tests/test_hal_stats.py
+
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from modules.hal import AdbWrapper, HalStats, LatencyHistogram
+from modules.hal import stats
+from modules.hal.tool_wrapper import ToolWrapper
+import config
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_within_precision(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 10001):
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.count, 10000)
+        self.assertAlmostEqual(histogram.percentile(50), 5.0, delta=5.0 / 128)
+        self.assertAlmostEqual(histogram.percentile(99), 9.9, delta=9.9 / 128)
+        self.assertEqual(histogram.percentile(100), 10.0)
+        self.assertAlmostEqual(histogram.mean(), 5.0005, places=3)
+        # Buckets grow with magnitude, so memory stays bounded.
+        self.assertLess(len(histogram.buckets), 1200)
+
+    def test_merge(self):
+        fast, slow = LatencyHistogram(), LatencyHistogram()
+        for _ in range(99):
+            fast.record(0.01)
+        slow.record(2.0)
+        merged = LatencyHistogram().merge(fast).merge(slow)
+        self.assertEqual(merged.count, 100)
+        self.assertAlmostEqual(merged.percentile(50), 0.01, delta=0.001)
+        self.assertEqual(merged.percentile(100), 2.0)
+        self.assertIsNone(LatencyHistogram().percentile(50))
+
+class TestHalStats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = HalStats()
+        patcher = patch.object(stats, '_hal_stats', self.stats)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.trace_path = "tests/temp_hal_trace.jsonl"
+
+    def tearDown(self):
+        self.stats.set_trace_file(None)
+        if os.path.exists(self.trace_path):
+            os.remove(self.trace_path)
+
+    def test_records_real_invocations(self):
+        sh = ToolWrapper("/bin/sh")
+        sh._run_command(["-c", "printf 12345"])
+        sh._run_command(["-c", "exit 2"])
+        sh._run_command(["-c", "sleep 5"], timeout=0.1)
+        list(sh.iter_lines(["-c", "seq 1 1000"]))
+
+        counters = self.stats.counters(tool="sh")
+        self.assertEqual(counters['calls'], 4)
+        self.assertEqual(counters['failures'], 1)
+        self.assertEqual(counters['timeouts'], 1)
+        self.assertEqual(counters['bytes'], 5 + len("\n".join(map(str, range(1, 1001)))) + 1)
+        self.assertGreaterEqual(self.stats.histogram(tool="sh").percentile(100), 0.1)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_adb_shell_keys_by_program_and_serial(self, mock_run, mock_exists):
+        mock_run.return_value.stdout = "value"
+        mock_run.return_value.stderr = ""
+        mock_run.return_value.returncode = 0
+        for serial in ("S1", "S2"):
+            adb = AdbWrapper(config.ADB_PATH, serial=serial)
+            adb.get_prop("ro.product.model")
+            adb.shell("whoami")
+        AdbWrapper(config.ADB_PATH, serial="S1").get_prop("ro.serialno")
+
+        rows = {row['subcommand']: row for row in self.stats.summary()}
+        self.assertEqual(rows['shell getprop']['calls'], 3)
+        self.assertEqual(rows['shell whoami']['calls'], 2)
+        self.assertEqual(rows['shell getprop']['bytes'], 15)
+        per_serial = [r for r in self.stats.summary(by_serial=True) if r['subcommand'] == 'shell getprop']
+        self.assertEqual([(r['serial'], r['calls']) for r in per_serial], [('S1', 2), ('S2', 1)])
+
+    def test_trace_file(self):
+        self.stats.set_trace_file(self.trace_path)
+        ToolWrapper("/bin/sh")._run_command(["-c", "echo hi"])
+        self.stats.set_trace_file(None)
+
+        with open(self.trace_path) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['tool'], 'sh')
+        self.assertEqual(entries[0]['subcommand'], '-c')
+        self.assertEqual(entries[0]['exit_code'], 0)
+        self.assertEqual(entries[0]['bytes'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
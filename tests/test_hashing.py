@@ -0,0 +1,61 @@
+# tests/test_hashing.py
+
+import hashlib
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from modules import hashing
+
+class TestHashing(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.abspath("tests/temp_hashing")
+        os.makedirs(self.dir, exist_ok=True)
+        self.files = {}
+        for name, size in (("empty.img", 0), ("small.img", 1000), ("big.img", 3 * 1024 * 1024 + 7)):
+            path = os.path.join(self.dir, name)
+            data = os.urandom(size)
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.files[path] = data
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _expected(self, data, algorithms=hashing.ALGORITHMS):
+        return {a: hashlib.new(a, data).hexdigest() for a in algorithms}
+
+    def test_hash_file_in_one_pass(self):
+        with patch.object(hashing, 'HASH_BUFFER_SIZE', 1024 * 1024):
+            for path, data in self.files.items():
+                self.assertEqual(hashing.hash_file(path, hashing.ALGORITHMS), self._expected(data))
+
+    def test_unmappable_files_are_read(self):
+        path = os.path.join(self.dir, "big.img")
+        with patch.object(hashing.mmap, 'mmap', side_effect=OSError("no mmap here")):
+            self.assertEqual(hashing.hash_file(path), self._expected(self.files[path], ('sha256',)))
+
+    def test_hash_service(self):
+        service = hashing.HashService(workers=3)
+        self.addCleanup(service.shutdown)
+        missing = os.path.join(self.dir, "missing.img")
+        results = service.hash_files(list(self.files) + [missing], ('sha256', 'md5'))
+        self.assertEqual(results, {p: self._expected(d, ('sha256', 'md5')) for p, d in self.files.items()})
+
+    def test_checksums(self):
+        digest = hashlib.sha1(b"x").hexdigest()
+        self.assertEqual(hashing.parse_checksum(digest.upper()), ('sha1', digest))
+        self.assertEqual(hashing.parse_checksum(f"md5:{'A' * 32}"), ('md5', 'a' * 32))
+        for bad in ("valid_checksum", "abc", f"sha256:{digest}", ""):
+            with self.assertRaises(ValueError):
+                hashing.parse_checksum(bad)
+        path = os.path.join(self.dir, "small.img")
+        self.assertTrue(hashing.verify_file(path, hashlib.md5(self.files[path]).hexdigest()))
+        self.assertFalse(hashing.verify_file(path, f"sha256:{'0' * 64}"))
+        with self.assertRaises(ValueError):
+            hashing.MultiHasher(('crc32',))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# tests/test_http_client.py
+
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from modules import download, http_client
+from modules.http_file_server import HttpFileServer
+
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(300 * 1024)
+        self.server = HttpFileServer({'/tool.zip': self.data}).start()
+        self.addCleanup(self.server.stop)
+        http_client.close()
+        self.addCleanup(http_client.close)
+        http_client.reset_stats()
+        self.sleep = patch('time.sleep')
+        self.sleep.start()
+        self.addCleanup(self.sleep.stop)
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            response = http_client.get(self.server.url('/tool.zip'))
+            self.assertEqual(response.content, self.data)
+        http_client.head(self.server.url('/tool.zip'))
+        self.assertEqual(http_client.stats(), {'requests': 6, 'connections': 1, 'reused': 5})
+        self.assertEqual(self.server.connections, 1)
+
+    def test_server_errors_are_retried(self):
+        self.server.errors['/tool.zip'] = [503, 502]
+        response = http_client.get(self.server.url('/tool.zip'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(http_client.stats()['requests'], 3)
+
+        # Once the retries are used up the last answer is returned, not raised.
+        self.server.errors['/tool.zip'] = [503] * 10
+        with patch.object(http_client.config, 'HTTP_RETRIES', 1):
+            http_client.close()
+            response = http_client.get(self.server.url('/tool.zip'))
+        self.assertEqual(response.status_code, 503)
+        with self.assertRaises(requests.HTTPError):
+            response.raise_for_status()
+
+    def test_default_timeout(self):
+        with patch.object(requests.adapters.HTTPAdapter, 'send', return_value=requests.Response()) as send:
+            http_client.get(self.server.url('/tool.zip'))
+            http_client.get(self.server.url('/tool.zip'), timeout=3)
+        self.assertEqual([c.kwargs['timeout'] for c in send.call_args_list], [http_client.DEFAULT_TIMEOUT, 3])
+
+    def test_segmented_downloads_share_the_pool(self):
+        destination = os.path.abspath("tests/temp_http_client/tool.zip")
+        self.addCleanup(shutil.rmtree, os.path.dirname(destination), ignore_errors=True)
+        with patch.object(download, 'MIN_SEGMENT_SIZE', 64 * 1024):
+            for _ in range(3):
+                download.fetch(self.server.url('/tool.zip'), destination, connections=4)
+        stats = http_client.stats()
+        # Three downloads of a probe and four ranges each, over at most four connections.
+        self.assertEqual(stats['requests'], 15)
+        self.assertLessEqual(stats['connections'], 4)
+        self.assertEqual(self.server.connections, stats['connections'])
+
+if __name__ == '__main__':
+    unittest.main()
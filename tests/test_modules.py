@@ -1,8 +1,11 @@
 # tests/test_modules.py
 
+import os
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
-from modules import compile, decompile, diagnostic, debug, repair
+from modules import compile, decompile, diagnostic, debug, repair, device_quarry
 import config
 
 class TestModules(unittest.TestCase):
@@ -41,13 +44,36 @@ class TestModules(unittest.TestCase):
     @patch('modules.hal.AdbWrapper')
     def test_diagnostic_root_check(self, MockAdbWrapper):
         mock_adb_instance = MockAdbWrapper.return_value
-        mock_adb_instance.shell.return_value = "rooted"
+        mock_adb_instance.get_props.return_value = {}
+        mock_adb_instance.shell_many.return_value = ["rooted", None, None, None]
+        mock_adb_instance.iter_shell_lines.return_value = iter([])
         
         device_info = {'model': 'Test', 'boot_mode': 'adb', 'serial': 'test-serial'}
         diagnostic.run_diagnostics(device_info)
         
         MockAdbWrapper.assert_called_with('dummy_adb', serial='test-serial')
-        mock_adb_instance.shell.assert_any_call(["su", "-c", "echo 'rooted'"])
+        commands = mock_adb_instance.shell_many.call_args[0][0]
+        self.assertIn("su -c \"echo 'rooted'\"", commands)
+        mock_adb_instance.shell.assert_not_called()
+
+    def test_quarry_adb_uses_property_snapshot(self):
+        mock_adb = MagicMock()
+        mock_adb.serial = 'test-serial'
+        mock_adb.get_props.return_value = {
+            'ro.product.model': 'Pixel 6',
+            'ro.product.brand': 'google',
+            'ro.build.version.release': '14',
+            'ro.build.version.incremental': '1234567',
+            'ro.build.version.security_patch': '2024-01-05',
+        }
+
+        info = device_quarry.quarry_adb(mock_adb)
+
+        self.assertEqual(info['model'], 'Pixel 6')
+        self.assertEqual(info['os_version'], '14')
+        self.assertEqual(info['security_patch'], '2024-01-05')
+        mock_adb.get_props.assert_called_once()
+        mock_adb.get_prop.assert_not_called()
 
     @patch('config.ADB_PATH', 'dummy_adb')
     @patch('modules.hal.AdbWrapper')
@@ -72,30 +98,53 @@ class TestModules(unittest.TestCase):
         mock_process.terminate.assert_called_once()
 
     @patch('config.FASTBOOT_PATH', 'dummy_fastboot')
+    @patch('modules.db_manager.get_resumable_flash_job', return_value=None)
+    @patch('modules.db_manager.record_flashed_image')
+    @patch('modules.db_manager.log_operation')
     @patch('modules.hal.FastbootWrapper')
     @patch('rich.prompt.Confirm.ask', return_value=True)
-    @patch('os.path.exists')
-    def test_repair_flash_stock_rom(self, mock_os_exists, mock_confirm, MockFastbootWrapper):
+    def test_repair_flash_stock_rom(self, mock_confirm, MockFastbootWrapper, mock_log, mock_record, mock_jobs):
         mock_fastboot_instance = MockFastbootWrapper.return_value
+        mock_fastboot_instance.getvar_all.return_value = {'vars': {}, 'partitions': {}, 'slots': {}}
+        MockFastbootWrapper.partition_info.return_value = None
         
         device_info = {'model': 'Test', 'boot_mode': 'fastboot', 'serial': 'test-serial'}
-        rom_path = '/path/to/rom'
-
-        # Simulate that flash-all script doesn't exist, but image files do
-        def side_effect(path):
-            if path.endswith('.sh') or path.endswith('.bat'):
-                return False
-            return True
-        mock_os_exists.side_effect = side_effect
+        # No flash-all script, but image files exist (and must pass validation)
+        rom_path = tempfile.mkdtemp(dir='tests')
+        self.addCleanup(shutil.rmtree, rom_path)
+        for name in ('boot.img', 'system.img'):
+            with open(os.path.join(rom_path, name), 'wb') as f:
+                f.write(b'\0' * 4096)
 
         repair.flash_stock_rom(device_info, rom_path)
 
         MockFastbootWrapper.assert_called_with('dummy_fastboot', serial='test-serial')
         
         # Check that flash was called for the images
-        mock_fastboot_instance.flash.assert_any_call('boot', '/path/to/rom/boot.img')
-        mock_fastboot_instance.flash.assert_any_call('system', '/path/to/rom/system.img')
+        mock_fastboot_instance.flash.assert_any_call('boot', os.path.join(rom_path, 'boot.img'))
+        mock_fastboot_instance.flash.assert_any_call('system', os.path.join(rom_path, 'system.img'))
         # ... and so on for other images
 
+    @patch('modules.repair.check_battery', return_value=True)
+    @patch('modules.backup.backup_device')
+    @patch('rich.prompt.Confirm.ask')
+    def test_repair_flash_stops_after_incomplete_backup(self, mock_confirm, mock_backup, mock_battery):
+        device_info = {'model': 'Test', 'boot_mode': 'adb', 'serial': 'test-serial'}
+        failed = {'partitions': [{'partition': 'boot', 'status': 'ok'},
+                                 {'partition': 'persist', 'status': 'failed: exited with status 1'}]}
+        for manifest, reason in ((failed, "persist (failed: exited with status 1)"),
+                                 (None, "backup failed"), ({'partitions': []}, "No partitions")):
+            mock_backup.return_value = manifest
+            # Wipe warning, back up first, then "flash anyway?" declined.
+            mock_confirm.reset_mock()
+            mock_confirm.side_effect = [True, True, False]
+            with patch.object(repair, 'console') as mock_console:
+                repair.flash_stock_rom(device_info, '/path/to/rom')
+            self.assertEqual(mock_confirm.call_count, 3)
+            self.assertIn("without a complete backup", mock_confirm.call_args[0][0])
+            printed = " ".join(str(c.args[0]) for c in mock_console.print.call_args_list if c.args)
+            self.assertIn(reason, printed)
+            self.assertNotIn("Flashing stock ROM", printed)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+# tests/test_pit.py
+
+import struct
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+from modules import db_manager, device_quarry
+from modules.exceptions import ToolError
+from modules.hal import HeimdallWrapper, PitEntry, parse_pit
+from modules.hal.pit import PIT_MAGIC, parse_pit_binary, parse_pit_text
+
+ENTRIES = [
+    PitEntry(80, 'BOOTLOADER', 'sboot.bin', 0, 8192, 2, 1, 0, 2, ''),
+    PitEntry(81, 'BOOT', 'boot.img', 94208, 131072, 5, 1, 0, 2, ''),
+    PitEntry(82, 'SYSTEM', 'system.img', 225280, 9437184, 5, 1, 0, 2, 'system.fota'),
+]
+
+PRINT_PIT = """Heimdall v1.4.2
+
+Downloading device's PIT file...
+PIT file download successful.
+
+Entry Count: 3
+Unknown 1: 1598902083
+
+--- Entry #0 ---
+Binary Type: 0 (AP)
+Device Type: 2 (MMC)
+Identifier: 80
+Attributes: 2 (STL Read-Only)
+Update Attributes: 1 (FOTA)
+Partition Block Size/Offset: 0
+Partition Block Count: 8192
+File Offset (Obsolete): 0
+File Size (Obsolete): 0
+Partition Name: BOOTLOADER
+Flash Filename: sboot.bin
+FOTA Filename:
+
+--- Entry #1 ---
+Binary Type: 0 (AP)
+Device Type: 2 (MMC)
+Identifier: 81
+Attributes: 5 (Read/Write)
+Update Attributes: 1 (FOTA)
+Partition Block Size/Offset: 94208
+Partition Block Count: 131072
+File Offset (Obsolete): 0
+File Size (Obsolete): 0
+Partition Name: BOOT
+Flash Filename: boot.img
+FOTA Filename:
+
+--- Entry #2 ---
+Binary Type: 0 (AP)
+Device Type: 2 (MMC)
+Identifier: 82
+Attributes: 5 (Read/Write)
+Update Attributes: 1 (FOTA)
+Partition Block Size/Offset: 225280
+Partition Block Count: 9437184
+File Offset (Obsolete): 0
+File Size (Obsolete): 0
+Partition Name: SYSTEM
+Flash Filename: system.img
+FOTA Filename: system.fota
+"""
+
+def build_pit(entries, chip=b"SM8550"):
+    data = struct.pack('<II8s8sI', PIT_MAGIC, len(entries), b"COM_TAR2", chip, 0)
+    for e in entries:
+        data += struct.pack(
+            '<9I32s32s32s', e.binary_type, e.device_type, e.identifier, e.attributes, e.update_attributes,
+            e.block_offset, e.block_count, 0, 0, e.name.encode(), e.flash_filename.encode(), e.fota_filename.encode(),
+        )
+    return data
+
+class TestPit(unittest.TestCase):
+
+    def test_parse_binary(self):
+        table = parse_pit_binary(build_pit(ENTRIES))
+        self.assertEqual(table.entries, ENTRIES)
+        self.assertEqual(table.chip, "SM8550")
+        self.assertEqual(table.find("boot").block_count, 131072)
+        self.assertEqual(table.find_by_filename("SYSTEM.img.lz4").name, "SYSTEM")
+        self.assertIsNone(table.find("missing"))
+
+    def test_parse_print_pit_text(self):
+        table = parse_pit_text(PRINT_PIT)
+        self.assertEqual(table.entries, ENTRIES)
+        self.assertEqual(parse_pit(PRINT_PIT.encode()), table)
+        self.assertEqual(parse_pit(build_pit(ENTRIES)).entries, table.entries)
+
+    def test_rejects_bad_input(self):
+        with self.assertRaises(ToolError):
+            parse_pit_binary(b"\0" * 40)
+        with self.assertRaises(ToolError):
+            parse_pit_binary(build_pit(ENTRIES)[:-10])
+        with self.assertRaises(ToolError):
+            parse_pit_text("ERROR: Failed to detect compatible download-mode device.")
+
+    def test_json_roundtrip(self):
+        table = parse_pit_text(PRINT_PIT)
+        self.assertEqual(type(table).from_json(table.to_json()), table)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.run')
+    def test_wrapper_get_pit(self, mock_run, mock_exists):
+        mock_run.return_value.stdout = PRINT_PIT
+        self.assertEqual(HeimdallWrapper(config.HEIMDALL_PATH).get_pit().entries, ENTRIES)
+        mock_run.return_value.stdout = "garbage"
+        self.assertIsNone(HeimdallWrapper(config.HEIMDALL_PATH).get_pit())
+
+class TestPitCache(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        db_manager.engine = self.engine
+        db_manager.Session = sessionmaker(bind=self.engine)
+        db_manager.init_db()
+
+    def test_quarry_reuses_cached_table(self):
+        heimdall = MagicMock()
+        heimdall.get_pit.return_value = parse_pit_text(PRINT_PIT)
+        with patch.object(device_quarry.console, 'print'):
+            first = device_quarry.quarry_heimdall(heimdall, device_key="download:R5CT")
+            second = device_quarry.quarry_heimdall(heimdall, device_key="download:R5CT")
+        self.assertEqual(first['partitions'], ['BOOTLOADER', 'BOOT', 'SYSTEM'])
+        self.assertEqual(second, first)
+        heimdall.get_pit.assert_called_once()
+
+        table = device_quarry.load_partition_table(heimdall, "download:R5CT", refresh=True)
+        self.assertEqual(heimdall.get_pit.call_count, 2)
+        db_manager.invalidate_partition_table("download:R5CT")
+        self.assertIsNone(db_manager.get_partition_table("download:R5CT"))
+        self.assertEqual(table.entries, ENTRIES)
+
+    def test_no_key_means_no_cache(self):
+        heimdall = MagicMock()
+        heimdall.get_pit.return_value = None
+        with patch.object(device_quarry, 'download_mode_key', return_value=None):
+            info = device_quarry.quarry_heimdall(heimdall)
+        self.assertEqual(info['partitions'], [])
+
+if __name__ == '__main__':
+    unittest.main()
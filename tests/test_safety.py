@@ -7,13 +7,11 @@ from modules import download
 class TestSafety(unittest.TestCase):
 
     @patch('modules.download.download_file')
-    @patch('modules.download.verify_checksum')
     @patch('modules.db_manager.get_url')
-    def test_checksum_verification_failure(self, mock_get_url, mock_verify, mock_download):
+    def test_checksum_verification_failure(self, mock_get_url, mock_download):
         # Setup
-        mock_get_url.return_value = {'url': 'http://test.com/file.zip', 'checksum': 'valid_checksum'}
-        mock_download.return_value = True
-        mock_verify.return_value = False # Simulate checksum failure
+        mock_get_url.return_value = {'url': 'http://test.com/file.zip', 'checksum': 'a' * 64}
+        mock_download.return_value = {'sha256': 'b' * 64} # Simulate checksum failure
         
         # Capture stdout to verify error message
         with patch('builtins.print') as mock_print:
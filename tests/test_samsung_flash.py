@@ -0,0 +1,149 @@
+# tests/test_samsung_flash.py
+
+import io
+import os
+import shutil
+import stat
+import tarfile
+import unittest
+from unittest.mock import patch
+
+from modules import samsung_flash
+from modules.exceptions import ToolError
+from modules.hal import HeimdallWrapper, PitEntry, PitTable
+
+# Copies each --PARTITION file into $FLASHED/ and prints Heimdall-style progress.
+# Every invocation is appended to $FLASHED/invocations.
+FAKE_HEIMDALL = """#!/bin/sh
+echo "$*" >> "$FLASHED/invocations"
+shift
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --resume|--no-reboot) shift; continue ;;
+    esac
+    name="${1#--}"
+    [ -f "$2" ] || { echo "ERROR: Failed to open file \\"$2\\""; exit 1; }
+    printf '\\nUploading %s\\n0%%\\b\\b50%%\\b\\b\\b100%%\\n' "$name"
+    cp "$2" "$FLASHED/$name"
+    printf '%s upload successful\\n' "$name"
+    shift 2
+done
+"""
+
+def _entry(identifier, name, filename):
+    return PitEntry(identifier, name, filename, 0, 1024, 5, 1, 0, 2, '')
+
+TABLE = PitTable([
+    _entry(1, 'BOOTLOADER', 'sboot.bin'),
+    _entry(2, 'BOOT', 'boot.img'),
+    _entry(3, 'SYSTEM', 'system.img'),
+    _entry(4, 'RADIO', 'modem.bin'),
+])
+
+def _add(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    archive.addfile(info, io.BytesIO(data))
+
+class TestSamsungFlash(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.abspath("tests/temp_samsung_flash")
+        self.firmware = os.path.join(self.root, "firmware")
+        self.flashed = os.path.join(self.root, "flashed")
+        os.makedirs(self.firmware)
+        os.makedirs(self.flashed)
+        self.heimdall_path = os.path.join(self.root, "heimdall")
+        with open(self.heimdall_path, "w") as f:
+            f.write(FAKE_HEIMDALL)
+        os.chmod(self.heimdall_path, os.stat(self.heimdall_path).st_mode | stat.S_IEXEC)
+        self.images = {
+            'BOOTLOADER': b"sboot" * 1000,
+            'BOOT': os.urandom(300000),
+            'SYSTEM': os.urandom(700000),
+            'RADIO': b"modem" * 2000,
+        }
+        self.env = patch.dict(os.environ, {'FLASHED': self.flashed})
+        self.env.start()
+        HeimdallWrapper.end_sessions()
+
+    def tearDown(self):
+        HeimdallWrapper.end_sessions()
+        self.env.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _write_tar(self, name, members):
+        with tarfile.open(os.path.join(self.firmware, name), "w") as archive:
+            for member, data in members.items():
+                _add(archive, member, data)
+
+    def _invocations(self):
+        with open(os.path.join(self.flashed, "invocations")) as f:
+            return f.read().splitlines()
+
+    def _assert_flashed(self, names):
+        for name in names:
+            with open(os.path.join(self.flashed, name), "rb") as f:
+                self.assertEqual(f.read(), self.images[name])
+
+    def test_odin_tar_set_in_one_session(self):
+        self._write_tar("BL_G991B.tar.md5", {"sboot.bin": self.images['BOOTLOADER']})
+        self._write_tar("AP_G991B.tar.md5", {
+            "boot.img": self.images['BOOT'],
+            "system.img": self.images['SYSTEM'],
+            "meta-data/fota.zip": b"not in the PIT",
+        })
+        self._write_tar("CP_G991B.tar.md5", {"modem.bin": self.images['RADIO']})
+        self._write_tar("HOME_CSC_G991B.tar.md5", {"cache.img": b"unmapped"})
+
+        stats = samsung_flash.flash_firmware(HeimdallWrapper(self.heimdall_path), TABLE, self.firmware)
+
+        self.assertEqual(list(stats), ['BOOTLOADER', 'BOOT', 'SYSTEM', 'RADIO'])
+        self.assertEqual(stats['SYSTEM']['bytes'], len(self.images['SYSTEM']))
+        self.assertGreaterEqual(stats['BOOT']['mib_per_s'], 0)
+        self._assert_flashed(self.images)
+        invocations = self._invocations()
+        self.assertEqual(len(invocations), 1)
+        self.assertTrue(invocations[0].startswith("flash --BOOTLOADER "))
+        # Staged members are removed once the session is over.
+        self.assertEqual(sorted(os.listdir(self.firmware)), sorted(
+            ["BL_G991B.tar.md5", "AP_G991B.tar.md5", "CP_G991B.tar.md5", "HOME_CSC_G991B.tar.md5"]))
+
+    def test_image_folder_is_flashed_in_place(self):
+        for name, filename in (('BOOT', 'boot.img'), ('RADIO', 'modem.bin')):
+            with open(os.path.join(self.firmware, filename), "wb") as f:
+                f.write(self.images[name])
+        HeimdallWrapper.mark_session("download:R5C1")
+        heimdall = HeimdallWrapper(self.heimdall_path, device_key="download:R5C1")
+        stats = samsung_flash.flash_firmware(heimdall, TABLE, self.firmware, reboot=False)
+        self.assertEqual(list(stats), ['BOOT', 'RADIO'])
+        self._assert_flashed(['BOOT', 'RADIO'])
+        self.assertTrue(self._invocations()[0].endswith("--resume --no-reboot"))
+        self.assertTrue(HeimdallWrapper.session_open("download:R5C1"))
+
+    def test_session_is_per_device_and_ends_on_failure(self):
+        with open(os.path.join(self.firmware, "boot.img"), "wb") as f:
+            f.write(self.images['BOOT'])
+        HeimdallWrapper.mark_session("download:R5C1")
+        # Another device never inherits the first one's open session.
+        samsung_flash.flash_firmware(HeimdallWrapper(self.heimdall_path, device_key="download:R5C2"), TABLE, self.firmware)
+        self.assertNotIn("--resume", self._invocations()[0])
+
+        heimdall = HeimdallWrapper(self.heimdall_path, device_key="download:R5C1")
+        self.assertIsNone(heimdall.flash_many([('BOOT', os.path.join(self.root, "missing.img"))]))
+        self.assertFalse(HeimdallWrapper.session_open("download:R5C1"))
+
+    def test_failures(self):
+        with self.assertRaisesRegex(ToolError, "No images"):
+            samsung_flash.flash_firmware(HeimdallWrapper(self.heimdall_path), TABLE, self.firmware)
+        heimdall = HeimdallWrapper(self.heimdall_path)
+        self.assertIsNone(heimdall.flash_many([('BOOT', os.path.join(self.root, "missing.img"))]))
+
+    @unittest.skipIf(samsung_flash.lz4 is not None, "lz4 is installed")
+    def test_lz4_images_need_lz4(self):
+        self._write_tar("AP_G991B.tar", {"boot.img.lz4": b"\x04\x22\x4d\x18"})
+        with self.assertRaisesRegex(ToolError, "lz4"):
+            samsung_flash.flash_firmware(HeimdallWrapper(self.heimdall_path), TABLE, self.firmware)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# tests/test_scheduler.py
+
+import asyncio
+import os
+import shutil
+import stat
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from modules.exceptions import ToolError
+from modules.hal import AsyncFastbootWrapper, FastbootWrapper, ToolScheduler
+from modules.hal import scheduler
+from modules.hal.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE
+from modules.hal.tool_wrapper import ToolWrapper
+
+# Records how many fastboot processes overlap per serial while each one runs.
+FAKE_FASTBOOT = """#!/bin/sh
+dir="$(dirname "$0")"
+[ "$1" = "-s" ] && serial="$2" && shift 2
+echo start >> "$dir/$serial.log"
+sleep "${SLEEP:-0.2}"
+echo end >> "$dir/$serial.log"
+echo "(bootloader) $1" >&2
+"""
+
+class TestToolScheduler(unittest.TestCase):
+
+    def _start(self, tools, order, name, tool, serial=None, priority=10):
+        def worker():
+            tools.acquire(tool, serial, priority)
+            order.append(name)
+            tools.release(tool, serial)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        return thread
+
+    def _wait_for_waiters(self, tools, count):
+        deadline = time.monotonic() + 2
+        while len(tools._waiting) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(tools._waiting), count)
+
+    def test_limits(self):
+        tools = ToolScheduler({'adb': (2, None), 'fastboot': (None, 1)})
+        self.assertTrue(tools.acquire('adb', 'A1'))
+        self.assertTrue(tools.acquire('adb', 'A1'))
+        self.assertFalse(tools.acquire('adb', 'A2', timeout=0.05))
+
+        self.assertTrue(tools.acquire('fastboot', 'F1'))
+        self.assertTrue(tools.acquire('fastboot', 'F2'))
+        self.assertFalse(tools.acquire('fastboot', 'F1', timeout=0.05))
+        self.assertEqual(tools.running('fastboot'), 2)
+
+        tools.release('fastboot', 'F1')
+        self.assertTrue(tools.acquire('fastboot', 'F1', timeout=0.05))
+        # Unknown tools are not limited.
+        self.assertTrue(tools.acquire('heimdall', timeout=0))
+
+    def test_serial_less_calls_share_a_device_bucket(self):
+        tools = ToolScheduler({'fastboot': (None, 1)})
+        self.assertTrue(tools.acquire('fastboot'))
+        # A second `-s`-less command could reach the same device, so it waits...
+        self.assertFalse(tools.acquire('fastboot', timeout=0.05))
+        # ...but commands naming a serial are not held back by it.
+        self.assertTrue(tools.acquire('fastboot', 'F1', timeout=0.05))
+        self.assertEqual(tools.running('fastboot', scheduler.ANY_DEVICE), 1)
+        tools.release('fastboot')
+        self.assertTrue(tools.acquire('fastboot', timeout=0.05))
+
+    def test_priority_order(self):
+        tools = ToolScheduler({'adb': (1, None)})
+        tools.acquire('adb')
+        order = []
+        threads = [self._start(tools, order, 'bulk', 'adb', priority=PRIORITY_BULK)]
+        self._wait_for_waiters(tools, 1)
+        threads.append(self._start(tools, order, 'interactive', 'adb', priority=PRIORITY_INTERACTIVE))
+        self._wait_for_waiters(tools, 2)
+
+        tools.release('adb')
+        for thread in threads:
+            thread.join(timeout=2)
+        self.assertEqual(order, ['interactive', 'bulk'])
+
+    def test_busy_device_does_not_block_others(self):
+        tools = ToolScheduler({'fastboot': (None, 1)})
+        tools.acquire('fastboot', 'F1')
+        order = []
+        blocked = self._start(tools, order, 'F1', 'fastboot', 'F1', priority=PRIORITY_INTERACTIVE)
+        self._wait_for_waiters(tools, 1)
+        other = self._start(tools, order, 'F2', 'fastboot', 'F2', priority=PRIORITY_BULK)
+        other.join(timeout=2)
+        self.assertEqual(order, ['F2'])
+
+        tools.release('fastboot', 'F1')
+        blocked.join(timeout=2)
+        self.assertEqual(order, ['F2', 'F1'])
+
+class TestScheduledWrappers(unittest.TestCase):
+
+    def setUp(self):
+        self.tools_dir = "tests/temp_scheduler_tools"
+        os.makedirs(self.tools_dir, exist_ok=True)
+        self.fastboot_path = os.path.join(self.tools_dir, "fastboot")
+        with open(self.fastboot_path, "w") as f:
+            f.write(FAKE_FASTBOOT)
+        os.chmod(self.fastboot_path, os.stat(self.fastboot_path).st_mode | stat.S_IEXEC)
+        patcher = patch.object(scheduler, '_scheduler', ToolScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tools_dir, ignore_errors=True)
+
+    def _log(self, serial):
+        with open(os.path.join(self.tools_dir, f"{serial}.log")) as f:
+            return f.read().split()
+
+    def test_one_fastboot_op_per_serial(self):
+        wrappers = [FastbootWrapper(self.fastboot_path, serial=s) for s in ("F1", "F1", "F1", "F2")]
+        threads = [threading.Thread(target=w.getvar, args=("product",)) for w in wrappers]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        # Never two overlapping processes on F1; F2 runs alongside them.
+        self.assertEqual(self._log("F1"), ["start", "end"] * 3)
+        self.assertLess(elapsed, 0.8)
+
+    def test_async_wrappers_share_limits(self):
+        async def run():
+            wrappers = [AsyncFastbootWrapper(self.fastboot_path, serial="F1") for _ in range(3)]
+            return await asyncio.gather(*(w.getvar("product") for w in wrappers))
+
+        self.assertEqual(asyncio.run(run()), ["(bootloader) getvar"] * 3)
+        self.assertEqual(self._log("F1"), ["start", "end"] * 3)
+
+    def test_deadline_kills_process(self):
+        sh = ToolWrapper("/bin/sh")
+        start = time.monotonic()
+        self.assertIsNone(sh._run_command(["-c", "sleep 5"], timeout=0.2))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(scheduler.get_scheduler().running("sh"), 0)
+
+    def test_stream_deadline_releases_slot(self):
+        sh = ToolWrapper("/bin/sh")
+        tools = scheduler.get_scheduler()
+        start = time.monotonic()
+        with patch.object(ToolWrapper, 'default_timeout', 0.3), self.assertRaises(ToolError):
+            # Prints once, then wedges without output.
+            for _ in sh.iter_lines(["-c", "echo started; exec sleep 30"]):
+                self.assertEqual(tools.running("sh"), 1)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(tools.running("sh"), 0)
+        self.assertLess(sh.last_returncode, 0)
+
+    def test_per_command_timeouts(self):
+        fastboot = FastbootWrapper(self.fastboot_path, serial="F1")
+        self.assertEqual(fastboot._timeout_for(['-s', 'F1', 'getvar', 'all']), 15)
+        self.assertEqual(fastboot._timeout_for(['flash', 'boot', 'boot.img']), 1800)
+        self.assertEqual(fastboot._timeout_for(['oem', 'device-info']), ToolWrapper.default_timeout)
+
+        with patch.dict(os.environ, {"SLEEP": "5"}), \
+                patch.dict(FastbootWrapper.command_timeouts, {'getvar': 0.2}):
+            self.assertIsNone(fastboot.getvar("product"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,7 +18,7 @@ class TestSetup(unittest.TestCase):
         if os.path.exists(self.test_tools_dir):
             shutil.rmtree(self.test_tools_dir)
 
-    @patch('requests.get')
+    @patch('modules.http_client.get')
     def test_download_file(self, mock_get):
         # Mock the response
         mock_response = MagicMock()
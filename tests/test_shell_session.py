@@ -0,0 +1,106 @@
+# tests/test_shell_session.py
+
+import os
+import shutil
+import stat
+import unittest
+from unittest.mock import Mock, patch
+
+from modules import diagnostic
+from modules.hal import AdbWrapper
+from modules.hal.shell_session import ShellSession
+
+# Pays a fixed startup cost per process, like a real `adb shell` spawn, then runs the
+# command (or an interactive `sh` for `shell sh`) on the host.
+FAKE_ADB = """#!/bin/sh
+echo "$*" >> "$(dirname "$0")/spawns"
+sleep 0.2
+[ "$1" = "-s" ] && shift 2
+shift
+if [ "$1" = "sh" ] && [ $# -eq 1 ]; then
+    exec sh
+fi
+exec sh -c "$*"
+"""
+
+class TestShellSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tools_dir = "tests/temp_shell_tools"
+        os.makedirs(self.tools_dir, exist_ok=True)
+        self.adb_path = os.path.join(self.tools_dir, "adb")
+        with open(self.adb_path, "w") as f:
+            f.write(FAKE_ADB)
+        os.chmod(self.adb_path, os.stat(self.adb_path).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        AdbWrapper.close_shell_sessions()
+        AdbWrapper.invalidate_props()
+        shutil.rmtree(self.tools_dir, ignore_errors=True)
+
+    def test_framing_and_exit_codes(self):
+        with ShellSession.over_process(["sh"]) as session:
+            results = session.run_many([
+                "echo hello",
+                "printf 'no newline'",
+                "echo oops >&2; exit 3",
+                "cat",
+                "true",
+            ])
+            self.assertEqual(results[0], ("hello\n", 0))
+            self.assertEqual(results[1], ("no newline", 0))
+            self.assertEqual(results[2], ("oops\n", 3))
+            # `cat` reads /dev/null, not the commands queued behind it
+            self.assertEqual(results[3], ("", 0))
+            self.assertEqual(results[4], ("", 0))
+            self.assertEqual(session.run("echo still alive").output, "still alive\n")
+
+    def test_large_output(self):
+        with ShellSession.over_process(["sh"]) as session:
+            result = session.run("seq 1 200000")
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.splitlines()[-1], "200000")
+
+    def test_session_is_shared_per_serial(self):
+        first = AdbWrapper(self.adb_path, serial="S1").shell_session()
+        second = AdbWrapper(self.adb_path, serial="S1").shell_session()
+        self.assertIs(first, second)
+        self.assertEqual(AdbWrapper(self.adb_path, serial="S1").shell_many(["echo a", "false"]), ["a", None])
+
+    def _spawns(self):
+        path = os.path.join(self.tools_dir, "spawns")
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            count = len(f.readlines())
+        os.remove(path)
+        return count
+
+    def test_diagnostics_pipelined_round_trips(self):
+        adb = AdbWrapper(self.adb_path, serial="S1")
+        commands = diagnostic.DIAGNOSTIC_COMMANDS + [diagnostic.CRASH_LOG_COMMAND, diagnostic.DMESG_COMMAND]
+        for command in commands:
+            adb.shell([command])
+        separate = self._spawns()
+
+        # Quarry has already filled the property snapshot by the time diagnostics run.
+        AdbWrapper.store_props("S1", {})
+        with patch('config.ADB_PATH', self.adb_path):
+            diagnostic.run_diagnostics({'model': 'Test', 'boot_mode': 'adb', 'serial': 'S1'})
+        pipelined = self._spawns()
+
+        # One adb spawn per command versus a single session for all of them.
+        self.assertEqual(separate, len(commands))
+        self.assertEqual(pipelined, 1)
+        self.assertGreaterEqual(separate, 5 * pipelined)
+
+    def test_session_falls_back_when_the_server_is_gone(self):
+        adb = AdbWrapper(self.adb_path, serial="S1")
+        native = Mock()
+        native.open_service.side_effect = ConnectionRefusedError("adb server went away")
+        native.shell.return_value = ("fallback", 0)
+        with patch.object(AdbWrapper, '_native_transport', return_value=native):
+            self.assertEqual(adb.shell_many(["echo a", "echo b"]), ["fallback", "fallback"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# tests/test_streaming.py
+
+import io
+import os
+import shutil
+import stat
+import threading
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from rich.console import Console
+
+from modules import diagnostic
+from modules.hal import AdbWrapper
+from modules.hal.shell_session import ShellSession
+from modules.hal.tool_wrapper import ToolWrapper, iter_decoded_lines
+
+# Runs `adb [-s serial] shell ...` on the host: an interactive `sh` for `shell sh`.
+FAKE_ADB = """#!/bin/sh
+[ "$1" = "-s" ] && shift 2
+shift
+if [ "$1" = "sh" ] && [ $# -eq 1 ]; then
+    exec sh
+fi
+exec sh -c "$*"
+"""
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.sh = ToolWrapper("/bin/sh")
+
+    def test_incremental_decoding(self):
+        # A multi-byte character split across chunks, CRLF endings and no final newline.
+        data = "héllo\r\nwörld\nlast".encode()
+        chunks = [data[i:i + 1] for i in range(len(data))]
+        self.assertEqual(list(iter_decoded_lines(chunks)), ["héllo", "wörld", "last"])
+
+    def test_long_lines_are_bounded(self):
+        lines = list(iter_decoded_lines([b"x" * 25 + b"\nyz"], max_line_length=10))
+        self.assertEqual(lines, ["x" * 10, "x" * 10, "x" * 5, "yz"])
+
+    def test_iter_lines_and_returncode(self):
+        lines = list(self.sh.iter_lines(["-c", "seq 1 100000; exit 3"]))
+        self.assertEqual(len(lines), 100000)
+        self.assertEqual(lines[-1], "100000")
+        self.assertEqual(self.sh.last_returncode, 3)
+
+    def test_stderr_merge(self):
+        command = ["-c", "echo out; echo err >&2"]
+        self.assertEqual(list(self.sh.iter_lines(command)), ["out"])
+        self.assertEqual(sorted(self.sh.iter_lines(command, merge_stderr=True)), ["err", "out"])
+
+    def test_closing_early_kills_process(self):
+        lines = self.sh.iter_lines(["-c", "exec yes"])
+        self.assertEqual([next(lines) for _ in range(3)], ["y", "y", "y"])
+        lines.close()
+        self.assertLess(self.sh.last_returncode, 0)
+
+    def test_cancel_event(self):
+        cancel = threading.Event()
+        count = 0
+        for _ in self.sh.iter_lines(["-c", "exec yes"], cancel_event=cancel):
+            count += 1
+            if count == 1000:
+                cancel.set()
+        self.assertGreaterEqual(count, 1000)
+        self.assertLess(self.sh.last_returncode, 0)
+
+    def test_session_streaming(self):
+        with ShellSession.over_process(["sh"]) as session:
+            lines = list(session.iter_lines("seq 1 200000; exit 4"))
+            self.assertEqual(lines, [str(i) for i in range(1, 200001)])
+            self.assertEqual(session.last_exit_code, 4)
+            self.assertEqual(list(session.iter_lines("printf 'no newline'")), ["no newline"])
+            self.assertEqual(list(session.iter_lines("echo; echo")), ["", ""])
+            # The session keeps working after streamed commands.
+            self.assertEqual(session.run("echo still alive").output, "still alive\n")
+
+    def test_session_abort_on_early_close(self):
+        with ShellSession.over_process(["sh"]) as session:
+            lines = session.iter_lines("exec yes")
+            self.assertEqual(next(lines), "y")
+            lines.close()
+            self.assertFalse(session.alive())
+
+class TestStreamingDiagnostics(unittest.TestCase):
+
+    def setUp(self):
+        self.tools_dir = "tests/temp_stream_tools"
+        os.makedirs(self.tools_dir, exist_ok=True)
+        self.adb_path = os.path.join(self.tools_dir, "adb")
+        with open(self.adb_path, "w") as f:
+            f.write(FAKE_ADB)
+        os.chmod(self.adb_path, os.stat(self.adb_path).st_mode | stat.S_IEXEC)
+        AdbWrapper.store_props("S1", {})
+
+    def tearDown(self):
+        AdbWrapper.close_shell_sessions()
+        AdbWrapper.invalidate_props()
+        shutil.rmtree(self.tools_dir, ignore_errors=True)
+
+    def test_dmesg_scan_memory_stays_flat(self):
+        # About 20 MB of kernel log, every 100th line an error.
+        dmesg = ("seq 1 400000 | awk '{ if ($1 % 100 == 0) print \"[\" $1 \"] usb 1-1: device descriptor read/64, error -71\";"
+                 " else print \"[\" $1 \"] audit: type=1400 avc: denied { read } for name=kmsg dev=proc\" }'")
+        output = io.StringIO()
+        with patch('config.ADB_PATH', self.adb_path), \
+                patch.object(diagnostic, 'DMESG_COMMAND', dmesg), \
+                patch.object(diagnostic, 'CRASH_LOG_COMMAND', "true"), \
+                patch.object(diagnostic, 'Console', return_value=Console(file=output, width=200)):
+            tracemalloc.start()
+            diagnostic.run_diagnostics({'model': 'Test', 'boot_mode': 'adb', 'serial': 'S1'})
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        report = output.getvalue()
+        self.assertIn("Found 4000 potential errors in dmesg. Showing last 5:", report)
+        self.assertIn("[400000] usb 1-1", report)
+        self.assertIn("No recent crashes found.", report)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_failed_crash_log_is_not_reported_as_crashes(self):
+        output = io.StringIO()
+        with patch('config.ADB_PATH', self.adb_path), \
+                patch.object(diagnostic, 'DMESG_COMMAND', "true"), \
+                patch.object(diagnostic, 'CRASH_LOG_COMMAND', "echo 'logcat: Unable to open log device'; exit 1"), \
+                patch.object(diagnostic, 'Console', return_value=Console(file=output, width=200)):
+            diagnostic.run_diagnostics({'model': 'Test', 'boot_mode': 'adb', 'serial': 'S1'})
+
+        report = output.getvalue()
+        self.assertNotIn("Found recent crashes", report)
+        self.assertNotIn("Unable to open log device", report)
+        self.assertIn("Could not read the crash log.", report)
+
+if __name__ == '__main__':
+    unittest.main()
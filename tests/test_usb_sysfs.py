@@ -0,0 +1,49 @@
+# tests/test_usb_sysfs.py
+
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from fake_sysfs import make_usb_device
+from modules import device_quarry
+from modules.hal import usb_sysfs
+
+class TestUsbSysfs(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = "tests/temp_usb_sysfs"
+        os.makedirs(self.sysfs, exist_ok=True)
+        os.makedirs(os.path.join(self.sysfs, "usb1"), exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs, ignore_errors=True)
+
+    def test_classifies_devices_in_one_pass(self):
+        make_usb_device(self.sysfs, "1-1", "A1", usb_sysfs.ADB_INTERFACE)
+        make_usb_device(self.sysfs, "1-2", "F1", usb_sysfs.FASTBOOT_INTERFACE)
+        make_usb_device(self.sysfs, "1-3", "", None, vid='05c6', pid='9008')
+        make_usb_device(self.sysfs, "1-4", "", None, vid='04E8', pid='685D')
+        make_usb_device(self.sysfs, "1-5", "", None, vid='0e8d', pid='0003')
+        make_usb_device(self.sysfs, "1-6", "", None, vid='046d', pid='c52b')
+
+        modes = {d['path']: d['mode'] for d in usb_sysfs.enumerate_usb_devices(self.sysfs)}
+
+        self.assertEqual(modes, {
+            "1-1": 'adb', "1-2": 'fastboot', "1-3": 'edl',
+            "1-4": 'download', "1-5": 'brom', "1-6": None,
+        })
+        self.assertEqual(usb_sysfs.list_fastboot_serials(self.sysfs), ["F1"])
+
+    def test_missing_sysfs(self):
+        self.assertIsNone(usb_sysfs.enumerate_usb_devices(os.path.join(self.sysfs, "missing")))
+
+    @patch('subprocess.run')
+    def test_detect_edl_without_lsusb(self, mock_run):
+        make_usb_device(self.sysfs, "1-3", "", None, vid='05c6', pid='9008')
+        with patch.object(usb_sysfs, 'SYSFS_USB_DEVICES', self.sysfs):
+            self.assertTrue(device_quarry.detect_edl())
+        mock_run.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,11 +4,16 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
 from rich.prompt import Confirm
-from modules import download, root, compile, decompile, diagnostic, debug, repair, ai_integration, db_manager
+from modules import download, download_queue, root, compile, decompile, diagnostic, debug, repair, ai_integration, db_manager
 from modules.exceptions import AIError
+from modules.hal import get_device_watcher
 import json
+import logging
+import threading
 import config
 
+logger = logging.getLogger("ACRD")
+
 console = Console()
 
 def get_tailored_options(option, device_info):
@@ -28,6 +33,96 @@ def get_tailored_options(option, device_info):
         console.print(f"[red]Could not get tailored options: {e}[/red]")
     return {}
 
+def watch_active_device(device_info):
+    """
+    Keeps device_info's boot mode in sync with the device watcher registry and
+    reports when the active device disconnects. Returns the subscribed callback.
+    """
+    watcher = get_device_watcher()
+    if watcher is None or not device_info.get('serial'):
+        return None
+
+    def on_device_event(event, device):
+        if device['serial'] != device_info['serial']:
+            return
+        if event == 'detach':
+            console.print(f"\n[yellow]Device {device['serial']} disconnected ({device['mode']}).[/yellow]")
+        elif device['mode'] == 'fastboot':
+            if device_info.get('boot_mode') not in ['fastboot', 'fastbootd']:
+                device_info['boot_mode'] = 'fastboot'
+                console.print(f"\n[green]Device {device['serial']} is now in fastboot mode.[/green]")
+        elif device['state'] == 'device':
+            device_info['boot_mode'] = 'adb'
+            console.print(f"\n[green]Device {device['serial']} is now in adb mode.[/green]")
+
+    watcher.subscribe(on_device_event)
+    return on_device_event
+
+_queue_run = None
+
+def _report_queue_run(results):
+    done = sum(1 for r in results if r['status'] == 'done')
+    console.print(f"\n[bold]Download queue finished:[/bold] {done}/{len(results)} download(s) finished.")
+    for r in results:
+        if r['status'] != 'done':
+            console.print(f"[red]{r['model']} {r['component']} ({r['type']}): {r['detail']}[/red]")
+
+def start_queue_run():
+    """
+    Runs the download queue on a background thread so the menu stays usable; a summary
+    is printed when it finishes. Returns False if a run is already in progress.
+    """
+    global _queue_run
+    if queue_running():
+        return False
+
+    def run():
+        try:
+            _report_queue_run(download_queue.run_queue(live=False))
+        except Exception as e:
+            logger.error(f"Download queue run failed: {e}")
+            console.print(f"\n[red]Download queue run failed: {e}[/red]")
+
+    _queue_run = threading.Thread(target=run, name="acrd-download-queue-run", daemon=True)
+    _queue_run.start()
+    return True
+
+def queue_running():
+    return _queue_run is not None and _queue_run.is_alive()
+
+def download_menu(device_info):
+    """Downloads one component now, or queues any number of them and runs the queue."""
+    menu = Table(show_header=False, show_lines=True)
+    menu.add_column("Option", style="cyan")
+    menu.add_column("Description")
+    menu.add_row("1", "Download a component now")
+    menu.add_row("2", "Queue a component")
+    menu.add_row("3", "Queue every component for this device")
+    menu.add_row("4", "Run the download queue")
+    menu.add_row("5", "Show the download queue")
+    console.print(menu)
+    choice = console.input("Select a download option: ")
+    model = device_info['model']
+    if choice in ('1', '2'):
+        component = console.input("Enter component (e.g., recovery, kernel, firmware): ")
+        type = console.input("Enter type (e.g., custom, stock): ")
+        if choice == '1':
+            download.download_component(model, component, type)
+        else:
+            priority = console.input("Priority (higher runs first) [0]: ") or "0"
+            download_queue.enqueue(model, component, type, int(priority) if priority.lstrip('-').isdigit() else 0)
+            console.print(f"[green]Queued {component} ({type}).[/green]")
+    elif choice == '3':
+        ids = download_queue.enqueue_model(model)
+        console.print(f"[green]Queued {len(ids)} component(s) for {model}.[/green]")
+    elif choice == '4':
+        if start_queue_run():
+            console.print("[green]Downloading in the background; use option 5 to see the queue.[/green]")
+        else:
+            console.print("[yellow]The download queue is already running.[/yellow]")
+    elif choice == '5':
+        console.print(download_queue.render_queue(db_manager.get_download_queue()))
+
 def launch_tui(device_info):
     """Launches the Text-based User Interface."""
     # Display device info
@@ -56,12 +151,19 @@ def launch_tui(device_info):
 
     console.print(menu)
 
+    device_callback = watch_active_device(device_info)
+    try:
+        _menu_loop(device_info)
+    finally:
+        watcher = get_device_watcher()
+        if device_callback and watcher:
+            watcher.unsubscribe(device_callback)
+
+def _menu_loop(device_info):
     while True:
         choice = console.input("Select an option: ")
         if choice == '1':
-            component = console.input("Enter component (e.g., recovery, kernel, firmware): ")
-            type = console.input("Enter type (e.g., custom, stock): ")
-            download.download_component(device_info['model'], component, type)
+            download_menu(device_info)
         elif choice == '2':
             if Confirm.ask("[bold red]WARNING: Rooting can brick your device and voids warranty. Continue?[/bold red]", default=False):
                 root.root_device(device_info)
@@ -126,4 +228,6 @@ def launch_tui(device_info):
             if Confirm.ask("[bold red]WARNING: Repair/Flashing can result in data loss. Continue?[/bold red]", default=False):
                 repair.repair_device(device_info)
         elif choice == 'q':
+            if queue_running():
+                console.print("[yellow]Downloads still running are stopped; the next queue run resumes them.[/yellow]")
             break
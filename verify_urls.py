@@ -1,5 +1,6 @@
 import requests
 import setup
+from modules import http_client
 
 def verify_urls():
     print("Verifying tool URLs...")
@@ -7,7 +8,7 @@ def verify_urls():
         url = metadata.get("download_url")
         if url:
             try:
-                response = requests.head(url, allow_redirects=True, timeout=5)
+                response = http_client.head(url, allow_redirects=True, timeout=5)
                 if response.status_code == 200:
                     print(f"[OK] {tool}: {url}")
                 else:
@@ -16,6 +17,8 @@ def verify_urls():
                 print(f"[ERROR] {tool}: {url} ({e})")
         else:
             print(f"[SKIP] {tool}: No download URL")
+    stats = http_client.stats()
+    print(f"{stats['requests']} requests over {stats['connections']} connections ({stats['reused']} reused)")
 
 if __name__ == "__main__":
     verify_urls()